@@ -0,0 +1,135 @@
+"""Import-time guard for the `rag` package.
+
+Run: `python artifacts/import_time_benchmark.py [--repeat 5] [--budget-ms 400]`
+
+Each module is imported in a fresh interpreter from a temporary copy of
+the package whose project root holds a ``.env`` (with dummy credentials),
+while the Azure / OpenAI credentials are removed from the environment. The
+measurement therefore covers exactly what a search-only worker or offline
+tool pays at startup on a configured machine. Checks:
+
+1. The import succeeds without credentials in the environment.
+2. No network SDK (openai, requests, bs4) or dotenv is loaded by the import,
+   although a ``.env`` is present to be read.
+3. The import creates no directories (``cache/``, ``data_pilot/``).
+4. The median wall time stays under the per-module budget.
+
+Exits non-zero on any violation; results are written as JSON next to the
+other benchmark outputs.
+"""
+from __future__ import annotations
+from pathlib import Path
+from statistics import median
+from typing import Dict, List
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_OUTPUT = PROJECT_ROOT / "artifacts" / "import_time_results.json"
+
+# Module -> budget in ms (interpreter start-up excluded). Search modules pay for numpy + faiss.
+MODULES: Dict[str, float] = {
+    "rag": 20,
+    "rag.config": 20,
+    "rag.telemetry": 50,
+    "rag.retrieval": 400,
+    "rag.cache": 400,
+    "rag.service": 400,
+    "rag.snapshots": 400,
+    "rag.headers": 400,
+    "rag.answer": 150,
+    "rag.scrape": 50,
+}
+FORBIDDEN = ("openai", "requests", "bs4", "dotenv")
+CREDENTIALS = ("AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_API_KEY", "AOAI_EMBED_MODEL", "AOAI_CHAT_MODEL", "OPENAI_API_KEY")
+CREATED_DIRS = ("cache", "data_pilot")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+
+def _sandbox(root: Path) -> Path:
+    """Copy the package under `root` next to a ``.env``, as on a configured machine."""
+    shutil.copytree(PROJECT_ROOT / "rag", root / "rag", ignore=shutil.ignore_patterns("__pycache__"))
+    (root / ".env").write_text("".join(f"{name}=dummy-{name.lower()}\n" for name in CREDENTIALS), "utf-8")
+    return root
+
+
+def _env(root: Path) -> Dict[str, str]:
+    env = {k: v for k, v in os.environ.items() if k not in CREDENTIALS}
+    env["PYTHONPATH"] = os.pathsep.join([str(root)] + [p for p in [env.get("PYTHONPATH")] if p])
+    return env
+
+
+def measure(module: str, repeat: int, root: Path) -> Dict[str, object]:
+    times: List[float] = []
+    loaded: List[str] = []
+    created: List[str] = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, forbidden=FORBIDDEN)],
+            cwd=root, env=_env(root), capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            return {"module": module, "error": proc.stderr.strip().splitlines()[-1:] or ["failed"]}
+        row = json.loads(proc.stdout.strip().splitlines()[-1])
+        times.append(row["ms"])
+        loaded = row["loaded"]
+        created = [d for d in CREATED_DIRS if (root / d).exists()]
+        for d in created:
+            shutil.rmtree(root / d)
+    return {"module": module, "median_ms": median(times), "min_ms": min(times), "max_ms": max(times), "loaded": loaded, "created": created}
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--repeat", type=int, default=5, help="fresh interpreters per module (median reported)")
+    ap.add_argument("--budget-ms", type=float, default=None, help="override every per-module budget")
+    ap.add_argument("--modules", nargs="*", default=list(MODULES))
+    ap.add_argument("--out", type=Path, default=DEFAULT_OUTPUT)
+    args = ap.parse_args(argv)
+
+    results, failures = [], []
+    with tempfile.TemporaryDirectory(prefix="rag-imports-") as tmp:
+        root = _sandbox(Path(tmp))
+        subprocess.run([sys.executable, "-c", "import rag.service"], cwd=root, env=_env(root), capture_output=True)  # warm bytecode cache
+        for d in CREATED_DIRS:
+            shutil.rmtree(root / d, ignore_errors=True)
+        for module in args.modules:
+            results.append(measure(module, args.repeat, root))
+
+    for row in results:
+        module = row["module"]
+        budget = args.budget_ms if args.budget_ms is not None else MODULES.get(module, 400)
+        row["budget_ms"] = budget
+        if "error" in row:
+            failures.append(f"{module}: import failed ({row['error'][0]})")
+        else:
+            if row["loaded"]:
+                failures.append(f"{module}: loaded {', '.join(row['loaded'])}")
+            if row["created"]:
+                failures.append(f"{module}: created {', '.join(row['created'])}/")
+            if row["median_ms"] > budget:
+                failures.append(f"{module}: {row['median_ms']:.1f} ms > {budget:.0f} ms budget")
+            print(f"[imports] {module:<16} median {row['median_ms']:7.1f} ms  (budget {budget:.0f} ms)")
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps({"python": sys.version.split()[0], "results": results, "failures": failures}, indent=2))
+    for failure in failures:
+        print(f"[imports] FAIL {failure}")
+    print(f"[imports] Results written to {args.out}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
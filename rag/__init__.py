@@ -1,4 +1,10 @@
-"""RAG core package initialization."""
+"""RAG core package initialization.
+
+Submodules are imported on first attribute access (``rag.retrieval``), so
+``import rag`` itself loads nothing beyond this file.
+"""
+import importlib
+
 __all__ = [
     "config",
     "models",
@@ -6,3 +12,13 @@ __all__ = [
     "index",
     "retrieval",
 ]
+
+
+def __getattr__(name: str):
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
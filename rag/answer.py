@@ -0,0 +1,452 @@
+"""Grounded answer generation: token-budgeted context and streamed replies.
+
+Usage:
+
+    answerer = AnswerGenerator(retriever, chunk_lookup={c.chunk_id: c for c in chunks})
+    stream = answerer.stream("When should breast cancer screening start?")
+    stream.citations                  # available before the first token
+    for delta in stream:              # tokens as the model produces them
+        print(delta, end="", flush=True)
+    stream.answer                     # `Answer` (full text, timings) once finished
+
+Pipeline:
+
+1. `pack_context` dedupes the retrieved chunks (by chunk id and by text),
+   admits them in rank order while they fit `context_tokens`, then renders
+   them grouped by document: documents in order of their best hit, chunks
+   in reading order, one citation number per document.
+2. The prompt is streamed through an async ``llm_stream(messages,
+   max_completion_tokens=...)`` adapter yielding text deltas. The default,
+   `azure_chat_stream`, reuses one ``AsyncAzureOpenAI`` client per event
+   loop, so connections (TLS, HTTP/2) survive across questions. Synchronous
+   iteration runs on one shared background loop for the same reason.
+3. Finished answers are kept in an LRU keyed on (normalized query, index
+   version, packed chunk ids): a repeated question over the same index and
+   retrieval result is replayed without a model call. Streams abandoned
+   half-way or failing are never cached.
+
+Token counts use a ~4 characters/token estimate unless a ``count_tokens``
+callable (e.g. a tiktoken encoder's ``len(encode(text))``) is supplied.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+import asyncio
+import threading
+import weakref
+
+from . import config, telemetry
+
+__all__ = [
+    "PackedContext",
+    "Answer",
+    "AnswerStream",
+    "AnswerGenerator",
+    "estimate_tokens",
+    "pack_context",
+    "build_messages",
+    "azure_chat_stream",
+]
+
+LLMStream = Callable[..., AsyncIterator[str]]
+
+SYSTEM_PROMPT = "You are a helpful medical information assistant that synthesizes information from clinical guidelines."
+
+ANSWER_PROMPT = """You are a medical information assistant. Based on the following excerpts from trusted medical guidelines, provide a comprehensive, accurate answer to the user's question.
+
+User Question: {query}
+
+Relevant Guidelines:
+{context}
+
+Instructions:
+- Provide a clear, well-organized answer
+- Use specific information from the guidelines
+- Include inline citations using [1], [2], etc. format
+- Be precise and evidence-based
+- If guidelines conflict, note the differences
+- Keep the answer concise but complete
+
+Answer:"""
+
+NO_CONTEXT_REPLY = "No relevant guideline excerpts were found for this question."
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English prose)."""
+    return len(text) // 4 + 1
+
+
+def _truncate_to_tokens(text: str, limit: int, count_tokens: Callable[[str], int]) -> str:
+    """Longest prefix of `text` that `count_tokens` puts at or under `limit` (bisection on length)."""
+    if count_tokens(text) <= limit:
+        return text
+    lo, hi = 0, len(text)  # count(text[:lo]) fits (or lo == 0), count(text[:hi]) does not
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if count_tokens(text[:mid]) <= limit:
+            lo = mid
+        else:
+            hi = mid
+    return text[:lo]
+
+
+# -------- Context packing ---------
+@dataclass(slots=True)
+class PackedContext:
+    text: str
+    citations: List[Dict[str, Any]]
+    chunk_ids: Tuple[Any, ...]  # admitted chunks, in rendered order
+    tokens: int
+    dropped: int = 0  # retrieved chunks left out (duplicates or over budget)
+
+
+def _chunk_fields(result: Dict[str, Any], lookup: Optional[Mapping[Any, Any]]) -> Tuple[str, int]:
+    """(prompt text, position in document) for one retrieval result."""
+    chunk = lookup.get(result.get("chunk_id")) if lookup is not None else None
+    if chunk is not None:
+        text = chunk.augmented_chunk or f"{chunk.ctx_header}\n\n{chunk.raw_chunk}"
+        return text.strip(), chunk.chunk_index
+    text = result.get("augmented_chunk") or f"{result.get('ctx_header', '')}\n\n{result.get('raw_chunk', '')}"
+    return text.strip(), int(result.get("chunk_index", 0) or 0)
+
+
+def _doc_heading(number: int, result: Dict[str, Any]) -> str:
+    org = result.get("source_org")
+    return f"[{number}] {result.get('doc_title') or 'Untitled'}" + (f" ({org})" if org else "")
+
+
+def pack_context(
+    results: Sequence[Dict[str, Any]],
+    budget_tokens: Optional[int] = None,
+    chunk_lookup: Optional[Mapping[Any, Any]] = None,
+    count_tokens: Callable[[str], int] = estimate_tokens,
+) -> PackedContext:
+    """Fit retrieved chunks into `budget_tokens`, grouped and cited per document.
+
+    Chunks are admitted in rank order; one that does not fit is skipped so a
+    smaller, lower-ranked chunk may still be used. Only the top hit is
+    truncated, when it alone exceeds the budget. `chunk_lookup` maps chunk id
+    to `Chunk` for metadata records that do not carry the chunk text.
+    `budget_tokens` defaults to ``config.ANSWER_CONTEXT_TOKENS``.
+    """
+    if budget_tokens is None:
+        budget_tokens = config.ANSWER_CONTEXT_TOKENS
+    seen_ids, seen_texts = set(), set()
+    docs: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()  # doc key -> first result + admitted chunks
+    used = dropped = 0
+    for rank, r in enumerate(results):
+        cid = r.get("chunk_id")
+        text, position = _chunk_fields(r, chunk_lookup)
+        norm = " ".join(text.split())
+        if not norm or (cid is not None and cid in seen_ids) or norm in seen_texts:
+            dropped += 1
+            continue
+        doc_key = r.get("doc_id") or r.get("source_url") or r.get("doc_title")
+        entry = docs.get(doc_key)
+        heading = 0 if entry is not None else count_tokens(_doc_heading(len(docs) + 1, r))
+        cost = heading + count_tokens(text)
+        if used + cost > budget_tokens:
+            if docs or heading >= budget_tokens:
+                dropped += 1
+                continue
+            # Top hit alone is over budget: keep its beginning rather than nothing
+            text = _truncate_to_tokens(text, budget_tokens - heading, count_tokens)
+            cost = heading + count_tokens(text)
+        if entry is None:
+            entry = docs[doc_key] = {"result": r, "chunks": []}
+        entry["chunks"].append((position, rank, cid, text))
+        seen_ids.add(cid)
+        seen_texts.add(norm)
+        used += cost
+
+    blocks, citations, chunk_ids = [], [], []
+    for number, entry in enumerate(docs.values(), 1):
+        first = entry["result"]
+        chunks = sorted(entry["chunks"])  # reading order within the document
+        blocks.append(_doc_heading(number, first) + "\n" + "\n\n".join(c[3] for c in chunks))
+        chunk_ids.extend(c[2] for c in chunks)
+        citations.append({
+            "number": number,
+            "source": first.get("source_url", "Unknown"),
+            "title": first.get("doc_title", "Unknown Document"),
+            "header": first.get("ctx_header", "Unknown Section"),
+            "chunk_ids": [c[2] for c in chunks],
+        })
+    return PackedContext("\n\n".join(blocks), citations, tuple(chunk_ids), used, dropped)
+
+
+def build_messages(query: str, packed: PackedContext) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": ANSWER_PROMPT.format(query=query, context=packed.text)},
+    ]
+
+
+# -------- Pooled streaming LLM adapter ---------
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def _async_client():
+    """One ``AsyncAzureOpenAI`` client per running event loop (its HTTP pool is loop-bound)."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        client = _clients.get(loop)
+        if client is None:
+            from openai import AsyncAzureOpenAI  # type: ignore
+            client = AsyncAzureOpenAI(
+                api_key=config.AZURE_OPENAI_API_KEY,
+                azure_endpoint=config.AZURE_OPENAI_ENDPOINT,
+                api_version="2024-08-01-preview",
+            )
+            _clients[loop] = client
+    return client
+
+
+async def azure_chat_stream(messages: List[Dict], model: str | None = None, max_completion_tokens: Optional[int] = None) -> AsyncIterator[str]:
+    """Yield content deltas of a streamed Azure OpenAI chat completion."""
+    stream = await _async_client().chat.completions.create(
+        model=model or config.AOAI_CHAT_MODEL,
+        messages=messages,
+        max_completion_tokens=max_completion_tokens or config.ANSWER_MAX_TOKENS,
+        stream=True,
+    )
+    async for event in stream:
+        if event.choices:
+            delta = event.choices[0].delta.content
+            if delta:
+                yield delta
+
+
+class _LoopThread:
+    """Shared background event loop for synchronous streaming callers."""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="rag-answer-loop", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def iterate(self, agen: AsyncIterator[str]) -> Iterator[str]:
+        """Drive `agen` one item per request (handshake): nothing is produced ahead of the consumer."""
+        loop = self.loop()
+        step = None
+        try:
+            while True:
+                step = asyncio.run_coroutine_threadsafe(agen.__anext__(), loop)
+                try:
+                    item = step.result()
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            if step is not None and not step.done():
+                step.cancel()  # consumer interrupted mid-request: stop the model call too
+            asyncio.run_coroutine_threadsafe(_close(agen), loop)  # runs the generator's cleanup
+
+
+async def _close(agen: AsyncIterator[str]):
+    try:
+        await agen.aclose()  # type: ignore[attr-defined]
+    except RuntimeError:  # still unwinding from the cancellation above
+        pass
+
+
+_LOOP = _LoopThread()
+
+
+# -------- Answers ---------
+@dataclass(slots=True)
+class Answer:
+    query: str
+    text: str
+    citations: List[Dict[str, Any]]
+    chunk_ids: Tuple[Any, ...]
+    cached: bool = False
+    first_token_seconds: Optional[float] = None
+    total_seconds: float = 0.0
+    context_tokens: int = 0
+
+
+@dataclass(slots=True)
+class _CachedAnswer:
+    text: str
+    citations: List[Dict[str, Any]]
+
+
+class AnswerStream:
+    """One answer in flight; iterate (sync or ``async for``) to receive text deltas.
+
+    `citations` / `packed` are known up front; `answer` is set once the
+    stream has been consumed to the end. A stream that is closed (or whose
+    synchronous iteration stops) early is neither cached nor counted as
+    answered.
+    """
+
+    def __init__(self, owner: "AnswerGenerator", query: str, packed: PackedContext, key: Tuple):
+        self.query = query
+        self.packed = packed
+        self.citations = packed.citations
+        self.answer: Optional[Answer] = None
+        self.closed = False
+        self._owner = owner
+        self._key = key
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._owner._generate(self, self._key)
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            yield from _LOOP.iterate(self.__aiter__())
+        finally:
+            self.closed = True
+
+    def close(self):
+        """Abandon the stream: whatever was produced so far is not cached."""
+        self.closed = True
+
+    def text(self) -> str:
+        """Consume the stream and return the full answer text."""
+        return "".join(self)
+
+
+class AnswerGenerator:
+    """Retrieve, pack and stream grounded answers.
+
+    Parameters
+    ----------
+    retriever : object | None
+        Anything with ``search(query, top_k)`` (and ideally ``version``).
+        Optional when results are passed to `stream` directly.
+    llm_stream : callable | None
+        Async ``llm_stream(messages, max_completion_tokens=...)`` yielding
+        text deltas. Defaults to `azure_chat_stream`.
+    chunk_lookup : mapping | None
+        chunk id -> `Chunk`, for metadata records without chunk text.
+    context_tokens : int | None
+        Token budget for the packed guideline excerpts
+        (default ``config.ANSWER_CONTEXT_TOKENS``).
+    max_tokens : int | None
+        ``max_completion_tokens`` for the model (default ``config.ANSWER_MAX_TOKENS``).
+    cache_size : int | None
+        LRU capacity for finished answers; 0 disables caching
+        (default ``config.ANSWER_CACHE_SIZE``).
+    count_tokens : callable
+        ``count_tokens(text) -> int`` used for packing.
+    """
+
+    def __init__(
+        self,
+        retriever=None,
+        llm_stream: Optional[LLMStream] = None,
+        chunk_lookup: Optional[Mapping[Any, Any]] = None,
+        context_tokens: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        cache_size: Optional[int] = None,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+    ):
+        self.retriever = retriever
+        self.llm_stream = llm_stream or azure_chat_stream
+        self.chunk_lookup = chunk_lookup
+        self.context_tokens = context_tokens or config.ANSWER_CONTEXT_TOKENS
+        self.max_tokens = max_tokens or config.ANSWER_MAX_TOKENS
+        self.cache_size = config.ANSWER_CACHE_SIZE if cache_size is None else cache_size
+        self.count_tokens = count_tokens
+        self._cache: "OrderedDict[Tuple, _CachedAnswer]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.stats = {"answered": 0, "cache_hits": 0, "errors": 0}
+
+    def stream(
+        self,
+        query: str,
+        results: Optional[Sequence[Dict[str, Any]]] = None,
+        top_k: int = 5,
+        version: Optional[str] = None,
+    ) -> AnswerStream:
+        """Retrieve (unless `results` given) and pack now; the model is called on iteration."""
+        if results is None:
+            if self.retriever is None:
+                raise ValueError("AnswerGenerator needs a retriever or explicit results")
+            results = self.retriever.search(query, top_k=top_k)
+        packed = pack_context(results, self.context_tokens, self.chunk_lookup, self.count_tokens)
+        if version is None:
+            version = getattr(self.retriever, "version", None)
+        key = (" ".join(query.lower().split()), version, packed.chunk_ids)
+        return AnswerStream(self, query, packed, key)
+
+    def answer(self, query: str, results: Optional[Sequence[Dict[str, Any]]] = None, top_k: int = 5) -> Answer:
+        """Non-streaming convenience: consume `stream` and return the `Answer`."""
+        stream = self.stream(query, results, top_k)
+        for _ in stream:
+            pass
+        return stream.answer  # type: ignore[return-value]
+
+    async def _generate(self, stream: AnswerStream, key: Tuple) -> AsyncIterator[str]:
+        start = perf_counter()
+        packed = stream.packed
+        hit = self._cache_get(key)
+        if hit is not None:
+            telemetry.count("answer.cache_hits")
+            stream.answer = Answer(stream.query, hit.text, hit.citations, packed.chunk_ids, True, 0.0, perf_counter() - start, packed.tokens)
+            yield hit.text
+            return
+        if not packed.chunk_ids:
+            stream.answer = Answer(stream.query, NO_CONTEXT_REPLY, [], (), False, 0.0, perf_counter() - start, 0)
+            yield NO_CONTEXT_REPLY
+            return
+
+        parts: List[str] = []
+        first: Optional[float] = None
+        with telemetry.span("answer.generate", chunks=len(packed.chunk_ids), context_tokens=packed.tokens) as sp:
+            try:
+                async for delta in self.llm_stream(build_messages(stream.query, packed), max_completion_tokens=self.max_tokens):
+                    if not delta:
+                        continue
+                    if first is None:
+                        first = perf_counter() - start
+                        telemetry.observe("answer.first_token_seconds", first)
+                    parts.append(delta)
+                    yield delta
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+            sp.set(first_token_seconds=first, chars=sum(map(len, parts)))
+        if stream.closed:  # abandoned by its consumer: a partial answer
+            return
+        text = "".join(parts)
+        self.stats["answered"] += 1
+        if text:
+            self._cache_put(key, _CachedAnswer(text, packed.citations))
+        stream.answer = Answer(stream.query, text, packed.citations, packed.chunk_ids, False, first, perf_counter() - start, packed.tokens)
+
+    def _cache_get(self, key: Tuple) -> Optional[_CachedAnswer]:
+        if self.cache_size <= 0:
+            return None
+        with self._cache_lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+            return hit
+
+    def _cache_put(self, key: Tuple, value: _CachedAnswer):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
@@ -4,38 +4,64 @@ Design goals:
 - Idempotent: safe to call repeatedly without corrupting state.
 - Atomic writes: write to temp then rename to avoid partial files.
 - Simple JSON/NumPy/FAISS persistence; no external DB required.
+- Chunks use the compact binary record store (`rag.chunkstore`); JSON is
+  kept as an export format and still read when no binary store exists.
+- Documents and chunks go to a database instead when ``STORAGE_BACKEND`` is
+  ``sqlite`` or ``cosmos`` (`rag.storage`); `get_chunk` / `load_doc_chunks`
+  then read single records without loading the corpus.
 - Layered: documents -> chunks -> embeddings -> index.
+- Shareable: `load_*(mmap=True)` memory-maps the index, embeddings and the
+  metadata column store read-only so serving workers share one copy through
+  the OS page cache (see `load_readonly_index`).
 
 Public functions:
 - save_documents(docs)
 - load_documents()
 - save_chunks(chunks)
 - load_chunks()
+- iter_cached_chunks()
+- get_chunk(chunk_id, doc_id=None)
+- load_doc_chunks(doc_id)
+- export_chunks_json(chunks=None)
 - save_embeddings(emb_matrix)
 - load_embeddings()
 - save_faiss_index(index)
 - load_faiss_index()
-- build_or_load_index(texts, embed_fn, force=False)
+- load_readonly_index()
+- load_neighbors()
+- build_or_load_index(texts, metadata, embed_fn=None, force=False, model=None)
 
 The build_or_load_index helper derives embeddings (if needed) and returns (index, metadata, embeddings).
 """
 from __future__ import annotations
-from typing import List, Sequence, Dict, Any, Tuple, Callable, Optional
-import json, os, tempfile
+from typing import List, Sequence, Dict, Any, Tuple, Callable, Optional, Iterator
+from dataclasses import fields
+from contextlib import contextmanager
+import hashlib, json, os, shutil, tempfile
 from pathlib import Path
 import numpy as np
 import faiss  # type: ignore
 
-from . import config
+from . import config, telemetry
 from .models import Document, Chunk
-from .embeddings import get_embeddings_batch
-from .index import build_faiss_index
-
-DOCS_PATH = config.CACHE_DIR / "documents.json"
-CHUNKS_PATH = config.CACHE_DIR / "chunks.json"
-EMB_PATH = config.CACHE_DIR / "embeddings.npy"
-INDEX_PATH = config.CACHE_DIR / "faiss.index"
-META_PATH = config.CACHE_DIR / "metadata.json"
+from .chunkstore import write_chunks, iter_chunks
+from .colstore import write_columns, ColumnarMetadata, _swap_dir
+from .embeddings import embed_into, embedding_model_name
+from .index import build_faiss_index, build_faiss_index_bulk
+from .storage import get_storage
+from .neighbors import NeighborIndex
+
+# Cache paths follow config.CACHE_DIR at access time (importing this module touches no disk)
+_path, __getattr__ = config.lazy_paths(__name__, {
+    "DOCS_PATH": lambda: config.CACHE_DIR / "documents.json",
+    "CHUNKS_PATH": lambda: config.CACHE_DIR / "chunks.json",
+    "CHUNKS_BIN_PATH": lambda: config.CACHE_DIR / "chunks.bin",
+    "EMB_PATH": lambda: config.CACHE_DIR / "embeddings.npy",
+    "INDEX_PATH": lambda: config.CACHE_DIR / "faiss.index",
+    "META_PATH": lambda: config.CACHE_DIR / "metadata.json",
+    "META_COLS_DIR": lambda: config.CACHE_DIR / "metadata_cols",
+    "NEIGHBORS_PATH": lambda: config.CACHE_DIR / "neighbors.npy",
+})
 
 # ----------------------- generic helpers -----------------------
 
@@ -46,64 +72,256 @@ def _atomic_write(path: Path, data: bytes):
         tmp_path = Path(tmp.name)
     tmp_path.replace(path)
 
+
+@contextmanager
+def _atomic_path(path: Path):
+    """Yield a temp path next to `path`; rename it into place if the block succeeds."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    os.close(fd)
+    tmp_path = Path(tmp)
+    try:
+        yield tmp_path
+        tmp_path.replace(path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+class _HashingWriter:
+    """File wrapper that sha256-hashes everything written through it."""
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.sha = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self.sha.update(data)
+        return self.fh.write(data)
+
+
+def _link_or_copy(src, dst):
+    """Hard-link `src` at `dst`, copying where the filesystem has no hard links."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+def _as_dict(obj) -> Dict[str, Any]:
+    return {f.name: getattr(obj, f.name) for f in fields(obj)}
+
 # ----------------------- documents -----------------------------
 
 def save_documents(docs: Sequence[Document]):
-    payload = [doc.__dict__ for doc in docs]
-    _atomic_write(DOCS_PATH, json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8"))
+    store = get_storage()
+    if store is not None:
+        store.upsert_documents(docs)
+        return
+    payload = [_as_dict(doc) for doc in docs]
+    _atomic_write(_path("DOCS_PATH"), json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8"))
 
 
 def load_documents() -> List[Document]:
-    if not DOCS_PATH.exists():
+    store = get_storage()
+    if store is not None:
+        return list(store.iter_documents())
+    path = _path("DOCS_PATH")
+    if not path.exists():
         return []
-    data = json.loads(DOCS_PATH.read_text("utf-8"))
+    data = json.loads(path.read_text("utf-8"))
     return [Document(**d) for d in data]
 
 # ----------------------- chunks --------------------------------
 
 def save_chunks(chunks: Sequence[Chunk]):
-    payload = [c.__dict__ for c in chunks]
-    _atomic_write(CHUNKS_PATH, json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8"))
+    """Replace the cached chunks (file or storage backend); ids not in `chunks` are dropped."""
+    store = get_storage()
+    if store is not None:
+        store.replace_chunks(chunks)
+        return
+    write_chunks(_path("CHUNKS_BIN_PATH"), chunks)
+
+
+def iter_cached_chunks() -> Iterator[Chunk]:
+    """Stream cached chunks without materializing the full list."""
+    store = get_storage()
+    binary, legacy = _path("CHUNKS_BIN_PATH"), _path("CHUNKS_PATH")
+    if store is not None:
+        yield from store.iter_chunks()
+    elif binary.exists():
+        yield from iter_chunks(binary)
+    elif legacy.exists():
+        for c in json.loads(legacy.read_text("utf-8")):
+            yield Chunk(**c)
 
 
 def load_chunks() -> List[Chunk]:
-    if not CHUNKS_PATH.exists():
-        return []
-    data = json.loads(CHUNKS_PATH.read_text("utf-8"))
-    return [Chunk(**c) for c in data]
+    return list(iter_cached_chunks())
+
+
+def get_chunk(chunk_id: str, doc_id: Optional[str] = None) -> Optional[Chunk]:
+    """One cached chunk by id (point lookup with a storage backend, a scan otherwise).
+
+    Passing the chunk's `doc_id` lets partitioned backends read it directly.
+    """
+    store = get_storage()
+    if store is not None:
+        return store.get_chunk(chunk_id, doc_id)
+    return next((c for c in iter_cached_chunks() if c.chunk_id == chunk_id), None)
+
+
+def load_doc_chunks(doc_id: str) -> List[Chunk]:
+    """Cached chunks of one document in `chunk_index` order."""
+    store = get_storage()
+    if store is not None:
+        return list(store.iter_doc_chunks(doc_id))
+    return sorted((c for c in iter_cached_chunks() if c.doc_id == doc_id), key=lambda c: c.chunk_index)
+
+
+def export_chunks_json(chunks: Optional[Sequence[Chunk]] = None, path: Optional[Path] = None) -> Path:
+    """Write chunks (default: the cached store) as indented JSON for inspection/export."""
+    if chunks is None:
+        chunks = load_chunks()
+    path = path or _path("CHUNKS_PATH")
+    payload = [_as_dict(c) for c in chunks]
+    _atomic_write(path, json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8"))
+    return path
 
 # ----------------------- embeddings ----------------------------
 
-def save_embeddings(embeddings: np.ndarray):
+def save_embeddings(embeddings: np.ndarray, path: Optional[Path] = None) -> str:
+    """Write the embedding matrix as ``.npy``; returns the file's sha256 (hashed while writing)."""
     embeddings = np.asarray(embeddings, dtype=np.float32)
-    np.save(EMB_PATH, embeddings)
+    with _atomic_path(path or _path("EMB_PATH")) as tmp:
+        with open(tmp, "wb") as fh:
+            out = _HashingWriter(fh)
+            np.save(out, embeddings)
+    return out.sha.hexdigest()
 
 
-def load_embeddings() -> Optional[np.ndarray]:
-    if not EMB_PATH.exists():
+def load_embeddings(mmap: bool = False, path: Optional[Path] = None) -> Optional[np.ndarray]:
+    path = path or _path("EMB_PATH")
+    if not path.exists():
         return None
-    return np.load(EMB_PATH)
+    return np.load(path, mmap_mode="r" if mmap else None)
 
 # ----------------------- metadata & index ----------------------
 
-def save_metadata(meta: Sequence[Dict[str, Any]]):
-    _atomic_write(META_PATH, json.dumps(list(meta), ensure_ascii=False, indent=2).encode("utf-8"))
+def save_metadata(meta: Sequence[Dict[str, Any]], path: Optional[Path] = None, columns_dir: Optional[Path] = None, neighbors_path: Optional[Path] = None):
+    """Write metadata as JSON, as a column store and as neighbour arrays (`rag.neighbors`)."""
+    meta = list(meta)
+    _atomic_write(path or _path("META_PATH"), json.dumps(meta, ensure_ascii=False, indent=2).encode("utf-8"))
+    write_columns(columns_dir or _path("META_COLS_DIR"), meta)
+    NeighborIndex.build(meta).save(neighbors_path or _path("NEIGHBORS_PATH"))
+
+
+def load_neighbors(mmap: bool = False, path: Optional[Path] = None) -> Optional[NeighborIndex]:
+    return NeighborIndex.load(path or _path("NEIGHBORS_PATH"), mmap=mmap)
 
 
-def load_metadata() -> List[Dict[str, Any]]:
-    if not META_PATH.exists():
+def load_metadata(mmap: bool = False, path: Optional[Path] = None, columns_dir: Optional[Path] = None) -> Sequence[Dict[str, Any]]:
+    """Load chunk metadata; with `mmap=True` return a read-only `ColumnarMetadata` view if available."""
+    path = path or _path("META_PATH")
+    if mmap:
+        cols = ColumnarMetadata.open(columns_dir or _path("META_COLS_DIR"))
+        if cols is not None:
+            return cols
+    if not path.exists():
         return []
-    return json.loads(META_PATH.read_text("utf-8"))
+    return json.loads(path.read_text("utf-8"))
+
+
+def save_faiss_index(index: faiss.Index, path: Optional[Path] = None) -> str:
+    """Write the index; returns the file's sha256 (hashed while writing)."""
+    with _atomic_path(path or _path("INDEX_PATH")) as tmp:
+        with open(tmp, "wb") as fh:
+            out = _HashingWriter(fh)
+            faiss.write_index(index, faiss.PyCallbackIOWriter(out.write))
+    return out.sha.hexdigest()
+
+
+def _read_index_mmap(path: Path) -> faiss.Index:
+    flags = faiss.IO_FLAG_READ_ONLY
+    ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", None)  # zero-copy flat codes (faiss >= 1.8)
+    if ifc is not None:
+        index = faiss.read_index(str(path), ifc | flags)
+        try:
+            faiss.extract_index_ivf(index)
+        except RuntimeError:
+            return index
+    # IVF inverted lists are mapped via IO_FLAG_MMAP
+    return faiss.read_index(str(path), faiss.IO_FLAG_MMAP | flags)
+
+
+def load_faiss_index(mmap: bool = False, path: Optional[Path] = None) -> Optional[faiss.Index]:
+    path = path or _path("INDEX_PATH")
+    if not path.exists():
+        return None
+    if mmap:
+        return _read_index_mmap(path)
+    return faiss.read_index(str(path))
+
 
+def load_readonly_index() -> Tuple[Optional[faiss.Index], Sequence[Dict[str, Any]]]:
+    """Memory-map the cached index and metadata for serving workers.
 
-def save_faiss_index(index: faiss.Index):
-    faiss.write_index(index, str(INDEX_PATH))
+    Nothing is copied into process memory up front, so starting another worker
+    is near-instant and its pages are shared with every other worker mapping
+    the same files. Do not add to or modify the returned index.
+    """
+    return load_faiss_index(mmap=True), load_metadata(mmap=True)
 
+# ----------------------- index bundles -------------------------
+# A bundle is one directory holding an index with its embeddings and metadata
+# under fixed file names (used for shards and other named index sets).
 
-def load_faiss_index() -> Optional[faiss.Index]:
-    if not INDEX_PATH.exists():
+BUNDLE_INDEX = "faiss.index"
+BUNDLE_EMB = "embeddings.npy"
+BUNDLE_META = "metadata.json"
+BUNDLE_META_COLS = "metadata_cols"
+BUNDLE_NEIGHBORS = "neighbors.npy"
+
+
+def save_index_bundle(directory: Path, index: faiss.Index, embeddings: np.ndarray, metadata: Sequence[Dict[str, Any]]) -> Dict[str, str]:
+    """Write a bundle; returns the sha256 of its two large files, computed while writing them."""
+    directory.mkdir(parents=True, exist_ok=True)
+    digests = {BUNDLE_EMB: save_embeddings(embeddings, directory / BUNDLE_EMB)}
+    save_metadata(metadata, directory / BUNDLE_META, directory / BUNDLE_META_COLS, directory / BUNDLE_NEIGHBORS)
+    digests[BUNDLE_INDEX] = save_faiss_index(index, directory / BUNDLE_INDEX)
+    return digests
+
+
+def _link_flat_files(directory: Path):
+    """Expose a bundle as the flat CACHE_DIR files without writing its data again.
+
+    Every file is hard-linked (or copied) into place and renamed over the
+    old one, so readers see either the previous or the new file. Writers
+    always rename new files into place, never modify them, so the links
+    cannot change under the snapshot.
+    """
+    for name, key in ((BUNDLE_EMB, "EMB_PATH"), (BUNDLE_META, "META_PATH"), (BUNDLE_NEIGHBORS, "NEIGHBORS_PATH"), (BUNDLE_INDEX, "INDEX_PATH")):
+        with _atomic_path(_path(key)) as tmp:
+            tmp.unlink()
+            _link_or_copy(directory / name, tmp)
+    cols = _path("META_COLS_DIR")
+    tmp = Path(tempfile.mkdtemp(dir=cols.parent, prefix=f".{cols.name}."))
+    try:
+        shutil.copytree(directory / BUNDLE_META_COLS, tmp, copy_function=_link_or_copy, dirs_exist_ok=True)
+        _swap_dir(tmp, cols)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def load_index_bundle(directory: Path, mmap: bool = False) -> Optional[Tuple[faiss.Index, Sequence[Dict[str, Any]], np.ndarray]]:
+    """Return (index, metadata, embeddings) for a bundle, or None if incomplete."""
+    index = load_faiss_index(mmap=mmap, path=directory / BUNDLE_INDEX)
+    emb = load_embeddings(mmap=mmap, path=directory / BUNDLE_EMB)
+    meta = load_metadata(mmap=mmap, path=directory / BUNDLE_META, columns_dir=directory / BUNDLE_META_COLS)
+    if index is None or emb is None or not len(meta):
         return None
-    return faiss.read_index(str(INDEX_PATH))
+    return index, meta, emb
 
 # ----------------------- orchestration -------------------------
 
@@ -113,9 +331,22 @@ def build_or_load_index(
     embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
     force: bool = False,
     index_type: str = "auto",
+    repair: bool = True,
+    model: Optional[str] = None,
 ) -> Tuple[faiss.Index, List[Dict[str, Any]], np.ndarray]:
     """Load cached index+embeddings or build from provided texts.
 
+    The cache is the CURRENT snapshot (`rag.snapshots`) when its manifest
+    matches these texts (content hash), counts and embedding model; a fresh
+    build is published as a new snapshot. The flat files under CACHE_DIR are
+    hard links to the snapshot's files (kept for the notebooks, so the
+    embeddings are stored once) and only trusted on their own (count check)
+    when no snapshot exists yet.
+
+    Rows whose embedding failed (zero vectors) are left out of the index and
+    recorded as ``pending`` in the manifest; search labels remain row
+    positions, so metadata stays aligned (`rag.repair`).
+
     Parameters
     ----------
     texts : list of str
@@ -123,65 +354,187 @@ def build_or_load_index(
     metadata : list of dict
         Parallel metadata aligned to texts.
     embed_fn : callable
-        Embedding function (defaults to get_embeddings_batch).
+        Embedding function (defaults to the API client via `rag.embeddings.embed_into`).
     force : bool
         If True, rebuild even if cache exists.
     index_type : str
         Index strategy forwarded to build_faiss_index.
+    repair : bool
+        Re-embed pending rows on a background thread and publish the
+        repaired index as a new snapshot.
+    model : str | None
+        Name of the embedding model, recorded in the manifest and used to key
+        the embedding journal. Defaults to ``AOAI_EMBED_MODEL`` for the API
+        path and to the embedder's ``model_name`` (or a warned fallback) for a
+        custom `embed_fn` (`rag.embeddings.embedding_model_name`).
     """
-    embed_fn = embed_fn or get_embeddings_batch
+    from .journal import EmbeddingJournal
+    from .repair import failed_rows
+    from .snapshots import SNAPSHOTS_DIR, load_snapshot, publish_snapshot, read_manifest, texts_digest
+
+    model = embedding_model_name(embed_fn, model)
+    if not force:
+        manifest = read_manifest()
+        if manifest is not None:
+            if (
+                manifest.get("texts_sha256") == texts_digest(texts)
+                and manifest["counts"]["metadata"] == len(metadata)
+                and manifest.get("model") == model
+            ):
+                snap = load_snapshot(manifest["version"])
+                if snap is not None:
+                    if repair and manifest.get("pending"):
+                        _ensure_repair(texts, embed_fn, model, len(manifest["pending"]))
+                    return snap.index, list(snap.metadata), snap.embeddings
+        else:
+            cached_index = load_faiss_index()
+            cached_emb = load_embeddings()
+            cached_meta = load_metadata()
+            if cached_index and cached_emb is not None and cached_meta and len(cached_meta) == len(texts):
+                # Legacy cache without a manifest: counts are all we can check
+                return cached_index, cached_meta, cached_emb
+
+    # Finished batches are journaled so an interrupted build resumes instead of re-embedding
+    journal = EmbeddingJournal.for_model(model)
+    ids = [str(m.get("chunk_id", i)) for i, m in enumerate(metadata)]
+    emb_matrix = embed_texts(texts, embed_fn, ids=ids, journal=journal)
+    pending = failed_rows(emb_matrix)
+    if len(pending) == len(texts):
+        raise RuntimeError("Failed to generate embeddings")
+    if len(pending):
+        # Quarantine zero vectors: index healthy rows under their row positions
+        healthy = np.setdiff1d(np.arange(len(texts), dtype=np.int64), pending, assume_unique=True)
+        index = build_faiss_index_bulk(emb_matrix, index_type=index_type, rows=healthy)
+        print(f"[embeddings] {len(pending)} rows failed; indexed {len(healthy)} and marked the rest pending")
+    else:
+        index = build_faiss_index(emb_matrix, index_type=index_type)
+
+    # Persist: versioned snapshot first (source of truth), then link the legacy flat files to it
+    manifest = publish_snapshot(index, emb_matrix, metadata, texts=texts, model=model, extra={"pending": pending.tolist()})
+    _link_flat_files(SNAPSHOTS_DIR / manifest["version"])
+
+    journal.clear()  # the snapshot now holds every finished row
+    if repair and len(pending):
+        _ensure_repair(texts, embed_fn, model, len(pending))
+    return index, list(metadata), emb_matrix
+
+
+_repair_worker = None
+
 
-    cached_index = load_faiss_index()
-    cached_emb = load_embeddings()
-    cached_meta = load_metadata()
+def _ensure_repair(texts: Sequence[str], embed_fn, model: str, count: int):
+    """Start (at most) one background repair thread per process."""
+    global _repair_worker
+    from .repair import start_background_repair
 
-    if not force and cached_index and cached_emb is not None and cached_meta and len(cached_meta) == len(texts):
-        # Assume cache is valid if counts match
-        return cached_index, cached_meta, cached_emb
+    if _repair_worker is not None and _repair_worker.is_alive():
+        return
+    print(f"[embeddings] Scheduling background repair of {count} pending rows")
+    _repair_worker = start_background_repair(texts, embed_fn, model=model)
 
+
+def embed_texts(
+    texts: Sequence[str],
+    embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+    out: Optional[np.ndarray] = None,
+    ids: Optional[Sequence[str]] = None,
+    journal=None,
+) -> np.ndarray:
+    """Embed `texts` in rate-limit friendly batches into one (n, d) float32 matrix.
+
+    Batches are written straight into `out` (preallocated, or e.g. an
+    ``np.lib.format.open_memmap`` file for corpora larger than RAM). When
+    `out` is None the matrix is allocated once the first successful batch
+    reveals the dimension; batches that failed before that stay zero rows.
+    Without a custom `embed_fn` the API's base64 payloads are decoded
+    directly into the matrix rows (`rag.embeddings.embed_into`).
+
+    With a `journal` (`rag.journal.EmbeddingJournal`) and per-text `ids`,
+    rows already journaled for the same text are reused and every finished
+    batch is appended to the journal, so an interrupted run resumes where it
+    stopped. Output row order always follows `texts`.
+    """
+    import time
+    from .journal import content_key
+
+    n = len(texts)
     # Build fresh with batching and delays to avoid rate limits
     batch_size = config.EMBED_BATCH_SIZE
     batch_delay = config.EMBED_DELAY_SECONDS
-    embeddings_list = []
-    
-    print(f"[embeddings] Processing {len(texts)} texts in batches of {batch_size} (delay: {batch_delay}s)")
-    for i in range(0, len(texts), batch_size):
-        batch = list(texts[i:i + batch_size])
-        batch_embeddings = embed_fn(batch)
-        if not batch_embeddings:
-            raise RuntimeError(f"Failed to generate embeddings for batch {i//batch_size + 1}")
-        embeddings_list.extend(batch_embeddings)
-        batch_num = i//batch_size + 1
-        total_batches = (len(texts) + batch_size - 1)//batch_size
+    if n == 0:
+        raise RuntimeError("Failed to generate embeddings")
+
+    todo = np.arange(n)
+    keys: List[str] = []
+    if journal is not None:
+        ids = [str(i) for i in (ids if ids is not None else range(n))]
+        keys = [content_key(t) for t in texts]
+        done = journal.lookup(ids, keys)
+        if done.any():
+            if out is None:
+                out = np.empty((n, journal.dim), dtype=np.float32)
+            journal.fill(ids, np.flatnonzero(done), out)
+            todo = np.flatnonzero(~done)
+            print(f"[embeddings] Resumed {int(done.sum())}/{n} rows from journal")
+    total_batches = (len(todo) + batch_size - 1) // batch_size
+
+    print(f"[embeddings] Processing {len(todo)} texts in batches of {batch_size} (delay: {batch_delay}s)")
+    for b, j in enumerate(range(0, len(todo), batch_size)):
+        pos = todo[j:j + batch_size]
+        batch = [texts[p] for p in pos]
+        batch_num = b + 1
+        contiguous = pos[-1] - pos[0] + 1 == len(pos)
+        with telemetry.span("embeddings.batch", batch=batch_num, rows=len(pos)):
+            if embed_fn is None and out is not None and contiguous:
+                embed_into(batch, out=out[pos[0]:pos[-1] + 1])  # decoded in place
+            else:
+                if embed_fn is None:
+                    rows, ok = embed_into(batch)
+                    if not ok.any():
+                        rows = None  # zeros of a guessed width (EMBED_DIM_FALLBACK); never size `out` from them
+                else:
+                    batch_embeddings = embed_fn(batch)
+                    if batch_embeddings is None or len(batch_embeddings) == 0:
+                        raise RuntimeError(f"Failed to generate embeddings for batch {batch_num}")
+                    rows = np.asarray(batch_embeddings, dtype=np.float32)
+                if out is None and rows is not None:
+                    # first real dimension; zero-filled so rows of earlier failed batches stay zero (pending)
+                    out = np.zeros((n, rows.shape[1]), dtype=np.float32)
+                if out is not None:
+                    out[pos] = 0.0 if rows is None else rows
+        telemetry.count("embeddings.rows", len(pos))
+        if journal is not None and out is not None:
+            written = out[pos]
+            ok = np.flatnonzero(np.any(written, axis=1))  # zero rows failed; never journal them
+            journal.append([ids[pos[k]] for k in ok], [keys[pos[k]] for k in ok], written[ok])
         print(f"[embeddings] Completed batch {batch_num}/{total_batches}")
-        
+
         # Add delay between batches (except for last batch)
         if batch_num < total_batches:
-            import time
             time.sleep(batch_delay)
-    
-    if not embeddings_list:
-        raise RuntimeError("Failed to generate embeddings")
-    emb_matrix = np.asarray(embeddings_list, dtype=np.float32)
-    index = build_faiss_index(embeddings_list, index_type=index_type)
-
-    # Persist
-    save_embeddings(emb_matrix)
-    save_faiss_index(index)
-    save_metadata(metadata)
-
-    return index, list(metadata), emb_matrix
+    if out is None:  # every batch failed: all rows zero, dimension unknown
+        out = np.zeros((n, config.EMBED_DIM_FALLBACK), dtype=np.float32)
+    return out
 
 __all__ = [
     "save_documents",
     "load_documents",
     "save_chunks",
     "load_chunks",
+    "iter_cached_chunks",
+    "get_chunk",
+    "load_doc_chunks",
+    "export_chunks_json",
     "save_embeddings",
     "load_embeddings",
     "save_faiss_index",
     "load_faiss_index",
+    "load_readonly_index",
     "save_metadata",
     "load_metadata",
+    "load_neighbors",
+    "save_index_bundle",
+    "load_index_bundle",
+    "embed_texts",
     "build_or_load_index",
 ]
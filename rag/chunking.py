@@ -4,11 +4,11 @@ Initial simple implementation mirrors existing logic (paragraph grouping) but
 is modular so it can be swapped for more advanced approaches later.
 """
 from __future__ import annotations
-from typing import List, Dict
+from typing import List, Dict, Optional
 import re
 import uuid
 
-from .config import SEMANTIC_MAX_WORDS
+from . import config, telemetry
 from .models import Document, Chunk
 
 __all__ = ["split_by_semantic_boundaries", "SemanticChunker"]
@@ -16,7 +16,8 @@ __all__ = ["split_by_semantic_boundaries", "SemanticChunker"]
 def _normalize_whitespace(text: str) -> str:
     return re.sub(r"\s+", " ", text or "").strip()
 
-def split_by_semantic_boundaries(text: str, max_words: int = SEMANTIC_MAX_WORDS) -> List[Dict]:
+def split_by_semantic_boundaries(text: str, max_words: Optional[int] = None) -> List[Dict]:
+    max_words = max_words or config.SEMANTIC_MAX_WORDS
     paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
     chunks: List[Dict] = []
     cur = []
@@ -40,14 +41,17 @@ def split_by_semantic_boundaries(text: str, max_words: int = SEMANTIC_MAX_WORDS)
 class SemanticChunker:
     """Semantic chunker that splits documents into chunks with semantic boundaries."""
 
-    def __init__(self, max_words: int = SEMANTIC_MAX_WORDS):
-        self.max_words = max_words
+    def __init__(self, max_words: Optional[int] = None):
+        self.max_words = max_words or config.SEMANTIC_MAX_WORDS
 
-    def chunk_documents(self, documents: List[Document]) -> List[Chunk]:
+    @telemetry.traced("chunking")
+    def chunk_documents(self, documents: List[Document], dedupe: bool = False) -> List[Chunk]:
         """Chunk a list of documents.
 
         Args:
             documents: List of Document objects to chunk
+            dedupe: Collapse exact / near-duplicate chunks onto the first
+                copy, keeping the others' citations (`rag.dedup`)
 
         Returns:
             List of Chunk objects
@@ -69,4 +73,8 @@ class SemanticChunker:
                 )
                 all_chunks.append(chunk)
 
+        if dedupe:
+            from .dedup import dedupe_chunks
+            all_chunks = dedupe_chunks(all_chunks)
+        telemetry.annotate(documents=len(documents), chunks=len(all_chunks))
         return all_chunks
@@ -0,0 +1,225 @@
+"""Compact binary record store for chunks (and other flat dataclasses).
+
+File layout::
+
+    b"RAGREC1\\n"                      magic
+    uint32 (LE) + JSON header        {"type": ..., "fields": [[name, kind], ...]}
+    (record + b"\\x1e")*              one UTF-8 record per dataclass instance
+
+A record is the field values joined by NUL, so a whole block of records is
+decoded with one ``bytes.decode`` and split with two ``str.split`` calls -- no
+per-field framing or JSON parsing on the hot path. A record whose values
+themselves contain NUL / RS characters is written as ``\\x02`` + JSON array
+instead (JSON escapes control characters). Field kinds are ``str``, ``int``
+and ``json`` (anything else, e.g. lists/dicts). An empty ``json`` list (the
+usual ``duplicate_sources``) is decoded inline without calling the parser.
+
+The header records field names, so files written by an older model (fields
+added or removed since) still load; unknown fields are dropped and missing
+ones take their dataclass defaults.
+
+Readers and writers stream: `iter_records` parses fixed-size blocks (cut at
+the last record terminator, which never occurs inside a multi-byte UTF-8
+sequence) and yields instances one at a time; `RecordWriter` appends to a
+temp file and atomically renames it into place on close.
+"""
+from __future__ import annotations
+from dataclasses import fields as dc_fields, MISSING
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, List, Sequence, Tuple, Type, TypeVar
+import gc
+import json
+import os
+import struct
+import tempfile
+
+from .models import Chunk
+
+__all__ = [
+    "RecordWriter",
+    "iter_records",
+    "write_records",
+    "read_records",
+    "write_chunks",
+    "iter_chunks",
+    "read_chunks",
+]
+
+T = TypeVar("T")
+
+MAGIC = b"RAGREC1\n"
+BLOCK_SIZE = 1 << 20
+_LEN = struct.Struct("<I")
+_SEP = "\x00"
+_END = "\x1e"
+_END_BYTE = b"\x1e"
+_JSON_MARK = "\x02"
+
+
+def _field_kinds(cls: type) -> List[Tuple[str, str]]:
+    kinds = []
+    for f in dc_fields(cls):
+        t = f.type if isinstance(f.type, str) else getattr(f.type, "__name__", "")
+        kinds.append((f.name, t if t in ("str", "int") else "json"))
+    return kinds
+
+
+def _encode_value(value: Any, kind: str) -> str:
+    if kind == "str":
+        return value if isinstance(value, str) else ("" if value is None else str(value))
+    if kind == "int":
+        return str(int(value))
+    return json.dumps(value, ensure_ascii=False)
+
+
+class RecordWriter:
+    """Streaming writer; use as a context manager.
+
+    The file only appears at `path` once the writer closes cleanly, so a crash
+    mid-write never leaves a truncated store behind.
+    """
+
+    def __init__(self, path: Path | str, cls: type = Chunk):
+        self.path = Path(path)
+        self.cls = cls
+        self._kinds = _field_kinds(cls)
+        self.count = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        self._tmp_path = Path(tmp)
+        self._fh = os.fdopen(fd, "wb", buffering=BLOCK_SIZE)
+        header = json.dumps({"type": cls.__name__, "fields": self._kinds}).encode("utf-8")
+        self._fh.write(MAGIC + _LEN.pack(len(header)) + header)
+
+    def write(self, obj: Any):
+        parts = [_encode_value(getattr(obj, n), k) for n, k in self._kinds]
+        record = _SEP.join(parts)
+        if record.count(_SEP) != len(parts) - 1 or _END in record or record.startswith(_JSON_MARK):
+            record = _JSON_MARK + json.dumps(parts, ensure_ascii=False)
+        self._fh.write((record + _END).encode("utf-8"))
+        self.count += 1
+
+    def write_many(self, objs: Iterable[Any]) -> int:
+        for obj in objs:
+            self.write(obj)
+        return self.count
+
+    def close(self):
+        if self._fh.closed:
+            return
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._fh.close()
+        self._tmp_path.replace(self.path)
+
+    def abort(self):
+        if not self._fh.closed:
+            self._fh.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "RecordWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _make_decoder(cls: Type[T], kinds: Sequence[Tuple[str, str]]) -> Callable[[str], List[T]]:
+    names = [n for n, _ in kinds]
+    n_fields = len(names)
+    int_idx = [i for i, (_, k) in enumerate(kinds) if k == "int"]
+    json_idx = [i for i, (_, k) in enumerate(kinds) if k == "json"]
+    model = {f.name: f for f in dc_fields(cls)}
+    positional = names == [f.name for f in dc_fields(cls)]
+    if not positional:
+        keep = [(i, n) for i, n in enumerate(names) if n in model]
+        missing = [f for n, f in model.items() if n not in names and f.default is MISSING and f.default_factory is MISSING]
+        if missing:
+            raise ValueError(f"Record store lacks required field(s) {[f.name for f in missing]} for {cls.__name__}")
+
+    def convert(values: List[Any]) -> T:
+        if len(values) != n_fields:
+            raise ValueError(f"Corrupt record: expected {n_fields} fields, got {len(values)}")
+        for i in int_idx:
+            values[i] = int(values[i]) if values[i] else 0
+        for i in json_idx:
+            values[i] = json.loads(values[i]) if values[i] else None
+        if positional:
+            return cls(*values)
+        return cls(**{n: values[i] for i, n in keep})
+
+    def decode(text: str) -> List[T]:
+        records = text.split(_END)
+        if _JSON_MARK in text or not positional:
+            return [convert(json.loads(r[1:]) if r.startswith(_JSON_MARK) else r.split(_SEP)) for r in records]
+        # Fast path: plain NUL-joined records matching the model's field order.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()  # allocation-heavy loop of acyclic objects; skip generational scans
+        loads = json.loads
+        try:
+            out: List[T] = []
+            append = out.append
+            for record in records:
+                values = record.split(_SEP)
+                for i in int_idx:
+                    values[i] = int(values[i]) if values[i] else 0
+                for i in json_idx:  # almost always an empty list (e.g. duplicate_sources): no parser call
+                    v = values[i]
+                    values[i] = [] if v == "[]" else (loads(v) if v else None)
+                append(cls(*values))
+            return out
+        except TypeError:
+            return [convert(r.split(_SEP)) for r in records]
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    return decode
+
+
+def iter_records(path: Path | str, cls: Type[T] = Chunk) -> Iterator[T]:
+    """Yield instances of `cls` from a record store, reading in blocks."""
+    with open(path, "rb") as fh:
+        if fh.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a record store (bad magic)")
+        (hlen,) = _LEN.unpack(fh.read(_LEN.size))
+        header = json.loads(fh.read(hlen).decode("utf-8"))
+        decode = _make_decoder(cls, [tuple(fk) for fk in header["fields"]])
+        pending = b""
+        while True:
+            block = fh.read(BLOCK_SIZE)
+            if not block:
+                break
+            data = pending + block if pending else block
+            cut = data.rfind(_END_BYTE)
+            if cut < 0:
+                pending = data
+                continue
+            pending = data[cut + 1:]
+            yield from decode(data[:cut].decode("utf-8"))
+        if pending:
+            raise ValueError(f"{path} is truncated ({len(pending)} trailing bytes)")
+
+
+def write_records(path: Path | str, objs: Iterable[Any], cls: type = Chunk) -> int:
+    with RecordWriter(path, cls) as writer:
+        return writer.write_many(objs)
+
+
+def read_records(path: Path | str, cls: Type[T] = Chunk) -> List[T]:
+    return list(iter_records(path, cls))
+
+
+def write_chunks(path: Path | str, chunks: Iterable[Chunk]) -> int:
+    return write_records(path, chunks, Chunk)
+
+
+def iter_chunks(path: Path | str) -> Iterator[Chunk]:
+    return iter_records(path, Chunk)
+
+
+def read_chunks(path: Path | str) -> List[Chunk]:
+    return read_records(path, Chunk)
@@ -0,0 +1,177 @@
+"""Memory-mappable column store for chunk metadata.
+
+``metadata.json`` has to be parsed into one dict per chunk by every process
+that serves queries. This store keeps each metadata key as a column on disk so
+serving workers can ``mmap`` it read-only and share the pages through the OS
+page cache; rows are only materialized for the hits actually returned.
+
+Directory layout::
+
+    columns.json              {"count": n, "columns": [{"name", "kind", "masked"}, ...]}
+    <i>.data                  str/json columns: concatenated UTF-8 values
+    <i>.offsets.npy           str/json columns: int64 offsets, length n + 1
+    <i>.values.npy            int/float columns: fixed-width values
+    <i>.mask.npy              only when some rows lack the key
+
+Column kinds: ``str``, ``int``, ``float`` and ``json`` (anything else).
+"""
+from __future__ import annotations
+from collections.abc import Sequence as SequenceABC
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+import json
+import shutil
+import tempfile
+import numpy as np
+
+__all__ = ["write_columns", "ColumnarMetadata"]
+
+MANIFEST = "columns.json"
+
+
+def _kind_of(values: Iterable[Any]) -> str:
+    kinds = set()
+    for v in values:
+        if isinstance(v, bool):
+            kinds.add("json")
+        elif isinstance(v, str):
+            kinds.add("str")
+        elif isinstance(v, int):
+            kinds.add("int")
+        elif isinstance(v, float):
+            kinds.add("float")
+        else:
+            kinds.add("json")
+    if kinds <= {"int"}:
+        return "int"
+    if kinds <= {"int", "float"}:
+        return "float"
+    if kinds == {"str"}:
+        return "str"
+    return "json"
+
+
+def write_columns(directory: Path | str, rows: Sequence[Dict[str, Any]]) -> Path:
+    """Write `rows` as a column store, atomically replacing `directory`."""
+    directory = Path(directory)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    names: Dict[str, None] = {}
+    for row in rows:
+        names.update(dict.fromkeys(row))
+    tmp = Path(tempfile.mkdtemp(dir=directory.parent, prefix=f".{directory.name}."))
+    try:
+        columns = []
+        n = len(rows)
+        for i, name in enumerate(names):
+            present = np.fromiter((name in row for row in rows), dtype=bool, count=n)
+            masked = not bool(present.all())
+            values = [row.get(name) for row in rows]
+            kind = _kind_of(v for v, p in zip(values, present) if p)
+            if kind in ("int", "float"):
+                dtype = np.int64 if kind == "int" else np.float64
+                arr = np.array([v if p else 0 for v, p in zip(values, present)], dtype=dtype)
+                np.save(tmp / f"{i}.values.npy", arr)
+            else:
+                encode = (lambda v: v or "") if kind == "str" else (lambda v: json.dumps(v, ensure_ascii=False))
+                parts = [encode(v).encode("utf-8") if p else b"" for v, p in zip(values, present)]
+                offsets = np.zeros(n + 1, dtype=np.int64)
+                np.cumsum([len(b) for b in parts], out=offsets[1:])
+                (tmp / f"{i}.data").write_bytes(b"".join(parts))
+                np.save(tmp / f"{i}.offsets.npy", offsets)
+            if masked:
+                np.save(tmp / f"{i}.mask.npy", present)
+            columns.append({"name": name, "kind": kind, "masked": masked})
+        (tmp / MANIFEST).write_text(json.dumps({"count": n, "columns": columns}), "utf-8")
+        _swap_dir(tmp, directory)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return directory
+
+
+def _swap_dir(tmp: Path, directory: Path):
+    """Move the finished directory `tmp` to `directory`, replacing any previous one."""
+    if directory.exists():
+        old = directory.with_name(f".{directory.name}.old")
+        shutil.rmtree(old, ignore_errors=True)
+        directory.replace(old)
+        tmp.replace(directory)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        tmp.replace(directory)
+
+
+class _Column:
+    __slots__ = ("name", "kind", "values", "data", "offsets", "mask")
+
+    def __init__(self, directory: Path, i: int, spec: Dict[str, Any]):
+        self.name = spec["name"]
+        self.kind = spec["kind"]
+        self.values = self.data = self.offsets = self.mask = None
+        if self.kind in ("int", "float"):
+            self.values = np.load(directory / f"{i}.values.npy", mmap_mode="r")
+        else:
+            self.offsets = np.load(directory / f"{i}.offsets.npy", mmap_mode="r")
+            data_path = directory / f"{i}.data"
+            # np.memmap cannot map empty files
+            self.data = np.memmap(data_path, dtype=np.uint8, mode="r") if data_path.stat().st_size else np.zeros(0, np.uint8)
+        if spec.get("masked"):
+            self.mask = np.load(directory / f"{i}.mask.npy", mmap_mode="r")
+
+    def has(self, row: int) -> bool:
+        return self.mask is None or bool(self.mask[row])
+
+    def get(self, row: int) -> Any:
+        if self.values is not None:
+            v = self.values[row]
+            return int(v) if self.kind == "int" else float(v)
+        start, stop = int(self.offsets[row]), int(self.offsets[row + 1])
+        text = self.data[start:stop].tobytes().decode("utf-8")
+        return text if self.kind == "str" else json.loads(text)
+
+
+class ColumnarMetadata(SequenceABC):
+    """Read-only, lazily materialized sequence of metadata dicts.
+
+    Opening is O(number of columns): only the manifest is parsed, everything
+    else is memory-mapped. Indexing returns a fresh dict for that row.
+    """
+
+    def __init__(self, directory: Path | str):
+        self.directory = Path(directory)
+        manifest = json.loads((self.directory / MANIFEST).read_text("utf-8"))
+        self._count = int(manifest["count"])
+        self._columns = [_Column(self.directory, i, spec) for i, spec in enumerate(manifest["columns"])]
+
+    @classmethod
+    def open(cls, directory: Path | str) -> Optional["ColumnarMetadata"]:
+        directory = Path(directory)
+        return cls(directory) if (directory / MANIFEST).exists() else None
+
+    @property
+    def columns(self) -> List[str]:
+        return [c.name for c in self._columns]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        i = int(i)
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return {c.name: c.get(i) for c in self._columns if c.has(i)}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(self._count):
+            yield self[i]
+
+    def value(self, i: int, name: str, default: Any = None) -> Any:
+        """Single field lookup without building the whole row."""
+        for c in self._columns:
+            if c.name == name:
+                return c.get(i) if c.has(i) else default
+        return default
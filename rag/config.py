@@ -1,36 +1,59 @@
 """Central configuration loading for the medical RAG project.
 
-Loads environment variables from a `.env` file if present and exposes
-constants with safe access patterns. This module should be imported
-by other modules instead of re-reading the environment.
+Exposes constants with safe access patterns. This module should be
+imported by other modules instead of re-reading the environment.
+
+Nothing happens at import time. Values are resolved on first attribute
+access (PEP 562 module ``__getattr__``) and then cached as module globals:
+
+- the first environment-derived value loads ``.env`` (if present) into the
+  process environment, without overriding variables that are already set;
+- ``DATA_DIR`` / ``PDF_DIR`` / ``CACHE_DIR`` are created when first read;
+- required Azure settings raise only when they are actually read, so search
+  and offline tools run without credentials until a network call is made.
+
+Other modules follow suit: settings are read as ``config.NAME`` inside
+functions (parameters default to None), and paths under ``CACHE_DIR`` are
+lazy module attributes built with `lazy_paths`, so importing any ``rag``
+module neither loads ``.env`` nor creates directories.
 """
 from __future__ import annotations
 import os
+import sys
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Dict, Optional
 
-from dotenv import dotenv_values  # type: ignore
-
-# Project root resolution
+# Project root resolution (pure path arithmetic, no I/O)
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
-DATA_DIR = PROJECT_ROOT / "data_pilot"
-PDF_DIR = DATA_DIR / "pdfs"
-CACHE_DIR = PROJECT_ROOT / "cache"
-for d in (DATA_DIR, PDF_DIR, CACHE_DIR):
-    d.mkdir(exist_ok=True, parents=True)
-
-_env = {}
-if (PROJECT_ROOT / ".env").exists():
-    # Raw load (does not mutate os.environ)
-    _env = dotenv_values(PROJECT_ROOT / ".env")  # type: ignore
-    # Inject into process env if not already set so downstream modules using os.getenv see them.
-    for k, v in _env.items():
-        if v is None:
-            continue
-        # strip leading/trailing whitespace (common when .env lines are indented in notebooks)
-        cleaned = str(v).strip().strip('"')
-        if k not in os.environ and cleaned:
-            os.environ[k] = cleaned
+
+_env: Dict[str, Optional[str]] = {}
+_env_loaded = False
+_env_lock = threading.Lock()
+
+
+def load_env():
+    """Load ``.env`` into ``os.environ`` once (idempotent, thread-safe)."""
+    global _env, _env_loaded
+    if _env_loaded:
+        return
+    with _env_lock:
+        if _env_loaded:
+            return
+        if (PROJECT_ROOT / ".env").exists():
+            from dotenv import dotenv_values  # type: ignore
+            # Raw load (does not mutate os.environ)
+            _env = dotenv_values(PROJECT_ROOT / ".env")  # type: ignore
+            # Inject into process env if not already set so downstream modules using os.getenv see them.
+            for k, v in _env.items():
+                if v is None:
+                    continue
+                # strip leading/trailing whitespace (common when .env lines are indented in notebooks)
+                cleaned = str(v).strip().strip('"')
+                if k not in os.environ and cleaned:
+                    os.environ[k] = cleaned
+        _env_loaded = True
+
 
 def _normalize_endpoint(ep: str | None) -> str | None:
     if not ep:
@@ -49,33 +72,147 @@ def _get(name: str, required: bool = False, default: Optional[str] = None) -> Op
         raise RuntimeError(f"Missing required environment variable: {name}")
     return val
 
-# Azure / OpenAI
-AZURE_OPENAI_ENDPOINT = _normalize_endpoint(_get("AZURE_OPENAI_ENDPOINT", required=True))  # e.g. https://xxx.openai.azure.com
-AZURE_OPENAI_API_KEY = _get("AZURE_OPENAI_API_KEY", required=True)
-AOAI_EMBED_MODEL = _get("AOAI_EMBED_MODEL", required=True)
-AOAI_CHAT_MODEL = _get("AOAI_CHAT_MODEL", required=True)
-
-# Cosmos (optional if not used in refactored subset yet)
-COSMOS_ENDPOINT = _get("COSMOS_ENDPOINT")
-COSMOS_KEY = _get("COSMOS_KEY")
-COSMOS_DB_NAME = _get("COSMOS_DB_NAME")
-COSMOS_CONTAINER = _get("COSMOS_CONTAINER")
-
-# Chunk / header constants (centralized)
-SEMANTIC_MAX_WORDS = int(os.getenv("SEMANTIC_MAX_WORDS", 300))
-HEADER_MAX_CHARS = int(os.getenv("HEADER_MAX_CHARS", 200))
-
-# Concurrency / rate limits
-REQUESTS_PER_MIN = int(os.getenv("REQUESTS_PER_MIN", 60))
-TOKENS_PER_MIN = int(os.getenv("TOKENS_PER_MIN", 60000))
-EST_TOKENS_PER_REQUEST = int(os.getenv("EST_TOKENS_PER_REQUEST", 200))
-MAX_CONCURRENT = int(os.getenv("MAX_CONCURRENT", 8))
-BATCH_SIZE = int(os.getenv("HEADER_BATCH_SIZE", 50))
-
-# Embeddings - Conservative settings to avoid 429 errors
-EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 5))  # Reduced from 10 to 5
-EMBED_DELAY_SECONDS = float(os.getenv("EMBED_DELAY_SECONDS", 2.0))  # Delay between batches
-EMBED_DIM_FALLBACK = int(os.getenv("EMBED_DIM_FALLBACK", 3072))  # Match text-embedding-3-large
+
+def _directory(path: Path) -> Path:
+    path.mkdir(exist_ok=True, parents=True)
+    return path
+
+
+# Data directories: created on first access, independent of the environment
+_DIRS: Dict[str, Callable[[], Path]] = {
+    "DATA_DIR": lambda: _directory(PROJECT_ROOT / "data_pilot"),
+    "PDF_DIR": lambda: _directory(PROJECT_ROOT / "data_pilot" / "pdfs"),
+    "CACHE_DIR": lambda: _directory(PROJECT_ROOT / "cache"),
+}
+
+# Environment-derived settings: computed after `load_env` on first access
+_LAZY: Dict[str, Callable[[], Any]] = {
+    # Azure / OpenAI
+    "AZURE_OPENAI_ENDPOINT": lambda: _normalize_endpoint(_get("AZURE_OPENAI_ENDPOINT", required=True)),  # e.g. https://xxx.openai.azure.com
+    "AZURE_OPENAI_API_KEY": lambda: _get("AZURE_OPENAI_API_KEY", required=True),
+    "AOAI_EMBED_MODEL": lambda: _get("AOAI_EMBED_MODEL", required=True),
+    "AOAI_CHAT_MODEL": lambda: _get("AOAI_CHAT_MODEL", required=True),
+
+    # Cosmos (rag.storage, STORAGE_BACKEND=cosmos)
+    "COSMOS_ENDPOINT": lambda: _get("COSMOS_ENDPOINT"),
+    "COSMOS_KEY": lambda: _get("COSMOS_KEY"),
+    "COSMOS_DB_NAME": lambda: _get("COSMOS_DB_NAME"),
+    "COSMOS_CONTAINER": lambda: _get("COSMOS_CONTAINER"),
+
+    # Document / chunk persistence (rag.storage)
+    "STORAGE_BACKEND": lambda: os.getenv("STORAGE_BACKEND", "files"),  # files | sqlite | cosmos
+    "STORAGE_SQLITE_PATH": lambda: os.getenv("STORAGE_SQLITE_PATH", ""),  # empty = CACHE_DIR/rag.sqlite
+    "STORAGE_UPSERT_CONCURRENCY": lambda: int(os.getenv("STORAGE_UPSERT_CONCURRENCY", 8)),  # parallel Cosmos partition batches
+
+    # Chunk / header constants (centralized)
+    "SEMANTIC_MAX_WORDS": lambda: int(os.getenv("SEMANTIC_MAX_WORDS", 300)),
+    "HEADER_MAX_CHARS": lambda: int(os.getenv("HEADER_MAX_CHARS", 200)),
+
+    # Header prompts (rag.headers)
+    "HEADER_ADVANCED": lambda: os.getenv("HEADER_ADVANCED", "1") == "1",  # advanced prompt style; 0 = basic
+    "HEADER_CHUNK_HEAD": lambda: int(os.getenv("HEADER_CHUNK_HEAD", 850)),  # chunk chars kept from the start...
+    "HEADER_CHUNK_TAIL": lambda: int(os.getenv("HEADER_CHUNK_TAIL", 350)),  # ...and from the end
+    "HEADER_NEIGHBOR_CHARS": lambda: int(os.getenv("HEADER_NEIGHBOR_CHARS", 140)),  # prev/next chunk snippet
+    "HEADER_DOC_SUMMARY_CHARS": lambda: int(os.getenv("HEADER_DOC_SUMMARY_CHARS", 600)),
+    "HEADER_KEYWORD_COUNT": lambda: int(os.getenv("HEADER_KEYWORD_COUNT", 12)),
+    "HEADER_WINDOW": lambda: int(os.getenv("HEADER_WINDOW", 1)),  # consecutive chunks per request (advanced mode); 1 = off
+    "HEADER_MAX_COMPLETION_TOKENS": lambda: int(os.getenv("HEADER_MAX_COMPLETION_TOKENS", 800)),  # azure_chat_completion output cap
+    "HEADER_CACHE_PREFIX_TOKENS": lambda: int(os.getenv("HEADER_CACHE_PREFIX_TOKENS", 0)),  # pad document prefixes to this (providers cache from 1024); 0 = off
+
+    # Near-duplicate chunk collapsing (rag.dedup)
+    "DEDUPE_THRESHOLD": lambda: float(os.getenv("DEDUPE_THRESHOLD", 0.9)),  # min estimated Jaccard of word shingles
+
+    # Concurrency / rate limits
+    "REQUESTS_PER_MIN": lambda: int(os.getenv("REQUESTS_PER_MIN", 60)),
+    "TOKENS_PER_MIN": lambda: int(os.getenv("TOKENS_PER_MIN", 60000)),
+    "EST_TOKENS_PER_REQUEST": lambda: int(os.getenv("EST_TOKENS_PER_REQUEST", 200)),
+    "MAX_CONCURRENT": lambda: int(os.getenv("MAX_CONCURRENT", 8)),
+    "BATCH_SIZE": lambda: int(os.getenv("HEADER_BATCH_SIZE", 50)),
+
+    # Embeddings - Conservative settings to avoid 429 errors
+    "EMBED_BATCH_SIZE": lambda: int(os.getenv("EMBED_BATCH_SIZE", 5)),  # Reduced from 10 to 5
+    "EMBED_DELAY_SECONDS": lambda: float(os.getenv("EMBED_DELAY_SECONDS", 2.0)),  # Delay between batches
+    "EMBED_DIM_FALLBACK": lambda: int(os.getenv("EMBED_DIM_FALLBACK", 3072)),  # Match text-embedding-3-large
+
+    # Local LSA embedder / API failover (rag.local_embeddings)
+    "LOCAL_EMBED_DIM": lambda: int(os.getenv("LOCAL_EMBED_DIM", 256)),  # SVD components
+    "LOCAL_EMBED_MAX_FEATURES": lambda: int(os.getenv("LOCAL_EMBED_MAX_FEATURES", 100000)),  # TF-IDF vocabulary cap
+    "LOCAL_EMBED_BATCH": lambda: int(os.getenv("LOCAL_EMBED_BATCH", 1024)),  # texts per thread-pool task
+    "LOCAL_EMBED_WORKERS": lambda: int(os.getenv("LOCAL_EMBED_WORKERS", 0)),  # 0 = os.cpu_count()
+    "LOCAL_FAILOVER_COOLDOWN_SECONDS": lambda: float(os.getenv("LOCAL_FAILOVER_COOLDOWN_SECONDS", 30)),  # skip the API after a failure
+
+    # Index building (rag.index.build_faiss_index_bulk)
+    "INDEX_ADD_BATCH": lambda: int(os.getenv("INDEX_ADD_BATCH", 65536)),  # rows normalized + added per call
+    "INDEX_THREADS": lambda: int(os.getenv("INDEX_THREADS", 0)),  # FAISS OpenMP threads; 0 = library default
+    "INDEX_TRAIN_PER_LIST": lambda: int(os.getenv("INDEX_TRAIN_PER_LIST", 256)),  # IVF training sample per list
+
+    # Failed-embedding repair (rag.repair)
+    "REPAIR_INTERVAL_SECONDS": lambda: float(os.getenv("REPAIR_INTERVAL_SECONDS", 60)),  # first retry delay, doubles per round
+    "REPAIR_MAX_ROUNDS": lambda: int(os.getenv("REPAIR_MAX_ROUNDS", 8)),
+
+    # Second-stage reranking (rag.rerank)
+    "RERANK_CANDIDATES": lambda: int(os.getenv("RERANK_CANDIDATES", 20)),  # over-fetch N first-stage hits
+    "RERANK_TIMEOUT_SECONDS": lambda: float(os.getenv("RERANK_TIMEOUT_SECONDS", 1.5)),  # hard budget per query
+    "RERANK_MAX_CONCURRENT": lambda: int(os.getenv("RERANK_MAX_CONCURRENT", 4)),
+    "RERANK_CACHE_SIZE": lambda: int(os.getenv("RERANK_CACHE_SIZE", 1024)),
+
+    # Semantic result cache (rag.semantic_cache)
+    "SEMANTIC_CACHE_THRESHOLD": lambda: float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95)),  # min cosine to reuse results
+    "SEMANTIC_CACHE_SIZE": lambda: int(os.getenv("SEMANTIC_CACHE_SIZE", 2048)),
+
+    # Grounded answers (rag.answer)
+    "ANSWER_CONTEXT_TOKENS": lambda: int(os.getenv("ANSWER_CONTEXT_TOKENS", 6000)),  # prompt budget for packed chunks
+    "ANSWER_MAX_TOKENS": lambda: int(os.getenv("ANSWER_MAX_TOKENS", 4000)),  # max_completion_tokens per answer
+    "ANSWER_CACHE_SIZE": lambda: int(os.getenv("ANSWER_CACHE_SIZE", 256)),
+
+    # Async search service (rag.service)
+    "SERVICE_HOST": lambda: os.getenv("SERVICE_HOST", "0.0.0.0"),
+    "SERVICE_PORT": lambda: int(os.getenv("SERVICE_PORT", 8080)),
+    "SERVICE_COALESCE_MS": lambda: float(os.getenv("SERVICE_COALESCE_MS", 5)),  # batching window for concurrent queries
+    "SERVICE_MAX_BATCH": lambda: int(os.getenv("SERVICE_MAX_BATCH", 64)),
+    "SERVICE_MAX_TOP_K": lambda: int(os.getenv("SERVICE_MAX_TOP_K", 50)),
+
+    # Index snapshots (rag.snapshots)
+    "SNAPSHOT_KEEP": lambda: int(os.getenv("SNAPSHOT_KEEP", 3)),  # published snapshots retained on disk
+    "SNAPSHOT_POLL_SECONDS": lambda: float(os.getenv("SNAPSHOT_POLL_SECONDS", 2.0)),  # hot-reload check interval
+
+    # Stage timing / metrics (rag.telemetry); off unless enabled
+    "TELEMETRY_ENABLED": lambda: os.getenv("TELEMETRY_ENABLED", "0") == "1",
+    "TELEMETRY_JSONL": lambda: os.getenv("TELEMETRY_JSONL", ""),  # span log path; empty = none
+    "TELEMETRY_PROMETHEUS": lambda: os.getenv("TELEMETRY_PROMETHEUS", ""),  # text exposition path written on flush/exit
+}
+
+def lazy_paths(module: str, factories: Dict[str, Callable[[], Path]]):
+    """``(path, __getattr__)`` for a module's paths derived from configuration.
+
+    Assign the returned ``__getattr__`` in the module (PEP 562) so
+    ``module.NAME`` calls ``factories[NAME]()`` on every access, following
+    later changes to e.g. ``CACHE_DIR``. Code inside the module calls
+    ``path(NAME)``, which prefers a value assigned on the module (a test
+    override) over the factory.
+    """
+    def path(name: str) -> Path:
+        namespace = vars(sys.modules[module])
+        return namespace[name] if name in namespace else factories[name]()
+
+    def module_getattr(name: str) -> Path:
+        if name in factories:
+            return factories[name]()
+        raise AttributeError(f"module {module!r} has no attribute {name!r}")
+
+    return path, module_getattr
+
+
+class _Default:
+    """Marker for path parameters whose default lives under CACHE_DIR (None disables)."""
+
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "DEFAULT"
+
+
+DEFAULT: Any = _Default()
 
 # Persistence paths
 INDEX_PATH = PROJECT_ROOT / "faiss_medical_index.bin"
@@ -83,7 +220,27 @@ CHUNK_METADATA_PATH = PROJECT_ROOT / "chunk_metadata.json"
 
 VERSION = "0.1.0"
 
+
+def __getattr__(name: str) -> Any:
+    factory = _DIRS.get(name)
+    if factory is None:
+        factory = _LAZY.get(name)
+        if factory is None:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+        load_env()
+    value = factory()
+    globals()[name] = value  # later reads are plain global lookups
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_DIRS) | set(_LAZY))
+
+
 __all__ = [
+    "load_env",
+    "lazy_paths",
+    "DEFAULT",
     "PROJECT_ROOT",
     "DATA_DIR",
     "PDF_DIR",
@@ -96,8 +253,12 @@ __all__ = [
     "COSMOS_KEY",
     "COSMOS_DB_NAME",
     "COSMOS_CONTAINER",
+    "STORAGE_BACKEND",
+    "STORAGE_SQLITE_PATH",
+    "STORAGE_UPSERT_CONCURRENCY",
     "SEMANTIC_MAX_WORDS",
     "HEADER_MAX_CHARS",
+    "DEDUPE_THRESHOLD",
     "REQUESTS_PER_MIN",
     "TOKENS_PER_MIN",
     "EST_TOKENS_PER_REQUEST",
@@ -106,6 +267,35 @@ __all__ = [
     "EMBED_BATCH_SIZE",
     "EMBED_DELAY_SECONDS",
     "EMBED_DIM_FALLBACK",
+    "LOCAL_EMBED_DIM",
+    "LOCAL_EMBED_MAX_FEATURES",
+    "LOCAL_EMBED_BATCH",
+    "LOCAL_EMBED_WORKERS",
+    "LOCAL_FAILOVER_COOLDOWN_SECONDS",
+    "INDEX_ADD_BATCH",
+    "INDEX_THREADS",
+    "INDEX_TRAIN_PER_LIST",
+    "REPAIR_INTERVAL_SECONDS",
+    "REPAIR_MAX_ROUNDS",
+    "RERANK_CANDIDATES",
+    "RERANK_TIMEOUT_SECONDS",
+    "RERANK_MAX_CONCURRENT",
+    "RERANK_CACHE_SIZE",
+    "SEMANTIC_CACHE_THRESHOLD",
+    "SEMANTIC_CACHE_SIZE",
+    "ANSWER_CONTEXT_TOKENS",
+    "ANSWER_MAX_TOKENS",
+    "ANSWER_CACHE_SIZE",
+    "SERVICE_HOST",
+    "SERVICE_PORT",
+    "SERVICE_COALESCE_MS",
+    "SERVICE_MAX_BATCH",
+    "SERVICE_MAX_TOP_K",
+    "SNAPSHOT_KEEP",
+    "SNAPSHOT_POLL_SECONDS",
+    "TELEMETRY_ENABLED",
+    "TELEMETRY_JSONL",
+    "TELEMETRY_PROMETHEUS",
     "INDEX_PATH",
     "CHUNK_METADATA_PATH",
     "VERSION",
@@ -0,0 +1,231 @@
+"""Near-duplicate chunk detection (MinHash + LSH) ahead of header and embedding work.
+
+NCI PDQ patient / health-professional versions and USPSTF pages repeat long
+boilerplate passages. Each copy used to cost an LLM header call, an
+embedding call and an index slot, and then crowded other hits out of the
+top-k. `dedupe_chunks` collapses exact and near-duplicate chunks onto one
+canonical chunk (the first in corpus order) and records every other copy's
+citation in ``Chunk.duplicate_sources``:
+
+    chunks = SemanticChunker().chunk_documents(docs, dedupe=True)
+    # or: await generate_headers(docs, llm, dedupe=True)
+
+Pipeline, vectorized with NumPy:
+
+1. Normalize (lower-case alphanumeric tokens) and hash word shingles with a
+   polynomial rolling hash over corpus-wide token ids.
+2. MinHash: ``num_perm`` multiply-shift hash functions applied to all
+   shingles in blocks; per-chunk minima via ``np.minimum.reduceat``.
+3. LSH banding: chunks sharing any band of their signature become
+   candidates; candidates are verified by signature agreement (estimated
+   Jaccard) >= `threshold`.
+4. Union-find over exact-text matches and verified pairs.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence, Tuple
+from dataclasses import replace
+import hashlib
+import re
+import numpy as np
+
+from . import config
+from .models import Chunk
+
+__all__ = [
+    "minhash_signatures",
+    "near_duplicate_groups",
+    "dedupe_chunks",
+]
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_MASK32 = np.uint64(0xFFFFFFFF)
+
+
+def _shingle_hashes(texts: Sequence[str], shingle: int) -> Tuple[np.ndarray, np.ndarray]:
+    """All shingle hashes concatenated (uint64) plus each text's start offset."""
+    vocab: Dict[str, int] = {}
+    parts: List[np.ndarray] = []
+    starts = np.zeros(len(texts), dtype=np.int64)
+    total = 0
+    for i, text in enumerate(texts):
+        ids = np.fromiter((vocab.setdefault(t, len(vocab) + 1) for t in _TOKEN.findall(text.lower())), dtype=np.uint64)
+        if ids.size == 0:
+            ids = np.zeros(1, dtype=np.uint64)
+        k = min(shingle, ids.size)
+        h = np.zeros(ids.size - k + 1, dtype=np.uint64)
+        for j in range(k):  # rolling polynomial over the window, wraps mod 2**64
+            h = h * _MIX + ids[j:ids.size - k + 1 + j]
+        # splitmix64 finalizer: spread bits before the multiply-shift hashes
+        h ^= h >> np.uint64(30)
+        h *= np.uint64(0xBF58476D1CE4E5B9)
+        h ^= h >> np.uint64(27)
+        h *= np.uint64(0x94D049BB133111EB)
+        h ^= h >> np.uint64(31)
+        starts[i] = total
+        total += h.size
+        parts.append(h)
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint64), starts
+
+
+def minhash_signatures(
+    texts: Sequence[str],
+    num_perm: int = 128,
+    shingle: int = 5,
+    seed: int = 1,
+    block: int = 1 << 15,
+) -> np.ndarray:
+    """(len(texts), num_perm) uint32 MinHash signatures over word shingles."""
+    n = len(texts)
+    if n == 0:
+        return np.zeros((0, num_perm), dtype=np.uint32)
+    shingles, starts = _shingle_hashes(texts, shingle)
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1)  # odd multipliers
+    b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+    sig = np.full((n, num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+    ends = np.append(starts[1:], shingles.size)
+    # Blocks are whole texts so reduceat segments never straddle a block
+    doc = 0
+    while doc < n:
+        stop = int(np.searchsorted(ends, starts[doc] + block, side="right"))
+        stop = max(stop, doc + 1)
+        lo, hi = starts[doc], ends[stop - 1]
+        x = shingles[lo:hi]
+        hashed = ((a[:, None] * x[None, :] + b[:, None]) >> np.uint64(32)) & _MASK32
+        sig[doc:stop] = np.minimum.reduceat(hashed, starts[doc:stop] - lo, axis=1).T
+        doc = stop
+    return sig
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:  # path compression
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, x: int, y: int):
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            # smaller index wins so the canonical chunk is the earliest one
+            lo, hi = (rx, ry) if rx < ry else (ry, rx)
+            self.parent[hi] = lo
+
+
+def _exact_pairs(texts: Sequence[str]) -> List[Tuple[int, int]]:
+    first: Dict[str, int] = {}
+    pairs = []
+    for i, text in enumerate(texts):
+        key = hashlib.sha1(" ".join(_TOKEN.findall(text.lower())).encode("utf-8")).hexdigest()
+        j = first.setdefault(key, i)
+        if j != i:
+            pairs.append((j, i))
+    return pairs
+
+
+def _candidate_pairs(sig: np.ndarray, bands: int) -> np.ndarray:
+    """(m, 2) array of (bucket head, member) pairs sharing at least one LSH band."""
+    n, num_perm = sig.shape
+    rows = num_perm // bands
+    pairs = []
+    for band in range(bands):
+        keys = np.ascontiguousarray(sig[:, band * rows:(band + 1) * rows]).view(np.dtype((np.void, rows * 4))).ravel()
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        new_bucket = np.ones(n, dtype=bool)
+        new_bucket[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        head = order[np.maximum.accumulate(np.where(new_bucket, np.arange(n), 0))]
+        member = ~new_bucket
+        if member.any():
+            pairs.append(np.stack([head[member], order[member]], axis=1))
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+def near_duplicate_groups(
+    texts: Sequence[str],
+    threshold: Optional[float] = None,
+    num_perm: int = 128,
+    bands: int = 32,
+    shingle: int = 5,
+) -> Tuple[np.ndarray, int, int]:
+    """Canonical position for every text (itself when unique).
+
+    Returns ``(canonical, exact_pairs, near_pairs)``; ``canonical[i] == i``
+    for texts that are kept. `threshold` defaults to ``config.DEDUPE_THRESHOLD``.
+    """
+    if threshold is None:
+        threshold = config.DEDUPE_THRESHOLD
+    n = len(texts)
+    uf = _UnionFind(n)
+    exact = _exact_pairs(texts)
+    for x, y in exact:
+        uf.union(x, y)
+    sig = minhash_signatures(texts, num_perm=num_perm, shingle=shingle)
+    cand = _candidate_pairs(sig, bands)
+    near = 0
+    if len(cand):
+        agreement = (sig[cand[:, 0]] == sig[cand[:, 1]]).mean(axis=1)
+        for x, y in cand[agreement >= threshold]:
+            if uf.find(int(x)) != uf.find(int(y)):
+                near += 1
+            uf.union(int(x), int(y))
+    canonical = np.fromiter((uf.find(i) for i in range(n)), dtype=np.int64, count=n)
+    return canonical, len(exact), near
+
+
+def _citation(chunk: Chunk) -> Dict[str, str]:
+    return {
+        "chunk_id": chunk.chunk_id,
+        "doc_id": chunk.doc_id,
+        "doc_title": chunk.doc_title,
+        "source_org": chunk.source_org,
+        "source_url": chunk.source_url,
+        "pub_date": chunk.pub_date,
+    }
+
+
+def dedupe_chunks(
+    chunks: Sequence[Chunk],
+    threshold: Optional[float] = None,
+    stats: Optional[Dict[str, int]] = None,
+) -> List[Chunk]:
+    """Keep one canonical chunk per (near-)duplicate group, in original order.
+
+    Citations of the dropped copies are added to a copy of the canonical
+    chunk's ``duplicate_sources`` (each chunk id once); the input chunks are
+    never modified, so deduping an already-deduped list is a no-op. Pass a
+    dict as `stats` to receive counters.
+    """
+    if not chunks:
+        return []
+    canonical, exact, near = near_duplicate_groups([c.raw_chunk for c in chunks], threshold)
+    extra: Dict[int, List[Dict[str, str]]] = {}
+    for i, chunk in enumerate(chunks):
+        c = int(canonical[i])
+        if c != i:  # a dropped copy brings its own citation and any it already carried
+            extra.setdefault(c, []).extend([_citation(chunk), *chunk.duplicate_sources])
+    kept: List[Chunk] = []
+    for i, chunk in enumerate(chunks):
+        if int(canonical[i]) != i:
+            continue
+        if i in extra:
+            seen = {chunk.chunk_id, *(s.get("chunk_id") for s in chunk.duplicate_sources)}
+            sources = list(chunk.duplicate_sources)
+            for s in extra[i]:
+                if s.get("chunk_id") not in seen:
+                    seen.add(s.get("chunk_id"))
+                    sources.append(s)
+            chunk = replace(chunk, duplicate_sources=sources)
+        kept.append(chunk)
+    if stats is not None:
+        stats.update({"chunks": len(chunks), "canonical": len(kept), "exact": exact, "near": near})
+    print(f"[dedup] {len(chunks)} chunks -> {len(kept)} canonical ({len(chunks) - len(kept)} duplicates collapsed)")
+    return kept
@@ -3,20 +3,25 @@
 Keeps a single function `get_embeddings_batch` that other modules can import.
 Provides robust retry logic with exponential backoff for rate limits (429 errors)
 and returns zero vectors on failure to avoid crashing downstream logic during exploratory work.
+
+`embed_into` is the allocation-free path used for corpus builds: it requests
+base64 payloads and decodes each one straight into a row of a caller-owned
+float32 matrix (preallocated or memory-mapped), so 3072-dim vectors never
+become Python float objects. `get_embeddings_batch` wraps it for list users.
+
+The OpenAI SDK is imported by `get_client` on the first real request, and the
+model name is read from `rag.config` there too, so importing this module
+needs neither the SDK nor credentials.
 """
 from __future__ import annotations
-from typing import List, Sequence
+from typing import List, Optional, Sequence, Tuple
+import base64
 import os
 import time
 import random
 import numpy as np
 
-from .config import AOAI_EMBED_MODEL, EMBED_DIM_FALLBACK
-
-try:  # pragma: no cover - import variability
-    from openai import OpenAI, AzureOpenAI  # type: ignore
-except ImportError:  # graceful degradation
-    OpenAI = AzureOpenAI = None  # type: ignore
+from . import config, telemetry
 
 _client = None
 
@@ -33,6 +38,12 @@ def get_client():
     if _client is not None:
         return _client
 
+    try:  # pragma: no cover - import variability
+        from openai import OpenAI, AzureOpenAI  # type: ignore
+    except ImportError:  # graceful degradation
+        OpenAI = AzureOpenAI = None  # type: ignore
+
+    config.load_env()
     openai_key = os.getenv("OPENAI_API_KEY")
     az_key = os.getenv("AZURE_OPENAI_API_KEY")
     az_ep = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -58,39 +69,30 @@ def get_client():
     )
 
 
-def get_embeddings_batch(texts: Sequence[str], model: str = AOAI_EMBED_MODEL, max_retries: int = 5) -> List[List[float]]:
-    if not texts:
-        return []
-    try:
-        client = get_client()
-    except RuntimeError as cred_err:
-        # Explicit credentials error -> surface once then zero-fallback
-        print(f"[embeddings] credential error: {cred_err}")
-        return [[0.0] * EMBED_DIM_FALLBACK for _ in texts]
+def _is_rate_limit(error: Exception) -> bool:
+    error_str = str(error).lower()
+    return "429" in error_str or "rate limit" in error_str or "too many requests" in error_str
 
-    # If dummy sentinel, short-circuit
-    if client.__class__.__name__ == '_Dummy':  # type: ignore
-        return [[0.0] * EMBED_DIM_FALLBACK for _ in texts]
 
+def _create_with_retry(client, texts: Sequence[str], model: str, max_retries: int):
+    """Call the embeddings endpoint (raw base64 payload) with backoff; None after the last failure."""
     # Robust retry with exponential backoff for rate limits
     for attempt in range(max_retries):
         try:
-            resp = client.embeddings.create(input=list(texts), model=model)
-            return [d.embedding for d in resp.data]
+            with telemetry.span("embeddings.request", texts=len(texts), attempt=attempt + 1):
+                return client.embeddings.create(input=list(texts), model=model, encoding_format="base64")
         except Exception as e:
-            error_str = str(e).lower()
-            
+            telemetry.count("embeddings.request_errors", rate_limited=_is_rate_limit(e))
             # Handle rate limit errors (429) with exponential backoff
-            if "429" in error_str or "rate limit" in error_str or "too many requests" in error_str:
+            if _is_rate_limit(e):
                 if attempt < max_retries - 1:  # Don't sleep on final attempt
                     # Exponential backoff: 2^attempt + jitter, capped at 60s
                     delay = min(2 ** attempt + random.uniform(0, 1), 60)
                     print(f"[embeddings] Rate limit hit (attempt {attempt + 1}/{max_retries}), waiting {delay:.1f}s...")
                     time.sleep(delay)
                     continue
-                else:
-                    print(f"[embeddings] Rate limit exceeded after {max_retries} attempts")
-            
+                print(f"[embeddings] Rate limit exceeded after {max_retries} attempts")
+
             # Handle other errors with shorter backoff
             elif attempt < max_retries - 1:
                 delay = min(2 ** attempt, 10)  # Shorter backoff for other errors
@@ -100,15 +102,118 @@ def get_embeddings_batch(texts: Sequence[str], model: str = AOAI_EMBED_MODEL, ma
                 continue
             else:
                 print(f"[embeddings] Failed after {max_retries} attempts: {e}")
-            
-        # If we reach here, all retries failed
-        return [[0.0] * EMBED_DIM_FALLBACK for _ in texts]
-    
-    # Fallback (shouldn't reach here)
-    return [[0.0] * EMBED_DIM_FALLBACK for _ in texts]
-
-def generate_embeddings(texts: Sequence[str], model: str = AOAI_EMBED_MODEL) -> List[List[float]]:
+            return None
+    return None
+
+
+def _decode_into(embedding, row: np.ndarray):
+    """Write one API embedding into `row` without creating per-float Python objects."""
+    if isinstance(embedding, str):
+        # base64 little-endian float32 -> bytes -> viewed in place -> one memcpy into the row
+        row[:] = np.frombuffer(base64.b64decode(embedding), dtype="<f4")
+    else:  # SDK already decoded to floats (older clients / custom stubs)
+        row[:] = np.asarray(embedding, dtype=np.float32)
+
+
+def _embedding_dim(embedding) -> int:
+    if isinstance(embedding, str):
+        padding = len(embedding) - len(embedding.rstrip("="))
+        return (len(embedding) * 3 // 4 - padding) // 4
+    return len(embedding)
+
+
+def embed_into(
+    texts: Sequence[str],
+    out: Optional[np.ndarray] = None,
+    model: Optional[str] = None,
+    max_retries: int = 5,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Embed `texts` directly into the rows of a float32 matrix.
+
+    Parameters
+    ----------
+    out : ndarray | None
+        ``(len(texts), d)`` float32 destination, typically a row slice of a
+        preallocated or ``np.lib.format.open_memmap`` corpus matrix. When
+        None a matrix is allocated once the dimension is known.
+
+    Returns
+    -------
+    (matrix, ok) where `ok` is a boolean mask of rows that were embedded.
+    Failed rows are zero-filled (never allocated as Python lists). When no
+    row succeeded and `out` is None, the width is ``EMBED_DIM_FALLBACK``, a
+    guess that need not match the model, so check ``ok.any()`` before
+    sizing anything from it.
+    """
+    n = len(texts)
+    ok = np.zeros(n, dtype=bool)
+    if not n:
+        return (out if out is not None else np.zeros((0, config.EMBED_DIM_FALLBACK), dtype=np.float32)), ok
+    resp = None
+    try:
+        client = get_client()
+    except RuntimeError as cred_err:
+        # Explicit credentials error -> surface once then zero-fallback
+        print(f"[embeddings] credential error: {cred_err}")
+        client = None
+    # If dummy sentinel, short-circuit
+    if client is not None and client.__class__.__name__ != '_Dummy':  # type: ignore
+        resp = _create_with_retry(client, texts, model or config.AOAI_EMBED_MODEL, max_retries)
+
+    if resp is None or not resp.data:
+        if out is None:
+            out = np.zeros((n, config.EMBED_DIM_FALLBACK), dtype=np.float32)
+        else:
+            out[:] = 0.0
+        return out, ok
+    if out is None:
+        out = np.empty((n, _embedding_dim(resp.data[0].embedding)), dtype=np.float32)
+    for item in resp.data:
+        _decode_into(item.embedding, out[item.index])
+        ok[item.index] = True
+    if not ok.all():
+        out[~ok] = 0.0
+    return out, ok
+
+
+def get_embeddings_batch(texts: Sequence[str], model: Optional[str] = None, max_retries: int = 5) -> List[List[float]]:
+    """List-of-lists wrapper around `embed_into` for callers that expect plain Python data."""
+    if not texts:
+        return []
+    matrix, _ = embed_into(texts, model=model, max_retries=max_retries)
+    return matrix.tolist()
+
+def generate_embeddings(texts: Sequence[str], model: Optional[str] = None) -> List[List[float]]:
     """Alias for get_embeddings_batch for compatibility with existing pipeline code."""
     return get_embeddings_batch(texts, model)
 
-__all__ = ["get_embeddings_batch", "generate_embeddings"]
+
+_unnamed_warned: set = set()
+
+
+def embedding_model_name(embed_fn=None, model: Optional[str] = None) -> str:
+    """Identity of the vectors `embed_fn` produces, as recorded in manifests and journals.
+
+    An explicit `model` wins. The API path (no `embed_fn`, or this module's
+    own functions) is the configured ``AOAI_EMBED_MODEL`` deployment. Other
+    embedders should say what they are, either through `model` or a
+    ``model_name`` attribute; without one the identity falls back to
+    ``custom:<module>.<qualname>`` of the callable (with a warning), which
+    keeps its cached vectors apart from the API model's but not from a
+    retrained embedder behind the same function.
+    """
+    if model:
+        return model
+    if embed_fn is None or embed_fn in (get_embeddings_batch, generate_embeddings):
+        return config.AOAI_EMBED_MODEL
+    name = getattr(embed_fn, "model_name", None)
+    if name:
+        return str(name)
+    target = embed_fn if hasattr(embed_fn, "__qualname__") else type(embed_fn)
+    name = f"custom:{getattr(target, '__module__', None) or '?'}.{target.__qualname__}"
+    if name not in _unnamed_warned:
+        _unnamed_warned.add(name)
+        print(f"[embeddings] WARNING: embed_fn has no model_name; recording its vectors as {name!r} (pass model=... to name the model)")
+    return name
+
+__all__ = ["embed_into", "get_embeddings_batch", "generate_embeddings", "embedding_model_name"]
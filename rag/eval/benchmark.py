@@ -1,61 +1,279 @@
-"""Benchmark runner for retrieval evaluation."""
+"""Benchmark runner for retrieval evaluation.
+
+Scoring is batched: each query's expected terms are normalized once
+(`metrics.term_matcher`) and all of its results are scored together;
+per-query metrics, aggregates and the category breakdown are computed on
+``(queries, top_k)`` arrays in a single pass. Retrievers exposing
+``search_batch`` are queried in batches (one embedding call per batch).
+
+`compare_retrievers` runs several arms (e.g. baseline vs header-enhanced)
+concurrently over the same queries and reports paired deltas; nDCG of every
+arm is normalized against the results pooled over all arms. Arms sharing an
+embedding model can share one query-embedding batch (`embed_queries`).
+
+Besides the term-relevance metrics, each evaluation carries rank metrics:
+reciprocal rank (MRR in aggregates), nDCG@k with term relevance as graded
+gain, and recall@k. A result counts as relevant for MRR when its term
+relevance exceeds `RELEVANCE_THRESHOLD`, or, when the query lists
+``relevant_ids``, when its ``chunk_id`` is one of them; recall@k is the share
+of ``relevant_ids`` retrieved, or else the share of expected terms covered by
+the top-k results.
+"""
 from __future__ import annotations
-from typing import List, Dict, Any, Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Optional, Sequence, Union
 from time import perf_counter
 import numpy as np
 
-from .metrics import term_match_relevance, aggregate_retrieval_metrics
+from .metrics import term_matcher, reciprocal_ranks, ndcg_at_k
 
 __all__ = [
+    "RELEVANCE_THRESHOLD",
     "evaluate_query_results",
+    "score_results",
     "run_retrieval_benchmark",
+    "compare_retrievers",
 ]
 
-def evaluate_query_results(query_data: Dict, results: List[Dict], top_k: int = 5) -> Dict[str, Any]:
-    expected_terms = query_data.get("expected_terms", [])
-    relevance_scores = []
-    for r in results[:top_k]:
-        combined = f"{r.get('ctx_header','')} {r.get('raw_chunk','')}"
-        relevance_scores.append(term_match_relevance(combined, expected_terms))
-    evaluation = {
-        "query": query_data["query"],
-        "category": query_data.get("category", "uncategorized"),
-        "num_results": len(results),
-        "relevance_scores": relevance_scores,
-        "avg_relevance": float(np.mean(relevance_scores)) if relevance_scores else 0.0,
-        "max_relevance": float(max(relevance_scores)) if relevance_scores else 0.0,
-        "top_3_avg_relevance": float(np.mean(relevance_scores[:3])) if relevance_scores else 0.0,
-        "precision_at_1": relevance_scores[0] if relevance_scores else 0.0,
-        "has_relevant_result": any(s > 0.3 for s in relevance_scores),
-        "avg_similarity_score": float(np.mean([r.get("similarity_score", 0) for r in results[:top_k]])) if results else 0.0,
-    }
-    return evaluation
+RELEVANCE_THRESHOLD = 0.3  # term relevance above which a result counts as relevant
+
+QuerySpec = Union[str, Dict[str, Any]]
+
+
+def _result_text(r: Dict[str, Any]) -> str:
+    return f"{r.get('ctx_header','')} {r.get('raw_chunk','')}"
+
+
+def _pool_key(r: Dict[str, Any]):
+    # chunk ids differ between arms built from different texts; the raw text does not
+    return (r.get("doc_id"), (r.get("raw_chunk") or "")[:200]) if r.get("raw_chunk") else r.get("chunk_id")
+
+
+def _normalize_queries(queries: Sequence[QuerySpec]) -> List[Dict[str, Any]]:
+    return [{"query": q} if isinstance(q, str) else q for q in queries]
 
-def run_retrieval_benchmark(queries: List[Dict], retriever, top_k: int = 5, progress: Callable[[int,int,str], None] | None = None):
+
+def score_results(queries: Sequence[Dict[str, Any]], results: Sequence[List[Dict]], top_k: int = 5) -> Dict[str, np.ndarray]:
+    """Padded ``(queries, top_k)`` relevance / similarity arrays plus per-query counts and recall."""
+    nq = len(queries)
+    relevance = np.zeros((nq, top_k))
+    similarity = np.zeros((nq, top_k))
+    relevant = np.zeros((nq, top_k), dtype=bool)
+    counts = np.zeros(nq, dtype=np.int64)
+    recall = np.zeros(nq)
+    for i, (qd, res) in enumerate(zip(queries, results)):
+        res = res[:top_k]
+        n = counts[i] = len(res)
+        if not n:
+            continue
+        terms = qd.get("expected_terms", [])
+        texts = [_result_text(r) for r in res]
+        coverage = 0.0
+        if terms:
+            relevance[i, :n], coverage = term_matcher(terms).score_and_coverage(texts)
+        similarity[i, :n] = [r.get("similarity_score", 0) for r in res]
+        ids = qd.get("relevant_ids")
+        if ids:
+            wanted = set(ids)
+            relevant[i, :n] = [r.get("chunk_id") in wanted for r in res]
+            recall[i] = len({r.get("chunk_id") for r in res} & wanted) / len(wanted)
+        else:
+            relevant[i, :n] = relevance[i, :n] > RELEVANCE_THRESHOLD
+            recall[i] = coverage
+    return {"relevance": relevance, "similarity": similarity, "relevant": relevant, "num_results": counts, "recall": recall}
+
+
+def _evaluations(queries: Sequence[Dict[str, Any]], scores: Dict[str, np.ndarray], ideal_gains: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    rel, sim, n = scores["relevance"], scores["similarity"], scores["num_results"]
+    safe_n = np.maximum(n, 1)
+    cols = {
+        "avg_relevance": rel.sum(axis=1) / safe_n,
+        "max_relevance": rel.max(axis=1, initial=0.0),
+        "top_3_avg_relevance": rel[:, :3].sum(axis=1) / np.maximum(np.minimum(n, 3), 1),
+        "precision_at_1": rel[:, 0] if rel.shape[1] else np.zeros(len(n)),
+        "has_relevant_result": (rel > RELEVANCE_THRESHOLD).any(axis=1),
+        "avg_similarity_score": sim.sum(axis=1) / safe_n,
+        "reciprocal_rank": reciprocal_ranks(scores["relevant"]),
+        "ndcg_at_k": ndcg_at_k(rel, ideal_gains),
+        "recall_at_k": scores["recall"],
+    }
     evaluations = []
-    start = perf_counter()
-    for i, qd in enumerate(queries, 1):
-        results = retriever.search(qd["query"], top_k=top_k)
-        eval_row = evaluate_query_results(qd, results, top_k)
-        evaluations.append(eval_row)
+    for i, qd in enumerate(queries):
+        row = {
+            "query": qd["query"],
+            "category": qd.get("category", "uncategorized"),
+            "num_results": int(n[i]),
+            "relevance_scores": rel[i, : n[i]].tolist(),
+        }
+        row.update({k: (bool(v[i]) if v.dtype == bool else float(v[i])) for k, v in cols.items()})
+        evaluations.append(row)
+    return {"columns": cols, "evaluations": evaluations}
+
+
+def _aggregate(cols: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    if not len(cols["avg_relevance"]):
+        return {}
+    return {
+        "total_queries": int(len(cols["avg_relevance"])),
+        "avg_relevance_overall": float(cols["avg_relevance"].mean()),
+        "avg_max_relevance": float(cols["max_relevance"].mean()),
+        "avg_precision_at_1": float(cols["precision_at_1"].mean()),
+        "avg_top_3_relevance": float(cols["top_3_avg_relevance"].mean()),
+        "percent_with_relevant_results": float(cols["has_relevant_result"].mean() * 100),
+        "avg_similarity_score": float(cols["avg_similarity_score"].mean()),
+        "mrr": float(cols["reciprocal_rank"].mean()),
+        "ndcg_at_k": float(cols["ndcg_at_k"].mean()),
+        "recall_at_k": float(cols["recall_at_k"].mean()),
+    }
+
+
+def _categories(queries: Sequence[Dict[str, Any]], cols: Dict[str, np.ndarray]) -> Dict[str, Dict[str, Any]]:
+    """Per-category means via one bincount per metric."""
+    if not queries:
+        return {}
+    names, inverse = np.unique([q.get("category", "uncategorized") for q in queries], return_inverse=True)
+    counts = np.bincount(inverse)
+    mean = lambda x: np.bincount(inverse, weights=np.asarray(x, dtype=np.float64)) / counts
+    avg_rel, avg_max, pct = mean(cols["avg_relevance"]), mean(cols["max_relevance"]), mean(cols["has_relevant_result"]) * 100
+    mrr, ndcg = mean(cols["reciprocal_rank"]), mean(cols["ndcg_at_k"])
+    return {
+        str(name): {
+            "count": int(counts[j]),
+            "avg_relevance": float(avg_rel[j]),
+            "avg_max_relevance": float(avg_max[j]),
+            "percent_relevant": float(pct[j]),
+            "mrr": float(mrr[j]),
+            "ndcg_at_k": float(ndcg[j]),
+        }
+        for j, name in enumerate(names)
+    }
+
+
+def evaluate_query_results(query_data: Dict, results: List[Dict], top_k: int = 5) -> Dict[str, Any]:
+    queries = [query_data]
+    return _evaluations(queries, score_results(queries, [results], top_k))["evaluations"][0]
+
+
+def _search_all(retriever, queries: Sequence[str], top_k: int, batch_size: int, progress: Optional[Callable[[int, int, str], None]]) -> List[List[Dict]]:
+    results: List[List[Dict]] = []
+    batched = hasattr(retriever, "search_batch") and batch_size > 1
+    step = batch_size if batched else 1
+    for start in range(0, len(queries), step):
+        chunk = list(queries[start:start + step])
+        if batched:
+            results.extend(retriever.search_batch(chunk, top_k))
+        else:
+            results.append(retriever.search(chunk[0], top_k=top_k))
         if progress:
-            progress(i, len(queries), qd["query"])
-    elapsed = perf_counter() - start
-    aggregates = aggregate_retrieval_metrics(evaluations)
+            for i in range(start, start + len(chunk)):
+                progress(i + 1, len(queries), queries[i])
+    return results
+
+
+def _benchmark_report(queries: Sequence[Dict[str, Any]], results: List[List[Dict]], top_k: int, search_seconds: float, ideal_gains: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    start = perf_counter()
+    scored = _evaluations(queries, score_results(queries, results, top_k), ideal_gains)
+    aggregates = _aggregate(scored["columns"])
+    elapsed = search_seconds + perf_counter() - start
     aggregates["benchmark_time_seconds"] = elapsed
     aggregates["avg_time_per_query"] = elapsed / len(queries) if queries else 0.0
-    # Category breakdown
-    categories = {}
-    for cat in {e["category"] for e in evaluations}:
-        cat_evals = [e for e in evaluations if e["category"] == cat]
-        categories[cat] = {
-            "count": len(cat_evals),
-            "avg_relevance": float(np.mean([e["avg_relevance"] for e in cat_evals])),
-            "avg_max_relevance": float(np.mean([e["max_relevance"] for e in cat_evals])),
-            "percent_relevant": float(np.mean([e["has_relevant_result"] for e in cat_evals]) * 100),
-        }
+    aggregates["search_time_seconds"] = search_seconds
     return {
         "aggregate_metrics": aggregates,
-        "category_metrics": categories,
-        "individual_evaluations": evaluations,
+        "category_metrics": _categories(queries, scored["columns"]),
+        "individual_evaluations": scored["evaluations"],
     }
+
+
+def run_retrieval_benchmark(
+    queries: List[Dict],
+    retriever,
+    top_k: int = 5,
+    progress: Callable[[int,int,str], None] | None = None,
+    batch_size: int = 32,
+):
+    queries = _normalize_queries(queries)
+    start = perf_counter()
+    results = _search_all(retriever, [q["query"] for q in queries], top_k, batch_size, progress)
+    return _benchmark_report(queries, results, top_k, perf_counter() - start)
+
+
+def compare_retrievers(
+    queries: Sequence[QuerySpec],
+    arms: Dict[str, Any],
+    top_k: int = 5,
+    batch_size: int = 32,
+    max_workers: Optional[int] = None,
+    embed_queries: Optional[Callable[[Sequence[str]], np.ndarray]] = None,
+) -> Dict[str, Any]:
+    """Benchmark several retrievers on the same queries concurrently.
+
+    `arms` maps a name to a retriever; the first arm is the reference for the
+    paired deltas (e.g. ``{"baseline": base, "enhanced": with_headers}``).
+    Searches run on one thread per arm (embedding calls are I/O bound).
+    With `embed_queries` (normalized ``(n, d)`` vectors, e.g.
+    `rag.variants.VariantSet.embed_queries`) each batch of queries is
+    embedded once and every arm's ``search_vectors`` reuses it.
+    Returns ``{"arms": {name: run_retrieval_benchmark-style report},
+    "deltas": {name: paired differences vs the reference arm}}``.
+    """
+    queries = _normalize_queries(queries)
+    texts = [q["query"] for q in queries]
+    names = list(arms)
+
+    shared: Optional[List[np.ndarray]] = None
+    embed_seconds = 0.0
+    if embed_queries is not None:
+        start = perf_counter()
+        step = max(1, batch_size)
+        shared = [embed_queries(texts[i:i + step]) for i in range(0, len(texts), step)]
+        embed_seconds = perf_counter() - start
+
+    def run(name: str):
+        start = perf_counter()
+        if shared is not None:
+            results = [hits for vecs in shared for hits in arms[name].search_vectors(vecs, top_k)]
+        else:
+            results = _search_all(arms[name], texts, top_k, batch_size, None)
+        return results, perf_counter() - start + embed_seconds
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(names), thread_name_prefix="eval-arm") as pool:
+        runs = dict(zip(names, pool.map(run, names)))
+
+    # Ideal ranking per query pooled over all arms. A result keeps its best gain over the
+    # arms (its header, hence its term relevance, can differ per arm) and as many copies as
+    # any single arm returned, so no arm's DCG can exceed the pooled ideal (nDCG <= 1).
+    pooled: List[Dict[Any, List[float]]] = [dict() for _ in queries]
+    scored = {name: score_results(queries, runs[name][0], top_k) for name in names}
+    for name in names:
+        rel = scored[name]["relevance"]
+        for i, res in enumerate(runs[name][0]):
+            copies: Dict[Any, List[float]] = {}
+            for j, r in enumerate(res[:top_k]):
+                copies.setdefault(_pool_key(r), []).append(float(rel[i, j]))
+            for key, gains in copies.items():
+                best = pooled[i].setdefault(key, [])
+                gains.sort(reverse=True)
+                best[:] = [max(pair) for pair in zip(best, gains)] + best[len(gains):] + gains[len(best):]
+    width = max([sum(map(len, p.values())) for p in pooled] + [top_k])
+    ideal = np.zeros((len(queries), width))
+    for i, p in enumerate(pooled):
+        gains = [g for copies in p.values() for g in copies]
+        ideal[i, : len(gains)] = gains
+
+    reports = {name: _benchmark_report(queries, runs[name][0], top_k, runs[name][1], ideal) for name in names}
+    reference = names[0]
+    base_rows = reports[reference]["individual_evaluations"]
+    deltas = {}
+    for name in names[1:]:
+        rows = reports[name]["individual_evaluations"]
+        delta = {}
+        for key in ("avg_relevance", "ndcg_at_k", "reciprocal_rank", "recall_at_k", "avg_similarity_score"):
+            d = np.array([r[key] - b[key] for r, b in zip(rows, base_rows)])
+            delta[key] = {"mean": float(d.mean()) if len(d) else 0.0, "median": float(np.median(d)) if len(d) else 0.0}
+        wins = np.array([r["ndcg_at_k"] > b["ndcg_at_k"] for r, b in zip(rows, base_rows)])
+        losses = np.array([r["ndcg_at_k"] < b["ndcg_at_k"] for r, b in zip(rows, base_rows)])
+        delta["win_rate_pct"] = float(wins.mean() * 100) if len(wins) else 0.0
+        delta["loss_rate_pct"] = float(losses.mean() * 100) if len(losses) else 0.0
+        deltas[f"{name}_vs_{reference}"] = delta
+    return {"arms": reports, "deltas": deltas}
@@ -0,0 +1,313 @@
+"""Offline retrieval latency benchmark with percentile reporting.
+
+`run_retrieval_benchmark` measures relevance on real queries but only total
+wall time, which mixes embedding-API latency with search time. This harness
+runs without network access on synthetic corpora and reports, for each
+index type / search parameter:
+
+- latency percentiles (p50/p95/p99, ms) split into end-to-end
+  (`EmbeddingRetriever.search`), query embedding and index search;
+- QPS for sequential single queries and for one batched search;
+- build time, current and peak RSS;
+- recall@k against exact (brute-force) ground truth.
+
+    python -m rag.eval.latency --sizes 10000 100000 --dim 3072 --queries 500 \\
+        --index-types flat ivf --nprobe 1 4 16 64
+
+Corpora are clustered Gaussian vectors written block by block to a ``.npy``
+memmap under `--workdir` and indexed with `build_faiss_index_bulk`, so 1M x
+3072 (12 GB) never has to fit in RAM at once (the flat index itself does).
+Query embeddings come from `HashEmbedder`, a deterministic fake ``embed_fn``.
+Results are written as JSON next to ``artifacts/retrieval_benchmark_results.json``.
+"""
+from __future__ import annotations
+from collections.abc import Sequence as SequenceABC
+from datetime import datetime, timezone
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Sequence
+import argparse
+import hashlib
+import json
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import numpy as np
+import faiss  # type: ignore
+
+from ..config import PROJECT_ROOT
+from ..index import build_faiss_index_bulk, omp_threads
+from ..retrieval import EmbeddingRetriever
+
+__all__ = [
+    "DEFAULT_OUTPUT",
+    "HashEmbedder",
+    "synthetic_corpus",
+    "make_queries",
+    "exact_top_k",
+    "latency_summary",
+    "recall_at_k",
+    "run_latency_benchmark",
+]
+
+DEFAULT_OUTPUT = PROJECT_ROOT / "artifacts" / "retrieval_latency_results.json"
+
+
+class HashEmbedder:
+    """Deterministic fake ``embed_fn``: registered texts map to fixed vectors,
+    anything else to a unit vector seeded from the text's sha1."""
+
+    def __init__(self, dim: int, known: Optional[Dict[str, np.ndarray]] = None):
+        self.dim = dim
+        self.known = dict(known or {})
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            vec = self.known.get(text)
+            if vec is None:
+                seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+                vec = np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32)
+            out[i] = vec
+        return out
+
+
+class _RowIds(SequenceABC):
+    """Metadata stand-in ({"chunk_id": i}) that never materializes n dicts."""
+
+    def __init__(self, n: int):
+        self.n = n
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, i):
+        i = int(i)
+        if not -self.n <= i < self.n:
+            raise IndexError(i)
+        return {"chunk_id": i % self.n}
+
+
+def synthetic_corpus(path: Path, n: int, dim: int, clusters: int = 256, noise: float = 1.0, seed: int = 0, block: int = 16384) -> np.ndarray:
+    """Clustered Gaussian corpus written to a ``.npy`` memmap; returns it opened read-only."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    mm = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(n, dim))
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        assign = rng.integers(0, clusters, size=stop - start)
+        mm[start:stop] = centers[assign] + noise * rng.standard_normal((stop - start, dim), dtype=np.float32)
+    mm.flush()
+    del mm
+    return np.load(path, mmap_mode="r")
+
+
+def make_queries(corpus: np.ndarray, count: int, noise: float = 0.1, seed: int = 1) -> np.ndarray:
+    """Perturbed corpus rows (so each query has true near neighbours), L2-normalized."""
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(corpus.shape[0], size=min(count, corpus.shape[0]), replace=False))
+    q = np.array(corpus[rows], dtype=np.float32)
+    q += noise * np.linalg.norm(q, axis=1, keepdims=True) / np.sqrt(q.shape[1]) * rng.standard_normal(q.shape, dtype=np.float32)
+    faiss.normalize_L2(q)
+    return q
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int, block: int = 65536) -> np.ndarray:
+    """Brute-force cosine top-k ids, streaming over the corpus in blocks."""
+    nq = queries.shape[0]
+    best_scores = np.full((nq, k), -np.inf, dtype=np.float32)
+    best_ids = np.full((nq, k), -1, dtype=np.int64)
+    for start in range(0, corpus.shape[0], block):
+        blk = np.array(corpus[start:start + block], dtype=np.float32)
+        faiss.normalize_L2(blk)
+        scores = queries @ blk.T
+        ids = np.broadcast_to(np.arange(start, start + blk.shape[0]), scores.shape)
+        all_scores = np.concatenate([best_scores, scores], axis=1)
+        all_ids = np.concatenate([best_ids, ids], axis=1)
+        top = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(all_scores, top, axis=1)
+        best_ids = np.take_along_axis(all_ids, top, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_ids, order, axis=1)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Mean fraction of the true top-k present in the returned top-k."""
+    k = truth.shape[1]
+    hits = [len(np.intersect1d(f[f >= 0], t, assume_unique=True)) for f, t in zip(found, truth)]
+    return float(np.mean(hits) / k) if hits else 0.0
+
+
+def latency_summary(samples_ms: Sequence[float]) -> Dict[str, float]:
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    if arr.size == 0:
+        return {}
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "mean": float(arr.mean()), "max": float(arr.max())}
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return float("nan")
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if platform.system() == "Darwin" else peak / 2**10  # bytes on macOS, KiB on Linux
+
+
+def _timed(fn, *args) -> float:
+    t0 = perf_counter()
+    fn(*args)
+    return (perf_counter() - t0) * 1000.0
+
+
+def _measure(retriever: EmbeddingRetriever, texts: List[str], qvecs: np.ndarray, truth: np.ndarray, k: int, warmup: int) -> Dict[str, Any]:
+    index = retriever.index
+    for i in range(min(warmup, len(texts))):
+        retriever.search(texts[i], k)
+    e2e = [_timed(retriever.search, t, k) for t in texts]
+    embed = [_timed(retriever.embed_query, t) for t in texts]
+    search = [_timed(index.search, qvecs[i:i + 1], k) for i in range(len(texts))]
+    t0 = perf_counter()
+    _, found = index.search(qvecs, k)
+    batch_seconds = perf_counter() - t0
+    return {
+        "recall_at_k": recall_at_k(found, truth),
+        "latency_ms": {
+            "end_to_end": latency_summary(e2e),
+            "embed": latency_summary(embed),
+            "search": latency_summary(search),
+        },
+        "qps_sequential": len(texts) / (sum(e2e) / 1000.0) if e2e else 0.0,
+        "qps_search_only": len(texts) / (sum(search) / 1000.0) if search else 0.0,
+        "qps_batch": len(texts) / batch_seconds if batch_seconds > 0 else float("inf"),
+    }
+
+
+def run_latency_benchmark(
+    sizes: Sequence[int] = (10_000,),
+    dim: int = 3072,
+    n_queries: int = 200,
+    top_k: int = 10,
+    index_types: Sequence[str] = ("flat", "ivf"),
+    nlists: Sequence[Optional[int]] = (None,),
+    nprobes: Sequence[int] = (1, 4, 16, 64),
+    threads: int = 0,
+    workdir: Optional[Path] = None,
+    warmup: int = 10,
+    seed: int = 0,
+    progress: bool = True,
+) -> Dict[str, Any]:
+    """Sweep corpus sizes x index types x search parameters; returns a JSON-ready report."""
+    own_workdir = workdir is None
+    workdir = Path(workdir or tempfile.mkdtemp(prefix="rag-latency-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    runs: List[Dict[str, Any]] = []
+    try:
+        for n in sizes:
+            corpus = synthetic_corpus(workdir / f"corpus-{n}x{dim}.npy", n, dim, seed=seed)
+            qvecs = make_queries(corpus, n_queries, seed=seed + 1)
+            texts = [f"synthetic query {i}" for i in range(qvecs.shape[0])]
+            embedder = HashEmbedder(dim, dict(zip(texts, qvecs)))
+            t0 = perf_counter()
+            truth = exact_top_k(corpus, qvecs, top_k)
+            truth_seconds = perf_counter() - t0
+            for index_type in index_types:
+                for nlist in (nlists if index_type == "ivf" else (None,)):
+                    rss_before = _rss_mb()
+                    t0 = perf_counter()
+                    index = build_faiss_index_bulk(corpus, index_type=index_type, nlist=nlist, threads=threads)
+                    build_seconds = perf_counter() - t0
+                    retriever = EmbeddingRetriever(index, _RowIds(n), embed_fn=embedder)
+                    run: Dict[str, Any] = {
+                        "n": n,
+                        "dim": dim,
+                        "index_type": type(index).__name__,
+                        "requested_type": index_type,
+                        "nlist": int(getattr(index, "nlist", 0)) or None,
+                        "build_seconds": build_seconds,
+                        "ground_truth_seconds": truth_seconds,
+                        "rss_mb_before_build": rss_before,
+                        "rss_mb_after_build": _rss_mb(),
+                        "peak_rss_mb": _peak_rss_mb(),
+                        "sweeps": [],
+                    }
+                    is_ivf = hasattr(index, "nprobe")
+                    with omp_threads(threads):
+                        for nprobe in (nprobes if is_ivf else (None,)):
+                            if nprobe is not None:
+                                index.nprobe = min(nprobe, index.nlist)
+                            row = {"nprobe": None if nprobe is None else int(index.nprobe)}
+                            row.update(_measure(retriever, texts, qvecs, truth, top_k, warmup))
+                            run["sweeps"].append(row)
+                            if progress:
+                                lat = row["latency_ms"]["search"]
+                                print(f"[latency] n={n} {run['index_type']} nlist={run['nlist']} nprobe={row['nprobe']}: "
+                                      f"search p50={lat['p50']:.3f}ms p99={lat['p99']:.3f}ms recall@{top_k}={row['recall_at_k']:.3f}", flush=True)
+                    runs.append(run)
+                    del retriever, index
+            del corpus
+    finally:
+        if own_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "generated": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "faiss": getattr(faiss, "__version__", "unknown"),
+            "cpu_count": os.cpu_count(),
+            "omp_threads": threads or faiss.omp_get_max_threads(),
+        },
+        "config": {
+            "sizes": list(sizes),
+            "dim": dim,
+            "queries": n_queries,
+            "top_k": top_k,
+            "index_types": list(index_types),
+            "nlists": list(nlists),
+            "nprobes": list(nprobes),
+            "seed": seed,
+        },
+        "runs": runs,
+    }
+
+
+def main(argv: Optional[List[str]] = None):  # pragma: no cover - CLI entry point
+    parser = argparse.ArgumentParser(description="Offline retrieval latency benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000])
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--index-types", nargs="+", default=["flat", "ivf"], choices=["flat", "ivf"])
+    parser.add_argument("--nlist", type=int, nargs="*", default=[], help="IVF list counts (default: builder heuristic)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--threads", type=int, default=0, help="FAISS OpenMP threads (0 = library default)")
+    parser.add_argument("--workdir", type=Path, default=None, help="Where synthetic corpora are written (default: temp dir)")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUTPUT)
+    args = parser.parse_args(argv)
+    report = run_latency_benchmark(
+        sizes=args.sizes,
+        dim=args.dim,
+        n_queries=args.queries,
+        top_k=args.top_k,
+        index_types=args.index_types,
+        nlists=args.nlist or [None],
+        nprobes=args.nprobe,
+        threads=args.threads,
+        workdir=args.workdir,
+    )
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps(report, indent=2), "utf-8")
+    print(f"[latency] Wrote {args.out}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -8,6 +8,20 @@ Design choices:
 - Dependency injection for LLM call (`llm` coroutine) to allow testing.
 - Simple token request rate limiter (dual buckets: requests + tokens).
 - Document-level summary caching option placeholder (future optimization).
+- Provider prompt caching: every advanced prompt starts with a prefix that is
+  byte-identical for all chunks of a document (system message, document
+  context, task). Chunk-specific parts (position, chunk, neighbours) come
+  last, and a document's chunks are dispatched back to back. Cached prompt
+  tokens reported by the API are surfaced as the "prompt_cache" progress
+  phase.
+- Prefix padding is opt-in (``HEADER_CACHE_PREFIX_TOKENS``, default 0).
+  Providers only cache prefixes of ~1024+ tokens, and padding the summary
+  up to that length costs more than Azure's 50% cached-input discount saves
+  on a ~300-token prefix. It also changes the prompt, and with it every
+  header journal key. When enabled, requests are charged to the rate
+  limiter at their real prompt size.
+- Prompt style and sizes (``HEADER_ADVANCED``, ``HEADER_WINDOW``,
+  ``HEADER_CHUNK_HEAD`` ...) are `rag.config` settings read at call time.
 """
 from __future__ import annotations
 import asyncio
@@ -15,19 +29,14 @@ import time
 import random
 from dataclasses import dataclass
 from typing import Iterable, List, Dict, Callable, Awaitable, Optional
-import re, collections, os
+import re, collections, json
+from pathlib import Path
 
+from . import config, telemetry
 from .models import Document, Chunk
 from .chunking import split_by_semantic_boundaries
-from .config import (
-    REQUESTS_PER_MIN,
-    TOKENS_PER_MIN,
-    EST_TOKENS_PER_REQUEST,
-    MAX_CONCURRENT,
-    BATCH_SIZE,
-    HEADER_MAX_CHARS,
-    SEMANTIC_MAX_WORDS,
-)
+from .journal import HeaderJournal, content_key
+from .keywords import STOPWORDS, corpus_keywords, extract_keywords
 
 # -------- Rate Limiter ---------
 class AsyncRateLimiter:
@@ -56,47 +65,57 @@ class AsyncRateLimiter:
             self.token_tokens = min(self.tokens_per_min, self.token_tokens + add)
             self._last_token_refill = now
 
-    async def acquire(self):
+    async def acquire(self, tokens: Optional[int] = None):
+        """Take one request plus `tokens` (default `tokens_per_request`) from the buckets."""
+        need = min(tokens or self.tokens_per_request, self.tokens_per_min)
         while True:
             await self._refill()
             async with self._req_lock:
                 async with self._tok_lock:
-                    if self.request_tokens >= 1 and self.token_tokens >= self.tokens_per_request:
+                    if self.request_tokens >= 1 and self.token_tokens >= need:
                         self.request_tokens -= 1
-                        self.token_tokens -= self.tokens_per_request
+                        self.token_tokens -= need
                         return
             await asyncio.sleep(0.1)
 
 # -------- Prompt Templates (Basic vs Advanced) ---------
-ADVANCED_STYLE = os.getenv("HEADER_ADVANCED", "1") == "1"
-
 DOCUMENT_CONTEXT_PROMPT = """
 <doc_title>{doc_title}</doc_title>
 <summary>{doc_summary}</summary>
 <keywords>{keywords}</keywords>
-<position>{position_info}</position>
 """.strip()
 
-CHUNK_CONTEXT_PROMPT = """
-<chunk>
-{chunk_content}
-</chunk>
-{surrounding}
-
-Task: Produce ONE ultra-concise (<=22 tokens) retrieval header capturing:
+HEADER_CRITERIA = """
 - Clinical/topic focus (disease / condition / population)
 - Specific subtopic or action (screening, risk factor, staging, management, adverse event, prognosis, epidemiology, recommendation, dosage nuance, contraindication)
 - If present: patient group / modality / phase qualifier
 - Distinguish from sibling chunks; avoid generic words (section, overview, information)
+""".strip()
 
-Rules:
+HEADER_RULES = """
 - No leading labels or numbering
 - Prefer noun phrase or terse clause; can include key qualifier (e.g., pediatric, first-line)
 - Do NOT copy chunk verbatim; abstract its role in the broader guideline
 - Avoid repeating doc title unless necessary for specificity
-Return ONLY the header text.
 """.strip()
 
+# Static per document: DOCUMENT_CONTEXT_PROMPT + HEADER_TASK_PROMPT form the cacheable prefix
+HEADER_TASK_PROMPT = (
+    "Task: For EACH <chunk> below produce ONE ultra-concise (<=22 tokens) retrieval header capturing:\n" + HEADER_CRITERIA
+    + "\n\nRules:\n" + HEADER_RULES
+)
+
+CHUNK_CONTEXT_PROMPT = (
+    "<position>{position_info}</position>\n<chunk>\n{chunk_content}\n</chunk>\n{surrounding}\n\n"
+    "Return ONLY the header text."
+)
+
+# Several consecutive chunks of one document per request (`window` > 1)
+WINDOW_CONTEXT_PROMPT = (
+    "<position>{position_info}</position>\n{chunks}\n{surrounding}\n\n"
+    'Return ONLY a JSON array of {count} objects in chunk order: [{{"id": 1, "header": "..."}}, ...]'
+)
+
 SYSTEM_MESSAGE_BASIC = (
     "You are a medical information specialist. Provide a single concise contextualizing phrase or sentence "
     "that situates the chunk within the larger medical document. Output ONLY the phrase."
@@ -107,34 +126,72 @@ SYSTEM_MESSAGE_ADVANCED = (
     "packs global guideline context + specific subtopic nuance, excludes boilerplate, and maximizes discriminative recall value."
 )
 
-SYSTEM_MESSAGE = SYSTEM_MESSAGE_ADVANCED if ADVANCED_STYLE else SYSTEM_MESSAGE_BASIC
-
-STOPWORDS = { 'the','and','for','with','that','this','from','are','was','were','will','into','about','your','their','there','such','these','those','than','then','have','has','had','may','can','also','been','being','within','without','between','among','over','under','more','most','some','other','which','while','where','when','what','who','whom','whose','why','how','a','an','of','to','in','on','by','it','its','as','at','or','we','our','you' }
-
-# Truncation controls for advanced mode (prevent oversize prompts / token errors)
-CHUNK_HEAD_CHARS = int(os.getenv("HEADER_CHUNK_HEAD", "850"))
-CHUNK_TAIL_CHARS = int(os.getenv("HEADER_CHUNK_TAIL", "350"))
-NEIGHBOR_SNIP_CHARS = int(os.getenv("HEADER_NEIGHBOR_CHARS", "140"))
-DOC_SUMMARY_CHARS = int(os.getenv("HEADER_DOC_SUMMARY_CHARS", "600"))
-KEYWORD_COUNT = int(os.getenv("HEADER_KEYWORD_COUNT", "12"))
-
-def _extract_keywords(text: str, k: int = KEYWORD_COUNT) -> List[str]:
-    text = re.sub(r"[^A-Za-z0-9\s]", " ", text.lower())
-    tokens = [t for t in text.split() if len(t) > 3 and t not in STOPWORDS]
-    freq = collections.Counter(tokens)
-    boosted = {}
-    for w, c in freq.items():
-        bonus = 0
-        if any(suf in w for suf in ("itis","osis","emia","pathy","genic","therapy","lysis","oma")):
-            bonus += 2
-        if any(s in w for s in ("onc", "cardio", "neuro", "hepat", "renal", "derm", "pulmo", "immun")):
-            bonus += 1
-        boosted[w] = c + bonus
-    top = sorted(boosted.items(), key=lambda x: x[1], reverse=True)[:k]
-    return [w for w,_ in top]
-
-def _summarize_doc_head(text: str, max_chars: int = DOC_SUMMARY_CHARS) -> str:
-    return re.sub(r"\s+"," ", text.strip())[:max_chars]
+
+def _system_message() -> str:
+    return SYSTEM_MESSAGE_ADVANCED if config.HEADER_ADVANCED else SYSTEM_MESSAGE_BASIC
+
+
+WINDOW_OUTPUT_TOKENS = 40  # per-header allowance in the rate-limiter estimate
+PROMPT_CACHE_MIN_REQUESTS = 3  # fewer requests per document don't repay the longer prefix
+
+
+class LLMReply(str):
+    """Chat completion text plus the prompt-token usage reported with it."""
+
+    prompt_tokens: int
+    cached_tokens: int
+
+    def __new__(cls, text: str, prompt_tokens: int = 0, cached_tokens: int = 0):
+        reply = super().__new__(cls, text)
+        reply.prompt_tokens = prompt_tokens
+        reply.cached_tokens = cached_tokens
+        return reply
+
+
+@dataclass(slots=True)
+class PromptCacheStats:
+    """Running totals of prompt tokens and provider-cached prompt tokens."""
+
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+
+    def add(self, reply: str):
+        # plain-str replies (custom adapters) carry no usage
+        if not isinstance(reply, LLMReply):
+            return
+        self.requests += 1
+        self.prompt_tokens += reply.prompt_tokens
+        self.cached_tokens += reply.cached_tokens
+        telemetry.count("headers.prompt_tokens", reply.prompt_tokens)
+        telemetry.count("headers.cached_prompt_tokens", reply.cached_tokens)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+
+def _extract_keywords(text: str, k: Optional[int] = None) -> List[str]:
+    """Keywords of a single text (no corpus IDF); `generate_headers` uses `corpus_keywords`."""
+    return extract_keywords([text], k or config.HEADER_KEYWORD_COUNT)[0]
+
+def _summarize_doc_head(text: str, max_chars: Optional[int] = None) -> str:
+    return re.sub(r"\s+"," ", text.strip())[:max_chars or config.HEADER_DOC_SUMMARY_CHARS]
+
+
+def _summary_chars(title: str, keywords: str, requests: int) -> int:
+    """Summary length that makes the document prefix provider-cacheable when it pays off.
+
+    Documents sending at least `PROMPT_CACHE_MIN_REQUESTS` requests get a
+    summary long enough for system message + document prefix to reach
+    ``HEADER_CACHE_PREFIX_TOKENS`` (~4 characters per token); the rest keep
+    ``HEADER_DOC_SUMMARY_CHARS``. A document shorter than that stays uncached.
+    """
+    summary_chars, prefix_tokens = config.HEADER_DOC_SUMMARY_CHARS, config.HEADER_CACHE_PREFIX_TOKENS
+    if not prefix_tokens or requests < PROMPT_CACHE_MIN_REQUESTS:
+        return summary_chars
+    fixed = len(_system_message()) + len(_document_prefix({"doc_title": title, "keywords": keywords}))
+    return max(summary_chars, prefix_tokens * 4 - fixed)
 
 def _slice_for_header(text: str) -> str:
     """Return a condensed representation of a chunk for header generation.
@@ -142,71 +199,233 @@ def _slice_for_header(text: str) -> str:
     Strategy: head + ellipsis + tail if long. Keeps salient opening defs + concluding recommendation cues.
     """
     t = text.strip()
-    if len(t) <= CHUNK_HEAD_CHARS + CHUNK_TAIL_CHARS + 20:
+    head_chars, tail_chars = config.HEADER_CHUNK_HEAD, config.HEADER_CHUNK_TAIL
+    if len(t) <= head_chars + tail_chars + 20:
         return t
-    head = t[:CHUNK_HEAD_CHARS]
-    tail = t[-CHUNK_TAIL_CHARS:]
+    head = t[:head_chars]
+    tail = t[-tail_chars:]
     return head + " ... " + tail
 
 # -------- Core Logic ---------
 async def _generate_header(llm: Callable[[List[Dict]], Awaitable[str]], chunk_payload: Dict, limiter: AsyncRateLimiter, retries: int = 4):
+    header = await _request_header(llm, chunk_payload, limiter, retries)
+    return header if header is not None else _fallback_header(chunk_payload)
+
+
+def _fallback_header(chunk_payload: Dict) -> str:
+    # Include document title in fallback for better context
+    return f"{chunk_payload.get('doc_title', 'document')} — {chunk_payload.get('section_path', 'Section')}"
+
+
+_unnamed_llms: set = set()
+
+
+def chat_model_name(llm=None, model: Optional[str] = None) -> str:
+    """Identity of the model behind `llm` for header journal keys.
+
+    An explicit `model` wins; `azure_chat_completion` (or no `llm`) is the
+    configured deployment plus its completion cap; other adapters use their
+    ``model_name`` attribute. An adapter without one is journaled as
+    ``custom:<module>.<qualname>`` with a warning: its headers still resume,
+    but switching the model behind it will not regenerate them. Wrappers of
+    `azure_chat_completion` can pass ``model=chat_model_name()``.
+    """
+    if model:
+        return model
+    if llm is None or llm is azure_chat_completion:
+        return f"{config.AOAI_CHAT_MODEL}:max_completion_tokens={config.HEADER_MAX_COMPLETION_TOKENS}"
+    name = getattr(llm, "model_name", None)
+    if name:
+        return str(name)
+    target = llm if hasattr(llm, "__qualname__") else type(llm)
+    name = f"custom:{getattr(target, '__module__', None) or '?'}.{target.__qualname__}"
+    if name not in _unnamed_llms:
+        _unnamed_llms.add(name)
+        print(f"[headers] WARNING: llm has no model_name; journaling its headers as {name!r} (pass model=... to name the chat model)", flush=True)
+    return name
+
+
+def _journal_key(chunk_payload: Dict, model: str, window: int = 1) -> str:
+    """Everything that shapes the header: chat model, templates, style, window and the chunk payload.
+
+    Windowed runs (`window` > 1) key their headers by the window prompt and
+    size, so they never reuse single-chunk headers or those of another
+    window size, and vice versa. Single-chunk keys are unchanged.
+    """
+    template = DOCUMENT_CONTEXT_PROMPT + HEADER_TASK_PROMPT + CHUNK_CONTEXT_PROMPT if config.HEADER_ADVANCED else "basic"
+    if window > 1:
+        template += f"{WINDOW_CONTEXT_PROMPT}\nwindow={window}"
+    return content_key(model, _system_message(), template, json.dumps(chunk_payload, sort_keys=True, ensure_ascii=False))
+
+
+def _document_prefix(chunk_payload: Dict) -> str:
+    """Prompt head shared by every chunk of a document (the provider-cacheable part)."""
+    return DOCUMENT_CONTEXT_PROMPT.format(
+        doc_title=chunk_payload.get("doc_title",""),
+        doc_summary=chunk_payload.get("doc_summary",""),
+        keywords=chunk_payload.get("keywords",""),
+    ) + "\n\n" + HEADER_TASK_PROMPT + "\n\n"
+
+
+def _surrounding(prev_text: str, next_text: str) -> str:
+    parts = []
+    snip = config.HEADER_NEIGHBOR_CHARS
+    prev_snip = prev_text[:snip]
+    next_snip = next_text[:snip]
+    if prev_snip:
+        parts.append(f"<prev>{prev_snip}</prev>")
+    if next_snip:
+        parts.append(f"<next>{next_snip}</next>")
+    return "\n".join(parts)
+
+
+def _clean_header(header: str) -> Optional[str]:
+    header = header.replace("\n", " ").strip()
+    if not header:
+        return None
+    max_chars = config.HEADER_MAX_CHARS
+    if len(header) > max_chars:
+        header = header[: max_chars - 3].rstrip() + "..."
+    return header
+
+
+def _window_prompt(payloads: List[Dict]) -> str:
+    """Document prefix once, then the window's chunks tagged with id and position."""
+    first, last = payloads[0], payloads[-1]
+    chunks = "\n".join(
+        f'<chunk id="{n}" position="{p.get("position", "")}">\n{_slice_for_header(p["text"])}\n</chunk>'
+        for n, p in enumerate(payloads, 1)
+    )
+    return _document_prefix(first) + WINDOW_CONTEXT_PROMPT.format(
+        position_info=f"{first.get('position', '')} to {last.get('position', '')}",
+        chunks=chunks,
+        surrounding=_surrounding(first.get("prev_text", ""), last.get("next_text", "")),
+        count=len(payloads),
+    )
+
+
+def _parse_window_reply(reply: str, count: int) -> List[Optional[str]]:
+    """Per-chunk headers from a window reply; invalid or missing items are None."""
+    headers: List[Optional[str]] = [None] * count
+    match = re.search(r"\[.*\]", reply or "", re.S)
+    try:
+        items = json.loads(match.group(0)) if match else None
+    except ValueError:
+        items = None
+    if not isinstance(items, list):
+        return headers
+    for pos, item in enumerate(items):
+        if isinstance(item, dict):
+            text = item.get("header")
+            try:
+                idx = int(item.get("id")) - 1
+            except (TypeError, ValueError):
+                idx = pos
+        elif isinstance(item, str) and len(items) == count:
+            idx, text = pos, item
+        else:
+            continue
+        if 0 <= idx < count and headers[idx] is None and isinstance(text, str):
+            headers[idx] = _clean_header(text)
+    return headers
+
+
+async def _request_window(llm: Callable[[List[Dict]], Awaitable[str]], payloads: List[Dict], limiter: AsyncRateLimiter, retries: int = 2, usage: Optional[PromptCacheStats] = None) -> List[Optional[str]]:
+    """Headers for consecutive chunks of one document from a single request.
+
+    Items the model skipped or returned malformed are None; the caller
+    retries those one chunk at a time.
+    """
+    content = _window_prompt(payloads)
+    messages = [
+        {"role": "system", "content": _system_message()},
+        {"role": "user", "content": content},
+    ]
+    estimate = len(content) // 4 + WINDOW_OUTPUT_TOKENS * len(payloads)
+    for attempt in range(retries):
+        waited = time.perf_counter()
+        await limiter.acquire(estimate)
+        telemetry.observe("headers.queue_wait_seconds", time.perf_counter() - waited, queue="rate_limiter")
+        try:
+            with telemetry.span("headers.llm", attempt=attempt + 1, prompt_chars=len(content), window=len(payloads)):
+                reply = await llm(messages)
+            if usage is not None:
+                usage.add(reply)
+            headers = _parse_window_reply(reply, len(payloads))
+            if any(h is not None for h in headers):
+                return headers
+            raise ValueError("LLM reply contained no valid window headers")
+        except Exception as e:  # pragma: no cover - network variability
+            telemetry.count("headers.llm_errors", error=type(e).__name__)
+            await asyncio.sleep((2 ** attempt) + random.uniform(0, 1))
+    return [None] * len(payloads)
+
+
+async def _request_header(llm: Callable[[List[Dict]], Awaitable[str]], chunk_payload: Dict, limiter: AsyncRateLimiter, retries: int = 4, usage: Optional[PromptCacheStats] = None) -> Optional[str]:
+    """LLM header for one chunk, or None once `retries` attempts have failed."""
+    if config.HEADER_ADVANCED:
+        surrounding = _surrounding(chunk_payload.get("prev_text", ""), chunk_payload.get("next_text", ""))
+        content = _document_prefix(chunk_payload) + CHUNK_CONTEXT_PROMPT.format(
+            position_info=chunk_payload.get("position",""),
+            chunk_content=_slice_for_header(chunk_payload["text"]),
+            surrounding=surrounding,
+        )
+    else:
+        content = f"<document>{chunk_payload['doc_content']}</document>\n<chunk>{_slice_for_header(chunk_payload['text'])}</chunk>\nProvide a concise context phrase."  # legacy simplified
+    messages = [
+        {"role": "system", "content": _system_message()},
+        {"role": "user", "content": content},
+    ]
+    # A padded (cacheable) prefix makes prompts far larger than EST_TOKENS_PER_REQUEST: charge what is sent
+    estimate = None
+    if config.HEADER_CACHE_PREFIX_TOKENS:
+        estimate = max(limiter.tokens_per_request, (len(messages[0]["content"]) + len(content)) // 4 + WINDOW_OUTPUT_TOKENS)
     attempt = 0
     last_error = None
     while attempt < retries:
-        await limiter.acquire()
+        waited = time.perf_counter()
+        await limiter.acquire(estimate)
+        telemetry.observe("headers.queue_wait_seconds", time.perf_counter() - waited, queue="rate_limiter")
         try:
-            if ADVANCED_STYLE:
-                surrounding_parts = []
-                prev_snip = chunk_payload.get("prev_text", "")[:NEIGHBOR_SNIP_CHARS]
-                next_snip = chunk_payload.get("next_text", "")[:NEIGHBOR_SNIP_CHARS]
-                if prev_snip:
-                    surrounding_parts.append(f"<prev>{prev_snip}</prev>")
-                if next_snip:
-                    surrounding_parts.append(f"<next>{next_snip}</next>")
-                surrounding = "\n".join(surrounding_parts)
-                content = DOCUMENT_CONTEXT_PROMPT.format(
-                    doc_title=chunk_payload.get("doc_title",""),
-                    doc_summary=chunk_payload.get("doc_summary",""),
-                    keywords=chunk_payload.get("keywords",""),
-                    position_info=chunk_payload.get("position",""),
-                ) + "\n" + CHUNK_CONTEXT_PROMPT.format(chunk_content=_slice_for_header(chunk_payload["text"]), surrounding=surrounding)
-            else:
-                content = f"<document>{chunk_payload['doc_content']}</document>\n<chunk>{_slice_for_header(chunk_payload['text'])}</chunk>\nProvide a concise context phrase."  # legacy simplified
-            messages = [
-                {"role": "system", "content": SYSTEM_MESSAGE},
-                {"role": "user", "content": content},
-            ]
-            header = await llm(messages)
-            header = header.replace("\n", " ").strip()
+            with telemetry.span("headers.llm", attempt=attempt + 1, prompt_chars=len(content)):
+                reply = await llm(messages)
+                if usage is not None:
+                    usage.add(reply)
+                header = _clean_header(reply)
 
             # If LLM returned empty/whitespace, treat as failure and retry
             if not header:
                 raise ValueError("LLM returned empty header")
-
-            if len(header) > HEADER_MAX_CHARS:
-                header = header[: HEADER_MAX_CHARS - 3].rstrip() + "..."
             return header
         except Exception as e:  # pragma: no cover - network variability
             last_error = e
+            telemetry.count("headers.llm_errors", error=type(e).__name__)
             backoff = (2 ** attempt) + random.uniform(0, 1)
             await asyncio.sleep(backoff)
             attempt += 1
 
-    # Log the failure before returning fallback with document context
+    # Log the failure; caller substitutes a fallback with document context
     section = chunk_payload.get('section_path', 'Section')
-    doc_title = chunk_payload.get('doc_title', 'document')
     print(f"⚠️  Header generation failed after {retries} attempts for {section}: {last_error}", flush=True)
-    # Include document title in fallback for better context
-    return f"{doc_title} — {section}"
+    return None
 
+@telemetry.traced("headers.generate")
 async def generate_headers(
     documents: Iterable[Document],
     llm: Callable[[List[Dict]], Awaitable[str]],
-    semantic_max_words: int = SEMANTIC_MAX_WORDS,
-    batch_size: int = BATCH_SIZE,
-    max_concurrent: int = MAX_CONCURRENT,
+    semantic_max_words: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    max_concurrent: Optional[int] = None,
     progress_callback: Optional[Callable[[str, int, int, float, float, float], None]] = None,
     use_tqdm: bool = False,
+    journal_path: Optional[Path] = config.DEFAULT,
+    dedupe: bool = False,
+    dedupe_threshold: Optional[float] = None,
+    keyword_cache_path: Optional[Path] = config.DEFAULT,
+    priority: Optional[Callable[[Document], int]] = None,
+    cancel: Optional[asyncio.Event] = None,
+    window: Optional[int] = None,
+    model: Optional[str] = None,
 ) -> List[Chunk]:
     """Generate contextual headers for all semantic chunks across documents.
 
@@ -216,20 +435,64 @@ async def generate_headers(
         Source documents.
     llm : coroutine(messages) -> str
         Async LLM chat completion adapter returning a header string.
-    semantic_max_words : int
-        Approximate max words per semantic chunk.
+    semantic_max_words : int | None
+        Approximate max words per semantic chunk (default ``config.SEMANTIC_MAX_WORDS``).
     batch_size : int
-        Number of coroutine tasks to gather per await (throttles memory / progress cadence).
-    max_concurrent : int
-        Upper bound on simultaneous in-flight LLM requests.
+        Unused; kept for compatibility (scheduling is bounded by `max_concurrent`).
+    max_concurrent : int | None
+        Number of long-lived workers, i.e. simultaneous in-flight LLM requests
+        (default ``config.MAX_CONCURRENT``).
     progress_callback : callable(phase, done, total, pct, rate, eta)
-        Optional progress reporter. Phases: 'prepare', 'headers'.
+        Optional progress reporter. Phases: 'prepare', 'headers'. Also called
+        with phase "prompt_cache" (done = cached prompt tokens, total = prompt
+        tokens, pct = cached share, rate = requests/s) when the `llm` adapter
+        returns `LLMReply` usage, as `azure_chat_completion` does.
     use_tqdm : bool
         If True and no progress_callback provided, show local tqdm bars.
+    journal_path : Path | None
+        Append-only journal of finished headers (`rag.journal.HeaderJournal`).
+        Chunks already journaled with an identical prompt are not re-sent, so
+        a restarted run resumes. Defaults to
+        ``rag.journal.HEADER_JOURNAL_PATH``; None disables journaling.
+    dedupe : bool
+        Collapse exact / near-duplicate chunks (MinHash, `rag.dedup`) before
+        any LLM call; only the first copy gets a header and is returned, with
+        the other copies' citations in ``duplicate_sources``.
+    dedupe_threshold : float | None
+        Minimum estimated Jaccard similarity of word shingles to collapse
+        (default ``config.DEDUPE_THRESHOLD``).
+    keyword_cache_path : Path | None
+        Per-document keyword cache (`rag.keywords`); keywords for the prompt
+        are extracted for the whole corpus in one TF-IDF pass. Defaults to
+        ``rag.keywords.KEYWORD_CACHE_PATH``; None disables the cache.
+    priority : callable(Document) -> int | None
+        Scheduling lane per document; lower lanes are drained first, each in
+        document order (e.g. ``lambda d: 0 if d.doc_id in new_ids else 1``).
+    cancel : asyncio.Event | None
+        Cooperative cancellation: once set, workers take no new chunks;
+        in-flight requests finish and are journaled. Chunks never started are
+        left out of the result (a rerun resumes them from the journal).
+    window : int | None
+        Advanced mode only: up to `window` consecutive chunks of a document
+        share one request (document context sent once, JSON array reply).
+        Items missing or malformed in the reply fall back to single-chunk
+        requests. 1 sends one request per chunk (default ``config.HEADER_WINDOW``).
+    model : str | None
+        Name of the chat model (and settings) behind `llm`, part of every
+        journal key so switching models regenerates headers. Defaults to
+        ``AOAI_CHAT_MODEL`` plus ``HEADER_MAX_COMPLETION_TOKENS`` for
+        `azure_chat_completion`, else the adapter's ``model_name``
+        attribute, else a warned fallback (`chat_model_name`).
+
+    Returns chunks in document order, then chunk order, regardless of the
+    order in which LLM calls complete.
     """
-    limiter = AsyncRateLimiter(REQUESTS_PER_MIN, TOKENS_PER_MIN, EST_TOKENS_PER_REQUEST)
-    semaphore = asyncio.Semaphore(max_concurrent)
-    chunks_out: List[Chunk] = []
+    semantic_max_words = semantic_max_words or config.SEMANTIC_MAX_WORDS
+    max_concurrent = max_concurrent or config.MAX_CONCURRENT
+    limiter = AsyncRateLimiter(config.REQUESTS_PER_MIN, config.TOKENS_PER_MIN, config.EST_TOKENS_PER_REQUEST)
+    chat_model = chat_model_name(llm, model) if journal_path is not None else ""
+    journal = HeaderJournal(None if journal_path is config.DEFAULT else journal_path) if journal_path is not None else None
+    completed = 0
 
     # Optional tqdm setup
     tqdm_prepare = tqdm_headers = None
@@ -241,18 +504,23 @@ async def generate_headers(
             pass
 
     # -------- Preparation: build task payloads & count total --------
-    tasks: List[Awaitable[None]] = []
-    total_chunks = 0
+    specs: List[tuple] = []  # (doc, chunk index, payload, chunk_id) in document order
+    documents = list(documents)
+    advanced = config.HEADER_ADVANCED
+    window = max(1, config.HEADER_WINDOW if window is None else window) if advanced else 1
+    if advanced:
+        doc_keywords = corpus_keywords([doc.content for doc in documents], config.HEADER_KEYWORD_COUNT, keyword_cache_path)
     doc_index = 0
     for doc in documents:
         semantic_chunks = split_by_semantic_boundaries(doc.content, semantic_max_words)
-        if ADVANCED_STYLE:
-            doc_summary = _summarize_doc_head(doc.content)
-            kw = ", ".join(_extract_keywords(doc.content))
         total_in_doc = len(semantic_chunks) or 1
+        if advanced:
+            kw = ", ".join(doc_keywords[doc_index])
+            requests = -(-total_in_doc // window)
+            doc_summary = _summarize_doc_head(doc.content, _summary_chars(doc.title, kw, requests))
         for i, info in enumerate(semantic_chunks):
             info["section_path"] = f"Section {i+1}"
-            if ADVANCED_STYLE:
+            if advanced:
                 pct = (i+1)/total_in_doc*100
                 info.update({
                     "doc_title": doc.title,
@@ -265,27 +533,7 @@ async def generate_headers(
                 if i < total_in_doc-1:
                     info["next_text"] = semantic_chunks[i+1]['text']
             info["doc_content"] = doc.content[:30000]
-            payload = dict(info)
-            async def run_one(doc_ref=doc, idx=i, payload_ref=payload):
-                async with semaphore:
-                    header = await _generate_header(llm, payload_ref, limiter)
-                    augmented = f"{header}\n\n{payload_ref['text']}"
-                    chunk = Chunk(
-                        chunk_id=f"{doc_ref.doc_id}_chunk_{idx}",
-                        doc_id=doc_ref.doc_id,
-                        doc_title=doc_ref.title,
-                        raw_chunk=payload_ref['text'],
-                        chunk_index=idx,
-                        ctx_header=header,
-                        augmented_chunk=augmented,
-                        section_path=payload_ref.get('section_path',''),
-                        source_org=doc_ref.source_org,
-                        source_url=doc_ref.source_url,
-                        pub_date=doc_ref.pub_date,
-                    )
-                    chunks_out.append(chunk)
-            tasks.append(run_one())
-            total_chunks += 1
+            specs.append((doc, i, dict(info), f"{doc.doc_id}_chunk_{i}"))
         doc_index += 1
         if tqdm_prepare:
             tqdm_prepare.total = doc_index  # track docs processed
@@ -296,6 +544,52 @@ async def generate_headers(
     if tqdm_prepare:
         tqdm_prepare.close()
 
+    # Collapse (near-)duplicate chunks before paying for their headers/embeddings
+    duplicates: Dict[int, List[Dict[str, str]]] = collections.defaultdict(list)
+    if dedupe and specs:
+        from .dedup import near_duplicate_groups
+        canonical, _, _ = near_duplicate_groups([p["text"] for _, _, p, _ in specs], dedupe_threshold)
+        kept = []
+        for pos, spec in enumerate(specs):
+            c = int(canonical[pos])
+            if c == pos:
+                kept.append(spec)
+            else:
+                d, _, _, cid = spec
+                duplicates[c].append({
+                    "chunk_id": cid, "doc_id": d.doc_id, "doc_title": d.title,
+                    "source_org": d.source_org, "source_url": d.source_url, "pub_date": d.pub_date,
+                })
+        print(f"[dedup] {len(specs)} chunks -> {len(kept)} canonical ({len(specs) - len(kept)} duplicates collapsed)", flush=True)
+        spec_pos = [pos for pos in range(len(specs)) if int(canonical[pos]) == pos]
+        specs = kept
+    else:
+        spec_pos = list(range(len(specs)))
+
+    # -------- Work list: journal hits resolve now, the rest wait in priority lanes --------
+    total_chunks = len(specs)
+    chunks_out = [None] * total_chunks
+    hits: List[tuple] = []  # (slot, header)
+    lanes: Dict[int, collections.deque] = {}  # lane -> deque of work items [(slot, key), ...]
+    for slot, (doc, i, payload, chunk_id) in enumerate(specs):
+        key = _journal_key(payload, chat_model, window) if journal is not None else ""
+        cached = journal.get(chunk_id, key) if journal is not None else None
+        if cached is not None:
+            hits.append((slot, cached))
+            continue
+        # specs are in document order and lanes are FIFO, so a document's requests go out back
+        # to back and reuse the provider's cached prompt prefix while it is warm
+        lane = lanes.setdefault(priority(doc) if priority is not None else 0, collections.deque())
+        tail = lane[-1] if lane else None
+        if tail is not None and len(tail) < window and specs[tail[-1][0]][0] is doc and specs[tail[-1][0]][1] == i - 1:
+            tail.append((slot, key))  # extend the window of consecutive chunks
+        else:
+            lane.append([(slot, key)])
+    lane_queues = [lanes[lane] for lane in sorted(lanes)]  # drained lowest lane first
+
+    if hits:
+        print(f"[headers] Resumed {len(hits)}/{total_chunks} headers from journal", flush=True)
+
     # Early exit
     if total_chunks == 0:
         if progress_callback:
@@ -305,7 +599,7 @@ async def generate_headers(
     # Setup header progress
     start_time = time.time()
     last_report_time = start_time
-    done = 0
+    usage = PromptCacheStats()
     if progress_callback:
         progress_callback("headers", 0, total_chunks, 0.0, 0.0, float('inf'))
     elif use_tqdm and tqdm_headers is None:
@@ -315,36 +609,9 @@ async def generate_headers(
         except Exception:
             pass
 
-    # -------- Execute with streaming progress (as_completed) --------
-    # We process tasks in slices (batches) to avoid huge task lists overwhelming loop,
-    # but within each slice we stream completion updates.
-    from itertools import islice
-    task_iter = iter(tasks)
-    BATCH_SLICE = batch_size  # reuse batch_size for slice width
-    pending: List[asyncio.Task] = []
-
-    async def consume_slice():
-        nonlocal pending
-        slice_tasks = list(islice(task_iter, BATCH_SLICE))
-        if not slice_tasks:
-            return False
-        # wrap each in ensure_future so we can await as_completed
-        pending.extend([asyncio.ensure_future(t) for t in slice_tasks])
-        return True
-
-    # prime first slice
-    await consume_slice()
-
-    while pending:
-        # Wait for first task to finish
-        done_set, pending_set = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
-        # Update pending list
-        pending = list(pending_set)
-        # Refill if we have capacity (keep roughly <= 2*BATCH_SLICE queued)
-        if len(pending) < BATCH_SLICE:
-            await consume_slice()
-        # Update progress once per completion group
-        done = len(chunks_out)
+    def report():
+        nonlocal last_report_time
+        done = completed
         now = time.time()
         elapsed = now - start_time
         rate = done / elapsed if elapsed > 0 else 0.0
@@ -354,33 +621,112 @@ async def generate_headers(
         if progress_callback:
             if (now - last_report_time) > 0.2 or done == total_chunks or done <= 5:
                 progress_callback("headers", done, total_chunks, pct, rate, eta)
+                if usage.prompt_tokens:
+                    progress_callback("prompt_cache", usage.cached_tokens, usage.prompt_tokens, usage.hit_rate * 100.0, usage.requests / elapsed if elapsed > 0 else 0.0, eta)
                 last_report_time = now
         elif tqdm_headers:
             tqdm_headers.update(done - tqdm_headers.n)
-            tqdm_headers.set_postfix(rate=f"{rate:.2f}/s")
+            tqdm_headers.set_postfix(rate=f"{rate:.2f}/s", cached=f"{usage.hit_rate:.0%}")
         else:
             if (now - last_report_time) > 1 or done == total_chunks or done <= 5:
-                print(f"[headers] {done}/{total_chunks} ({pct:5.1f}%) rate={rate:.2f}/s ETA={'∞' if eta==float('inf') else f'{eta:.1f}s'}", flush=True)
+                cache_note = f" cached={usage.hit_rate:.0%}" if usage.prompt_tokens else ""
+                print(f"[headers] {done}/{total_chunks} ({pct:5.1f}%) rate={rate:.2f}/s ETA={'∞' if eta==float('inf') else f'{eta:.1f}s'}{cache_note}", flush=True)
                 last_report_time = now
 
-    if tqdm_headers:
-        tqdm_headers.close()
-    return chunks_out
+    def finish(slot: int, header: str):
+        nonlocal completed
+        doc_ref, idx, payload_ref, chunk_id = specs[slot]
+        chunks_out[slot] = Chunk(
+            chunk_id=chunk_id,
+            doc_id=doc_ref.doc_id,
+            doc_title=doc_ref.title,
+            raw_chunk=payload_ref['text'],
+            chunk_index=idx,
+            ctx_header=header,
+            augmented_chunk=f"{header}\n\n{payload_ref['text']}",
+            section_path=payload_ref.get('section_path',''),
+            source_org=doc_ref.source_org,
+            source_url=doc_ref.source_url,
+            pub_date=doc_ref.pub_date,
+            duplicate_sources=list(duplicates.get(spec_pos[slot], [])),
+        )
+        completed += 1
+        report()
+
+    for slot, header in hits:
+        telemetry.count("headers.journal_hits")
+        finish(slot, header)
+
+    # -------- Execute: `max_concurrent` long-lived workers pull from the lanes --------
+    # Each completion is O(1): pop the next payload, store the chunk in its slot.
+    scheduled_at = time.perf_counter()
+
+    def next_item():
+        for lane in lane_queues:  # a handful of lanes: O(1) per pop
+            if lane:
+                return lane.popleft()
+        return None
+
+    async def worker():
+        while cancel is None or not cancel.is_set():
+            item = next_item()
+            if item is None:
+                return
+            telemetry.observe("headers.queue_wait_seconds", time.perf_counter() - scheduled_at, queue="concurrency")
+            if len(item) > 1:
+                window_headers = await _request_window(llm, [specs[slot][2] for slot, _ in item], limiter, usage=usage)
+            else:
+                window_headers = [None]
+            for (slot, key), header in zip(item, window_headers):
+                _, _, payload_ref, chunk_id = specs[slot]
+                if header is None:
+                    if len(item) > 1:
+                        telemetry.count("headers.window_fallbacks")
+                    header = await _request_header(llm, payload_ref, limiter, usage=usage)
+                if header is None:
+                    telemetry.count("headers.fallbacks")
+                    header = _fallback_header(payload_ref)  # not journaled: retried on resume
+                elif journal is not None:
+                    journal.append(chunk_id, key, header)
+                finish(slot, header)
+
+    workers = [asyncio.create_task(worker(), name=f"headers-worker-{n}") for n in range(min(max_concurrent, sum(map(len, lane_queues))))]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for w in workers:  # error or outer cancellation: stop the remaining workers
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if tqdm_headers:
+            tqdm_headers.close()
+        if journal is not None:
+            journal.close()
+
+    if usage.prompt_tokens:
+        print(f"[headers] Prompt cache: {usage.cached_tokens}/{usage.prompt_tokens} prompt tokens cached ({usage.hit_rate:.1%})", flush=True)
+    if completed < total_chunks:
+        print(f"[headers] Cancelled: {completed}/{total_chunks} headers done; rerun to resume from the journal", flush=True)
+    return [c for c in chunks_out if c is not None]
 
 # -------- Example LLM adapter (async) ---------
 async def azure_chat_completion(messages: List[Dict], model: str | None = None):  # placeholder; real impl in separate llm module later
     from openai import AsyncAzureOpenAI  # type: ignore
-    from .config import AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, AOAI_CHAT_MODEL
-    client = AsyncAzureOpenAI(api_key=AZURE_OPENAI_API_KEY, azure_endpoint=AZURE_OPENAI_ENDPOINT, api_version="2024-08-01-preview")
+    client = AsyncAzureOpenAI(api_key=config.AZURE_OPENAI_API_KEY, azure_endpoint=config.AZURE_OPENAI_ENDPOINT, api_version="2024-08-01-preview")
     # Use higher token limit for reasoning models like gpt-5-mini that use tokens for internal reasoning
     # Increased from 500 to 800 to handle longer contextual headers
     resp = await client.chat.completions.create(
-        model=model or AOAI_CHAT_MODEL,
+        model=model or config.AOAI_CHAT_MODEL,
         messages=messages,
-        max_completion_tokens=800
+        max_completion_tokens=config.HEADER_MAX_COMPLETION_TOKENS
     )
     content = resp.choices[0].message.content
-    return content.strip() if content else ""
+    usage = getattr(resp, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    return LLMReply(
+        content.strip() if content else "",
+        prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+        cached_tokens=getattr(details, "cached_tokens", 0) or 0,
+    )
 
 __version__ = "0.2.0-progress-callback"
 
@@ -388,15 +734,17 @@ __version__ = "0.2.0-progress-callback"
 class ContextualHeaderGenerator:
     """Synchronous wrapper for contextual header generation."""
 
-    def __init__(self, llm_func=None):
+    def __init__(self, llm_func=None, model: Optional[str] = None):
         """Initialize the header generator.
 
         Args:
             llm_func: Optional LLM function. If None, uses azure_chat_completion.
+            model: Chat model behind a custom `llm_func` (header journal key).
         """
         self.llm_func = llm_func or azure_chat_completion
+        self.model = model
 
-    def generate_headers_batch(self, chunks: List[Chunk], batch_size: int = BATCH_SIZE) -> List[Chunk]:
+    def generate_headers_batch(self, chunks: List[Chunk], batch_size: Optional[int] = None) -> List[Chunk]:
         """Generate contextual headers for a batch of chunks (synchronous).
 
         Args:
@@ -452,7 +800,8 @@ class ContextualHeaderGenerator:
             generate_headers(
                 documents=documents,
                 llm=self.llm_func,
-                batch_size=batch_size
+                batch_size=batch_size,
+                model=self.model,
             )
         )
 
@@ -462,6 +811,9 @@ class ContextualHeaderGenerator:
 __all__ = [
     "generate_headers",
     "azure_chat_completion",
+    "chat_model_name",
+    "LLMReply",
+    "PromptCacheStats",
     "ContextualHeaderGenerator",
     "__version__",
 ]
@@ -1,10 +1,34 @@
-"""FAISS index building and persistence helpers."""
+"""FAISS index building and persistence helpers.
+
+`build_faiss_index_bulk` is the memory-bounded builder used for large corpora:
+
+- the input can be an in-memory or memory-mapped float32 matrix (e.g.
+  ``np.load("embeddings.npy", mmap_mode="r")``), a path to a ``.npy`` file,
+  or an iterable of ``(rows, d)`` blocks;
+- IVF quantizers are trained on a reservoir sample of at most
+  ``INDEX_TRAIN_PER_LIST * nlist`` rows instead of the full matrix;
+- vectors are copied into a reusable per-batch buffer and L2-normalized in
+  place there, so the source is never duplicated or modified;
+- batches are added with FAISS' OpenMP pool sized explicitly
+  (``INDEX_THREADS``) while a helper thread prepares the next batch.
+
+Peak memory is the index itself plus two add buffers and the training
+sample, independent of how the input is supplied. `build_faiss_index` keeps
+its original signature and delegates to the bulk builder.
+"""
 from __future__ import annotations
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+import os
+import tempfile
 import numpy as np
 import faiss  # type: ignore
 
-from .config import EMBED_DIM_FALLBACK
+from . import config, telemetry
+
+EmbeddingSource = Union[np.ndarray, str, Path, Iterable[np.ndarray], List[List[float]]]
 
 
 def build_faiss_index(embeddings: List[List[float]], index_type: str = "auto") -> faiss.Index:
@@ -13,25 +37,238 @@ def build_faiss_index(embeddings: List[List[float]], index_type: str = "auto") -
         arr = arr.reshape(1, -1)
     if arr.size == 0:
         raise ValueError("No embeddings provided")
-    n, d = arr.shape
-    if d == 0:
-        d = EMBED_DIM_FALLBACK
+    return build_faiss_index_bulk(arr, index_type=index_type)
+
+
+def _default_nlist(n: int) -> int:
+    return max(1, min(100, n // 10))
+
+
+def _new_index(n: int, d: int, index_type: str, nlist: Optional[int]) -> Tuple[faiss.Index, bool]:
+    """Empty index for `n` vectors of dim `d`; second value says whether it needs training."""
     if index_type == "auto":
         index_type = "ivf" if n > 1000 else "flat"
     if index_type == "flat":
-        index = faiss.IndexFlatIP(d)
-    elif index_type == "ivf":
-        nlist = max(1, min(100, n // 10))
+        return faiss.IndexFlatIP(d), False
+    if index_type == "ivf":
+        nlist = nlist or _default_nlist(n)
         if n <= nlist:
-            index = faiss.IndexFlatIP(d)
-        else:
-            quantizer = faiss.IndexFlatIP(d)
-            index = faiss.IndexIVFFlat(quantizer, d, nlist)
-            index.train(arr)
-    else:
-        raise ValueError(f"Unknown index_type {index_type}")
-    faiss.normalize_L2(arr)
-    index.add(arr)
+            return faiss.IndexFlatIP(d), False
+        quantizer = faiss.IndexFlatIP(d)
+        # Inner product on normalized vectors = cosine, matching the flat index
+        return faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT), True
+    raise ValueError(f"Unknown index_type {index_type}")
+
+
+def _reservoir_rows(n: int, k: int, rng: np.random.Generator) -> np.ndarray:
+    """Sorted row positions of a uniform sample of `k` out of `n` (sequential reads on mmaps)."""
+    if k >= n:
+        return np.arange(n)
+    return np.sort(rng.choice(n, size=k, replace=False))
+
+
+class _Reservoir:
+    """Streaming uniform sample of rows (Algorithm R, vectorized per block)."""
+
+    def __init__(self, k: int, d: int, rng: np.random.Generator):
+        self.sample = np.empty((k, d), dtype=np.float32)
+        self.k = k
+        self.seen = 0
+        self.rng = rng
+
+    def update(self, block: np.ndarray):
+        b = block.shape[0]
+        fill = max(0, min(b, self.k - self.seen))
+        if fill:
+            self.sample[self.seen:self.seen + fill] = block[:fill]
+        if fill < b:
+            positions = np.arange(self.seen + fill, self.seen + b)
+            slots = self.rng.integers(0, positions + 1)
+            keep = slots < self.k
+            # duplicate slots resolve to the later row, as in the sequential algorithm
+            self.sample[slots[keep]] = block[fill:][keep]
+        self.seen += b
+
+    def rows(self) -> np.ndarray:
+        return self.sample[: min(self.seen, self.k)]
+
+
+def _is_block_stream(source) -> bool:
+    """Iterators/generators and lists of arrays are block streams; nested lists are one matrix."""
+    if isinstance(source, np.ndarray):
+        return False
+    if isinstance(source, (list, tuple)):
+        return bool(source) and isinstance(source[0], np.ndarray)
+    return True
+
+
+def _as_block(block) -> np.ndarray:
+    block = np.asarray(block, dtype=np.float32)
+    return block.reshape(1, -1) if block.ndim == 1 else block
+
+
+def _spill_blocks(blocks: Iterable[np.ndarray], reservoir_size: int, rng: np.random.Generator, spill_dir: Optional[Path]):
+    """Single pass over a block stream: write rows to a raw float32 file and reservoir-sample them."""
+    # on disk next to the cache by default: /tmp is often RAM-backed
+    fd, name = tempfile.mkstemp(suffix=".f32", prefix=".index-build-", dir=spill_dir or config.CACHE_DIR)
+    path = Path(name)
+    reservoir: Optional[_Reservoir] = None
+    n = d = 0
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            for block in blocks:
+                block = _as_block(block)
+                if block.size == 0:
+                    continue
+                if reservoir is None:
+                    d = block.shape[1]
+                    reservoir = _Reservoir(reservoir_size, d, rng)
+                elif block.shape[1] != d:
+                    raise ValueError(f"Inconsistent embedding dimension: {block.shape[1]} != {d}")
+                fh.write(np.ascontiguousarray(block).tobytes())
+                reservoir.update(block)
+                n += block.shape[0]
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return path, n, d, reservoir
+
+
+@contextmanager
+def omp_threads(threads: int):
+    """Temporarily set FAISS' OpenMP thread count (0 keeps the current setting)."""
+    previous = faiss.omp_get_max_threads()
+    if threads > 0:
+        faiss.omp_set_num_threads(threads)
+    try:
+        yield
+    finally:
+        faiss.omp_set_num_threads(previous)
+
+
+def _normalized_batches(source: np.ndarray, batch: int, rows: Optional[np.ndarray] = None) -> Iterator[np.ndarray]:
+    """Yield normalized copies of consecutive row ranges (of `rows` when given); the next one is prepared while the caller adds."""
+    n = source.shape[0] if rows is None else len(rows)
+    d = source.shape[1]
+    buffers = [np.empty((min(batch, n), d), dtype=np.float32) for _ in range(2)]
+
+    def prepare(i: int, start: int) -> np.ndarray:
+        stop = min(start + batch, n)
+        buf = buffers[i % 2][: stop - start]
+        block = source[start:stop] if rows is None else source[rows[start:stop]]
+        np.copyto(buf, block, casting="same_kind")
+        faiss.normalize_L2(buf)
+        return buf
+
+    starts = range(0, n, batch)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-prep") as prep:
+        pending = prep.submit(prepare, 0, 0)
+        for i in range(len(starts)):
+            ready = pending.result()
+            if i + 1 < len(starts):
+                # safe: the other buffer was consumed by the previous index.add
+                pending = prep.submit(prepare, i + 1, starts[i + 1])
+            yield ready
+
+
+@telemetry.traced("index.build")
+def build_faiss_index_bulk(
+    source: EmbeddingSource,
+    index_type: str = "auto",
+    nlist: Optional[int] = None,
+    train_per_list: Optional[int] = None,
+    add_batch: Optional[int] = None,
+    threads: Optional[int] = None,
+    seed: int = 1234,
+    spill_dir: Optional[Path] = None,
+    rows: Optional[np.ndarray] = None,
+) -> faiss.Index:
+    """Build a cosine-similarity index without materializing a normalized copy of the corpus.
+
+    Parameters
+    ----------
+    source : ndarray | path | iterable of blocks
+        ``(n, d)`` float32 matrix (memmaps are read, never written), a
+        ``.npy`` path opened with ``mmap_mode="r"``, or an iterable of
+        ``(rows, d)`` blocks. Block streams are spilled once to a temporary
+        raw file in `spill_dir` (default ``CACHE_DIR``) while being sampled, then added from a memmap.
+    index_type : str
+        ``"auto"``, ``"flat"`` or ``"ivf"`` (same rules as `build_faiss_index`).
+    nlist : int | None
+        IVF list count; defaults to the `build_faiss_index` heuristic.
+    train_per_list : int | None
+        Training sample size per IVF list (FAISS needs ~39-256); default
+        ``config.INDEX_TRAIN_PER_LIST``.
+    add_batch : int | None
+        Rows normalized and added per `index.add` call; default
+        ``config.INDEX_ADD_BATCH``.
+    threads : int | None
+        OpenMP threads for training/adding; 0 keeps FAISS' default. Default
+        ``config.INDEX_THREADS``.
+    rows : ndarray | None
+        Index only these row positions, labelled by position (flat indexes
+        are wrapped in ``IndexIDMap``). Used to leave failed embeddings out
+        while keeping labels aligned with the metadata (`rag.repair`).
+    """
+    train_per_list = train_per_list or config.INDEX_TRAIN_PER_LIST
+    add_batch = add_batch or config.INDEX_ADD_BATCH
+    threads = config.INDEX_THREADS if threads is None else threads
+    rng = np.random.default_rng(seed)
+    spill_path: Optional[Path] = None
+    sample: Optional[np.ndarray] = None
+    if isinstance(source, (str, Path)):
+        source = np.load(source, mmap_mode="r")
+    elif _is_block_stream(source):
+        # Iterable of blocks. The reservoir must be sized before n is known;
+        # size it for the largest nlist the heuristic can pick.
+        reservoir_size = train_per_list * (nlist or _default_nlist(10**9))
+        spill_path, n, d, reservoir = _spill_blocks(source, reservoir_size, rng, spill_dir)
+        if n == 0:
+            spill_path.unlink(missing_ok=True)
+            raise ValueError("No embeddings provided")
+        source = np.memmap(spill_path, dtype=np.float32, mode="r", shape=(n, d))
+        sample = reservoir.rows() if rows is None else None
+    if not isinstance(source, np.ndarray):
+        source = np.asarray(source, dtype=np.float32)
+    if source.ndim == 1:
+        source = source.reshape(1, -1)
+    if source.size == 0:
+        raise ValueError("No embeddings provided")
+    n, d = source.shape
+    if rows is not None:
+        rows = np.asarray(rows, dtype=np.int64)
+        n = len(rows)
+        if n == 0:
+            raise ValueError("No embeddings provided")
+
+    try:
+        with omp_threads(threads):
+            index, needs_training = _new_index(n, d, index_type, nlist)
+            telemetry.annotate(rows=n, dim=d, index_type=type(index).__name__)
+            if needs_training:
+                k = min(n, train_per_list * index.nlist)
+                if sample is None or sample.shape[0] > k:
+                    if sample is not None:
+                        sample = sample[_reservoir_rows(sample.shape[0], k, rng)]
+                    else:
+                        picked = _reservoir_rows(n, k, rng)
+                        sample = source[picked if rows is None else rows[picked]]
+                sample = np.array(sample, dtype=np.float32)  # private copy, normalized in place
+                faiss.normalize_L2(sample)
+                index.train(sample)
+                del sample
+            if rows is not None and not needs_training:
+                index = faiss.IndexIDMap(index)
+            start = 0
+            for batch in _normalized_batches(source, max(1, add_batch), rows):
+                if rows is None:
+                    index.add(batch)
+                else:
+                    index.add_with_ids(batch, rows[start:start + len(batch)])
+                start += len(batch)
+    finally:
+        if spill_path is not None:
+            spill_path.unlink(missing_ok=True)
     return index
 
 
@@ -39,4 +276,4 @@ def search_index(index: faiss.Index, query_vec, top_k: int = 5):
     scores, indices = index.search(query_vec, top_k)
     return scores, indices
 
-__all__ = ["build_faiss_index", "search_index"]
+__all__ = ["build_faiss_index", "build_faiss_index_bulk", "omp_threads", "search_index"]
@@ -10,6 +10,7 @@ try:
 except ImportError:
     PyPDF2 = None
 
+from . import telemetry
 from .models import Document
 
 
@@ -19,12 +20,13 @@ def extract_text_from_pdf(pdf_path: Path) -> str:
         raise ImportError("PyPDF2 is required for PDF extraction. Install with: pip install PyPDF2")
 
     text_parts = []
-    with open(pdf_path, 'rb') as f:
+    with telemetry.span("pdf.extract", file=Path(pdf_path).name) as sp, open(pdf_path, 'rb') as f:
         reader = PyPDF2.PdfReader(f)
         for page in reader.pages:
             text = page.extract_text()
             if text:
                 text_parts.append(text)
+        sp.set(pages=len(reader.pages))
 
     return "\n\n".join(text_parts)
 
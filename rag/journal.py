@@ -0,0 +1,242 @@
+"""Append-only journals that make header and embedding jobs resumable.
+
+Both long-running phases used to keep finished work only in memory, so a
+kernel restart at 90% lost every paid LLM / embedding call. Each completed
+result is now appended to a journal under ``CACHE_DIR/journals`` and reused
+on the next run:
+
+    headers.jsonl                     one JSON line per chunk:
+                                      {"chunk_id", "key", "header"}
+    embeddings/<model>/
+        seg-000001.npy                float32 rows of one finished batch
+        seg-000001.keys.json          [[chunk_id, key], ...] for those rows
+
+Entries are keyed by chunk id and carry a content ``key`` (sha1 of the
+input text plus prompt/model), so a re-chunked or edited chunk is recomputed
+rather than served stale. Writes are crash safe: a torn trailing JSONL line
+is ignored, and an embedding segment only counts once its ``keys.json`` has
+been renamed into place after the ``.npy``.
+
+The header journal is compacted when it is reopened: lines superseded by a
+later entry for the same chunk (a re-generated header) and torn lines are
+dropped, so the file stays one line per chunk however often headers are
+regenerated.
+
+An embedding journal is shared by every build using the same model. A build
+that persisted its rows elsewhere either clears the journal (the main index)
+or discards just the ids it wrote (`EmbeddingJournal.discard`, used by the
+variant builds).
+
+Delete the journal directory to force regeneration.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+import re
+import shutil
+import numpy as np
+
+from . import config
+
+__all__ = [
+    "JOURNAL_DIR",
+    "HEADER_JOURNAL_PATH",
+    "content_key",
+    "HeaderJournal",
+    "EmbeddingJournal",
+]
+
+# Resolved under config.CACHE_DIR on access, so importing this module touches no disk
+_path, __getattr__ = config.lazy_paths(__name__, {
+    "JOURNAL_DIR": lambda: config.CACHE_DIR / "journals",
+    "HEADER_JOURNAL_PATH": lambda: _path("JOURNAL_DIR") / "headers.jsonl",
+})
+
+
+def content_key(*parts: str) -> str:
+    """Stable sha1 over the inputs that determine a result."""
+    h = hashlib.sha1()
+    for p in parts:
+        h.update(p.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class HeaderJournal:
+    """Append-only JSONL of generated headers keyed by chunk id."""
+
+    def __init__(self, path: Optional[Path | str] = None, fsync_every: int = 32):
+        self.path = Path(path or _path("HEADER_JOURNAL_PATH"))
+        self.fsync_every = fsync_every
+        self._entries: Dict[str, Tuple[str, str]] = {}
+        self._fh = None
+        self._unsynced = 0
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        lines = 0
+        with open(self.path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                lines += 1
+                try:
+                    rec = json.loads(line)
+                except ValueError:  # torn final line from a crash mid-write
+                    continue
+                self._entries[rec["chunk_id"]] = (rec["key"], rec["header"])
+        if lines > len(self._entries):
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the file with one line per chunk (latest entry), atomically."""
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            for chunk_id, (key, header) in self._entries.items():
+                fh.write(json.dumps({"chunk_id": chunk_id, "key": key, "header": header}, ensure_ascii=False) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        tmp.replace(self.path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, chunk_id: str, key: str) -> Optional[str]:
+        entry = self._entries.get(chunk_id)
+        return entry[1] if entry is not None and entry[0] == key else None
+
+    def append(self, chunk_id: str, key: str, header: str):
+        if self._fh is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fh = open(self.path, "a", encoding="utf-8")
+        self._fh.write(json.dumps({"chunk_id": chunk_id, "key": key, "header": header}, ensure_ascii=False) + "\n")
+        self._fh.flush()  # survives a kernel/process crash
+        self._entries[chunk_id] = (key, header)
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            os.fsync(self._fh.fileno())  # survives power loss, amortized
+            self._unsynced = 0
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._fh.close()
+            self._fh = None
+            self._unsynced = 0
+
+
+class EmbeddingJournal:
+    """Directory of ``.npy`` segments, one per finished embedding batch."""
+
+    def __init__(self, directory: Path | str):
+        self.directory = Path(directory)
+        self._rows: Dict[str, Tuple[str, int, int]] = {}  # chunk_id -> (key, segment, row)
+        self._segments: List[np.ndarray] = []
+        self._paths: List[Path] = []  # keys file of each segment
+        self._load()
+
+    @classmethod
+    def for_model(cls, model: str, root: Optional[Path] = None) -> "EmbeddingJournal":
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "-", model or "default").strip("-") or "default"
+        return cls((root or _path("JOURNAL_DIR") / "embeddings") / slug)
+
+    def _load(self):
+        if not self.directory.exists():
+            return
+        for keys_path in sorted(self.directory.glob("seg-*.keys.json")):
+            npy = keys_path.with_name(keys_path.name.replace(".keys.json", ".npy"))
+            if not npy.exists():
+                continue
+            seg = np.load(npy, mmap_mode="r")
+            pairs = json.loads(keys_path.read_text("utf-8"))
+            if len(pairs) != seg.shape[0]:
+                continue
+            s = len(self._segments)
+            self._segments.append(seg)
+            self._paths.append(keys_path)
+            for row, (chunk_id, key) in enumerate(pairs):
+                self._rows[chunk_id] = (key, s, row)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def dim(self) -> Optional[int]:
+        return int(self._segments[0].shape[1]) if self._segments else None
+
+    def lookup(self, ids: Sequence[str], keys: Sequence[str]) -> np.ndarray:
+        """Boolean mask of positions whose (id, key) is journaled."""
+        return np.fromiter(
+            ((e := self._rows.get(i)) is not None and e[0] == k for i, k in zip(ids, keys)),
+            dtype=bool,
+            count=len(ids),
+        )
+
+    def fill(self, ids: Sequence[str], positions: Iterable[int], out: np.ndarray):
+        """Copy journaled vectors for `ids[p]` into ``out[p]``."""
+        for p in positions:
+            _, s, row = self._rows[ids[p]]
+            out[p] = self._segments[s][row]
+
+    def append(self, ids: Sequence[str], keys: Sequence[str], vectors: np.ndarray):
+        """Durably record one batch; the keys file is the commit marker."""
+        if len(ids) == 0:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        n = len(self._segments) + 1
+        while (self.directory / f"seg-{n:06d}.keys.json").exists():
+            n += 1
+        npy = self.directory / f"seg-{n:06d}.npy"
+        tmp = npy.with_suffix(".npy.tmp")
+        with open(tmp, "wb") as fh:
+            np.save(fh, np.ascontiguousarray(vectors, dtype=np.float32))
+            fh.flush()
+            os.fsync(fh.fileno())
+        tmp.replace(npy)
+        keys_tmp = self.directory / f".seg-{n:06d}.keys.tmp"
+        keys_tmp.write_text(json.dumps([[i, k] for i, k in zip(ids, keys)]), "utf-8")
+        keys_path = self.directory / f"seg-{n:06d}.keys.json"
+        keys_tmp.replace(keys_path)
+        s = len(self._segments)
+        self._segments.append(np.load(npy, mmap_mode="r"))
+        self._paths.append(keys_path)
+        for row, (chunk_id, key) in enumerate(zip(ids, keys)):
+            self._rows[chunk_id] = (key, s, row)
+
+    def discard(self, ids: Iterable[str]):
+        """Drop the rows of `ids` once they are persisted elsewhere; other writers' rows stay.
+
+        Segments left without live rows are deleted. A segment that still
+        holds other ids is rewritten as a new segment of just those rows
+        before the old one goes, so a crash in between only leaves duplicates.
+        """
+        affected: Dict[int, None] = {}
+        for chunk_id in ids:
+            entry = self._rows.pop(chunk_id, None)
+            if entry is not None:
+                affected[entry[1]] = None
+        if not affected:
+            return
+        live: Dict[int, List[Tuple[str, str, int]]] = {s: [] for s in affected}
+        for chunk_id, (key, s, row) in self._rows.items():
+            if s in live:
+                live[s].append((chunk_id, key, row))
+        for s, rows in live.items():
+            if rows:
+                rows.sort(key=lambda e: e[2])
+                self.append([e[0] for e in rows], [e[1] for e in rows], np.asarray(self._segments[s])[[e[2] for e in rows]])
+            self._segments[s] = np.empty((0, self._segments[s].shape[1]), dtype=np.float32)  # release the memory map
+            keys_path = self._paths[s]
+            keys_path.unlink(missing_ok=True)  # the keys file is the commit marker: remove it first
+            keys_path.with_name(keys_path.name.replace(".keys.json", ".npy")).unlink(missing_ok=True)
+
+    def clear(self):
+        """Drop the journal once its contents are persisted elsewhere (e.g. a snapshot)."""
+        self._rows.clear()
+        self._segments.clear()
+        self._paths.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,163 @@
+"""Corpus-level keyword extraction for header prompts.
+
+Each document's ``<keywords>`` in the header prompt used to be its most
+frequent tokens, so words that every guideline repeats ("screening",
+"patients", "recommendation") won everywhere. Keywords now come from one
+sparse TF-IDF pass over the whole corpus:
+
+    keywords = corpus_keywords([doc.content for doc in docs], k=12)
+
+Pipeline (scikit-learn, imported on first use):
+
+1. Tokens are lower-case alphanumeric runs of 4+ characters minus
+   `STOPWORDS`, as before. One ``TfidfVectorizer`` (sublinear tf, smoothed
+   idf) covers all documents, so corpus-wide terms sink.
+2. Medical boosts are a per-vocabulary vector computed once with
+   ``np.char.find``. A clinical suffix (`MEDICAL_SUFFIXES`) adds 2 and an
+   organ-system stem (`ORGAN_STEMS`) adds 1. Each column is scaled by
+   ``1 + boost / 2``.
+3. Top-k per document comes from ``argpartition`` on each CSR row, with
+   ties broken alphabetically, so results are deterministic.
+
+Results are cached per document content hash in ``CACHE_DIR/keywords.json``.
+A document keeps the keywords it was first given, even when documents are
+added later. That keeps header prompts, and therefore the header journal
+keys (`rag.journal`), stable. When every document is cached, no vectorizer
+runs.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import json
+import os
+import tempfile
+import numpy as np
+
+from . import config
+from .journal import content_key
+
+__all__ = [
+    "STOPWORDS",
+    "MEDICAL_SUFFIXES",
+    "ORGAN_STEMS",
+    "KEYWORD_CACHE_PATH",
+    "KeywordCache",
+    "extract_keywords",
+    "corpus_keywords",
+]
+
+STOPWORDS = { 'the','and','for','with','that','this','from','are','was','were','will','into','about','your','their','there','such','these','those','than','then','have','has','had','may','can','also','been','being','within','without','between','among','over','under','more','most','some','other','which','while','where','when','what','who','whom','whose','why','how','a','an','of','to','in','on','by','it','its','as','at','or','we','our','you' }
+MEDICAL_SUFFIXES = ("itis", "osis", "emia", "pathy", "genic", "therapy", "lysis", "oma")
+ORGAN_STEMS = ("onc", "cardio", "neuro", "hepat", "renal", "derm", "pulmo", "immun")
+
+_path, __getattr__ = config.lazy_paths(__name__, {"KEYWORD_CACHE_PATH": lambda: config.CACHE_DIR / "keywords.json"})
+_VERSION = "tfidf-v1"  # bump when tokenization / scoring changes
+
+
+def _boosts(vocabulary: np.ndarray) -> np.ndarray:
+    """Medical-term bonus per vocabulary entry (0 to 3)."""
+    terms = vocabulary.astype(str)
+    suffix = np.zeros(len(terms), dtype=bool)
+    for s in MEDICAL_SUFFIXES:
+        suffix |= np.char.find(terms, s) >= 0
+    stem = np.zeros(len(terms), dtype=bool)
+    for s in ORGAN_STEMS:
+        stem |= np.char.find(terms, s) >= 0
+    return 2.0 * suffix + 1.0 * stem
+
+
+def extract_keywords(texts: Sequence[str], k: int = 12) -> List[List[str]]:
+    """Top-`k` boosted TF-IDF terms for every text, fit on `texts` together (uncached)."""
+    if not texts:
+        return []
+    from scipy import sparse  # type: ignore
+    from sklearn.feature_extraction.text import TfidfVectorizer  # type: ignore
+
+    vectorizer = TfidfVectorizer(
+        lowercase=True,
+        token_pattern=r"[a-z0-9]{4,}",
+        stop_words=sorted(STOPWORDS),
+        sublinear_tf=True,
+        dtype=np.float32,
+    )
+    try:
+        matrix = vectorizer.fit_transform(texts)
+    except ValueError:  # empty vocabulary: no text has a usable token
+        return [[] for _ in texts]
+    vocabulary = vectorizer.get_feature_names_out()
+    matrix = (matrix @ sparse.diags(1.0 + _boosts(vocabulary) / 2.0)).tocsr()
+
+    out: List[List[str]] = []
+    indptr, indices, data = matrix.indptr, matrix.indices, matrix.data
+    for row in range(matrix.shape[0]):
+        cols = indices[indptr[row]:indptr[row + 1]]
+        scores = data[indptr[row]:indptr[row + 1]]
+        if len(scores) > k:
+            keep = np.argpartition(-scores, k - 1)[:k]
+            # include every term tied with the k-th score so the tie-break below is complete
+            cutoff = scores[keep].min()
+            keep = np.flatnonzero(scores >= cutoff)
+            cols, scores = cols[keep], scores[keep]
+        terms = vocabulary[cols]
+        order = np.lexsort((terms, -scores))[:k]
+        out.append(terms[order].tolist())
+    return out
+
+
+class KeywordCache:
+    """JSON map of document content hash -> keywords, rewritten atomically."""
+
+    def __init__(self, path: Optional[Path | str] = None):
+        self.path = Path(path or _path("KEYWORD_CACHE_PATH"))
+        self._entries: Dict[str, List[str]] = {}
+        self._dirty = False
+        if self.path.exists():
+            try:
+                self._entries = json.loads(self.path.read_text("utf-8"))
+            except ValueError:  # corrupt file: recompute
+                self._entries = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[List[str]]:
+        return self._entries.get(key)
+
+    def put(self, key: str, keywords: List[str]):
+        self._entries[key] = keywords
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self.path.parent, delete=False) as tmp:
+            json.dump(self._entries, tmp, ensure_ascii=False)
+        os.replace(tmp.name, self.path)
+        self._dirty = False
+
+
+def corpus_keywords(texts: Sequence[str], k: int = 12, cache_path: Optional[Path] = config.DEFAULT) -> List[List[str]]:
+    """Keywords for every text; only documents missing from the cache are vectorized.
+
+    The IDF is fit on all `texts` (the whole corpus) whenever at least one
+    document misses, so new documents are scored against the full corpus.
+    `cache_path` defaults to `KEYWORD_CACHE_PATH`; None disables caching.
+    """
+    if cache_path is config.DEFAULT:
+        cache_path = _path("KEYWORD_CACHE_PATH")
+    cache = KeywordCache(cache_path) if cache_path is not None else None
+    keys = [content_key(_VERSION, str(k), t) for t in texts]
+    result: List[Optional[List[str]]] = [cache.get(key) if cache is not None else None for key in keys]
+    if all(r is not None for r in result):
+        return result  # type: ignore[return-value]
+
+    computed = extract_keywords(texts, k)
+    for i, key in enumerate(keys):
+        if result[i] is None:
+            result[i] = computed[i]
+            if cache is not None:
+                cache.put(key, computed[i])
+    if cache is not None:
+        cache.save()
+    return result  # type: ignore[return-value]
@@ -0,0 +1,325 @@
+"""Local CPU embedder (LSA) with a companion index and API failover.
+
+Every query normally goes to Azure through `get_embeddings_batch`. During an
+outage that call retries with backoff and then returns zero vectors, which
+rank arbitrary chunks. This module provides a corpus-fitted embedder that
+needs no network:
+
+    local = build_local_index(texts, metadata)       # fit + embed + index, saved under CACHE_DIR/local
+    retriever = FailoverRetriever(primary, load_local_retriever())
+
+`LSAEmbedder` is TF-IDF (sublinear tf, smoothed idf, l2) followed by a
+TruncatedSVD projection to `LOCAL_EMBED_DIM` dimensions, fitted with
+scikit-learn. Encoding does not use scikit-learn. The vocabulary, idf and
+projection are plain arrays: tokenize, weight the terms, and sum the
+matching projection rows. A query is encoded in well under a millisecond.
+The model is saved as a single ``.npz`` (no pickle) inside the companion
+index bundle. Its `model_name` is a hash of those arrays, so a refit model
+never reuses vectors journaled or cached for another fit.
+
+The LSA vectors live in their own space, so they are searched only against
+the companion index built from the same texts and metadata rows. The bundle
+records the digest of those texts (``local.json``). `FailoverRetriever`
+searches the primary (API) retriever and answers from the companion index in
+two cases:
+- the primary raises or returns a zero query vector
+- the primary failed less than `cooldown` seconds ago
+
+The companion's row numbers only mean the same chunks while the primary
+holds the same texts. When the primary knows its texts digest (a snapshot,
+including one hot-swapped in later) and the companion's differs, failover is
+disabled until the companion is rebuilt.
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+
+from . import config, telemetry
+
+__all__ = [
+    "LOCAL_INDEX_DIR",
+    "LSAEmbedder",
+    "build_local_index",
+    "load_local_retriever",
+    "FailoverRetriever",
+]
+
+_path, __getattr__ = config.lazy_paths(__name__, {"LOCAL_INDEX_DIR": lambda: config.CACHE_DIR / "local"})
+MODEL_FILE = "lsa.npz"
+MANIFEST_FILE = "local.json"  # {"model", "texts_sha256", "count"} of the companion bundle
+_TOKEN_PATTERN = r"(?u)\b\w\w+\b"  # scikit-learn's default, so fit and encode tokenize alike
+
+
+class LSAEmbedder:
+    """TF-IDF + SVD projection; callable as an ``embed_fn`` (``List[str] -> (n, dim)`` float32).
+
+    `model_name` identifies the fitted arrays (vocabulary, idf, projection)
+    and is what manifests and embedding journals record.
+    """
+
+    def __init__(self, vocabulary: Sequence[str], idf: np.ndarray, components: np.ndarray, batch_size: Optional[int] = None, workers: Optional[int] = None):
+        self.terms = np.asarray(vocabulary, dtype=str)
+        self._column = {t: i for i, t in enumerate(self.terms.tolist())}
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)  # (vocab, dim)
+        self.batch_size = batch_size or config.LOCAL_EMBED_BATCH
+        self.workers = workers or config.LOCAL_EMBED_WORKERS or os.cpu_count() or 1
+        self._token = re.compile(_TOKEN_PATTERN)
+        self.model_name = self._fingerprint()
+
+    def _fingerprint(self) -> str:
+        h = hashlib.sha256()
+        h.update("\0".join(self.terms.tolist()).encode("utf-8"))
+        h.update(self.idf.tobytes())
+        h.update(self.components.tobytes())
+        return f"lsa-{self.dim}d-{h.hexdigest()[:16]}"
+
+    @property
+    def dim(self) -> int:
+        return self.components.shape[1]
+
+    @classmethod
+    def fit(cls, texts: Sequence[str], dim: Optional[int] = None, max_features: Optional[int] = None, seed: int = 1234) -> "LSAEmbedder":
+        """Fit vocabulary, idf and the SVD projection on the corpus `texts`."""
+        from sklearn.decomposition import TruncatedSVD  # type: ignore
+        from sklearn.feature_extraction.text import TfidfVectorizer  # type: ignore
+
+        vectorizer = TfidfVectorizer(
+            lowercase=True,
+            token_pattern=_TOKEN_PATTERN,
+            sublinear_tf=True,
+            min_df=2 if len(texts) >= 100 else 1,
+            max_features=max_features or config.LOCAL_EMBED_MAX_FEATURES,
+            dtype=np.float32,
+        )
+        with telemetry.span("local_embed.fit", texts=len(texts)):
+            tfidf = vectorizer.fit_transform(texts)
+            dim = min(dim or config.LOCAL_EMBED_DIM, tfidf.shape[1] - 1, tfidf.shape[0] - 1)
+            if dim < 1:
+                raise ValueError("Corpus too small to fit a local embedder")
+            svd = TruncatedSVD(n_components=dim, algorithm="randomized", random_state=seed)
+            svd.fit(tfidf)
+        return cls(vectorizer.get_feature_names_out(), vectorizer.idf_, svd.components_.T)
+
+    # -- persistence --
+    def save(self, path: Path | str):
+        from .cache import _atomic_path
+
+        with _atomic_path(Path(path)) as tmp:
+            with open(tmp, "wb") as fh:
+                np.savez(fh, vocabulary=self.terms, idf=self.idf, components=self.components)
+
+    @classmethod
+    def load(cls, path: Path | str) -> Optional["LSAEmbedder"]:
+        path = Path(path)
+        if not path.exists():
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["vocabulary"], data["idf"], data["components"])
+
+    # -- encoding --
+    def _encode(self, texts: Sequence[str]) -> np.ndarray:
+        # per text: term counts -> sublinear tf * idf -> l2 -> weighted sum of projection rows
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        column = self._column
+        for i, text in enumerate(texts):
+            counts: Dict[int, int] = {}
+            for token in self._token.findall(text.lower()):
+                j = column.get(token)
+                if j is not None:
+                    counts[j] = counts.get(j, 0) + 1
+            if not counts:
+                continue
+            idx = np.fromiter(counts, dtype=np.int64, count=len(counts))
+            w = (1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))) * self.idf[idx]
+            w /= np.linalg.norm(w)
+            out[i] = w @ self.components[idx]
+        out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """(n, dim) L2-normalized float32 vectors; large inputs run in batches on a thread pool."""
+        texts = list(texts)
+        if len(texts) <= self.batch_size or self.workers <= 1:
+            return self._encode(texts)
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        starts = range(0, len(texts), self.batch_size)
+
+        def work(start: int):
+            out[start:start + self.batch_size] = self._encode(texts[start:start + self.batch_size])
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="lsa-embed") as pool:
+            list(pool.map(work, starts))
+        return out
+
+    __call__ = embed
+
+
+def build_local_index(
+    texts: Sequence[str],
+    metadata: Sequence[Dict[str, Any]],
+    dim: Optional[int] = None,
+    directory: Optional[Path] = None,
+    index_type: str = "auto",
+):
+    """Fit an `LSAEmbedder` on `texts`, index them and save the companion bundle.
+
+    `texts` / `metadata` should be the same rows as the primary index, so
+    either index answers with the same chunks. Returns an `EmbeddingRetriever`.
+    """
+    from .cache import _atomic_write, save_index_bundle
+    from .index import build_faiss_index_bulk
+    from .retrieval import EmbeddingRetriever
+    from .snapshots import texts_digest
+
+    directory = directory or _path("LOCAL_INDEX_DIR")
+    start = time.perf_counter()
+    embedder = LSAEmbedder.fit(texts, dim)
+    with telemetry.span("local_embed.corpus", texts=len(texts), dim=embedder.dim):
+        emb = embedder.embed(texts)
+    index = build_faiss_index_bulk(emb, index_type=index_type)
+    save_index_bundle(directory, index, emb, metadata)
+    embedder.save(directory / MODEL_FILE)
+    digest = texts_digest(texts)
+    manifest = {"model": embedder.model_name, "texts_sha256": digest, "count": len(texts)}
+    _atomic_write(directory / MANIFEST_FILE, json.dumps(manifest, indent=2).encode("utf-8"))
+    print(f"[local-embed] {len(texts)} texts -> {embedder.dim}-dim LSA index in {time.perf_counter() - start:.1f}s ({directory})")
+    return EmbeddingRetriever(index, metadata, embed_fn=embedder, version=f"local:{embedder.model_name}:{index.ntotal}", texts_sha256=digest)
+
+
+def load_local_retriever(directory: Optional[Path] = None, mmap: bool = False):
+    """The saved companion index with its embedder, or None if it was never built.
+
+    Bundles saved before ``local.json`` existed load without a texts digest,
+    so a `FailoverRetriever` over a snapshot will not use them.
+    """
+    from .cache import load_index_bundle
+    from .retrieval import EmbeddingRetriever
+
+    directory = directory or _path("LOCAL_INDEX_DIR")
+    embedder = LSAEmbedder.load(directory / MODEL_FILE)
+    bundle = load_index_bundle(directory, mmap=mmap)
+    if embedder is None or bundle is None:
+        return None
+    index, metadata, _ = bundle
+    manifest_path = directory / MANIFEST_FILE
+    manifest = json.loads(manifest_path.read_text("utf-8")) if manifest_path.exists() else {}
+    return EmbeddingRetriever(
+        index, metadata, embed_fn=embedder, version=f"local:{embedder.model_name}:{index.ntotal}",
+        texts_sha256=manifest.get("texts_sha256"),
+    )
+
+
+class FailoverRetriever:
+    """Primary retriever with a local companion used while the primary is failing.
+
+    A query is answered from `fallback` when the primary raises, returns an
+    all-zero query vector (the embedding client's failure value), or failed
+    less than `cooldown` seconds ago. During the cooldown the primary is not
+    called, so an outage costs no retry latency. Fallback results carry
+    ``"retrieval_mode": "local"``.
+
+    The fallback is only used while it covers the primary's rows
+    (`fallback_current`). After the primary hot-swaps to a snapshot of other
+    texts, queries go to the primary alone, as without a fallback.
+    """
+
+    def __init__(self, primary, fallback, cooldown: Optional[float] = None):
+        self.primary = primary
+        self.fallback = fallback
+        self.cooldown = config.LOCAL_FAILOVER_COOLDOWN_SECONDS if cooldown is None else cooldown
+        self._failed_at = float("-inf")
+        self._lock = threading.Lock()
+        self._stale_version: Optional[str] = None  # primary version already reported as not covered
+        self.stats = {"primary": 0, "fallback": 0, "failures": 0}
+
+    @property
+    def index(self):
+        return self.primary.index
+
+    @property
+    def metadata(self):
+        return self.primary.metadata
+
+    @property
+    def version(self) -> str:
+        return self.primary.version
+
+    @property
+    def fallback_current(self) -> bool:
+        """Whether the fallback was built from the primary's texts.
+
+        A primary without a texts digest (a fixed flat-file index) is taken
+        as matching; a snapshot primary needs the companion's digest to be equal.
+        """
+        expected = getattr(self.primary, "texts_sha256", None)
+        return expected is None or getattr(self.fallback, "texts_sha256", None) == expected
+
+    def _check_fallback(self) -> bool:
+        if self.fallback_current:
+            return True
+        version = self.primary.version
+        if self._stale_version != version:
+            self._stale_version = version
+            print(f"[local-embed] Companion index does not match {version}; failover disabled until it is rebuilt")
+            telemetry.count("retrieval.failover_disabled")
+        return False
+
+    @property
+    def degraded(self) -> bool:
+        return time.monotonic() - self._failed_at < self.cooldown
+
+    def _mark_failed(self, reason: str):
+        with self._lock:
+            self._failed_at = time.monotonic()
+            self.stats["failures"] += 1
+        telemetry.count("retrieval.failover", reason=reason)
+
+    def _local(self, queries: Sequence[str], top_k: int) -> List[List[Dict[str, Any]]]:
+        with self._lock:
+            self.stats["fallback"] += len(queries)
+        results = self.fallback.search_batch(list(queries), top_k)
+        for hits in results:
+            for hit in hits:
+                hit["retrieval_mode"] = "local"
+        return results
+
+    def search_batch(self, queries: Sequence[str], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        if not queries:
+            return []
+        if not self._check_fallback():
+            return self.primary.search_batch(queries, top_k)
+        if self.degraded:
+            return self._local(queries, top_k)
+        try:
+            vecs = self.primary.embed_queries(queries)
+        except Exception as e:
+            self._mark_failed(type(e).__name__)
+            return self._local(queries, top_k)
+        ok = np.any(vecs, axis=1)
+        if not ok.all():
+            self._mark_failed("zero_vector")
+            if not ok.any():
+                return self._local(queries, top_k)
+        results: List[Optional[List[Dict[str, Any]]]] = [None] * len(queries)
+        rows = np.flatnonzero(ok)
+        for i, hits in zip(rows.tolist(), self.primary.search_vectors(vecs[rows], top_k)):
+            results[i] = hits
+        with self._lock:
+            self.stats["primary"] += len(rows)
+        missing = np.flatnonzero(~ok).tolist()
+        if missing:
+            for i, hits in zip(missing, self._local([queries[i] for i in missing], top_k)):
+                results[i] = hits
+        return results  # type: ignore[return-value]
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        return self.search_batch([query], top_k)[0]
@@ -1,9 +1,14 @@
-"""Dataclasses and type definitions for the RAG system."""
+"""Dataclasses and type definitions for the RAG system.
+
+Models are slotted (no per-instance ``__dict__``) so large chunk corpora stay
+compact in memory; use ``dataclasses.fields`` / ``rag.chunkstore`` rather than
+``obj.__dict__`` when serializing.
+"""
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Dict, Any, Optional
 
-@dataclass
+@dataclass(slots=True)
 class Document:
     doc_id: str
     title: str
@@ -12,7 +17,7 @@ class Document:
     source_org: str = ""
     pub_date: str = ""
 
-@dataclass
+@dataclass(slots=True)
 class Chunk:
     chunk_id: str
     doc_id: str
@@ -25,8 +30,10 @@ class Chunk:
     source_org: str = ""
     source_url: str = ""
     pub_date: str = ""
+    # Citations of near-duplicate chunks collapsed into this one (rag.dedup)
+    duplicate_sources: List[Dict[str, str]] = field(default_factory=list)
 
-@dataclass
+@dataclass(slots=True)
 class RetrievalResult:
     rank: int
     similarity: float
@@ -0,0 +1,181 @@
+"""Neighbour-window expansion of retrieval hits.
+
+A hit is one chunk. A recommendation that continues into the next chunk is
+cut off, and finding that neighbour used to mean scanning all metadata.
+`NeighborIndex` precomputes integer arrays at index time, so expanding a hit
+to its ``±k`` neighbours is a slice:
+
+    order          rows sorted by (document, chunk position)
+    rank[row]      position of `row` in `order`
+    doc_start/end  [start, end) of the row's document, in `order` space
+
+Window for a hit ``r``::
+
+    order[max(doc_start[r], rank[r] - k) : min(doc_end[r], rank[r] + k + 1)]
+
+`expand` computes every hit's bounds in one vectorized step. It merges
+overlapping or touching windows of the same document, so two adjacent hits
+come back as one passage. The cost is O(hits + returned chunks).
+
+Position within a document is the metadata ``chunk_index`` when present,
+else the ``_chunk_<n>`` suffix of ``chunk_id``, else row order. Index
+metadata is usually slim (headers, no chunk bodies), so `expand` takes an
+optional ``chunk_lookup`` (chunk id -> `Chunk`) to fill in each window
+entry's ``text``. The arrays are stored as one ``(4, n)`` int64 ``.npy`` file
+next to the metadata and can be memory-mapped. Files written with the
+earlier section rows (``(6, n)``) still load; the extra rows are ignored.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+import re
+import numpy as np
+
+__all__ = ["NeighborIndex"]
+
+_CHUNK_SUFFIX = re.compile(r"_chunk_(\d+)$")
+
+
+def _runs(keys_sorted: np.ndarray) -> tuple:
+    """Per sorted position: [start, end) of the run of equal keys it belongs to."""
+    n = len(keys_sorted)
+    new = np.ones(n, dtype=bool)
+    new[1:] = keys_sorted[1:] != keys_sorted[:-1]
+    starts = np.flatnonzero(new)
+    ends = np.append(starts[1:], n)
+    run = np.cumsum(new) - 1
+    return starts[run], ends[run]
+
+
+def _window_entry(meta: Dict[str, Any], lookup: Optional[Mapping[Any, Any]]) -> Dict[str, Any]:
+    """Row metadata plus ``text``: the chunk's prompt text, from `lookup` when it has the chunk."""
+    chunk = lookup.get(meta.get("chunk_id")) if lookup is not None else None
+    if chunk is not None:
+        text = chunk.augmented_chunk or f"{chunk.ctx_header}\n\n{chunk.raw_chunk}"
+    else:
+        text = meta.get("augmented_chunk") or f"{meta.get('ctx_header', '')}\n\n{meta.get('raw_chunk', '')}"
+    return {**meta, "text": text.strip()}
+
+
+class NeighborIndex:
+    """Adjacency arrays for one index's rows (see module docstring)."""
+
+    def __init__(self, arrays: np.ndarray):
+        if arrays.ndim != 2 or arrays.shape[0] not in (4, 6):
+            raise ValueError(f"expected a (4, n) array, got {arrays.shape}")
+        self.arrays = arrays[:4]
+        self.order, self.rank, self.doc_start, self.doc_end = self.arrays
+
+    def __len__(self) -> int:
+        return self.arrays.shape[1]
+
+    # -- build / persist --
+    @classmethod
+    def build(cls, metadata: Sequence[Dict[str, Any]]) -> "NeighborIndex":
+        """Derive the arrays from row-aligned metadata (one pass, then numpy)."""
+        n = len(metadata)
+        doc_ids: List[str] = []
+        positions = np.arange(n, dtype=np.int64)
+        for row, meta in enumerate(metadata):
+            doc_id = meta.get("doc_id")
+            doc_ids.append(str(doc_id) if doc_id not in (None, "") else f"\x00row{row}")  # no doc: no neighbours
+            index = meta.get("chunk_index")
+            if index is None:
+                m = _CHUNK_SUFFIX.search(str(meta.get("chunk_id", "")))
+                index = m.group(1) if m else None
+            if index is not None:
+                positions[row] = int(index)
+        if n == 0:
+            return cls(np.zeros((4, 0), dtype=np.int64))
+
+        _, doc_codes = np.unique(np.asarray(doc_ids, dtype=object).astype(str), return_inverse=True)
+        order = np.lexsort((np.arange(n), positions, doc_codes)).astype(np.int64)
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n, dtype=np.int64)
+
+        doc_start_s, doc_end_s = _runs(doc_codes[order])
+
+        arrays = np.empty((4, n), dtype=np.int64)
+        arrays[0] = order
+        arrays[1] = rank
+        arrays[2, order] = doc_start_s  # back to row space
+        arrays[3, order] = doc_end_s
+        return cls(arrays)
+
+    def save(self, path: Path | str):
+        from .cache import _atomic_path
+
+        with _atomic_path(Path(path)) as tmp:
+            with open(tmp, "wb") as fh:
+                np.save(fh, np.ascontiguousarray(self.arrays))
+
+    @classmethod
+    def load(cls, path: Path | str, mmap: bool = False) -> Optional["NeighborIndex"]:
+        path = Path(path)
+        if not path.exists():
+            return None
+        return cls(np.load(path, mmap_mode="r" if mmap else None))
+
+    # -- queries --
+    def bounds(self, rows: np.ndarray, k: int = 1, max_chunks: Optional[int] = None):
+        """Vectorized [lo, hi) window per hit row, in `order` space."""
+        rows = np.asarray(rows, dtype=np.int64)
+        pos = self.rank[rows]
+        lo = np.maximum(self.doc_start[rows], pos - k)
+        hi = np.minimum(self.doc_end[rows], pos + k + 1)
+        if max_chunks:
+            # keep the hit inside a window of at most `max_chunks`, centred where possible
+            lo = np.minimum(pos, np.clip(pos - (max_chunks - 1) // 2, lo, np.maximum(lo, hi - max_chunks)))
+            hi = np.minimum(hi, lo + max_chunks)
+        return lo, hi
+
+    def window(self, row: int, k: int = 1) -> np.ndarray:
+        lo, hi = self.bounds(np.array([row]), k)
+        return np.asarray(self.order[lo[0]:hi[0]])
+
+    def expand(
+        self,
+        results: Sequence[Dict[str, Any]],
+        metadata: Sequence[Dict[str, Any]],
+        k: int = 1,
+        max_chunks: Optional[int] = None,
+        chunk_lookup: Optional[Mapping[Any, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Merge hits into passages of neighbouring chunks.
+
+        `results` are search results carrying their index ``row``. Each
+        passage is the best hit's result plus ``window`` (metadata and
+        ``text`` of every chunk in reading order), ``window_rows``,
+        ``hit_rows`` and ``hit_ranks``. Passages are ordered by their best
+        hit.
+        """
+        hits = [r for r in results if r.get("row") is not None]
+        if not hits:
+            return []
+        rows = np.fromiter((r["row"] for r in hits), dtype=np.int64, count=len(hits))
+        lo, hi = self.bounds(rows, k, max_chunks)
+        doc = self.doc_start[rows]
+
+        passages: List[List[int]] = []  # [lo, hi, first hit index, ...hit indices]
+        for j in np.lexsort((lo, doc)).tolist():  # O(hits) merge of sorted intervals
+            last = passages[-1] if passages else None
+            if last is not None and doc[j] == doc[last[2]] and lo[j] <= last[1]:
+                last[1] = max(last[1], int(hi[j]))
+                last.append(j)
+            else:
+                passages.append([int(lo[j]), int(hi[j]), j])
+
+        passages.sort(key=lambda p: min(p[2:]))  # hits arrive in rank order: best hit first
+        out: List[Dict[str, Any]] = []
+        for start, end, *members in passages:
+            members.sort()
+            best = hits[members[0]]
+            window_rows = np.asarray(self.order[start:end]).tolist()
+            out.append({
+                **best,
+                "window": [_window_entry(metadata[r], chunk_lookup) for r in window_rows],
+                "window_rows": window_rows,
+                "hit_rows": [int(rows[m]) for m in members],
+                "hit_ranks": [hits[m].get("rank") for m in members],
+            })
+        return out
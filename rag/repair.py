@@ -0,0 +1,186 @@
+"""Quarantine and background repair of failed embedding rows.
+
+`rag.embeddings` zero-fills rows it could not embed (429 storms, timeouts).
+A zero row is useless to the index: `normalize_L2` leaves it at zero and it
+scores 0 against every query while occupying a metadata slot. Instead:
+
+- `failed_rows` finds zero/non-finite rows after embedding;
+- `build_or_load_index` indexes only the healthy rows, labelled by row
+  position (`build_faiss_index_bulk(rows=...)`), so search results stay
+  aligned with the metadata, and records the rest as ``pending`` in the
+  snapshot manifest;
+- `repair_snapshot` re-embeds just the pending rows, inserts the recovered
+  ones into a copy of the current index with ``add_with_ids`` and publishes
+  it as a new snapshot (serving processes hot-swap to it);
+- `start_background_repair` runs that pass on a daemon thread with backoff
+  until nothing is pending, so a transient outage costs a few extra calls
+  instead of a full re-embed.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import threading
+import numpy as np
+import faiss  # type: ignore
+
+from . import config
+from .cache import embed_texts
+
+__all__ = [
+    "failed_rows",
+    "repair_rows",
+    "repair_snapshot",
+    "BackgroundRepair",
+    "start_background_repair",
+]
+
+
+def failed_rows(embeddings: np.ndarray, batch: int = 65536) -> np.ndarray:
+    """Positions of rows that are all zero or contain NaN/inf (int64, ascending)."""
+    bad = []
+    for start in range(0, embeddings.shape[0], batch):
+        block = embeddings[start:start + batch]
+        mask = ~np.any(block, axis=1) | ~np.isfinite(block).all(axis=1)
+        bad.append(np.flatnonzero(mask) + start)
+    return np.concatenate(bad).astype(np.int64) if bad else np.zeros(0, dtype=np.int64)
+
+
+def repair_rows(
+    index: faiss.Index,
+    embeddings: np.ndarray,
+    texts: Sequence[str],
+    pending: Sequence[int],
+    embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+) -> np.ndarray:
+    """Re-embed `pending` rows, add the recovered ones to `index` and `embeddings` in place.
+
+    `index` must accept ``add_with_ids`` (IVF, or a flat index wrapped in
+    ``IndexIDMap`` as built for quarantined rows). Returns the rows that are
+    still failing.
+    """
+    pending = np.asarray(pending, dtype=np.int64)
+    if len(pending) == 0:
+        return pending
+    fresh = embed_texts([texts[i] for i in pending], embed_fn)
+    still = failed_rows(fresh)
+    ok = np.ones(len(pending), dtype=bool)
+    ok[still] = False
+    if ok.any():
+        vecs = np.array(fresh[ok], dtype=np.float32)
+        embeddings[pending[ok]] = vecs
+        faiss.normalize_L2(vecs)
+        index.add_with_ids(vecs, pending[ok])
+    print(f"[repair] Recovered {int(ok.sum())}/{len(pending)} pending rows")
+    return pending[~ok]
+
+
+def repair_snapshot(
+    texts: Sequence[str],
+    embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+    root: Optional[Path] = None,
+    model: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """One repair pass over the CURRENT snapshot's pending rows.
+
+    Publishes a new snapshot when at least one row was recovered and returns
+    its manifest; returns None when there was nothing to do, nothing was
+    recovered, or `texts` / the embedding model no longer match the snapshot.
+    The publish is a compare-and-swap on the repaired version: if a fresh
+    build became CURRENT while rows were being re-embedded, the repaired copy
+    is dropped rather than replacing it (the next pass starts from the new
+    snapshot).
+    """
+    from .embeddings import embedding_model_name
+    from .snapshots import SnapshotConflict, load_snapshot, publish_snapshot, texts_digest
+
+    snap = load_snapshot(root=root)  # private, writable copy; live retrievers keep theirs
+    if snap is None or not snap.manifest.get("pending"):
+        return None
+    if snap.manifest.get("texts_sha256") != texts_digest(texts):
+        print(f"[repair] Texts changed since {snap.version}; skipping repair")
+        return None
+    if snap.manifest.get("model") != embedding_model_name(embed_fn, model):
+        print(f"[repair] Embedding model differs from {snap.version}; skipping repair")
+        return None
+    pending = np.asarray(snap.manifest["pending"], dtype=np.int64)
+    embeddings = np.array(snap.embeddings, dtype=np.float32)
+    remaining = repair_rows(snap.index, embeddings, texts, pending, embed_fn)
+    if len(remaining) == len(pending):
+        return None
+    extra = {k: v for k, v in snap.manifest.items() if k not in _MANIFEST_OWN}
+    extra["pending"] = remaining.tolist()
+    extra["repaired_from"] = snap.version
+    try:
+        return publish_snapshot(
+            snap.index,
+            embeddings,
+            snap.metadata,
+            texts=texts,
+            model=snap.manifest.get("model"),
+            extra=extra,
+            root=root,
+            expected=snap.version,
+        )
+    except SnapshotConflict as e:
+        print(f"[repair] {e}; dropping the repaired copy")
+        return None
+
+
+# Keys publish_snapshot computes itself; everything else is carried forward
+_MANIFEST_OWN = {"version", "created", "counts", "dims", "index_type", "model", "texts_sha256", "files", "repaired_from"}
+
+
+class BackgroundRepair(threading.Thread):
+    """Daemon thread retrying pending rows with exponential backoff between rounds."""
+
+    def __init__(
+        self,
+        texts: Sequence[str],
+        embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        interval: Optional[float] = None,
+        max_rounds: Optional[int] = None,
+        root: Optional[Path] = None,
+        model: Optional[str] = None,
+    ):
+        super().__init__(name="embedding-repair", daemon=True)
+        self.texts = list(texts)
+        self.embed_fn = embed_fn
+        self.model = model
+        self.interval = config.REPAIR_INTERVAL_SECONDS if interval is None else interval
+        self.max_rounds = config.REPAIR_MAX_ROUNDS if max_rounds is None else max_rounds
+        self.root = root
+        self._stop_event = threading.Event()
+
+    def cancel(self):
+        self._stop_event.set()
+
+    def run(self):
+        from .snapshots import read_manifest
+
+        delay = self.interval
+        for round_no in range(1, self.max_rounds + 1):
+            if self._stop_event.wait(delay):
+                return
+            try:
+                repair_snapshot(self.texts, self.embed_fn, root=self.root, model=self.model)
+            except Exception as e:  # keep trying; the index stays usable meanwhile
+                print(f"[repair] Round {round_no} failed: {e}")
+            manifest = read_manifest(root=self.root)
+            if manifest is None or not manifest.get("pending"):
+                print("[repair] No pending rows left")
+                return
+            delay = min(delay * 2, self.interval * 16)
+        print(f"[repair] Giving up after {self.max_rounds} rounds; rows stay pending until the next build")
+
+
+def start_background_repair(
+    texts: Sequence[str],
+    embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+    interval: Optional[float] = None,
+    max_rounds: Optional[int] = None,
+    root: Optional[Path] = None,
+    model: Optional[str] = None,
+) -> BackgroundRepair:
+    worker = BackgroundRepair(texts, embed_fn, interval=interval, max_rounds=max_rounds, root=root, model=model)
+    worker.start()
+    return worker
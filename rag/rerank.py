@@ -0,0 +1,275 @@
+"""Optional second-stage reranking with a bounded latency budget.
+
+Usage:
+
+    reranker = Reranker(retriever, scorer=LexicalScorer())
+    results = reranker.search(query, top_k=5)
+
+`Reranker` over-fetches `candidates` hits from the first-stage retriever and
+rescores them with a pluggable scorer: any callable
+``scorer(query, candidates) -> Sequence[float]`` (higher is better).
+Bundled scorers:
+
+- `LexicalScorer`: cheap query-term / phrase coverage features over the
+  contextual header and chunk text, blended with the first-stage similarity.
+- `CrossEncoderScorer`: wraps a local model exposing ``predict(pairs)``
+  (e.g. a sentence-transformers CrossEncoder).
+- `LLMScorer`: one batched chat call scoring every candidate; uses the same
+  async ``llm(messages) -> str`` adapter as `rag.headers`.
+
+Guarantees:
+- Hard budget: scoring runs on a worker pool and is abandoned after
+  `timeout` seconds; the first-stage order is returned instead.
+- Concurrency cap: at most `max_concurrent` scorer calls run at once
+  (including abandoned stragglers); excess queries skip reranking rather
+  than queue behind them.
+- LRU cache keyed on (query, candidate chunk ids).
+
+`Reranker.search` has the same signature as `EmbeddingRetriever.search`, so
+it can be dropped into the demo or `run_retrieval_benchmark` unchanged.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import json
+import re
+import threading
+import time
+
+from . import config
+
+__all__ = [
+    "Reranker",
+    "LexicalScorer",
+    "CrossEncoderScorer",
+    "LLMScorer",
+]
+
+Scorer = Callable[[str, List[Dict[str, Any]]], Sequence[float]]
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_QUERY_STOPWORDS = {
+    "the", "and", "for", "with", "what", "are", "is", "of", "to", "in", "on", "a", "an",
+    "how", "when", "which", "who", "should", "does", "do", "current", "recommendations",
+}
+
+
+def _tokens(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 2 and t not in _QUERY_STOPWORDS]
+
+
+def _candidate_text(c: Dict[str, Any]) -> str:
+    return c.get("augmented_chunk") or f"{c.get('ctx_header', '')}\n\n{c.get('raw_chunk', '')}"
+
+
+# -------- Scorers ---------
+class LexicalScorer:
+    """Query-term coverage features blended with first-stage similarity.
+
+    score = similarity_weight * similarity
+          + body coverage + header_weight * header coverage
+          + phrase_weight * query-bigram coverage
+    """
+
+    def __init__(self, header_weight: float = 1.5, phrase_weight: float = 1.0, similarity_weight: float = 2.0):
+        self.header_weight = header_weight
+        self.phrase_weight = phrase_weight
+        self.similarity_weight = similarity_weight
+
+    def __call__(self, query: str, candidates: List[Dict[str, Any]]) -> List[float]:
+        q_terms = list(dict.fromkeys(_tokens(query)))
+        q_bigrams = {f"{a} {b}" for a, b in zip(q_terms, q_terms[1:])}
+        scores = []
+        for c in candidates:
+            sim = float(c.get("similarity_score", 0.0))
+            if not q_terms:
+                scores.append(self.similarity_weight * sim)
+                continue
+            header = set(_tokens(c.get("ctx_header", "")))
+            body_tokens = _tokens(c.get("raw_chunk", "") or _candidate_text(c))
+            body = set(body_tokens)
+            body_cov = sum(t in body for t in q_terms) / len(q_terms)
+            header_cov = sum(t in header for t in q_terms) / len(q_terms)
+            phrase_cov = 0.0
+            if q_bigrams:
+                body_bigrams = {f"{a} {b}" for a, b in zip(body_tokens, body_tokens[1:])}
+                phrase_cov = len(q_bigrams & body_bigrams) / len(q_bigrams)
+            scores.append(
+                self.similarity_weight * sim
+                + body_cov
+                + self.header_weight * header_cov
+                + self.phrase_weight * phrase_cov
+            )
+        return scores
+
+
+class CrossEncoderScorer:
+    """Adapter for a local cross-encoder exposing ``predict(pairs, batch_size=...)``."""
+
+    def __init__(self, model: Any, batch_size: int = 32):
+        self.model = model
+        self.batch_size = batch_size
+
+    def __call__(self, query: str, candidates: List[Dict[str, Any]]) -> List[float]:
+        pairs = [(query, _candidate_text(c)) for c in candidates]
+        return [float(s) for s in self.model.predict(pairs, batch_size=self.batch_size)]
+
+
+LLM_RERANK_PROMPT = """
+<query>{query}</query>
+{passages}
+
+Task: Rate how well each passage answers the clinical query on a 0-10 scale
+(10 = directly states the guideline recommendation asked for).
+Return ONLY a JSON array of {count} numbers in passage order.
+""".strip()
+
+
+class LLMScorer:
+    """Score all candidates with one chat completion.
+
+    `llm` is an async ``llm(messages) -> str`` adapter (see
+    `rag.headers.azure_chat_completion`). Passages are truncated to
+    `passage_chars` to bound prompt size. Malformed replies raise, which makes
+    the `Reranker` fall back to first-stage order.
+    """
+
+    def __init__(self, llm: Callable[[List[Dict]], Awaitable[str]], passage_chars: int = 700):
+        self.llm = llm
+        self.passage_chars = passage_chars
+
+    def __call__(self, query: str, candidates: List[Dict[str, Any]]) -> List[float]:
+        passages = "\n".join(
+            f'<passage id="{i}">{_candidate_text(c)[: self.passage_chars]}</passage>'
+            for i, c in enumerate(candidates, 1)
+        )
+        messages = [
+            {"role": "system", "content": "You are a precise relevance judge for medical guideline retrieval."},
+            {"role": "user", "content": LLM_RERANK_PROMPT.format(query=query, passages=passages, count=len(candidates))},
+        ]
+        reply = asyncio.run(self.llm(messages))
+        match = re.search(r"\[.*\]", reply, re.S)
+        scores = json.loads(match.group(0)) if match else None
+        if not isinstance(scores, list) or len(scores) != len(candidates):
+            raise ValueError(f"LLM rerank reply did not contain {len(candidates)} scores")
+        return [float(s) for s in scores]
+
+
+# -------- Reranking stage ---------
+class Reranker:
+    """Second-stage reranker wrapping any retriever with ``search(query, top_k)``.
+
+    Parameters
+    ----------
+    retriever : object
+        First-stage retriever (e.g. `EmbeddingRetriever`).
+    scorer : callable | None
+        ``scorer(query, candidates) -> scores``. Defaults to `LexicalScorer`.
+    candidates : int | None
+        Number of first-stage hits to over-fetch and rescore.
+    timeout : float | None
+        Hard per-query scoring budget in seconds.
+    max_concurrent : int | None
+        Maximum scorer calls in flight across all callers.
+    cache_size : int | None
+        LRU capacity for (query, candidate ids) -> scores; 0 disables caching.
+
+    Unset values come from ``config.RERANK_*`` when the reranker is created.
+    """
+
+    def __init__(
+        self,
+        retriever,
+        scorer: Optional[Scorer] = None,
+        candidates: Optional[int] = None,
+        timeout: Optional[float] = None,
+        max_concurrent: Optional[int] = None,
+        cache_size: Optional[int] = None,
+    ):
+        self.retriever = retriever
+        self.scorer = scorer or LexicalScorer()
+        self.candidates = candidates or config.RERANK_CANDIDATES
+        self.timeout = config.RERANK_TIMEOUT_SECONDS if timeout is None else timeout
+        self.cache_size = config.RERANK_CACHE_SIZE if cache_size is None else cache_size
+        max_concurrent = max_concurrent or config.RERANK_MAX_CONCURRENT
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="rerank")
+        self._cache: "OrderedDict[Tuple, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()  # guards the cache and `stats` (updated from many threads)
+        self.stats = {"reranked": 0, "cache_hits": 0, "timeouts": 0, "errors": 0, "shed": 0}
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        hits = self.retriever.search(query, top_k=max(top_k, self.candidates))
+        return self.rerank(query, hits, top_k)
+
+    def rerank(self, query: str, candidates: List[Dict[str, Any]], top_k: int = 5) -> List[Dict[str, Any]]:
+        """Reorder `candidates`; on timeout/error/overload return them in first-stage order."""
+        if len(candidates) <= 1:
+            return candidates[:top_k]
+        key = (query, tuple(c.get("chunk_id") for c in candidates))
+        scores = self._cache_get(key)
+        if scores is None:
+            scores = self._score_bounded(query, candidates)
+            if scores is None:
+                return candidates[:top_k]
+            self._cache_put(key, scores)
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return [
+            {**candidates[i], "rank": rank, "rerank_score": float(scores[i])}
+            for rank, i in enumerate(order[:top_k], 1)
+        ]
+
+    def _score_bounded(self, query: str, candidates: List[Dict[str, Any]]) -> Optional[List[float]]:
+        deadline = time.monotonic() + self.timeout
+        if not self._slots.acquire(blocking=False):  # at capacity: shed now, never queue
+            self._count("shed")
+            return None
+        try:
+            future = self._pool.submit(self.scorer, query, candidates)
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is held until the scorer actually finishes, so abandoned
+        # stragglers still count against the concurrency cap.
+        future.add_done_callback(lambda _f: self._slots.release())
+        try:
+            scores = list(future.result(timeout=max(0.0, deadline - time.monotonic())))
+        except FutureTimeout:
+            self._count("timeouts")
+            return None
+        except Exception:
+            self._count("errors")
+            return None
+        if len(scores) != len(candidates):
+            self._count("errors")
+            return None
+        self._count("reranked")
+        return scores
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _cache_get(self, key: Tuple) -> Optional[List[float]]:
+        if self.cache_size <= 0:
+            return None
+        with self._lock:
+            scores = self._cache.get(key)
+            if scores is not None:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+            return scores
+
+    def _cache_put(self, key: Tuple, scores: List[float]):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = scores
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -1,10 +1,13 @@
 """Unified retrieval abstraction."""
 from __future__ import annotations
-from typing import List, Dict, Any, Sequence
+from collections.abc import Sequence as SequenceABC
+from typing import List, Dict, Any, Sequence, Optional, Mapping
 import numpy as np
 import faiss  # type: ignore
 
+from . import telemetry
 from .embeddings import get_embeddings_batch
+from .neighbors import NeighborIndex
 
 class EmbeddingRetriever:
     """Embedding-based retriever with pluggable embedding function.
@@ -14,37 +17,110 @@ class EmbeddingRetriever:
     index : faiss.Index
         FAISS index (vectors assumed already normalized for IP similarity)
     metadata : Sequence[Dict[str, Any]]
-        Parallel metadata list aligned with index order.
+        Parallel metadata list aligned with index order. Lists (and other
+        iterables) are copied; read-only sequence views such as the
+        memory-mapped `ColumnarMetadata` are used as-is.
     embed_fn : callable | None
         Function accepting List[str] -> List[List[float]]. Defaults to
         `rag.embeddings.get_embeddings_batch`. Allows injection of a fake
         embedding function for offline tests.
+    version : str | None
+        Identifier of the index contents, used by caches layered on top to
+        detect index changes. Derived from the index object and size if omitted.
+    neighbors : NeighborIndex | None
+        Adjacency arrays for `search_expanded` (`rag.neighbors`), normally
+        loaded with the index. Built from `metadata` on first use if omitted.
+    texts_sha256 : str | None
+        Digest of the embedded texts (`rag.snapshots.texts_digest`), when
+        known. Lets a companion index over the same rows prove it matches.
     """
 
-    def __init__(self, index: faiss.Index, metadata: Sequence[Dict[str, Any]], embed_fn=None):
+    def __init__(
+        self,
+        index: faiss.Index,
+        metadata: Sequence[Dict[str, Any]],
+        embed_fn=None,
+        version: Optional[str] = None,
+        neighbors: Optional[NeighborIndex] = None,
+        texts_sha256: Optional[str] = None,
+    ):
         self.index = index
-        self.metadata = list(metadata)
+        self.metadata = list(metadata) if isinstance(metadata, (list, tuple)) or not isinstance(metadata, SequenceABC) else metadata
         self._embed_fn = embed_fn or get_embeddings_batch
+        self._version = version
+        self._neighbors = neighbors
+        self.texts_sha256 = texts_sha256
+
+    @property
+    def neighbors(self) -> NeighborIndex:
+        if self._neighbors is None or len(self._neighbors) != len(self.metadata):
+            with telemetry.span("retrieval.neighbors_build", rows=len(self.metadata)):
+                self._neighbors = NeighborIndex.build(self.metadata)
+        return self._neighbors
+
+    @property
+    def version(self) -> str:
+        return self._version or f"{id(self.index):x}:{self.index.ntotal}"
 
     def embed_query(self, query: str):
-        emb = self._embed_fn([query])
-        if not emb:
+        return self.embed_queries([query])
+
+    def embed_queries(self, queries: Sequence[str]) -> np.ndarray:
+        """Embed several queries in one call; returns a normalized (n, d) float32 matrix."""
+        with telemetry.span("retrieval.embed", queries=len(queries)):
+            emb = self._embed_fn(list(queries))
+        if emb is None or len(emb) == 0 or len(emb) != len(queries):
             raise RuntimeError("Failed to embed query (empty embedding list)")
-        vec = np.array([emb[0]], dtype=np.float32)
-        faiss.normalize_L2(vec)
-        return vec
+        mat = np.array(emb, dtype=np.float32)
+        faiss.normalize_L2(mat)
+        return mat
 
     def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        vec = self.embed_query(query)
-        scores, indices = self.index.search(vec, top_k)
+        return self.search_by_vector(self.embed_query(query), top_k)
+
+    def search_by_vector(self, vec: np.ndarray, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Search with an already embedded, L2-normalized (1, d) query vector."""
+        return self.search_vectors(vec, top_k)[0]
+
+    def search_batch(self, queries: Sequence[str], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """One embedding call and one index search for many queries."""
+        if not queries:
+            return []
+        return self.search_vectors(self.embed_queries(queries), top_k)
+
+    def search_expanded(
+        self,
+        query: str,
+        top_k: int = 5,
+        k: int = 1,
+        max_chunks: Optional[int] = None,
+        chunk_lookup: Optional[Mapping[Any, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Search, then widen each hit to its ±`k` neighbours, merging overlaps.
+
+        Returns passages (see `NeighborIndex.expand`): the best hit's fields
+        plus ``window`` (metadata and ``text`` of the chunks in reading
+        order). `chunk_lookup` (chunk id -> `Chunk`) supplies the text when
+        the index metadata does not carry chunk bodies.
+        """
+        hits = self.search(query, top_k)
+        return self.neighbors.expand(hits, self.metadata, k=k, max_chunks=max_chunks, chunk_lookup=chunk_lookup)
+
+    def search_vectors(self, vecs: np.ndarray, top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        with telemetry.span("retrieval.search", queries=len(vecs), top_k=top_k):
+            scores, indices = self.index.search(vecs, top_k)
+        return [self._format_hits(s, i) for s, i in zip(scores, indices)]
+
+    def _format_hits(self, scores: np.ndarray, indices: np.ndarray) -> List[Dict[str, Any]]:
         out: List[Dict[str, Any]] = []
-        for rank, (score, idx) in enumerate(zip(scores[0], indices[0]), 1):
+        for rank, (score, idx) in enumerate(zip(scores, indices), 1):
             if idx < 0:
                 break
             meta = self.metadata[idx] if idx < len(self.metadata) else {}
             out.append({
                 "rank": rank,
                 "similarity_score": float(score),
+                "row": int(idx),
                 **meta
             })
         return out
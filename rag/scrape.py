@@ -1,19 +1,22 @@
-"""Site-agnostic scraping utilities with simple recipe system."""
+"""Site-agnostic scraping utilities with simple recipe system.
+
+`requests` and BeautifulSoup are imported on first use; the shared HTTP
+session (`SESSION`) is created by the first fetch.
+"""
 from __future__ import annotations
 import time
-from typing import Dict, List, Iterable, Callable
+from typing import Dict, List, Iterable, Callable, Optional
 import uuid
 import re
 from pathlib import Path
-import requests
-from bs4 import BeautifulSoup  # type: ignore
+import threading
 
-from .config import DATA_DIR
+from . import config, telemetry
 from .models import Document
 
 USER_AGENT = "ContextualRetrievalPilot/0.2 (+contact: you@example.com)"
-SESSION = requests.Session()
-SESSION.headers.update({"User-Agent": USER_AGENT})
+_session = None
+_session_lock = threading.Lock()
 
 __all__ = [
     "fetch",
@@ -22,21 +25,47 @@ __all__ = [
     "save_document_json",
 ]
 
+def _get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                session = requests.Session()
+                session.headers.update({"User-Agent": USER_AGENT})
+                _session = session
+    return _session
+
+
+def __getattr__(name: str):
+    if name == "SESSION":  # kept for callers that configure the session directly
+        return _get_session()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def fetch(url: str, tries: int = 3, backoff: float = 1.5) -> str | None:
-    for i in range(tries):
-        try:
-            r = SESSION.get(url, timeout=25)
-            if r.status_code == 200:
-                return r.text
-        except requests.RequestException:
-            pass
-        time.sleep(backoff * (i + 1))
-    return None
+    import requests
+    session = _get_session()
+    with telemetry.span("scrape.fetch", url=url) as sp:
+        for i in range(tries):
+            try:
+                r = session.get(url, timeout=25)
+                if r.status_code == 200:
+                    sp.set(attempts=i + 1, status=200, bytes=len(r.content))
+                    return r.text
+                telemetry.count("scrape.fetch_errors", status=r.status_code)
+            except requests.RequestException:
+                telemetry.count("scrape.fetch_errors", status="exception")
+            time.sleep(backoff * (i + 1))
+        sp.set(attempts=tries, status=None)
+        return None
 
 def clean_text(s: str) -> str:
     return re.sub(r"\s+", " ", (s or "").strip())
 
+@telemetry.traced("scrape.parse")
 def extract_blocks(html: str, selectors: str, title_selector: str | None = None) -> tuple[str, List[str]]:
+    from bs4 import BeautifulSoup  # type: ignore
     soup = BeautifulSoup(html, "html.parser")
     main = soup.find("main") or soup.find(attrs={"role": "main"}) or soup
     blocks: List[str] = []
@@ -48,7 +77,8 @@ def extract_blocks(html: str, selectors: str, title_selector: str | None = None)
     title = clean_text(title_el.get_text(" ", strip=True)) if title_el else "Untitled"
     return title, blocks
 
-def save_document_json(doc: Document, outdir: Path = DATA_DIR) -> Path:
+def save_document_json(doc: Document, outdir: Optional[Path] = None) -> Path:
+    outdir = outdir or config.DATA_DIR
     outpath = outdir / f"{doc.doc_id}.json"
     import json
     with outpath.open("w", encoding="utf-8") as f:
@@ -0,0 +1,164 @@
+"""Semantic result cache for near-duplicate queries.
+
+Usage:
+
+    cached = SemanticCache(retriever)
+    results = cached.search("USPSTF mammography guideline", top_k=5)
+
+Lookup order:
+1. Lexical key: the query is lower-cased, stripped of punctuation and
+   stopwords, and its tokens sorted ("Breast cancer screening recs?" and
+   "screening recs for breast cancer" share a key). A hit skips both the
+   embedding call and the index search.
+2. Semantic key: the query is embedded once and matched against a small
+   FAISS inner-product index of cached query vectors. A neighbour with cosine
+   >= `threshold` (and at least `top_k` stored results) is served directly;
+   the new lexical key is aliased to it.
+3. Miss: the main index is searched with the already computed vector and the
+   result is stored.
+
+Entries are evicted LRU beyond `max_entries`. The whole cache is dropped
+whenever `retriever.version` changes (index rebuilt, swapped or grown).
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+import re
+import threading
+import numpy as np
+import faiss  # type: ignore
+
+from . import config
+
+__all__ = ["SemanticCache", "normalize_query"]
+
+_STOPWORDS = {
+    "the", "and", "for", "with", "what", "are", "is", "of", "to", "in", "on", "a", "an",
+    "how", "about", "me", "tell", "please", "guideline", "guidelines",
+}
+
+
+def normalize_query(query: str) -> str:
+    """Lexical cache key: lower-case, punctuation-free, stopword-free, sorted unique tokens."""
+    tokens = re.findall(r"[a-z0-9]+", query.lower())
+    kept = {t for t in tokens if t not in _STOPWORDS} or set(tokens)
+    return " ".join(sorted(kept))
+
+
+@dataclass(slots=True)
+class _Entry:
+    entry_id: int
+    top_k: int
+    results: List[Dict[str, Any]]
+    keys: Set[str] = field(default_factory=set)
+
+
+class SemanticCache:
+    """Result cache in front of an `EmbeddingRetriever`-like object.
+
+    The wrapped retriever must provide ``embed_query(query)`` returning a
+    normalized (1, d) float32 vector, ``search_by_vector(vec, top_k)`` and a
+    ``version`` attribute. `threshold` and `max_entries` default to
+    ``config.SEMANTIC_CACHE_THRESHOLD`` / ``config.SEMANTIC_CACHE_SIZE``.
+    """
+
+    def __init__(self, retriever, threshold: Optional[float] = None, max_entries: Optional[int] = None):
+        self.retriever = retriever
+        self.threshold = config.SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        self.max_entries = max_entries or config.SEMANTIC_CACHE_SIZE
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_key: Dict[str, _Entry] = {}
+        self._index: Optional[faiss.IndexIDMap2] = None
+        self._next_id = 0
+        self._version = retriever.version
+        self.stats = {"lexical_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        key = normalize_query(query)
+        with self._lock:
+            self._check_version()
+            entry = self._by_key.get(key)
+            if entry is not None and entry.top_k >= top_k:
+                self._touch(entry)
+                self.stats["lexical_hits"] += 1
+                return self._serve(entry, top_k)
+
+        vec = self.retriever.embed_query(query)
+        with self._lock:
+            self._check_version()
+            entry = self._nearest(vec, top_k)
+            if entry is not None:
+                self._touch(entry)
+                self._alias(entry, key)
+                self.stats["semantic_hits"] += 1
+                return self._serve(entry, top_k)
+            version = self._version
+
+        results = self.retriever.search_by_vector(vec, top_k)
+        with self._lock:
+            if self.retriever.version == version:
+                self._insert(key, vec, top_k, results)
+            self.stats["misses"] += 1
+        return [dict(r) for r in results]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_key.clear()
+            self._index = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ----------------------- internals -------------------------
+
+    def _check_version(self):
+        version = self.retriever.version
+        if version != self._version:
+            self.clear()
+            self._version = version
+            self.stats["invalidations"] += 1
+
+    @staticmethod
+    def _serve(entry: _Entry, top_k: int) -> List[Dict[str, Any]]:
+        return [dict(r) for r in entry.results[:top_k]]
+
+    def _touch(self, entry: _Entry):
+        self._entries.move_to_end(entry.entry_id)
+
+    def _alias(self, entry: _Entry, key: str):
+        old = self._by_key.get(key)
+        if old is not None and old is not entry:
+            old.keys.discard(key)
+        self._by_key[key] = entry
+        entry.keys.add(key)
+
+    def _nearest(self, vec: np.ndarray, top_k: int) -> Optional[_Entry]:
+        if self._index is None or self._index.ntotal == 0:
+            return None
+        scores, ids = self._index.search(vec, min(4, self._index.ntotal))
+        for score, entry_id in zip(scores[0], ids[0]):
+            if entry_id < 0 or score < self.threshold:
+                break
+            entry = self._entries.get(int(entry_id))
+            if entry is not None and entry.top_k >= top_k:
+                return entry
+        return None
+
+    def _insert(self, key: str, vec: np.ndarray, top_k: int, results: List[Dict[str, Any]]):
+        if self._index is None:
+            self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(vec.shape[1]))
+        entry = _Entry(self._next_id, top_k, [dict(r) for r in results])
+        self._next_id += 1
+        self._index.add_with_ids(vec, np.array([entry.entry_id], dtype=np.int64))
+        self._entries[entry.entry_id] = entry
+        self._alias(entry, key)
+        while len(self._entries) > self.max_entries:
+            _, old = self._entries.popitem(last=False)
+            self._index.remove_ids(np.array([old.entry_id], dtype=np.int64))
+            for k in old.keys:
+                if self._by_key.get(k) is old:
+                    del self._by_key[k]
+            self.stats["evictions"] += 1
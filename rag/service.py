@@ -0,0 +1,252 @@
+"""Async HTTP search service with request coalescing.
+
+Run:
+
+    python -m rag.service --port 8080
+
+Endpoints:
+- ``GET /search?q=...&top_k=5`` or ``POST /search`` with ``{"query": ..., "top_k": ...}``
+- ``GET /health`` -- index size and version
+- ``GET /stats``  -- coalescing counters
+- ``GET /metrics`` -- `rag.telemetry` registry in Prometheus text format
+  (populated when ``TELEMETRY_ENABLED=1``)
+
+The index, metadata and retriever are loaded once per process. With
+``--mmap`` (default when ``--workers`` > 1) they are memory-mapped read-only
+(`rag.cache.load_readonly_index`), so every worker process shares the same
+page-cache copy and starts without parsing or copying the index. Workers bind
+the same port with SO_REUSEPORT. Concurrent requests are funnelled through
+`SearchCoalescer`:
+
+- queries arriving within `window_ms` of each other are flushed as one batch:
+  one embedding call and one FAISS search (`EmbeddingRetriever.search_batch`),
+  executed off the event loop;
+- identical in-flight (query, top_k) requests share a single future;
+- a batch is flushed early once `max_batch` queries are waiting.
+
+`SearchCoalescer` depends only on asyncio and a retriever exposing
+``search_batch(queries, top_k)``, so it can be exercised offline with a fake
+``embed_fn`` (see `artifacts/smoke_test.py`).
+"""
+from __future__ import annotations
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+
+from . import config
+
+try:  # pragma: no cover - import variability
+    from aiohttp import web  # type: ignore
+except ImportError:  # graceful degradation: coalescer still usable in-process
+    web = None  # type: ignore
+
+__all__ = ["SearchCoalescer", "create_app", "main"]
+
+_Pending = Tuple[str, int, "asyncio.Future[List[Dict[str, Any]]]"]
+
+
+class SearchCoalescer:
+    """Micro-batches concurrent searches into shared embedding + index calls.
+
+    Parameters
+    ----------
+    retriever : object
+        Provides ``search_batch(queries, top_k) -> List[List[dict]]``.
+    window_ms : float | None
+        How long the first query of a batch waits for companions (default
+        ``config.SERVICE_COALESCE_MS``).
+    max_batch : int | None
+        Flush immediately once this many distinct queries are waiting
+        (default ``config.SERVICE_MAX_BATCH``).
+    executor : Executor | None
+        Where blocking embedding/search work runs. Defaults to a small
+        dedicated thread pool (FAISS releases the GIL during search).
+    """
+
+    def __init__(
+        self,
+        retriever,
+        window_ms: Optional[float] = None,
+        max_batch: Optional[int] = None,
+        executor: Optional[Executor] = None,
+    ):
+        self.retriever = retriever
+        self.window = (config.SERVICE_COALESCE_MS if window_ms is None else window_ms) / 1000.0
+        self.max_batch = max_batch or config.SERVICE_MAX_BATCH
+        self._executor = executor or ThreadPoolExecutor(max_workers=4, thread_name_prefix="search")
+        self._queue: List[_Pending] = []
+        self._inflight: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self.stats = {"requests": 0, "deduped": 0, "batches": 0, "batched_queries": 0}
+
+    async def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        self.stats["requests"] += 1
+        key = (query, top_k)
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.stats["deduped"] += 1
+        else:
+            loop = asyncio.get_running_loop()
+            fut = loop.create_future()
+            self._inflight[key] = fut
+            self._queue.append((query, top_k, fut))
+            if len(self._queue) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush)
+        # shield: one cancelled client must not cancel the shared result for others
+        results = await asyncio.shield(fut)
+        return [dict(r) for r in results]
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._queue = self._queue, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[_Pending]):
+        queries = list(dict.fromkeys(q for q, _, _ in batch))
+        top_k = max(k for _, k, _ in batch)
+        self.stats["batches"] += 1
+        self.stats["batched_queries"] += len(queries)
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self._executor, self.retriever.search_batch, queries, top_k)
+            by_query = dict(zip(queries, results))
+            for query, k, fut in batch:
+                if not fut.done():
+                    fut.set_result(by_query[query][:k])
+        except Exception as e:
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        finally:
+            for query, k, _ in batch:
+                self._inflight.pop((query, k), None)
+
+
+# ----------------------- HTTP layer -----------------------------
+
+def create_app(retriever, coalescer: Optional[SearchCoalescer] = None):
+    """Build the aiohttp application around an already loaded retriever."""
+    if web is None:
+        raise RuntimeError("aiohttp is required for the HTTP service. Install with: pip install aiohttp")
+    coalescer = coalescer or SearchCoalescer(retriever)
+    max_top_k = config.SERVICE_MAX_TOP_K
+
+    async def search(request):
+        if request.method == "POST":
+            try:
+                body = await request.json()
+            except ValueError:
+                raise web.HTTPBadRequest(text="Body must be JSON")
+            query, top_k = body.get("query", ""), body.get("top_k", 5)
+        else:
+            query, top_k = request.query.get("q", ""), request.query.get("top_k", 5)
+        query = str(query).strip()
+        try:
+            top_k = int(top_k)
+        except (TypeError, ValueError):
+            raise web.HTTPBadRequest(text="top_k must be an integer")
+        if not query:
+            raise web.HTTPBadRequest(text="Missing query")
+        if not 1 <= top_k <= max_top_k:
+            raise web.HTTPBadRequest(text=f"top_k must be between 1 and {max_top_k}")
+        results = await coalescer.search(query, top_k)
+        return web.json_response({"query": query, "top_k": top_k, "results": results})
+
+    async def health(request):
+        return web.json_response({"status": "ok", "ntotal": int(retriever.index.ntotal), "version": retriever.version})
+
+    async def stats(request):
+        return web.json_response(coalescer.stats)
+
+    async def metrics(request):
+        from .telemetry import prometheus_text
+        return web.Response(text=prometheus_text(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app["retriever"] = retriever
+    app["coalescer"] = coalescer
+    app.router.add_route("GET", "/search", search)
+    app.router.add_route("POST", "/search", search)
+    app.router.add_get("/health", health)
+    app.router.add_get("/stats", stats)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+
+def load_retriever(embed_fn=None, mmap: bool = False):
+    """Load the cached index + metadata once and wrap them in a retriever.
+
+    When a published snapshot exists the retriever follows it and hot-swaps
+    to newer snapshots (`rag.snapshots.SnapshotRetriever`).
+    """
+    from .cache import load_faiss_index, load_metadata, load_readonly_index
+    from .retrieval import EmbeddingRetriever
+    from .snapshots import SnapshotRetriever, current_version
+
+    if current_version() is not None:
+        return SnapshotRetriever(embed_fn=embed_fn, mmap=mmap)
+    if mmap:
+        index, metadata = load_readonly_index()
+    else:
+        index, metadata = load_faiss_index(), load_metadata()
+    if index is None or not len(metadata):
+        raise RuntimeError("Index not found in cache. Run main.ipynb to build it first.")
+    return EmbeddingRetriever(index, metadata, embed_fn=embed_fn)
+
+
+def main(argv: Optional[List[str]] = None):  # pragma: no cover - process entry point
+    parser = argparse.ArgumentParser(description="Medical guideline search service")
+    parser.add_argument("--host", default=config.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVICE_PORT)
+    parser.add_argument("--window-ms", type=float, default=config.SERVICE_COALESCE_MS)
+    parser.add_argument("--max-batch", type=int, default=config.SERVICE_MAX_BATCH)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes sharing the port (SO_REUSEPORT)")
+    parser.add_argument("--mmap", action="store_true", help="Memory-map index + metadata read-only (implied by --workers > 1)")
+    parser.add_argument("--local-fallback", action="store_true", help="Answer from the local LSA companion index while the embedding API fails")
+    args = parser.parse_args(argv)
+    args.mmap = args.mmap or args.workers > 1
+
+    if args.workers <= 1:
+        _serve(args)
+        return
+    import multiprocessing as mp
+    procs = [mp.Process(target=_serve, args=(args,), name=f"search-worker-{i}") for i in range(args.workers)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+
+
+def _serve(args):  # pragma: no cover - process entry point
+    retriever = load_retriever(mmap=args.mmap)
+    print(f"[service] Loaded index with {retriever.index.ntotal} vectors{' (mmap)' if args.mmap else ''}")
+    if args.local_fallback:
+        from .local_embeddings import FailoverRetriever, load_local_retriever
+
+        local = load_local_retriever(mmap=args.mmap)
+        if local is None:
+            print("[service] No local companion index (rag.local_embeddings.build_local_index); failover disabled")
+        else:
+            retriever = FailoverRetriever(retriever, local)
+            if not retriever.fallback_current:
+                print("[service] Local companion index was built from other texts than the loaded index; failover stays off until it is rebuilt")
+    app = create_app(retriever, SearchCoalescer(retriever, window_ms=args.window_ms, max_batch=args.max_batch))
+    web.run_app(app, host=args.host, port=args.port, reuse_port=args.workers > 1)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
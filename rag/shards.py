@@ -0,0 +1,236 @@
+"""Sharded indexes per document collection with parallel fan-out search.
+
+Each shard is an index bundle (`rag.cache.save_index_bundle`) under
+``CACHE_DIR/shards/<name>/`` and is built, persisted and replaced
+independently, so re-scraping one source (e.g. USPSTF) or uploading PDFs only
+re-embeds that collection. A rebuild is staged next to the shard and swapped
+in by renames (old copy aside, new copy in place); a crash between the two
+leaves the old copy, which `load_shard` / `list_shards` move back. Rows whose
+embedding failed (zero vectors) are left out of the shard index, like the
+main index (`rag.repair`).
+
+    build_shards(texts, metadata, by="source_org")        # or max_rows=50_000
+    retriever = ShardedRetriever.load()
+    results = retriever.search("colorectal screening age", top_k=5)
+
+`ShardedRetriever` embeds the query once, searches every shard in a thread
+pool (FAISS releases the GIL during search) and merges the per-shard top-k
+lists, each already sorted by score, with a heap (`heapq.merge`). Result dicts
+gain a ``shard`` key; `search_batch` / `search_vectors` match
+`EmbeddingRetriever` so the service and caches can wrap a sharded retriever.
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+import heapq
+import re
+import shutil
+import numpy as np
+import faiss  # type: ignore
+
+from . import config
+from .cache import save_index_bundle, load_index_bundle, embed_texts
+from .embeddings import get_embeddings_batch
+from .index import build_faiss_index_bulk
+
+__all__ = [
+    "SHARDS_DIR",
+    "Shard",
+    "shard_name",
+    "partition_by_key",
+    "partition_by_size",
+    "build_shard",
+    "build_shards",
+    "list_shards",
+    "load_shard",
+    "ShardedRetriever",
+]
+
+_path, __getattr__ = config.lazy_paths(__name__, {"SHARDS_DIR": lambda: config.CACHE_DIR / "shards"})
+
+
+@dataclass(slots=True)
+class Shard:
+    name: str
+    index: faiss.Index
+    metadata: Sequence[Dict[str, Any]]
+
+
+def shard_name(value: str) -> str:
+    """Filesystem-safe shard name ("NCI PDQ" -> "nci-pdq")."""
+    return re.sub(r"[^a-z0-9]+", "-", (value or "unassigned").lower()).strip("-") or "unassigned"
+
+
+def partition_by_key(metadata: Sequence[Dict[str, Any]], key: str = "source_org") -> Dict[str, List[int]]:
+    """Group row positions by a metadata field (default: source organisation)."""
+    parts: Dict[str, List[int]] = {}
+    for i, m in enumerate(metadata):
+        parts.setdefault(shard_name(str(m.get(key, ""))), []).append(i)
+    return parts
+
+
+def partition_by_size(n: int, max_rows: int) -> Dict[str, List[int]]:
+    """Split rows into consecutive shards of at most `max_rows`."""
+    return {f"part-{i // max_rows:04d}": list(range(i, min(i + max_rows, n))) for i in range(0, n, max_rows)}
+
+
+def build_shard(
+    name: str,
+    texts: Sequence[str],
+    metadata: Sequence[Dict[str, Any]],
+    embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+    index_type: str = "auto",
+    root: Optional[Path] = None,
+) -> Shard:
+    """Embed, index and persist one shard, replacing any previous version."""
+    from .repair import failed_rows
+
+    root = root or _path("SHARDS_DIR")
+    emb = embed_texts(texts, embed_fn)
+    pending = failed_rows(emb)
+    if len(pending) == len(texts):
+        raise RuntimeError(f"Failed to generate embeddings for shard '{name}'")
+    healthy = np.setdiff1d(np.arange(len(texts), dtype=np.int64), pending, assume_unique=True) if len(pending) else None
+    index = build_faiss_index_bulk(emb, index_type=index_type, rows=healthy)  # zero vectors stay out of the index
+    final, staging, old = root / name, root / f".{name}.building", root / f".{name}.old"
+    _recover(root, name)
+    shutil.rmtree(staging, ignore_errors=True)
+    save_index_bundle(staging, index, emb, metadata)
+    shutil.rmtree(old, ignore_errors=True)
+    if final.exists():
+        final.replace(old)
+    staging.replace(final)
+    shutil.rmtree(old, ignore_errors=True)
+    failed = f", {len(pending)} failed rows left out" if len(pending) else ""
+    print(f"[shards] Built shard '{name}' ({index.ntotal} vectors{failed})")
+    return Shard(name, index, list(metadata))
+
+
+def _recover(root: Path, name: str):
+    """Move back the previous copy of a shard whose swap was interrupted."""
+    old = root / f".{name}.old"
+    if old.is_dir() and not (root / name).exists():
+        old.replace(root / name)
+        print(f"[shards] Restored shard '{name}' after an interrupted rebuild")
+
+
+def build_shards(
+    texts: Sequence[str],
+    metadata: Sequence[Dict[str, Any]],
+    by: str = "source_org",
+    max_rows: Optional[int] = None,
+    only: Optional[Iterable[str]] = None,
+    embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+    index_type: str = "auto",
+    root: Optional[Path] = None,
+) -> Dict[str, Shard]:
+    """Partition the corpus and build each shard independently.
+
+    Parameters
+    ----------
+    by : str
+        Metadata key to partition on (ignored when `max_rows` is set).
+    max_rows : int | None
+        Partition by size instead of by key.
+    only : iterable of str | None
+        Rebuild just these shard names; other shards on disk are untouched.
+    """
+    parts = partition_by_size(len(texts), max_rows) if max_rows else partition_by_key(metadata, by)
+    wanted = set(only) if only is not None else None
+    built: Dict[str, Shard] = {}
+    for name, rows in parts.items():
+        if wanted is not None and name not in wanted:
+            continue
+        built[name] = build_shard(
+            name,
+            [texts[i] for i in rows],
+            [metadata[i] for i in rows],
+            embed_fn=embed_fn,
+            index_type=index_type,
+            root=root,
+        )
+    return built
+
+
+def list_shards(root: Optional[Path] = None) -> List[str]:
+    root = root or _path("SHARDS_DIR")
+    if not root.exists():
+        return []
+    for p in root.glob(".*.old"):
+        _recover(root, p.name[1:-len(".old")])
+    return sorted(p.name for p in root.iterdir() if p.is_dir() and not p.name.startswith("."))
+
+
+def load_shard(name: str, mmap: bool = False, root: Optional[Path] = None) -> Optional[Shard]:
+    root = root or _path("SHARDS_DIR")
+    _recover(root, name)
+    bundle = load_index_bundle(root / name, mmap=mmap)
+    if bundle is None:
+        return None
+    index, metadata, _ = bundle
+    return Shard(name, index, metadata)
+
+
+def _hit_stream(shard_pos: int, scores: np.ndarray, ids: np.ndarray):
+    """(-score, shard, row) tuples in ascending order, ready for heapq.merge."""
+    for score, idx in zip(scores, ids):
+        if idx >= 0:
+            yield -float(score), shard_pos, int(idx)
+
+
+class ShardedRetriever:
+    """Fan-out retriever over several shards sharing one embedding space."""
+
+    def __init__(self, shards: Sequence[Shard], embed_fn=None, max_workers: Optional[int] = None):
+        if not shards:
+            raise ValueError("ShardedRetriever needs at least one shard")
+        self.shards = list(shards)
+        self._embed_fn = embed_fn or get_embeddings_batch
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or len(self.shards), thread_name_prefix="shard")
+
+    @classmethod
+    def load(cls, names: Optional[Iterable[str]] = None, mmap: bool = False, root: Optional[Path] = None, embed_fn=None, max_workers: Optional[int] = None) -> "ShardedRetriever":
+        shards = [load_shard(n, mmap=mmap, root=root) for n in (names or list_shards(root))]
+        return cls([s for s in shards if s is not None], embed_fn=embed_fn, max_workers=max_workers)
+
+    @property
+    def version(self) -> str:
+        return "|".join(f"{s.name}:{id(s.index):x}:{s.index.ntotal}" for s in self.shards)
+
+    def embed_queries(self, queries: Sequence[str]) -> np.ndarray:
+        emb = self._embed_fn(list(queries))
+        if emb is None or len(emb) == 0 or len(emb) != len(queries):
+            raise RuntimeError("Failed to embed query (empty embedding list)")
+        mat = np.array(emb, dtype=np.float32)
+        faiss.normalize_L2(mat)
+        return mat
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.embed_queries([query])
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        return self.search_vectors(self.embed_query(query), top_k)[0]
+
+    def search_by_vector(self, vec: np.ndarray, top_k: int = 5) -> List[Dict[str, Any]]:
+        return self.search_vectors(vec, top_k)[0]
+
+    def search_batch(self, queries: Sequence[str], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        if not queries:
+            return []
+        return self.search_vectors(self.embed_queries(queries), top_k)
+
+    def search_vectors(self, vecs: np.ndarray, top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        per_shard = list(self._pool.map(lambda s: s.index.search(vecs, top_k), self.shards))
+        out: List[List[Dict[str, Any]]] = []
+        for q in range(vecs.shape[0]):
+            streams = [_hit_stream(si, scores[q], ids[q]) for si, (scores, ids) in enumerate(per_shard)]
+            hits = []
+            for rank, (neg_score, si, idx) in enumerate(islice(heapq.merge(*streams), top_k), 1):
+                shard = self.shards[si]
+                meta = shard.metadata[idx] if idx < len(shard.metadata) else {}
+                hits.append({"rank": rank, "similarity_score": -neg_score, **meta, "shard": shard.name})
+            out.append(hits)
+        return out
@@ -0,0 +1,356 @@
+"""Versioned, atomically published index snapshots with hot reload.
+
+Layout::
+
+    cache/snapshots/
+        CURRENT                       -> "20261019T101500.123456-3f9a1c" (atomic pointer)
+        20261019T101500.123456-3f9a1c/
+            faiss.index  embeddings.npy  metadata.json  metadata_cols/
+            manifest.json             counts, dims, model, texts hash, file sha256s
+
+Publishing writes a complete bundle into a hidden staging directory, writes
+its manifest, renames the directory into place and only then swaps the
+``CURRENT`` pointer (via `rag.cache._atomic_write`). A crash at any point
+leaves the previous snapshot current and intact; a half-written staging
+directory is never referenced.
+
+Pointer swaps are serialized by a lock file (``.lock``, ``flock`` where
+available). A publisher that derived its snapshot from an earlier one passes
+``expected=<that version>``; if another publish moved ``CURRENT`` meanwhile,
+the swap is refused with `SnapshotConflict` instead of overwriting the newer
+snapshot.
+
+`SnapshotRetriever` follows ``CURRENT``: a background thread polls the
+pointer, loads a new snapshot off the query path and swaps a single
+reference, so in-flight queries finish on the old index and new queries use
+the new one without a restart or stall.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+import numpy as np
+import faiss  # type: ignore
+
+from . import config
+from .cache import (
+    BUNDLE_NEIGHBORS,
+    _atomic_write,
+    save_index_bundle,
+    load_index_bundle,
+    load_neighbors,
+)
+from .retrieval import EmbeddingRetriever
+
+__all__ = [
+    "SNAPSHOTS_DIR",
+    "Snapshot",
+    "SnapshotConflict",
+    "texts_digest",
+    "publish_snapshot",
+    "current_version",
+    "list_snapshots",
+    "read_manifest",
+    "load_snapshot",
+    "verify_snapshot",
+    "SnapshotRetriever",
+]
+
+_path, __getattr__ = config.lazy_paths(__name__, {"SNAPSHOTS_DIR": lambda: config.CACHE_DIR / "snapshots"})
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"
+LOCK = ".lock"
+
+_pointer_mutex = threading.Lock()  # same-process publishers, and platforms without flock
+
+
+class SnapshotConflict(RuntimeError):
+    """CURRENT no longer points at the version a publisher expected."""
+
+
+@dataclass(slots=True)
+class Snapshot:
+    version: str
+    index: faiss.Index
+    metadata: Sequence[Dict[str, Any]]
+    embeddings: np.ndarray
+    manifest: Dict[str, Any]
+
+
+def texts_digest(texts: Sequence[str]) -> str:
+    """Order-sensitive sha256 over the embedded texts (detects content drift, not just counts)."""
+    h = hashlib.sha256()
+    for t in texts:
+        h.update(t.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _hash_tree(directory: Path, known: Optional[Mapping[str, str]] = None) -> Dict[str, str]:
+    """sha256 of every file but the manifest; `known` digests (computed while writing) are not re-read."""
+    known = known or {}
+    hashes = {}
+    for p in sorted(directory.rglob("*")):
+        if p.is_file() and p.name != MANIFEST:
+            rel = p.relative_to(directory).as_posix()
+            hashes[rel] = known.get(rel) or _file_sha256(p)
+    return hashes
+
+
+@contextmanager
+def _pointer_lock(root: Path):
+    """Exclusive lock on the CURRENT pointer, across threads and processes."""
+    with _pointer_mutex:
+        try:
+            import fcntl  # type: ignore
+        except ImportError:  # pragma: no cover - Windows: in-process lock only
+            yield
+            return
+        fd = os.open(root / LOCK, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # releases the flock
+
+
+def publish_snapshot(
+    index: faiss.Index,
+    embeddings: np.ndarray,
+    metadata: Sequence[Dict[str, Any]],
+    texts: Optional[Sequence[str]] = None,
+    model: Optional[str] = None,
+    extra: Optional[Dict[str, Any]] = None,
+    root: Optional[Path] = None,
+    keep: Optional[int] = None,
+    expected: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Write a new snapshot and atomically make it current. Returns its manifest.
+
+    With `expected`, the pointer is only swapped while CURRENT is still that
+    version (compare-and-swap under the pointer lock); otherwise the new
+    snapshot is discarded and `SnapshotConflict` is raised. `keep` (versions
+    retained) defaults to ``config.SNAPSHOT_KEEP``.
+    """
+    root = root or _path("SNAPSHOTS_DIR")
+    root.mkdir(parents=True, exist_ok=True)
+    created = datetime.now(timezone.utc)
+    version = f"{created:%Y%m%dT%H%M%S.%f}-{uuid.uuid4().hex[:6]}"  # sortable by creation time
+    staging = root / f".{version}.tmp"
+    try:
+        digests = save_index_bundle(staging, index, embeddings, metadata)
+        manifest = {
+            "version": version,
+            "created": created.isoformat(),
+            "counts": {
+                "vectors": int(index.ntotal),
+                "embeddings": int(embeddings.shape[0]),
+                "metadata": len(metadata),
+            },
+            "dims": int(index.d),
+            "index_type": type(index).__name__,
+            "model": model,
+            "texts_sha256": texts_digest(texts) if texts is not None else None,
+            "files": _hash_tree(staging, known=digests),
+            **(extra or {}),
+        }
+        _atomic_write(staging / MANIFEST, json.dumps(manifest, indent=2).encode("utf-8"))
+        staging.replace(root / version)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    with _pointer_lock(root):
+        if expected is not None and current_version(root) != expected:
+            shutil.rmtree(root / version, ignore_errors=True)
+            raise SnapshotConflict(f"CURRENT moved from {expected} to {current_version(root)}; {version} not published")
+        _atomic_write(root / CURRENT, version.encode("utf-8"))
+        _prune(root, config.SNAPSHOT_KEEP if keep is None else keep, version)
+    print(f"[snapshots] Published {version} ({manifest['counts']['vectors']} vectors)")
+    return manifest
+
+
+def _prune(root: Path, keep: int, current: str):
+    versions = list_snapshots(root)
+    for old in versions[: max(0, len(versions) - keep)]:
+        if old != current:
+            shutil.rmtree(root / old, ignore_errors=True)
+
+
+def current_version(root: Optional[Path] = None) -> Optional[str]:
+    pointer = (root or _path("SNAPSHOTS_DIR")) / CURRENT
+    if not pointer.exists():
+        return None
+    version = pointer.read_text("utf-8").strip()
+    return version or None
+
+
+def list_snapshots(root: Optional[Path] = None) -> List[str]:
+    root = root or _path("SNAPSHOTS_DIR")
+    if not root.exists():
+        return []
+    return sorted(p.name for p in root.iterdir() if p.is_dir() and not p.name.startswith(".") and (p / MANIFEST).exists())  # skip staging dirs
+
+
+def read_manifest(version: Optional[str] = None, root: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    root = root or _path("SNAPSHOTS_DIR")
+    version = version or current_version(root)
+    if version is None or not (root / version / MANIFEST).exists():
+        return None
+    return json.loads((root / version / MANIFEST).read_text("utf-8"))
+
+
+def verify_snapshot(version: Optional[str] = None, root: Optional[Path] = None) -> bool:
+    """Recompute file hashes and compare against the manifest."""
+    root = root or _path("SNAPSHOTS_DIR")
+    manifest = read_manifest(version, root)
+    if manifest is None:
+        return False
+    return _hash_tree(root / manifest["version"]) == manifest["files"]
+
+
+def load_snapshot(
+    version: Optional[str] = None,
+    mmap: bool = False,
+    verify: bool = False,
+    root: Optional[Path] = None,
+) -> Optional[Snapshot]:
+    """Load a snapshot (default: CURRENT); None if missing or inconsistent with its manifest."""
+    root = root or _path("SNAPSHOTS_DIR")
+    manifest = read_manifest(version, root)
+    if manifest is None:
+        return None
+    if verify and not verify_snapshot(manifest["version"], root):
+        print(f"[snapshots] Hash mismatch in {manifest['version']}; refusing to load")
+        return None
+    bundle = load_index_bundle(root / manifest["version"], mmap=mmap)
+    if bundle is None:
+        return None
+    index, metadata, embeddings = bundle
+    counts = manifest["counts"]
+    if (index.ntotal, len(metadata), embeddings.shape[0]) != (counts["vectors"], counts["metadata"], counts["embeddings"]):
+        print(f"[snapshots] Count mismatch in {manifest['version']}; refusing to load")
+        return None
+    return Snapshot(manifest["version"], index, metadata, embeddings, manifest)
+
+
+class SnapshotRetriever:
+    """`EmbeddingRetriever` facade that hot-swaps to newly published snapshots.
+
+    Parameters
+    ----------
+    embed_fn : callable | None
+        Query embedding function forwarded to each `EmbeddingRetriever`.
+    mmap : bool
+        Memory-map snapshots read-only (see `rag.cache.load_readonly_index`).
+    poll_interval : float | None
+        Seconds between checks of the CURRENT pointer (default
+        ``config.SNAPSHOT_POLL_SECONDS``); 0 disables the background thread
+        (call `check_for_update()` manually).
+    """
+
+    def __init__(self, embed_fn=None, mmap: bool = False, poll_interval: Optional[float] = None, root: Optional[Path] = None):
+        self._embed_fn = embed_fn
+        self._mmap = mmap
+        self._root = root or _path("SNAPSHOTS_DIR")
+        self._swap_lock = threading.Lock()
+        snap = load_snapshot(mmap=mmap, root=self._root)
+        if snap is None:
+            raise RuntimeError(f"No loadable snapshot under {self._root}")
+        self._current = self._wrap(snap)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if poll_interval is None:
+            poll_interval = config.SNAPSHOT_POLL_SECONDS
+        if poll_interval > 0:
+            self._thread = threading.Thread(target=self._poll, args=(poll_interval,), name="snapshot-watch", daemon=True)
+            self._thread.start()
+
+    def _wrap(self, snap: Snapshot) -> EmbeddingRetriever:
+        neighbors = load_neighbors(mmap=self._mmap, path=self._root / snap.version / BUNDLE_NEIGHBORS)
+        return EmbeddingRetriever(
+            snap.index, snap.metadata, embed_fn=self._embed_fn, version=snap.version, neighbors=neighbors,
+            texts_sha256=snap.manifest.get("texts_sha256"),
+        )
+
+    def _poll(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.check_for_update()
+            except Exception as e:  # keep serving the current snapshot
+                print(f"[snapshots] Reload failed: {e}")
+
+    def check_for_update(self) -> bool:
+        """Load and swap in the CURRENT snapshot if it changed. Returns True on swap."""
+        version = current_version(self._root)
+        if version is None or version == self._current.version:
+            return False
+        with self._swap_lock:
+            if version == self._current.version:
+                return False
+            snap = load_snapshot(version, mmap=self._mmap, root=self._root)
+            if snap is None:
+                return False
+            self._current = self._wrap(snap)  # single reference swap; in-flight queries keep the old one
+        print(f"[snapshots] Switched to {version}")
+        return True
+
+    def close(self):
+        self._stop.set()
+
+    # ---- EmbeddingRetriever surface (delegates to the current snapshot) ----
+    @property
+    def retriever(self) -> EmbeddingRetriever:
+        return self._current
+
+    @property
+    def version(self) -> str:
+        return self._current.version
+
+    @property
+    def texts_sha256(self) -> Optional[str]:
+        return self._current.texts_sha256
+
+    @property
+    def index(self) -> faiss.Index:
+        return self._current.index
+
+    @property
+    def metadata(self) -> Sequence[Dict[str, Any]]:
+        return self._current.metadata
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self._current.embed_query(query)
+
+    def embed_queries(self, queries: Sequence[str]) -> np.ndarray:
+        return self._current.embed_queries(queries)
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        return self._current.search(query, top_k)
+
+    def search_by_vector(self, vec: np.ndarray, top_k: int = 5) -> List[Dict[str, Any]]:
+        return self._current.search_by_vector(vec, top_k)
+
+    def search_batch(self, queries: Sequence[str], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        return self._current.search_batch(queries, top_k)
+
+    def search_vectors(self, vecs: np.ndarray, top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        return self._current.search_vectors(vecs, top_k)
+
+    def search_expanded(self, query: str, top_k: int = 5, k: int = 1, max_chunks: Optional[int] = None, chunk_lookup: Optional[Mapping[Any, Any]] = None) -> List[Dict[str, Any]]:
+        return self._current.search_expanded(query, top_k, k=k, max_chunks=max_chunks, chunk_lookup=chunk_lookup)
@@ -0,0 +1,453 @@
+"""Pluggable persistence for documents, chunks and metadata.
+
+`rag.cache` keeps everything in files under ``CACHE_DIR``. Reading one chunk
+therefore means loading the whole store. A storage backend keeps records
+individually addressable:
+
+    store = get_storage("sqlite")
+    store.replace_chunks(chunks)             # the stored set becomes exactly `chunks`
+    store.upsert_chunks(more)                # batched, idempotent; new ids go last
+    store.get_chunk("nci_breast_chunk_3")    # point lookup by chunk_id
+    list(store.iter_doc_chunks("nci_breast"))  # range scan, chunk_index order
+    list(store.iter_chunks())                # every chunk, in saved order
+
+Every chunk carries an explicit ``ordinal`` (its position in the saved
+list), so `iter_chunks` returns the order `replace_chunks` was given, which
+the index rows built from it rely on.
+
+Backends:
+
+- `SQLiteStorage`: one local database file (``STORAGE_SQLITE_PATH``, default
+  ``CACHE_DIR/rag.sqlite``). It runs in WAL mode, so readers in other
+  processes never block the writer. Each upsert or replace call is one
+  transaction of ``executemany`` batches, so readers see the old or the new
+  chunk set, never a mix.
+- `CosmosStorage`: an Azure Cosmos DB container partitioned on ``/doc_id``.
+  Upserts are grouped per partition into transactional batches (single
+  upserts when the SDK has no ``execute_item_batch``) and sent from a thread
+  pool, ``STORAGE_UPSERT_CONCURRENCY`` at a time. `replace_chunks` upserts
+  first and then deletes stale chunks per partition; Cosmos has no
+  cross-partition transaction, so readers may briefly see stale extras but
+  never miss a current chunk. Chunk lookups with a known ``doc_id`` are
+  point reads (``read_item``). The container is injectable, so a local stub
+  or the Cosmos emulator can stand in for the service.
+
+Select the backend with ``STORAGE_BACKEND`` (``files`` | ``sqlite`` |
+``cosmos``). With ``files``, the default, `rag.cache` behaves as before.
+Records are stored as JSON objects of the dataclass fields. Fields unknown to
+the current model are dropped on read, and missing ones take their defaults.
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import fields
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Type, TypeVar
+import json
+import sqlite3
+import threading
+import urllib.parse
+
+from . import config, telemetry
+from .models import Chunk, Document
+
+__all__ = [
+    "StorageBackend",
+    "SQLiteStorage",
+    "CosmosStorage",
+    "get_storage",
+]
+
+T = TypeVar("T")
+
+_LOOKUP_BATCH = 500  # ids per IN (...) / ARRAY_CONTAINS lookup
+_COSMOS_BATCH_OPS = 100  # transactional batch limit
+_COSMOS_BATCH_BYTES = 1_500_000  # stay under the 2 MB batch payload limit
+_METADATA_PARTITION = "__metadata__"
+
+
+def _to_dict(obj) -> Dict[str, Any]:
+    return {f.name: getattr(obj, f.name) for f in fields(obj)}
+
+
+def _from_dict(cls: Type[T], data: Dict[str, Any]) -> T:
+    names = {f.name for f in fields(cls)}
+    return cls(**{k: v for k, v in data.items() if k in names})
+
+
+class StorageBackend:
+    """Interface shared by all backends; `close` releases connections and pools."""
+
+    def upsert_documents(self, docs: Iterable[Document]) -> int:
+        raise NotImplementedError
+
+    def upsert_chunks(self, chunks: Iterable[Chunk]) -> int:
+        """Insert or overwrite `chunks`; existing ids keep their position, new ones go last."""
+        raise NotImplementedError
+
+    def replace_chunks(self, chunks: Iterable[Chunk]) -> int:
+        """Make the stored chunks exactly `chunks`, in this order (missing ids are deleted)."""
+        raise NotImplementedError
+
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        raise NotImplementedError
+
+    def iter_documents(self) -> Iterator[Document]:
+        raise NotImplementedError
+
+    def get_chunks(self, chunk_ids: Sequence[str], doc_ids: Optional[Sequence[Optional[str]]] = None) -> List[Optional[Chunk]]:
+        """Chunks in `chunk_ids` order; None where an id is unknown.
+
+        `doc_ids` (aligned with `chunk_ids`, None where unknown) lets
+        partitioned backends read each chunk from its partition directly.
+        """
+        raise NotImplementedError
+
+    def get_chunk(self, chunk_id: str, doc_id: Optional[str] = None) -> Optional[Chunk]:
+        return self.get_chunks([chunk_id], None if doc_id is None else [doc_id])[0]
+
+    def iter_doc_chunks(self, doc_id: str) -> Iterator[Chunk]:
+        """Chunks of one document in `chunk_index` order."""
+        raise NotImplementedError
+
+    def iter_chunks(self) -> Iterator[Chunk]:
+        """Every chunk, in ``ordinal`` (saved) order."""
+        raise NotImplementedError
+
+    def put_metadata(self, key: str, value: Any):
+        raise NotImplementedError
+
+    def get_metadata(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# ----------------------------- SQLite -----------------------------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY, body TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_id TEXT PRIMARY KEY,
+    doc_id TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    ordinal INTEGER
+);
+CREATE INDEX IF NOT EXISTS chunks_by_doc ON chunks (doc_id, chunk_index);
+CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+# Databases created before `ordinal` existed: add it, keeping insertion order
+_MIGRATE_ORDINAL = """
+ALTER TABLE chunks ADD COLUMN ordinal INTEGER;
+UPDATE chunks SET ordinal = rowid;
+"""
+
+_UPSERT_CHUNK = (
+    "INSERT INTO chunks (chunk_id, doc_id, chunk_index, body, ordinal) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(chunk_id) DO UPDATE SET doc_id = excluded.doc_id, "
+    "chunk_index = excluded.chunk_index, body = excluded.body"
+)
+
+
+def _chunk_row(chunk: Chunk, ordinal: int) -> tuple:
+    return (chunk.chunk_id, chunk.doc_id, int(chunk.chunk_index), json.dumps(_to_dict(chunk), ensure_ascii=False), ordinal)
+
+
+class SQLiteStorage(StorageBackend):
+    """Single-file local store (WAL journal, one transaction per upsert call)."""
+
+    def __init__(self, path: Optional[Path | str] = None):
+        self.path = Path(path) if path else config.CACHE_DIR / "rag.sqlite"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # autocommit mode; transactions are explicit. One connection shared under a lock
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; safe with WAL
+        self._conn.executescript(_SCHEMA)
+        if "ordinal" not in {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}:
+            self._conn.executescript("BEGIN IMMEDIATE;" + _MIGRATE_ORDINAL + "COMMIT;")
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS chunks_by_ordinal ON chunks (ordinal)")
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _write(self, sql: str, rows: Iterable[tuple]) -> int:
+        with self._transaction() as conn:
+            return conn.executemany(sql, rows).rowcount
+
+    def _read(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def upsert_documents(self, docs: Iterable[Document]) -> int:
+        with telemetry.span("storage.upsert", backend="sqlite", kind="documents"):
+            return self._write(
+                "INSERT INTO documents (doc_id, body) VALUES (?, ?) "
+                "ON CONFLICT(doc_id) DO UPDATE SET body = excluded.body",
+                ((d.doc_id, json.dumps(_to_dict(d), ensure_ascii=False)) for d in docs),
+            )
+
+    def upsert_chunks(self, chunks: Iterable[Chunk]) -> int:
+        with telemetry.span("storage.upsert", backend="sqlite", kind="chunks"), self._transaction() as conn:
+            (last,) = conn.execute("SELECT COALESCE(MAX(ordinal), -1) FROM chunks").fetchone()
+            # new ids take the next free ordinals; on conflict the stored ordinal is kept
+            return conn.executemany(_UPSERT_CHUNK, (_chunk_row(c, last + 1 + i) for i, c in enumerate(chunks))).rowcount
+
+    def replace_chunks(self, chunks: Iterable[Chunk]) -> int:
+        with telemetry.span("storage.replace", backend="sqlite", kind="chunks"), self._transaction() as conn:
+            conn.execute("DELETE FROM chunks")
+            return conn.executemany(_UPSERT_CHUNK, (_chunk_row(c, i) for i, c in enumerate(chunks))).rowcount
+
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        rows = self._read("SELECT body FROM documents WHERE doc_id = ?", (doc_id,))
+        return _from_dict(Document, json.loads(rows[0][0])) if rows else None
+
+    def iter_documents(self) -> Iterator[Document]:
+        for (body,) in self._read("SELECT body FROM documents ORDER BY rowid"):
+            yield _from_dict(Document, json.loads(body))
+
+    def get_chunks(self, chunk_ids: Sequence[str], doc_ids: Optional[Sequence[Optional[str]]] = None) -> List[Optional[Chunk]]:
+        found: Dict[str, str] = {}
+        for i in range(0, len(chunk_ids), _LOOKUP_BATCH):
+            batch = list(chunk_ids[i:i + _LOOKUP_BATCH])
+            marks = ",".join("?" * len(batch))
+            found.update(self._read(f"SELECT chunk_id, body FROM chunks WHERE chunk_id IN ({marks})", batch))
+        return [_from_dict(Chunk, json.loads(found[cid])) if cid in found else None for cid in chunk_ids]
+
+    def iter_doc_chunks(self, doc_id: str) -> Iterator[Chunk]:
+        for (body,) in self._read("SELECT body FROM chunks WHERE doc_id = ? ORDER BY chunk_index", (doc_id,)):
+            yield _from_dict(Chunk, json.loads(body))
+
+    def iter_chunks(self, batch_rows: int = 10_000) -> Iterator[Chunk]:
+        # keyset pagination on ordinal: the lock is never held across a yield
+        last = -1
+        while True:
+            rows = self._read("SELECT ordinal, body FROM chunks WHERE ordinal > ? ORDER BY ordinal LIMIT ?", (last, batch_rows))
+            if not rows:
+                return
+            for _, body in rows:
+                yield _from_dict(Chunk, json.loads(body))
+            last = rows[-1][0]
+
+    def put_metadata(self, key: str, value: Any):
+        self._write(
+            "INSERT INTO metadata (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            [(key, json.dumps(value, ensure_ascii=False))],
+        )
+
+    def get_metadata(self, key: str, default: Any = None) -> Any:
+        rows = self._read("SELECT value FROM metadata WHERE key = ?", (key,))
+        return json.loads(rows[0][0]) if rows else default
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ----------------------------- Cosmos -----------------------------
+
+def _cosmos_id(kind: str, key: str) -> str:
+    # '/', '\\', '?' and '#' are not allowed in Cosmos item ids
+    return f"{kind}:{urllib.parse.quote(key, safe='')}"
+
+
+class CosmosStorage(StorageBackend):
+    """Azure Cosmos DB container partitioned on ``/doc_id``.
+
+    `container` is any object with the ``azure.cosmos`` ContainerProxy
+    methods used here (``upsert_item``, ``read_item``, ``delete_item``,
+    ``query_items`` and optionally ``execute_item_batch``). When omitted, it is opened (and created if
+    needed) from the ``COSMOS_*`` settings.
+    """
+
+    def __init__(self, container: Any = None, concurrency: Optional[int] = None):
+        self.container = container if container is not None else self._open_container()
+        self.concurrency = concurrency or config.STORAGE_UPSERT_CONCURRENCY
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="cosmos-upsert")
+
+    @staticmethod
+    def _open_container():
+        try:
+            from azure.cosmos import CosmosClient, PartitionKey  # type: ignore
+        except ImportError as exc:  # pragma: no cover - optional dependency
+            raise RuntimeError("CosmosStorage requires the 'azure-cosmos' package") from exc
+        missing = [n for n in ("COSMOS_ENDPOINT", "COSMOS_KEY", "COSMOS_DB_NAME", "COSMOS_CONTAINER") if not getattr(config, n)]
+        if missing:
+            raise RuntimeError(f"Missing required environment variable: {missing[0]}")
+        client = CosmosClient(config.COSMOS_ENDPOINT, credential=config.COSMOS_KEY)
+        database = client.create_database_if_not_exists(id=config.COSMOS_DB_NAME)
+        return database.create_container_if_not_exists(id=config.COSMOS_CONTAINER, partition_key=PartitionKey(path="/doc_id"))
+
+    # -- writes --
+    def _upsert_group(self, partition: str, items: List[Dict[str, Any]]):
+        batch_fn = getattr(self.container, "execute_item_batch", None)
+        if batch_fn is None or len(items) == 1:
+            for item in items:
+                self.container.upsert_item(item)
+            return
+        batch, size = [], 0
+        for item in items:
+            item_size = len(json.dumps(item, ensure_ascii=False))
+            if batch and (len(batch) == _COSMOS_BATCH_OPS or size + item_size > _COSMOS_BATCH_BYTES):
+                batch_fn(batch_operations=batch, partition_key=partition)
+                batch, size = [], 0
+            batch.append(("upsert", (item,)))
+            size += item_size
+        if batch:
+            batch_fn(batch_operations=batch, partition_key=partition)
+
+    def _upsert(self, kind: str, items: Iterable[Dict[str, Any]]) -> int:
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for item in items:
+            groups.setdefault(item["doc_id"], []).append(item)
+        with telemetry.span("storage.upsert", backend="cosmos", kind=kind, partitions=len(groups)):
+            futures = [self._pool.submit(self._upsert_group, pk, group) for pk, group in groups.items()]
+            for f in futures:
+                f.result()  # re-raise the first failure
+        return sum(map(len, groups.values()))
+
+    def upsert_documents(self, docs: Iterable[Document]) -> int:
+        return self._upsert("documents", (
+            {**_to_dict(d), "id": _cosmos_id("doc", d.doc_id), "kind": "document"} for d in docs
+        ))
+
+    @staticmethod
+    def _chunk_item(chunk: Chunk, ordinal: int) -> Dict[str, Any]:
+        return {**_to_dict(chunk), "id": _cosmos_id("chunk", chunk.chunk_id), "kind": "chunk", "ordinal": ordinal}
+
+    def upsert_chunks(self, chunks: Iterable[Chunk]) -> int:
+        chunks = list(chunks)
+        ordinals: Dict[str, int] = {}
+        for i in range(0, len(chunks), _LOOKUP_BATCH):
+            for item in self._query(
+                "SELECT c.chunk_id, c.ordinal FROM c WHERE c.kind = 'chunk' AND ARRAY_CONTAINS(@ids, c.chunk_id)",
+                [{"name": "@ids", "value": [c.chunk_id for c in chunks[i:i + _LOOKUP_BATCH]]}],
+            ):
+                ordinals[item["chunk_id"]] = item["ordinal"]
+        # existing ids keep their position; new ones take the next free ordinals
+        last = next(self._query("SELECT VALUE MAX(c.ordinal) FROM c WHERE c.kind = 'chunk'", []), None)
+        next_ordinal = -1 if last is None else last
+        items = []
+        for c in chunks:
+            if c.chunk_id not in ordinals:
+                next_ordinal += 1
+                ordinals[c.chunk_id] = next_ordinal
+            items.append(self._chunk_item(c, ordinals[c.chunk_id]))
+        return self._upsert("chunks", items)
+
+    def replace_chunks(self, chunks: Iterable[Chunk]) -> int:
+        # upsert first, then delete the leftovers: there is no cross-partition
+        # transaction, and this order never hides a current chunk from readers
+        chunks = list(chunks)
+        count = self._upsert("chunks", (self._chunk_item(c, i) for i, c in enumerate(chunks)))
+        keep = {c.chunk_id for c in chunks}
+        stale = [
+            item for item in self._query("SELECT c.id, c.doc_id, c.chunk_id FROM c WHERE c.kind = 'chunk'", [])
+            if item["chunk_id"] not in keep
+        ]
+        with telemetry.span("storage.delete", backend="cosmos", kind="chunks", count=len(stale)):
+            futures = [self._pool.submit(self.container.delete_item, item=item["id"], partition_key=item["doc_id"]) for item in stale]
+            for f in futures:
+                f.result()
+        return count
+
+    # -- reads --
+    def _query(self, query: str, parameters: List[Dict[str, Any]], partition: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        if partition is None:
+            return iter(self.container.query_items(query=query, parameters=parameters, enable_cross_partition_query=True))
+        return iter(self.container.query_items(query=query, parameters=parameters, partition_key=partition))
+
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        for item in self._query("SELECT * FROM c WHERE c.kind = 'document'", [], partition=doc_id):
+            return _from_dict(Document, item)
+        return None
+
+    def iter_documents(self) -> Iterator[Document]:
+        for item in self._query("SELECT * FROM c WHERE c.kind = 'document'", []):
+            yield _from_dict(Document, item)
+
+    def _read_chunk(self, chunk_id: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self.container.read_item(item=_cosmos_id("chunk", chunk_id), partition_key=doc_id)
+        except Exception as exc:
+            if getattr(exc, "status_code", None) == 404:
+                return None
+            raise
+
+    def get_chunks(self, chunk_ids: Sequence[str], doc_ids: Optional[Sequence[Optional[str]]] = None) -> List[Optional[Chunk]]:
+        found: Dict[str, Dict[str, Any]] = {}
+        # point reads where the partition is known; one query per batch for the rest
+        known = [(cid, did) for cid, did in zip(chunk_ids, doc_ids or ()) if did is not None]
+        for (cid, _), future in zip(known, [self._pool.submit(self._read_chunk, cid, did) for cid, did in known]):
+            item = future.result()
+            if item is not None:
+                found[cid] = item
+        read = {cid for cid, _ in known}
+        unknown = [cid for cid in dict.fromkeys(chunk_ids) if cid not in read]
+        for i in range(0, len(unknown), _LOOKUP_BATCH):
+            batch = unknown[i:i + _LOOKUP_BATCH]
+            for item in self._query(
+                "SELECT * FROM c WHERE c.kind = 'chunk' AND ARRAY_CONTAINS(@ids, c.chunk_id)",
+                [{"name": "@ids", "value": batch}],
+            ):
+                found[item["chunk_id"]] = item
+        return [_from_dict(Chunk, found[cid]) if cid in found else None for cid in chunk_ids]
+
+    def iter_doc_chunks(self, doc_id: str) -> Iterator[Chunk]:
+        for item in self._query("SELECT * FROM c WHERE c.kind = 'chunk' ORDER BY c.chunk_index", [], partition=doc_id):
+            yield _from_dict(Chunk, item)
+
+    def iter_chunks(self) -> Iterator[Chunk]:
+        for item in self._query("SELECT * FROM c WHERE c.kind = 'chunk' ORDER BY c.ordinal", []):
+            yield _from_dict(Chunk, item)
+
+    def put_metadata(self, key: str, value: Any):
+        self.container.upsert_item({"id": _cosmos_id("meta", key), "doc_id": _METADATA_PARTITION, "kind": "metadata", "key": key, "value": value})
+
+    def get_metadata(self, key: str, default: Any = None) -> Any:
+        for item in self._query(
+            "SELECT * FROM c WHERE c.kind = 'metadata' AND c.key = @key",
+            [{"name": "@key", "value": key}],
+            partition=_METADATA_PARTITION,
+        ):
+            return item.get("value", default)
+        return default
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+# ----------------------------- selection -----------------------------
+
+_instances: Dict[str, StorageBackend] = {}
+_instances_lock = threading.Lock()
+
+
+def get_storage(backend: Optional[str] = None) -> Optional[StorageBackend]:
+    """Shared backend instance for `backend` (default ``STORAGE_BACKEND``); None for ``files``."""
+    name = (backend or config.STORAGE_BACKEND).lower()
+    if name == "files":
+        return None
+    with _instances_lock:
+        store = _instances.get(name)
+        if store is None:
+            if name == "sqlite":
+                store = SQLiteStorage(config.STORAGE_SQLITE_PATH or None)
+            elif name == "cosmos":
+                store = CosmosStorage()
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND {name!r} (expected files, sqlite or cosmos)")
+            _instances[name] = store
+        return store
@@ -0,0 +1,461 @@
+"""Opt-in stage timing (spans) and metrics (counters, histograms).
+
+Disabled by default: `span` returns a shared no-op object and `count` /
+`observe` return after one flag check, so instrumented code costs next to
+nothing unless telemetry is switched on:
+
+    from rag import telemetry
+    mem = telemetry.enable(telemetry.InMemoryExporter())
+    ... run the pipeline ...
+    mem.summary()                # per-span count / total / p50 / p95 / p99
+    print(telemetry.prometheus_text())
+
+or from the environment: ``TELEMETRY_ENABLED=1`` plus optional
+``TELEMETRY_JSONL=<path>`` (one JSON line per finished span) and
+``TELEMETRY_PROMETHEUS=<path>`` (text exposition written on `flush` and at
+exit). The environment is read on the first instrumented call, not at
+import. The search service also serves the registry at ``GET /metrics``.
+
+Every finished span is observed in the ``rag_stage_duration_seconds``
+histogram (label ``stage``) and handed to the exporters. Spans nest through
+`contextvars`, so parent/child links survive ``await`` and executor hops
+started from a copied context. Stages instrumented in the pipeline:
+
+    scrape.fetch, scrape.parse          rag.scrape
+    pdf.extract                         rag.ingestion
+    chunking                            rag.chunking
+    headers.generate, headers.llm       rag.headers (network time per call;
+                                        queue wait is the
+                                        ``headers.queue_wait_seconds`` histogram)
+    embeddings.request, embeddings.batch rag.embeddings / rag.cache
+    index.build                         rag.index
+    retrieval.embed, retrieval.search   rag.retrieval
+"""
+from __future__ import annotations
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from time import perf_counter, time
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+import atexit
+import functools
+import inspect
+import itertools
+import json
+import math
+import os
+import re
+import threading
+
+from . import config
+
+__all__ = [
+    "SpanRecord",
+    "Registry",
+    "InMemoryExporter",
+    "JsonlExporter",
+    "PrometheusExporter",
+    "enable",
+    "disable",
+    "enabled",
+    "span",
+    "traced",
+    "annotate",
+    "count",
+    "observe",
+    "registry",
+    "flush",
+    "prometheus_text",
+]
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf,
+)
+STAGE_METRIC = "stage_duration_seconds"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+@dataclass(slots=True)
+class SpanRecord:
+    name: str
+    start: float  # epoch seconds
+    duration: float  # seconds
+    span_id: str
+    parent_id: Optional[str]
+    trace_id: str
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Thread-safe counters and fixed-bucket histograms keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], _Histogram] = {}
+
+    def inc(self, name: str, value: float = 1.0, labels: Labels = ()):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: Labels = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        key = (name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = _Histogram(buckets)
+            hist.observe(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-ready copy of every series."""
+        with self._lock:
+            return {
+                "counters": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in self.counters.items()],
+                "histograms": [
+                    {"name": n, "labels": dict(l), "count": h.count, "sum": h.sum,
+                     "buckets": [["+Inf" if math.isinf(b) else b, c] for b, c in zip(h.buckets, itertools.accumulate(h.counts))]}
+                    for (n, l), h in self.histograms.items()
+                ],
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+# ----------------------------- exporters -----------------------------
+
+class Exporter:
+    """Receives finished spans; `flush` is called with the registry on demand and at shutdown."""
+
+    def export(self, record: SpanRecord):
+        pass
+
+    def flush(self, registry: Registry):
+        pass
+
+    def close(self):
+        pass
+
+
+class InMemoryExporter(Exporter):
+    """Keeps the last `maxlen` spans for inspection in a notebook or test."""
+
+    def __init__(self, maxlen: int = 100_000):
+        self.spans: Deque[SpanRecord] = deque(maxlen=maxlen)
+
+    def export(self, record: SpanRecord):
+        self.spans.append(record)  # deque.append is atomic
+
+    def durations(self, name: str) -> List[float]:
+        return [s.duration for s in list(self.spans) if s.name == name]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per span name: count, total seconds and latency percentiles in ms, slowest total first."""
+        by_name: Dict[str, List[float]] = {}
+        for s in list(self.spans):
+            by_name.setdefault(s.name, []).append(s.duration)
+        out = {}
+        for name, d in by_name.items():
+            d.sort()
+            pick = lambda q: d[min(len(d) - 1, int(q * len(d)))] * 1000.0
+            out[name] = {"count": len(d), "total_s": sum(d), "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": d[-1] * 1000.0}
+        return dict(sorted(out.items(), key=lambda kv: kv[1]["total_s"], reverse=True))
+
+    def clear(self):
+        self.spans.clear()
+
+
+class JsonlExporter(Exporter):
+    """Appends one JSON line per finished span; `flush` also writes a metrics snapshot line."""
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = open(self.path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, record: SpanRecord):
+        line = json.dumps({"type": "span", **asdict(record)}, default=str, ensure_ascii=False)
+        with self._lock:
+            self._fh.write(line + "\n")
+
+    def flush(self, registry: Registry):
+        line = json.dumps({"type": "metrics", "time": time(), **registry.snapshot()}, default=str)
+        with self._lock:
+            self._fh.write(line + "\n")
+            self._fh.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._fh.closed:
+                self._fh.close()
+
+
+class PrometheusExporter(Exporter):
+    """Writes the Prometheus text exposition of the registry to `path` on each flush."""
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+
+    def flush(self, registry: Registry):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(prometheus_text(registry), "utf-8")
+        tmp.replace(self.path)  # scrapers never see a half-written file
+
+
+_INVALID = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _metric_name(name: str) -> str:
+    return "rag_" + _INVALID.sub("_", name)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labels: Labels, extra: str = "") -> str:
+    parts = ['%s="%s"' % (_INVALID.sub("_", k), _escape(v)) for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def prometheus_text(reg: Optional[Registry] = None) -> str:
+    """Prometheus text format (0.0.4) for every counter and histogram."""
+    reg = reg or _registry
+    with reg._lock:
+        counters = sorted(reg.counters.items())
+        histograms = sorted(reg.histograms.items(), key=lambda kv: kv[0])
+        hist_data = [(k, h.buckets, list(h.counts), h.sum, h.count) for k, h in histograms]
+    lines: List[str] = []
+    typed = set()
+    for (name, labels), value in counters:
+        metric = _metric_name(name) + "_total"
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} counter")
+            typed.add(metric)
+        lines.append(f"{metric}{_label_str(labels)} {value:g}")
+    for (name, labels), buckets, counts, total, n in hist_data:
+        metric = _metric_name(name)
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} histogram")
+            typed.add(metric)
+        for bound, cum in zip(buckets, itertools.accumulate(counts)):
+            le = "+Inf" if math.isinf(bound) else f"{bound:g}"
+            le_label = 'le="%s"' % le
+            lines.append(f"{metric}_bucket{_label_str(labels, le_label)} {cum}")
+        lines.append(f"{metric}_sum{_label_str(labels)} {total:.9g}")
+        lines.append(f"{metric}_count{_label_str(labels)} {n}")
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------------ spans --------------------------------
+
+class _State:
+    enabled: Optional[bool] = None  # None until the config has been read (first use)
+    exporters: List[Exporter] = []
+
+
+_registry = Registry()
+_current: ContextVar[Optional["_Span"]] = ContextVar("rag_telemetry_span", default=None)
+_ids = itertools.count(1)
+_pid = f"{os.getpid():x}"
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        return self
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("name", "attrs", "span_id", "parent_id", "trace_id", "_start", "_wall", "_token")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self):
+        parent = _current.get()
+        self.span_id = f"{_pid}-{next(_ids):x}"
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else self.span_id
+        self._token = _current.set(self)
+        self._wall = time()
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = perf_counter() - self._start
+        try:
+            _current.reset(self._token)
+        except ValueError:  # exited in a different context (e.g. generator closed elsewhere)
+            pass
+        _registry.observe(STAGE_METRIC, duration, (("stage", self.name),))
+        if exc_type is not None:
+            _registry.inc("stage_errors", 1, (("stage", self.name),))
+        record = SpanRecord(
+            self.name, self._wall, duration, self.span_id, self.parent_id, self.trace_id,
+            self.attrs, None if exc_type is None else f"{exc_type.__name__}: {exc}",
+        )
+        for exporter in _State.exporters:
+            try:
+                exporter.export(record)
+            except Exception as e:  # telemetry must never break the pipeline
+                print(f"[telemetry] Exporter {type(exporter).__name__} failed: {e}")
+        return False
+
+
+def span(name: str, **attrs):
+    """Context manager timing one stage; ``with span("x") as s: s.set(rows=n)``."""
+    if not _State.enabled and not (_State.enabled is None and _autoconfigure()):
+        return _NOOP
+    return _Span(name, attrs)
+
+
+def annotate(**attrs):
+    """Attach attributes to the innermost active span (no-op when none / disabled)."""
+    if _State.enabled or (_State.enabled is None and _autoconfigure()):
+        current = _current.get()
+        if current is not None:
+            current.attrs.update(attrs)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator wrapping a sync or async function in a span (default name: module.qualname)."""
+
+    def decorate(fn: Callable):
+        stage = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__qualname__}"
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not _State.enabled and not (_State.enabled is None and _autoconfigure()):
+                    return await fn(*args, **kwargs)
+                with _Span(stage, {}):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _State.enabled and not (_State.enabled is None and _autoconfigure()):
+                return fn(*args, **kwargs)
+            with _Span(stage, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def count(name: str, value: float = 1.0, **labels):
+    """Increment counter `name` (exported as ``rag_<name>_total``)."""
+    if _State.enabled or (_State.enabled is None and _autoconfigure()):
+        _registry.inc(name, value, _labels(labels))
+
+
+def observe(name: str, value: float, **labels):
+    """Record `value` in histogram `name` (exported as ``rag_<name>``)."""
+    if _State.enabled or (_State.enabled is None and _autoconfigure()):
+        _registry.observe(name, value, _labels(labels))
+
+
+# ---------------------------- lifecycle ------------------------------
+
+def enabled() -> bool:
+    return bool(_State.enabled or (_State.enabled is None and _autoconfigure()))
+
+
+def registry() -> Registry:
+    return _registry
+
+
+def enable(*exporters: Exporter) -> Optional[Exporter]:
+    """Turn telemetry on, adding `exporters`; returns the first one for convenience."""
+    _State.exporters = _State.exporters + list(exporters)
+    _State.enabled = True
+    return exporters[0] if exporters else None
+
+
+def flush():
+    for exporter in _State.exporters:
+        try:
+            exporter.flush(_registry)
+        except Exception as e:
+            print(f"[telemetry] Flush of {type(exporter).__name__} failed: {e}")
+
+
+def disable(reset: bool = False):
+    """Flush and close exporters and stop recording; `reset` also clears the metrics."""
+    flush()
+    exporters, _State.exporters = _State.exporters, []
+    _State.enabled = False
+    for exporter in exporters:
+        exporter.close()
+    if reset:
+        _registry.reset()
+
+
+_config_lock = threading.Lock()
+
+
+def _autoconfigure() -> bool:
+    """Resolve ``TELEMETRY_*`` settings once; explicit `enable` / `disable` take precedence."""
+    with _config_lock:
+        if _State.enabled is None:
+            _State.enabled = False
+            if config.TELEMETRY_ENABLED:
+                _enable_from_config()
+    return bool(_State.enabled)
+
+
+def _enable_from_config():
+    exporters: List[Exporter] = []
+    if config.TELEMETRY_JSONL:
+        exporters.append(JsonlExporter(config.TELEMETRY_JSONL))
+    if config.TELEMETRY_PROMETHEUS:
+        exporters.append(PrometheusExporter(config.TELEMETRY_PROMETHEUS))
+    enable(*exporters)
+    atexit.register(disable)
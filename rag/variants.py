@@ -0,0 +1,235 @@
+"""Several indexes over the same chunks, built with shared embedding work.
+
+The header A/B evaluation needs a baseline index over ``raw_chunk`` and an
+enhanced index over ``augmented_chunk``. Built one at a time through
+`rag.cache.build_or_load_index`, each was a full embedding pass, and both
+wrote to the same ``cache/embeddings.npy`` / ``faiss.index`` paths.
+
+    variants = build_variant_indexes({
+        "baseline": ([c.raw_chunk for c in chunks], baseline_meta),
+        "enhanced": ([c.augmented_chunk for c in chunks], enhanced_meta),
+    })
+    report = variants.compare(queries, top_k=5)
+
+How the work is shared:
+
+1. A variant whose bundle under ``CACHE_DIR/variants/<name>`` matches its
+   texts (content hash) and embedding model is loaded, not rebuilt. A
+   bundle whose manifest records failed rows (zero vectors left out of its
+   index) is rebuilt: its healthy rows are copied and only the failed texts
+   are embedded again.
+2. The texts of all variants still to build are deduplicated (texts present
+   in several variants, empty headers, repeated chunks). Texts found in
+   `reuse` (e.g. the main index's texts and embeddings) are copied. Every
+   other unique text is embedded once through `rag.cache.embed_texts`,
+   journaled so an interrupted build resumes. Once the bundles are saved,
+   only the journal rows of those texts are discarded; the journal is
+   shared with other builds of the same model.
+3. Each variant's matrix is a row gather from the unique matrix. Its index
+   is saved as a bundle under its own name, next to the others.
+4. `VariantSet.search_batch` and `VariantSet.compare` embed a batch of
+   queries once and search every variant with the same vectors.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import json
+import numpy as np
+import faiss  # type: ignore
+
+from . import config, telemetry
+from .cache import _atomic_write, embed_texts, load_index_bundle, save_index_bundle
+from .embeddings import embedding_model_name
+from .index import build_faiss_index_bulk
+from .retrieval import EmbeddingRetriever
+
+__all__ = [
+    "VARIANTS_DIR",
+    "IndexVariant",
+    "VariantSet",
+    "build_variant_indexes",
+]
+
+_path, __getattr__ = config.lazy_paths(__name__, {"VARIANTS_DIR": lambda: config.CACHE_DIR / "variants"})
+VARIANT_MANIFEST = "variant.json"
+
+
+@dataclass(slots=True)
+class IndexVariant:
+    name: str
+    index: faiss.Index
+    metadata: Sequence[Dict[str, Any]]
+    embeddings: np.ndarray
+    failed: int = 0  # rows whose embedding failed, left out of the index
+
+
+@dataclass(slots=True)
+class VariantSet:
+    """Named variants searched with one shared query-embedding call per batch."""
+
+    variants: Dict[str, IndexVariant]
+    embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None
+    stats: Dict[str, int] = field(default_factory=dict)  # row / unique / reused / embedded counts of the build
+    _retrievers: Dict[str, EmbeddingRetriever] = field(default_factory=dict)
+
+    def __getitem__(self, name: str) -> IndexVariant:
+        return self.variants[name]
+
+    def retriever(self, name: str) -> EmbeddingRetriever:
+        r = self._retrievers.get(name)
+        if r is None:
+            v = self.variants[name]
+            r = self._retrievers[name] = EmbeddingRetriever(v.index, v.metadata, embed_fn=self.embed_fn)
+        return r
+
+    def retrievers(self) -> Dict[str, EmbeddingRetriever]:
+        return {name: self.retriever(name) for name in self.variants}
+
+    def embed_queries(self, queries: Sequence[str]) -> np.ndarray:
+        return self.retriever(next(iter(self.variants))).embed_queries(queries)
+
+    def search_batch(self, queries: Sequence[str], top_k: int = 5) -> Dict[str, List[List[Dict[str, Any]]]]:
+        """Results per variant for every query; the queries are embedded once."""
+        if not queries:
+            return {name: [] for name in self.variants}
+        vecs = self.embed_queries(queries)
+        return {name: r.search_vectors(vecs, top_k) for name, r in self.retrievers().items()}
+
+    def compare(self, queries, top_k: int = 5, batch_size: int = 32) -> Dict[str, Any]:
+        """`rag.eval.benchmark.compare_retrievers` over all variants (first variant is the reference)."""
+        from .eval.benchmark import compare_retrievers
+
+        return compare_retrievers(queries, self.retrievers(), top_k=top_k, batch_size=batch_size, embed_queries=self.embed_queries)
+
+
+def _load_variant(name: str, directory: Path, digest: str, model: str, count: int) -> Optional[IndexVariant]:
+    manifest_path = directory / VARIANT_MANIFEST
+    if not manifest_path.exists():
+        return None
+    manifest = json.loads(manifest_path.read_text("utf-8"))
+    if (manifest.get("texts_sha256"), manifest.get("model"), manifest.get("count")) != (digest, model, count):
+        return None
+    bundle = load_index_bundle(directory)
+    if bundle is None:
+        return None
+    index, metadata, embeddings = bundle
+    return IndexVariant(name, index, metadata, embeddings, failed=int(manifest.get("failed", 0)))
+
+
+def build_variant_indexes(
+    variants: Dict[str, Tuple[Sequence[str], Sequence[Dict[str, Any]]]],
+    embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+    force: bool = False,
+    index_type: str = "auto",
+    root: Optional[Path] = None,
+    reuse: Optional[Tuple[Sequence[str], np.ndarray]] = None,
+    model: Optional[str] = None,
+) -> VariantSet:
+    """Load or build one index per variant, embedding each distinct text once.
+
+    Parameters
+    ----------
+    variants : dict
+        Name -> (texts, metadata), metadata aligned to texts.
+    embed_fn : callable | None
+        Embedding function (default: the API via `rag.cache.embed_texts`).
+    force : bool
+        Rebuild every variant even if its bundle matches.
+    index_type : str
+        Forwarded to `rag.index.build_faiss_index_bulk`.
+    root : Path | None
+        Parent directory of the variant bundles (default ``CACHE_DIR/variants``).
+    reuse : (texts, embeddings) | None
+        Rows already embedded with the same model, e.g. the main index's
+        ``(texts, emb_matrix)``; matching texts are copied, not re-embedded.
+    model : str | None
+        Embedding model name recorded in the manifests (default
+        ``AOAI_EMBED_MODEL``; see `rag.embeddings.embedding_model_name`).
+    """
+    from .journal import EmbeddingJournal, content_key
+    from .repair import failed_rows
+    from .snapshots import texts_digest
+
+    root = root or _path("VARIANTS_DIR")
+    model = embedding_model_name(embed_fn, model)
+    built: Dict[str, IndexVariant] = {}
+    todo: Dict[str, Tuple[Sequence[str], Sequence[Dict[str, Any]], str]] = {}
+    sources: List[Tuple[Sequence[str], np.ndarray]] = [reuse] if reuse is not None else []  # rows to copy, not embed
+    for name, (texts, metadata) in variants.items():
+        if len(texts) != len(metadata):
+            raise ValueError(f"variant {name!r}: {len(texts)} texts but {len(metadata)} metadata rows")
+        digest = texts_digest(texts)
+        cached = None if force else _load_variant(name, root / name, digest, model, len(texts))
+        if cached is not None and not cached.failed:
+            built[name] = cached
+            continue
+        todo[name] = (texts, metadata, digest)
+        if cached is not None:
+            # stale: some rows never embedded. Rebuild, copying the rows that did
+            print(f"[variants] {name}: {cached.failed} failed rows in the cached bundle; rebuilding")
+            sources.append((texts, cached.embeddings))
+
+    stats = {"texts": sum(len(t) for t, _, _ in todo.values()), "unique": 0, "reused": 0, "embedded": 0, "loaded": len(built)}
+    if todo:
+        # -------- one embedding pass over the distinct texts of every pending variant --------
+        position: Dict[str, int] = {}
+        rows_of: Dict[str, np.ndarray] = {}
+        for name, (texts, _, _) in todo.items():
+            rows_of[name] = np.fromiter((position.setdefault(t, len(position)) for t in texts), dtype=np.int64, count=len(texts))
+        unique = list(position)
+        stats["unique"] = len(unique)
+
+        matrix: Optional[np.ndarray] = None
+        missing = np.arange(len(unique))
+        if sources:
+            src_of: Dict[str, Tuple[int, int]] = {}  # text -> (source, row); failed (zero) rows never copied
+            for s, (src_texts, src_emb) in enumerate(sources):
+                bad = set(failed_rows(src_emb).tolist())
+                for i, t in enumerate(src_texts):
+                    if i not in bad:
+                        src_of.setdefault(t, (s, i))
+            hit = [src_of.get(t) for t in unique]
+            found = np.fromiter((h is not None for h in hit), dtype=bool, count=len(unique))
+            if found.any():
+                matrix = np.empty((len(unique), sources[0][1].shape[1]), dtype=np.float32)
+                for s, (_, src_emb) in enumerate(sources):
+                    pos = [p for p, h in enumerate(hit) if h is not None and h[0] == s]
+                    if pos:
+                        matrix[pos] = np.asarray(src_emb, dtype=np.float32)[[hit[p][1] for p in pos]]
+                missing = np.flatnonzero(~found)
+                stats["reused"] = int(found.sum())
+
+        stats["embedded"] = len(missing)
+        print(f"[variants] {stats['texts']} rows in {len(todo)} variants -> {len(unique)} unique texts ({stats['reused']} reused, {len(missing)} to embed)")
+        journal = EmbeddingJournal.for_model(model)
+        journal_ids: List[str] = []
+        if len(missing):
+            todo_texts = [unique[p] for p in missing]
+            journal_ids = [content_key(t) for t in todo_texts]
+            with telemetry.span("variants.embed", unique=len(unique), rows=len(todo_texts)):
+                fresh = embed_texts(todo_texts, embed_fn, ids=journal_ids, journal=journal)
+            if matrix is None:
+                matrix = fresh
+            else:
+                matrix[missing] = fresh
+        pending = failed_rows(matrix)
+
+        for name, (texts, metadata, digest) in todo.items():
+            rows = rows_of[name]
+            emb = matrix[rows]
+            bad = np.isin(rows, pending)
+            healthy = np.flatnonzero(~bad) if bad.any() else None  # zero vectors stay out of the index
+            with telemetry.span("variants.index", variant=name, rows=len(rows)):
+                index = build_faiss_index_bulk(emb, index_type=index_type, rows=healthy)
+            directory = root / name
+            save_index_bundle(directory, index, emb, metadata)
+            failed = 0 if healthy is None else int(len(rows) - len(healthy))
+            manifest = {"name": name, "texts_sha256": digest, "model": model, "count": len(texts), "failed": failed}
+            _atomic_write(directory / VARIANT_MANIFEST, json.dumps(manifest, indent=2).encode("utf-8"))
+            built[name] = IndexVariant(name, index, list(metadata), emb, failed=failed)
+            print(f"[variants] {name}: {index.ntotal} vectors -> {directory}")
+        journal.discard(journal_ids)  # the bundles hold these rows now; other builds' rows stay
+
+    ordered = {name: built[name] for name in variants}  # keep the caller's order (first = reference arm)
+    return VariantSet(ordered, embed_fn=embed_fn, stats=stats)
@@ -0,0 +1,152 @@
+"""Shared offline fixtures: a deterministic fake embedder and fake chat model."""
+from __future__ import annotations
+from typing import Dict, List, Sequence
+import asyncio
+import hashlib
+import json
+import re
+
+import numpy as np
+import pytest
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+class FakeEmbedder:
+    """Hashed bag-of-words vectors; similar texts get similar vectors, no network.
+
+    `fail` is a set of texts that come back as zero vectors (the API client's
+    failure value). `calls` records every batch.
+    """
+
+    def __init__(self, dim: int = 32, model_name: str = "fake-embed-v1"):
+        self.dim = dim
+        self.model_name = model_name
+        self.fail: set = set()
+        self.calls: List[List[str]] = []
+
+    def vector(self, text: str) -> np.ndarray:
+        v = np.zeros(self.dim, dtype=np.float32)
+        for word in _WORD.findall(text.lower()):
+            h = int.from_bytes(hashlib.sha1(word.encode()).digest()[:4], "little")
+            v[h % self.dim] += 1.0 if h & 1 << 31 else -1.0
+        if not v.any():
+            v[0] = 1.0
+        return v
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        self.calls.append(list(texts))
+        return np.stack([np.zeros(self.dim, np.float32) if t in self.fail else self.vector(t) for t in texts])
+
+    @property
+    def embedded(self) -> int:
+        return sum(map(len, self.calls))
+
+
+_CHUNK = re.compile(r'<chunk(?: id="(\d+)"[^>]*)?>\n(.*?)\n</chunk>', re.S)
+
+
+class FakeLLM:
+    """Async chat adapter for `rag.headers`: the header is derived from the chunk text.
+
+    Single-chunk prompts get ``"H:<first words>"``; window prompts get the
+    JSON array the prompt asks for. `skip` holds window item ids to leave
+    out of a reply, `garble_windows` makes window replies unparseable, and
+    `delay` (seconds) keeps requests in flight. `calls` records the user
+    message of every request.
+    """
+
+    def __init__(self, model_name: str = "fake-chat-v1", delay: float = 0.0):
+        self.model_name = model_name
+        self.delay = delay
+        self.skip: set = set()
+        self.garble_windows = False
+        self.calls: List[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @staticmethod
+    def header(text: str) -> str:
+        return "H:" + " ".join(text.split()[:4])
+
+    async def __call__(self, messages: List[Dict]) -> str:
+        content = messages[-1]["content"]
+        self.calls.append(content)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        chunks = _CHUNK.findall(content)
+        if chunks and chunks[0][0]:  # window request
+            if self.garble_windows:
+                return "sorry, no JSON today"
+            return json.dumps([{"id": int(i), "header": self.header(t)} for i, t in chunks if int(i) not in self.skip])
+        return self.header(chunks[0][1]) if chunks else "H:?"
+
+    def chunk_texts(self) -> List[List[str]]:
+        """Chunk texts of each request, in request order."""
+        return [[t for _, t in _CHUNK.findall(c)] for c in self.calls]
+
+
+@pytest.fixture
+def fake_llm() -> FakeLLM:
+    return FakeLLM()
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    """Skip the header retry backoff sleeps (they still yield to the loop)."""
+    from rag import headers
+
+    real_sleep = asyncio.sleep
+
+    async def no_wait(_seconds, *args, **kwargs):
+        await real_sleep(0)
+
+    monkeypatch.setattr(headers.asyncio, "sleep", no_wait)
+    return no_wait
+
+
+@pytest.fixture
+def fake_embedder() -> FakeEmbedder:
+    return FakeEmbedder()
+
+
+@pytest.fixture
+def corpus():
+    """Texts and aligned metadata for three small documents."""
+    topics = {
+        "breast": ["mammography screening every two years", "women aged 40 to 74", "dense breast tissue ultrasound"],
+        "colon": ["colonoscopy every ten years", "stool based tests annually", "adults aged 45 to 75"],
+        "statin": ["statin therapy for cardiovascular risk", "ldl cholesterol targets", "adults aged 40 to 75 with risk factors"],
+    }
+    texts, metadata = [], []
+    for doc, lines in topics.items():
+        for i, line in enumerate(lines):
+            texts.append(f"{doc} guideline: {line}")
+            metadata.append({"chunk_id": f"{doc}_chunk_{i}", "doc_id": doc, "chunk_index": i, "raw_chunk": line})
+    return texts, metadata
+
+
+@pytest.fixture
+def make_document():
+    """Factory: a document whose paragraphs become one chunk each with ``semantic_max_words=12``."""
+    from rag.models import Document
+
+    def make(doc_id: str, paragraphs: int, words: int = 12) -> Document:
+        body = "\n\n".join(" ".join(f"{doc_id}p{p}w{w}" for w in range(words)) for p in range(paragraphs))
+        return Document(doc_id=doc_id, title=f"Title {doc_id}", content=body, source_url=f"https://example.org/{doc_id}")
+
+    return make
+
+
+@pytest.fixture
+def retriever(fake_embedder, corpus):
+    """`EmbeddingRetriever` over `corpus`, embedded with `fake_embedder` (flat index)."""
+    from rag.index import build_faiss_index_bulk
+    from rag.retrieval import EmbeddingRetriever
+
+    texts, metadata = corpus
+    return EmbeddingRetriever(build_faiss_index_bulk(fake_embedder(texts), index_type="flat"), metadata, embed_fn=fake_embedder, version="fake-v1")
@@ -0,0 +1,117 @@
+"""Answer streaming contracts: handshake iteration, caching, token-budgeted packing (rag.answer)."""
+from __future__ import annotations
+import asyncio
+import time
+
+from rag.answer import AnswerGenerator, pack_context
+
+
+class FakeStream:
+    """Async ``llm_stream`` yielding fixed deltas; records how many were produced."""
+
+    def __init__(self, deltas=("Screening ", "starts ", "at 40 [1].")):
+        self.deltas = list(deltas)
+        self.produced = 0
+        self.closed = 0
+        self.calls = 0
+
+    async def __call__(self, messages, max_completion_tokens=None):
+        self.calls += 1
+        try:
+            for d in self.deltas:
+                self.produced += 1
+                yield d
+                await asyncio.sleep(0)
+        except GeneratorExit:
+            self.closed += 1
+            raise
+
+
+def _results():
+    return [
+        {"chunk_id": "breast_chunk_0", "doc_id": "breast", "doc_title": "Breast", "chunk_index": 0, "raw_chunk": "Mammography every two years."},
+        {"chunk_id": "breast_chunk_1", "doc_id": "breast", "doc_title": "Breast", "chunk_index": 1, "raw_chunk": "Women aged 40 to 74."},
+    ]
+
+
+def _wait(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return predicate()
+
+
+def test_full_stream_is_cached_and_replayed():
+    llm = FakeStream()
+    gen = AnswerGenerator(llm_stream=llm)
+    stream = gen.stream("When does screening start?", _results())
+    assert stream.text() == "Screening starts at 40 [1]."
+    assert stream.answer.text == "Screening starts at 40 [1]." and gen.stats["answered"] == 1
+    again = gen.stream("when does  screening start?", _results())
+    assert again.text() == stream.answer.text
+    assert again.answer.cached and llm.calls == 1
+
+
+def test_abandoned_stream_is_not_cached():
+    llm = FakeStream()
+    gen = AnswerGenerator(llm_stream=llm)
+    for delta in gen.stream("q", _results()):
+        assert llm.produced == 1  # handshake: nothing produced ahead of the consumer
+        break
+    assert _wait(lambda: llm.closed == 1)
+    assert llm.produced == 1
+    assert gen.stats["answered"] == 0 and gen._cache == {}
+    gen.stream("q", _results()).text()
+    assert llm.calls == 2
+
+
+def test_closed_async_stream_is_not_cached():
+    llm = FakeStream()
+    gen = AnswerGenerator(llm_stream=llm)
+
+    async def consume():
+        stream = gen.stream("q", _results())
+        parts = []
+        async for delta in stream:
+            parts.append(delta)
+            if len(parts) == len(llm.deltas):
+                stream.close()  # e.g. client disconnected right at the end
+        return parts
+
+    assert len(asyncio.run(consume())) == 3
+    assert gen.stats["answered"] == 0 and gen._cache == {}
+
+
+def test_errors_propagate_to_sync_consumer():
+    async def broken(messages, max_completion_tokens=None):
+        yield "partial"
+        raise RuntimeError("model went away")
+
+    gen = AnswerGenerator(llm_stream=broken)
+    stream = gen.stream("q", _results())
+    it = iter(stream)
+    assert next(it) == "partial"
+    try:
+        next(it)
+    except RuntimeError as e:
+        assert "went away" in str(e)
+    else:
+        raise AssertionError("expected the model error")
+    assert gen.stats["errors"] == 1 and gen._cache == {}
+
+
+def test_top_hit_truncated_with_injected_counter():
+    words = lambda text: len(text.split())  # a tokenizer far from 4 chars/token
+    long = " ".join(f"w{i}" for i in range(500))
+    results = [{"chunk_id": "c0", "doc_id": "d", "doc_title": "T", "raw_chunk": long}]
+    packed = pack_context(results, budget_tokens=50, count_tokens=words)
+    assert packed.tokens <= 50
+    assert 40 <= words(packed.text) <= 50  # filled up to the budget, not cut by characters
+    assert packed.chunk_ids == ("c0",)
+
+
+def test_packing_skips_duplicates_and_over_budget_chunks():
+    results = _results() + [dict(_results()[0], chunk_id="copy")]
+    packed = pack_context(results, budget_tokens=1000)
+    assert packed.chunk_ids == ("breast_chunk_0", "breast_chunk_1")
+    assert packed.dropped == 1 and packed.citations[0]["number"] == 1
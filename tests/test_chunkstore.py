@@ -0,0 +1,124 @@
+"""Round trips of the binary chunk record store (rag.chunkstore)."""
+from __future__ import annotations
+from dataclasses import dataclass
+import json
+import struct
+
+import pytest
+
+from rag import chunkstore
+from rag.chunkstore import MAGIC, iter_records, read_chunks, write_chunks, write_records
+from rag.models import Chunk, Document
+
+
+def _chunk(i: int, **kw) -> Chunk:
+    base = dict(
+        chunk_id=f"doc{i % 3}_chunk_{i}",
+        doc_id=f"doc{i % 3}",
+        doc_title=f"Title {i % 3}",
+        raw_chunk=f"Raw text {i} – ünïcode ✓",
+        chunk_index=i,
+        ctx_header=f"Header {i}",
+        augmented_chunk=f"Header {i}\n\nRaw text {i}",
+        section_path=f"Section {i}",
+    )
+    base.update(kw)
+    return Chunk(**base)
+
+
+def test_models_are_slotted():
+    assert not hasattr(_chunk(0), "__dict__")
+    assert not hasattr(Document("d", "t", "c"), "__dict__")
+
+
+def test_round_trip_preserves_order_and_values(tmp_path):
+    chunks = [_chunk(i) for i in range(50)]
+    path = tmp_path / "chunks.bin"
+    assert write_chunks(path, chunks) == 50
+    assert read_chunks(path) == chunks
+
+
+def test_control_characters_and_json_fields(tmp_path):
+    chunks = [
+        _chunk(0, raw_chunk="nul\x00inside", ctx_header="rs\x1einside"),
+        _chunk(1, raw_chunk="\x02starts with the json mark"),
+        _chunk(2, duplicate_sources=[{"chunk_id": "x", "source_url": "https://e.org"}]),
+        _chunk(3),
+    ]
+    path = tmp_path / "chunks.bin"
+    write_chunks(path, chunks)
+    assert read_chunks(path) == chunks
+
+
+def test_records_span_block_boundaries(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunkstore, "BLOCK_SIZE", 64)  # many records straddle reads; multi-byte chars too
+    chunks = [_chunk(i, raw_chunk="é" * (i * 7)) for i in range(40)]
+    path = tmp_path / "chunks.bin"
+    write_chunks(path, chunks)
+    assert read_chunks(path) == chunks
+
+
+def test_older_schema_loads_with_defaults(tmp_path):
+    @dataclass(slots=True)
+    class OldChunk:  # written before section_path / duplicate_sources existed, plus a dropped field
+        chunk_id: str
+        doc_id: str
+        doc_title: str
+        raw_chunk: str
+        chunk_index: int = 0
+        legacy_score: int = 0
+
+    path = tmp_path / "old.bin"
+    write_records(path, [OldChunk("c1", "d1", "T", "text", 4, 9)], OldChunk)
+    (chunk,) = iter_records(path, Chunk)
+    assert (chunk.chunk_id, chunk.chunk_index, chunk.section_path, chunk.duplicate_sources) == ("c1", 4, "", [])
+
+
+def test_missing_required_field_is_an_error(tmp_path):
+    @dataclass(slots=True)
+    class NoTitle:
+        chunk_id: str
+        doc_id: str
+        raw_chunk: str
+
+    path = tmp_path / "bad.bin"
+    write_records(path, [NoTitle("c", "d", "t")], NoTitle)
+    with pytest.raises(ValueError, match="doc_title"):
+        read_chunks(path)
+
+
+def test_truncated_and_foreign_files_are_rejected(tmp_path):
+    path = tmp_path / "chunks.bin"
+    write_chunks(path, [_chunk(i) for i in range(3)])
+    data = path.read_bytes()
+    path.write_bytes(data[:-5])
+    with pytest.raises(ValueError, match="truncated"):
+        read_chunks(path)
+    path.write_bytes(b"not a store")
+    with pytest.raises(ValueError, match="magic"):
+        read_chunks(path)
+
+
+def test_failed_write_leaves_previous_file(tmp_path):
+    path = tmp_path / "chunks.bin"
+    write_chunks(path, [_chunk(0)])
+
+    def broken():
+        yield _chunk(1)
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        write_chunks(path, broken())
+    assert read_chunks(path) == [_chunk(0)]
+    assert list(tmp_path.glob("*.tmp")) == []
+
+
+def test_header_lists_field_kinds(tmp_path):
+    path = tmp_path / "chunks.bin"
+    write_chunks(path, [])
+    data = path.read_bytes()
+    (hlen,) = struct.unpack("<I", data[len(MAGIC):len(MAGIC) + 4])
+    header = json.loads(data[len(MAGIC) + 4:len(MAGIC) + 4 + hlen])
+    kinds = dict(header["fields"])
+    assert header["type"] == "Chunk"
+    assert (kinds["chunk_index"], kinds["raw_chunk"], kinds["duplicate_sources"]) == ("int", "str", "json")
@@ -0,0 +1,45 @@
+"""Memory-mapped column store and read-only index sharing (rag.colstore, rag.cache)."""
+from __future__ import annotations
+
+import numpy as np
+
+from rag import cache
+from rag.colstore import ColumnarMetadata, write_columns
+from rag.index import build_faiss_index_bulk
+from rag.retrieval import EmbeddingRetriever
+
+
+def test_columns_round_trip_every_kind(tmp_path):
+    rows = [
+        {"chunk_id": "a_chunk_0", "chunk_index": 0, "score": 0.5, "tags": ["x"], "flag": True, "note": "héllo"},
+        {"chunk_id": "a_chunk_1", "chunk_index": 1, "score": 2, "tags": [], "flag": False},
+        {"chunk_id": "", "chunk_index": 7, "score": 1.25, "tags": None, "flag": True, "note": ""},
+    ]
+    write_columns(tmp_path / "cols", rows)
+    meta = ColumnarMetadata(tmp_path / "cols")
+
+    assert len(meta) == 3 and list(meta) == rows
+    assert meta[-1] == rows[2] and meta[0:2] == rows[:2]
+    assert "note" not in meta[1]  # missing keys stay missing, not None
+    assert meta.value(1, "note", "default") == "default" and meta.value(0, "chunk_index") == 0
+
+
+def test_rewrite_replaces_the_directory(tmp_path):
+    write_columns(tmp_path / "cols", [{"a": 1}, {"a": 2}])
+    write_columns(tmp_path / "cols", [{"b": "x"}])
+    assert list(ColumnarMetadata(tmp_path / "cols")) == [{"b": "x"}]
+    assert [p.name for p in tmp_path.iterdir()] == ["cols"]  # no staging or old copies left
+
+
+def test_mmap_bundle_serves_the_same_results(tmp_path, fake_embedder, corpus):
+    texts, metadata = corpus
+    emb = fake_embedder(texts)
+    cache.save_index_bundle(tmp_path / "bundle", build_faiss_index_bulk(emb, index_type="flat"), emb, metadata)
+
+    index, meta, embeddings = cache.load_index_bundle(tmp_path / "bundle", mmap=True)
+
+    assert isinstance(meta, ColumnarMetadata) and isinstance(embeddings, np.memmap)
+    served = EmbeddingRetriever(index, meta, embed_fn=fake_embedder)
+    assert served.metadata is meta  # the mapped view is used as-is, not copied
+    in_memory = EmbeddingRetriever(build_faiss_index_bulk(emb, index_type="flat"), metadata, embed_fn=fake_embedder)
+    assert served.search("statin therapy", 3) == in_memory.search("statin therapy", 3)
@@ -0,0 +1,46 @@
+"""Lazy configuration: imports stay side-effect free, paths follow CACHE_DIR (rag.config)."""
+from __future__ import annotations
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+
+from rag import cache, config, journal, keywords, snapshots
+
+
+def test_import_reads_no_env_and_creates_no_directories(tmp_path):
+    shutil.copytree(Path(config.__file__).parent, tmp_path / "rag", ignore=shutil.ignore_patterns("__pycache__"))
+    (tmp_path / ".env").write_text("AOAI_EMBED_MODEL=from-dotenv\n", "utf-8")
+    probe = "import sys, rag.cache, rag.service, rag.headers, rag.answer; print('dotenv' in sys.modules)"
+    proc = subprocess.run([sys.executable, "-c", probe], cwd=tmp_path, capture_output=True, text=True, env={"PYTHONPATH": str(tmp_path)})
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip() == "False"
+    assert sorted(p.name for p in tmp_path.iterdir()) == [".env", "rag"]
+
+
+def test_dotenv_header_settings_reach_headers(tmp_path):
+    shutil.copytree(Path(config.__file__).parent, tmp_path / "rag", ignore=shutil.ignore_patterns("__pycache__"))
+    (tmp_path / ".env").write_text("HEADER_WINDOW=4\nHEADER_ADVANCED=0\nHEADER_CHUNK_HEAD=10\n", "utf-8")
+    probe = (
+        "from rag import config, headers; "
+        "print(config.HEADER_WINDOW, headers._system_message() == headers.SYSTEM_MESSAGE_BASIC, len(headers._slice_for_header('x' * 1000)))"
+    )
+    proc = subprocess.run([sys.executable, "-c", probe], cwd=tmp_path, capture_output=True, text=True, env={"PYTHONPATH": str(tmp_path)})
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.split() == ["4", "True", str(10 + 5 + 350)]  # head + " ... " + tail
+
+
+def test_paths_follow_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setitem(vars(config), "CACHE_DIR", tmp_path)
+    assert cache.DOCS_PATH == tmp_path / "documents.json"
+    assert journal.HEADER_JOURNAL_PATH == tmp_path / "journals" / "headers.jsonl"
+    assert keywords.KEYWORD_CACHE_PATH == tmp_path / "keywords.json"
+    assert snapshots.SNAPSHOTS_DIR == tmp_path / "snapshots"
+    cache.save_documents([])
+    assert (tmp_path / "documents.json").exists()
+
+
+def test_module_override_wins(tmp_path, monkeypatch):
+    monkeypatch.setitem(vars(journal), "JOURNAL_DIR", tmp_path / "j")  # removed again on undo
+    assert journal.HEADER_JOURNAL_PATH == tmp_path / "j" / "headers.jsonl"
+    assert journal.HeaderJournal().path == tmp_path / "j" / "headers.jsonl"
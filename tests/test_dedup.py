@@ -0,0 +1,39 @@
+"""Near-duplicate collapsing (rag.dedup)."""
+from __future__ import annotations
+
+from rag.dedup import dedupe_chunks
+from rag.models import Chunk
+
+_BOILERPLATE = "this summary is written and maintained by the editorial board which is editorially independent of the institute"
+
+
+def _chunks():
+    return [
+        Chunk(chunk_id="a_chunk_0", doc_id="a", doc_title="A", raw_chunk=_BOILERPLATE, source_url="https://e.org/a"),
+        Chunk(chunk_id="a_chunk_1", doc_id="a", doc_title="A", raw_chunk="mammography screening every two years for women"),
+        Chunk(chunk_id="b_chunk_0", doc_id="b", doc_title="B", raw_chunk=_BOILERPLATE.upper() + "!", source_url="https://e.org/b"),
+        Chunk(chunk_id="c_chunk_0", doc_id="c", doc_title="C", raw_chunk=_BOILERPLATE, source_url="https://e.org/c"),
+    ]
+
+
+def test_duplicates_collapse_onto_first_copy():
+    stats = {}
+    kept = dedupe_chunks(_chunks(), stats=stats)
+    assert [c.chunk_id for c in kept] == ["a_chunk_0", "a_chunk_1"]
+    assert [s["chunk_id"] for s in kept[0].duplicate_sources] == ["b_chunk_0", "c_chunk_0"]
+    assert stats["canonical"] == 2 and stats["chunks"] == 4
+
+
+def test_input_is_not_modified_and_repeat_is_idempotent():
+    chunks = _chunks()
+    first = dedupe_chunks(chunks)
+    assert all(c.duplicate_sources == [] for c in chunks)
+    second = dedupe_chunks(first)
+    assert second == first
+    assert [s["chunk_id"] for s in second[0].duplicate_sources] == ["b_chunk_0", "c_chunk_0"]
+
+
+def test_dropped_copies_hand_over_their_citations():
+    first = dedupe_chunks(_chunks()[2:])  # b absorbs c
+    merged = dedupe_chunks(_chunks()[:2] + first)  # a absorbs b, and with it c
+    assert [s["chunk_id"] for s in merged[0].duplicate_sources] == ["b_chunk_0", "c_chunk_0"]
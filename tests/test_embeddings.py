@@ -0,0 +1,65 @@
+"""Batch embedding into one matrix (rag.cache.embed_texts) with API failures."""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from rag import cache, config
+
+
+@pytest.fixture
+def fast_batches(monkeypatch):
+    monkeypatch.setitem(vars(config), "EMBED_BATCH_SIZE", 2)
+    monkeypatch.setitem(vars(config), "EMBED_DELAY_SECONDS", 0.0)
+
+
+def _fake_api(monkeypatch, dim: int, failing_calls):
+    """Replace the API path with `dim`-wide vectors; calls in `failing_calls` fail like the real client."""
+    calls = []
+
+    def embed_into(texts, out=None, model=None, max_retries=5):
+        calls.append(list(texts))
+        n = len(texts)
+        ok = np.full(n, len(calls) not in failing_calls)
+        rows = np.arange(1, n * dim + 1, dtype=np.float32).reshape(n, dim) if ok.all() else np.zeros((n, config.EMBED_DIM_FALLBACK), np.float32)
+        if out is None:
+            return rows, ok
+        out[:] = rows if ok.all() else 0.0
+        return out, ok
+
+    monkeypatch.setattr(cache, "embed_into", embed_into)
+    return calls
+
+
+@pytest.mark.parametrize("failing", [{1}, {1, 2}, {2}, set()])
+def test_failed_batches_do_not_fix_the_dimension(monkeypatch, fast_batches, failing):
+    monkeypatch.setitem(vars(config), "EMBED_DIM_FALLBACK", 3072)
+    _fake_api(monkeypatch, dim=8, failing_calls=failing)
+    out = cache.embed_texts([f"t{i}" for i in range(6)])
+    assert out.shape == (6, 8)
+    for call in range(1, 4):
+        rows = out[(call - 1) * 2:call * 2]
+        assert (not rows.any()) if call in failing else rows.all()
+
+
+def test_all_batches_failing_returns_zero_rows(monkeypatch, fast_batches):
+    _fake_api(monkeypatch, dim=8, failing_calls={1, 2})
+    out = cache.embed_texts(["a", "b", "c"])
+    assert out.shape[0] == 3 and not out.any()
+
+
+def test_custom_embed_fn_and_journal_resume(tmp_path, fast_batches, fake_embedder):
+    from rag.journal import EmbeddingJournal
+
+    texts = [f"text number {i}" for i in range(5)]
+    journal = EmbeddingJournal(tmp_path / "journal")
+    fake_embedder.fail = {texts[3]}
+    first = cache.embed_texts(texts, fake_embedder, ids=texts, journal=journal)
+    assert not first[3].any() and len(journal) == 4  # failed rows are never journaled
+
+    fake_embedder.fail = set()
+    fake_embedder.calls.clear()
+    again = cache.embed_texts(texts, fake_embedder, ids=texts, journal=EmbeddingJournal(tmp_path / "journal"))
+    assert fake_embedder.calls == [[texts[3]]]
+    np.testing.assert_array_equal(again[[0, 1, 2, 4]], first[[0, 1, 2, 4]])
+    assert again[3].any()
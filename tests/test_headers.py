@@ -0,0 +1,169 @@
+"""Header scheduling contracts: ordering, priority lanes, concurrency, cancellation, windows (rag.headers)."""
+from __future__ import annotations
+import asyncio
+
+from conftest import FakeLLM
+from rag.headers import generate_headers
+
+
+def _run(docs, llm, **kw):
+    kw.setdefault("journal_path", None)
+    return asyncio.run(generate_headers(docs, llm, semantic_max_words=12, keyword_cache_path=None, **kw))
+
+
+def _requested(llm):
+    """Chunk ids (``<doc>p<n>``) of every request, in request order."""
+    return [[t.split("w0")[0] for t in texts] for texts in llm.chunk_texts()]
+
+
+class SlowFirstLLM(FakeLLM):
+    """Earlier chunks take longer, so completions arrive in reverse order."""
+
+    async def __call__(self, messages):
+        content = messages[-1]["content"]
+        await asyncio.sleep(0.02 if "ap0w0" in content.split("</position>")[-1] else 0)
+        return await super().__call__(messages)
+
+
+def test_results_in_document_then_chunk_order(make_document):
+    llm = SlowFirstLLM()
+    docs = [make_document("a", 3), make_document("b", 2)]
+    chunks = _run(docs, llm, max_concurrent=4)
+    assert [c.chunk_id for c in chunks] == ["a_chunk_0", "a_chunk_1", "a_chunk_2", "b_chunk_0", "b_chunk_1"]
+    assert all(c.ctx_header == FakeLLM.header(c.raw_chunk) for c in chunks)
+    assert all(c.augmented_chunk == f"{c.ctx_header}\n\n{c.raw_chunk}" for c in chunks)
+
+
+def test_requests_follow_documents_and_priority_lanes(fake_llm, make_document):
+    docs = [make_document("a", 2), make_document("b", 2), make_document("c", 2)]
+    _run(docs, fake_llm, max_concurrent=1, priority=lambda d: 0 if d.doc_id == "c" else 1)
+    assert _requested(fake_llm) == [["cp0"], ["cp1"], ["ap0"], ["ap1"], ["bp0"], ["bp1"]]
+
+
+def test_max_concurrent_bounds_in_flight_requests(make_document):
+    llm = FakeLLM(delay=0.01)
+    _run([make_document("a", 4), make_document("b", 4)], llm, max_concurrent=3)
+    assert llm.max_in_flight == 3
+    assert len(llm.calls) == 8
+
+
+def test_cancel_stops_new_work_and_rerun_resumes(tmp_path, make_document):
+    class CancellingLLM(FakeLLM):
+        """Sets `cancel` once its third reply is ready."""
+
+        cancel: asyncio.Event
+
+        async def __call__(self, messages):
+            reply = await super().__call__(messages)
+            if len(self.calls) == 3:
+                self.cancel.set()
+            return reply
+
+    async def first_run():
+        llm.cancel = asyncio.Event()
+        return await generate_headers(docs, llm, semantic_max_words=12, keyword_cache_path=None,
+                                      journal_path=tmp_path / "h.jsonl", max_concurrent=1, cancel=llm.cancel)
+
+    docs = [make_document("a", 3), make_document("b", 3)]
+    llm = CancellingLLM()
+    done = asyncio.run(first_run())
+    assert [c.chunk_id for c in done] == ["a_chunk_0", "a_chunk_1", "a_chunk_2"]
+    assert len(llm.calls) == 3  # the in-flight request finished, nothing new started
+
+    resumed = FakeLLM()
+    full = _run(docs, resumed, journal_path=tmp_path / "h.jsonl", max_concurrent=1)
+    assert _requested(resumed) == [["bp0"], ["bp1"], ["bp2"]]
+    assert [c.chunk_id for c in full][:3] == [c.chunk_id for c in done]
+    assert len(full) == 6
+
+
+def test_windows_group_consecutive_chunks_of_one_document(fake_llm, make_document):
+    chunks = _run([make_document("a", 5), make_document("b", 1)], fake_llm, max_concurrent=1, window=3)
+    assert _requested(fake_llm) == [["ap0", "ap1", "ap2"], ["ap3", "ap4"], ["bp0"]]
+    assert all(c.ctx_header == FakeLLM.header(c.raw_chunk) for c in chunks)
+
+
+def test_window_items_missing_from_reply_fall_back_to_single_requests(fake_llm, make_document):
+    fake_llm.skip = {2}  # second chunk of every window is left out of the reply
+    chunks = _run([make_document("a", 3)], fake_llm, max_concurrent=1, window=3)
+    assert _requested(fake_llm) == [["ap0", "ap1", "ap2"], ["ap1"]]
+    assert all(c.ctx_header == FakeLLM.header(c.raw_chunk) for c in chunks)
+
+
+def test_window_size_is_part_of_the_journal_key(tmp_path, make_document):
+    docs = [make_document("a", 3)]
+    single = FakeLLM()
+    _run(docs, single, journal_path=tmp_path / "h.jsonl", max_concurrent=1)
+
+    windowed = FakeLLM()
+    _run(docs, windowed, journal_path=tmp_path / "h.jsonl", max_concurrent=1, window=3)
+    assert _requested(windowed) == [["ap0", "ap1", "ap2"]]  # single-chunk headers are not reused
+    _run(docs, windowed, journal_path=tmp_path / "h.jsonl", max_concurrent=1, window=3)
+    assert len(windowed.calls) == 1  # the same window size resumes
+
+
+def test_unparseable_window_reply_falls_back_per_chunk(fake_llm, fast_retries, make_document):
+    fake_llm.garble_windows = True
+    chunks = _run([make_document("a", 2)], fake_llm, max_concurrent=1, window=2)
+    assert _requested(fake_llm) == [["ap0", "ap1"], ["ap0", "ap1"], ["ap0"], ["ap1"]]  # two window attempts, then singles
+    assert all(c.ctx_header == FakeLLM.header(c.raw_chunk) for c in chunks)
+
+
+def test_bare_coroutine_llm_is_journaled_under_a_fallback_identity(tmp_path, make_document, capsys):
+    fake = FakeLLM()
+
+    async def llm(messages):  # no model_name attribute
+        return await fake(messages)
+
+    docs = [make_document("a", 2)]
+    chunks = _run(docs, llm, journal_path=tmp_path / "h.jsonl", max_concurrent=1)
+    assert len(chunks) == 2 and "no model_name" in capsys.readouterr().out
+
+    _run(docs, llm, journal_path=tmp_path / "h.jsonl", max_concurrent=1)
+    assert len(fake.calls) == 2  # the rerun resumed from the journal
+    _run(docs, llm, journal_path=tmp_path / "h.jsonl", max_concurrent=1, model="chat-v2")
+    assert len(fake.calls) == 4  # naming the model keys a fresh set of headers
+
+
+def _prefix(content):
+    return content.split("<position>")[0]
+
+
+def test_multi_request_documents_get_a_cacheable_prefix(fake_llm, make_document, monkeypatch):
+    from rag import config
+    from rag.headers import _system_message
+
+    monkeypatch.setitem(vars(config), "HEADER_CACHE_PREFIX_TOKENS", 1100)  # opt-in
+    _run([make_document("long", 4, words=150), make_document("short", 1, words=150)], fake_llm, max_concurrent=1)
+    long_prefixes = {_prefix(c) for c in fake_llm.calls[:4]}
+    assert len(long_prefixes) == 1  # byte-identical for every chunk of the document
+    (prefix,) = long_prefixes
+    assert (len(_system_message()) + len(prefix)) // 4 >= config.HEADER_CACHE_PREFIX_TOKENS >= 1024
+    assert prefix.index("<summary>") < prefix.index("Task:")  # document context, then instructions
+    short = _prefix(fake_llm.calls[4])
+    assert len(short) < len(prefix)  # a single request would only pay for a longer prefix
+
+
+def test_prefix_padding_is_off_by_default_and_charged_when_on(fake_llm, make_document, monkeypatch):
+    from rag import config
+    from rag.headers import AsyncRateLimiter
+
+    charged = []
+    acquire = AsyncRateLimiter.acquire
+
+    async def spy(self, tokens=None):
+        charged.append(tokens or self.tokens_per_request)
+        await acquire(self, tokens)
+
+    monkeypatch.setattr(AsyncRateLimiter, "acquire", spy)
+    docs = [make_document("long", 4, words=150)]
+    _run(docs, fake_llm, max_concurrent=1)
+    plain = _prefix(fake_llm.calls[0])
+    assert len(plain.split("<summary>")[1].split("</summary>")[0]) <= config.HEADER_DOC_SUMMARY_CHARS
+    assert charged == [config.EST_TOKENS_PER_REQUEST] * 4
+
+    charged.clear()
+    monkeypatch.setitem(vars(config), "HEADER_CACHE_PREFIX_TOKENS", 1100)
+    _run(docs, fake_llm, max_concurrent=1)
+    assert len(_prefix(fake_llm.calls[-1])) > len(plain)
+    assert len(charged) == 4 and min(charged) > 1100  # the padded prompt, not the flat estimate
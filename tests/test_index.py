@@ -0,0 +1,83 @@
+"""Memory-bounded bulk index builder (rag.index)."""
+from __future__ import annotations
+
+import faiss
+import numpy as np
+import pytest
+
+from rag import index as index_mod
+from rag.index import build_faiss_index, build_faiss_index_bulk
+
+
+def _matrix(n, d=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, d)).astype(np.float32)
+
+
+def _top(index, queries, k=5):
+    q = np.array(queries, dtype=np.float32)
+    faiss.normalize_L2(q)
+    return index.search(q, k)[1]
+
+
+def test_every_source_kind_builds_the_same_index(tmp_path):
+    emb = _matrix(50)
+    original = emb.copy()
+    np.save(tmp_path / "emb.npy", emb)
+
+    from_array = build_faiss_index_bulk(emb, index_type="flat", add_batch=16)
+    from_path = build_faiss_index_bulk(tmp_path / "emb.npy", index_type="flat", add_batch=16)
+    from_blocks = build_faiss_index_bulk((emb[i:i + 7] for i in range(0, 50, 7)), index_type="flat", spill_dir=tmp_path)
+
+    expected = _top(from_array, emb[:5])
+    assert (_top(from_path, emb[:5]) == expected).all() and (_top(from_blocks, emb[:5]) == expected).all()
+    assert (expected[:, 0] == np.arange(5)).all()
+    assert np.array_equal(emb, original)  # normalized in private buffers, never in place
+    assert [p.name for p in tmp_path.iterdir()] == ["emb.npy"]  # spill file removed
+    assert (_top(build_faiss_index(emb.tolist()), emb[:5]) == expected).all()
+
+
+def test_ivf_trains_on_a_bounded_sample(monkeypatch):
+    sampled = []
+    real = index_mod._reservoir_rows
+
+    def spy(n, k, rng):
+        sampled.append((n, k))
+        return real(n, k, rng)
+
+    monkeypatch.setattr(index_mod, "_reservoir_rows", spy)
+    emb = _matrix(2000)
+    index = build_faiss_index_bulk(emb, index_type="ivf", nlist=10, train_per_list=40, add_batch=300)
+
+    assert isinstance(index, faiss.IndexIVFFlat) and index.is_trained and index.ntotal == 2000
+    assert sampled == [(2000, 400)]
+    index.nprobe = 10
+    assert (_top(index, emb[:3], 1)[:, 0] == np.arange(3)).all()
+
+
+def test_small_ivf_request_falls_back_to_flat():
+    assert isinstance(build_faiss_index_bulk(_matrix(5), index_type="ivf", nlist=10), faiss.IndexFlatIP)
+    assert isinstance(build_faiss_index_bulk(_matrix(20), index_type="auto"), faiss.IndexFlatIP)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf"])
+def test_rows_keep_their_positions_as_labels(index_type):
+    emb = _matrix(400)
+    healthy = np.setdiff1d(np.arange(400), [3, 10, 11])
+
+    index = build_faiss_index_bulk(emb, index_type=index_type, nlist=4, train_per_list=39, rows=healthy, add_batch=64)
+    if index_type == "ivf":
+        index.nprobe = 4
+
+    assert index.ntotal == len(healthy)
+    labels = _top(index, emb[[3, 12, 399]], 400)
+    assert not np.isin(labels, [3, 10, 11]).any()
+    assert labels[1, 0] == 12 and labels[2, 0] == 399
+
+
+def test_empty_sources_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        build_faiss_index_bulk(np.zeros((0, 4), dtype=np.float32))
+    with pytest.raises(ValueError):
+        build_faiss_index_bulk(iter([]), spill_dir=tmp_path)
+    with pytest.raises(ValueError):
+        build_faiss_index_bulk(_matrix(4), rows=[])
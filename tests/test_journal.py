@@ -0,0 +1,87 @@
+"""Resumable header and embedding journals (rag.journal) and header journal keys."""
+from __future__ import annotations
+import asyncio
+import json
+
+import numpy as np
+
+from rag.headers import azure_chat_completion, chat_model_name, generate_headers
+from rag.journal import EmbeddingJournal, HeaderJournal
+
+
+def test_header_journal_survives_torn_line_and_compacts(tmp_path):
+    path = tmp_path / "headers.jsonl"
+    journal = HeaderJournal(path)
+    for round_no in range(3):  # the same chunks regenerated three times
+        for i in range(4):
+            journal.append(f"c{i}", f"k{round_no}", f"header {i} v{round_no}")
+    journal.close()
+    with open(path, "a", encoding="utf-8") as fh:
+        fh.write('{"chunk_id": "c9", "key"')  # crash mid-write
+    assert len(path.read_text("utf-8").splitlines()) == 13
+
+    reopened = HeaderJournal(path)
+    assert len(reopened) == 4
+    assert reopened.get("c2", "k2") == "header 2 v2"
+    assert reopened.get("c2", "k0") is None  # stale key
+    lines = path.read_text("utf-8").splitlines()
+    assert len(lines) == 4 and all(json.loads(line)["key"] == "k2" for line in lines)
+
+
+def test_embedding_journal_round_trip(tmp_path):
+    journal = EmbeddingJournal.for_model("text-embedding-3-large", root=tmp_path)
+    journal.append(["a", "b"], ["ka", "kb"], np.eye(2, 3, dtype=np.float32))
+    again = EmbeddingJournal.for_model("text-embedding-3-large", root=tmp_path)
+    assert again.lookup(["a", "b", "c"], ["ka", "changed", "kc"]).tolist() == [True, False, False]
+    out = np.zeros((1, 3), np.float32)
+    again.fill(["a"], [0], out)
+    assert out.tolist() == [[1.0, 0.0, 0.0]]
+    assert EmbeddingJournal.for_model("other-model", root=tmp_path).lookup(["a"], ["ka"]).tolist() == [False]
+
+
+def _run(docs, llm, journal_path, **kw):
+    return asyncio.run(generate_headers(docs, llm, semantic_max_words=12, journal_path=journal_path, keyword_cache_path=None, **kw))
+
+
+def test_rerun_resumes_from_journal(tmp_path, fake_llm, make_document):
+    docs = [make_document("a", 3), make_document("b", 2)]
+    first = _run(docs, fake_llm, tmp_path / "h.jsonl")
+    assert len(fake_llm.calls) == 5
+    fake_llm.calls.clear()
+    again = _run(docs, fake_llm, tmp_path / "h.jsonl")
+    assert fake_llm.calls == []
+    assert [c.ctx_header for c in again] == [c.ctx_header for c in first]
+
+
+def test_switching_chat_model_regenerates(tmp_path, fake_llm, make_document):
+    docs = [make_document("a", 3)]
+    _run(docs, fake_llm, tmp_path / "h.jsonl")
+    fake_llm.calls.clear()
+    _run(docs, fake_llm, tmp_path / "h.jsonl", model="another-chat-model")
+    assert len(fake_llm.calls) == 3
+
+
+def test_chat_model_identity(fake_llm, monkeypatch):
+    from rag import config
+
+    async def anonymous(messages):
+        return "header"
+
+    monkeypatch.setitem(vars(config), "AOAI_CHAT_MODEL", "chat-deployment")
+    assert chat_model_name().startswith("chat-deployment:") and chat_model_name() == chat_model_name(azure_chat_completion)
+    assert chat_model_name(fake_llm) == "fake-chat-v1" and chat_model_name(anonymous, model="x") == "x"
+    assert chat_model_name(anonymous) == f"custom:{__name__}.test_chat_model_identity.<locals>.anonymous"
+
+
+def test_embedding_journal_discard_keeps_other_ids(tmp_path):
+    journal = EmbeddingJournal(tmp_path / "emb")
+    journal.append(["a", "b"], ["ka", "kb"], np.eye(2, 3, dtype=np.float32))
+    journal.append(["c"], ["kc"], np.full((1, 3), 7, np.float32))
+    journal.discard(["a", "c", "unknown"])
+
+    again = EmbeddingJournal(tmp_path / "emb")
+    assert again.lookup(["a", "b", "c"], ["ka", "kb", "kc"]).tolist() == [False, True, False]
+    out = np.zeros((1, 3), np.float32)
+    again.fill(["b"], [0], out)
+    assert out.tolist() == [[0.0, 1.0, 0.0]]
+    assert len(list((tmp_path / "emb").glob("seg-*.npy"))) == 1
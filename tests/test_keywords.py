@@ -0,0 +1,59 @@
+"""Corpus TF-IDF keywords with a per-document cache (rag.keywords)."""
+from __future__ import annotations
+
+import pytest
+
+from rag import config, keywords
+from rag.keywords import KeywordCache, corpus_keywords, extract_keywords
+
+DOCS = [
+    "Screening recommendation: mammography screening for women. Screening every two years.",
+    "Screening recommendation: colonoscopy screening for adults. Colonoscopy detects polyps.",
+    "Screening recommendation: statin therapy lowers cholesterol. Screening lipids first.",
+]
+
+
+def test_corpus_wide_terms_sink_and_medical_terms_rise():
+    kws = extract_keywords(DOCS, k=6)
+    assert kws[2][0] == "therapy"  # clinical suffix boost
+    # "screening" is in every document: twice as frequent as "lipids" in the third, yet ranked below it
+    assert kws[2].index("lipids") < kws[2].index("screening")
+    assert all(len(k) == 6 for k in kws)
+
+
+def test_ties_break_alphabetically_and_empty_vocabulary():
+    assert extract_keywords(["zeta beta alpha gamma"], k=2) == [["alpha", "beta"]]
+    assert extract_keywords(["a an of", "to be"], k=3) == [[], []]
+    assert extract_keywords([], k=3) == []
+
+
+def test_cache_keeps_first_keywords_and_skips_the_vectorizer(tmp_path, monkeypatch):
+    path = tmp_path / "kw.json"
+    first = corpus_keywords(DOCS[:2], k=4, cache_path=path)
+    assert len(KeywordCache(path)) == 2
+
+    grown = corpus_keywords(DOCS, k=4, cache_path=path)  # the new document changes the idf...
+    assert grown[:2] == first  # ...but cached documents keep their keywords
+
+    def fail(*args, **kwargs):
+        raise AssertionError("vectorizer should not run")
+
+    monkeypatch.setattr(keywords, "extract_keywords", fail)
+    assert corpus_keywords(DOCS, k=4, cache_path=path) == grown
+    with pytest.raises(AssertionError):
+        corpus_keywords(DOCS, k=5, cache_path=path)  # k is part of the key
+
+
+def test_cache_path_defaults_under_cache_dir_and_none_disables(tmp_path, monkeypatch):
+    monkeypatch.setitem(vars(config), "CACHE_DIR", tmp_path)
+    corpus_keywords(DOCS, k=3, cache_path=None)
+    assert list(tmp_path.iterdir()) == []
+    corpus_keywords(DOCS, k=3)
+    assert (tmp_path / "keywords.json").exists()
+
+
+def test_corrupt_cache_is_recomputed(tmp_path):
+    path = tmp_path / "kw.json"
+    path.write_text("{not json", "utf-8")
+    assert corpus_keywords(DOCS, k=3, cache_path=path) == extract_keywords(DOCS, k=3)
+    assert len(KeywordCache(path)) == 3
@@ -0,0 +1,62 @@
+"""Offline retrieval latency benchmark (rag.eval.latency)."""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from rag.eval.latency import (
+    HashEmbedder,
+    exact_top_k,
+    latency_summary,
+    make_queries,
+    recall_at_k,
+    run_latency_benchmark,
+    synthetic_corpus,
+)
+
+
+def test_latency_summary_percentiles():
+    summary = latency_summary([float(ms) for ms in range(1, 101)])
+    assert summary["p50"] == pytest.approx(50.5) and summary["p95"] == pytest.approx(95.05)
+    assert summary["p99"] == pytest.approx(99.01) and summary["max"] == 100.0 and summary["mean"] == 50.5
+    assert latency_summary([]) == {}
+
+
+def test_exact_top_k_streams_blocks_like_a_full_scan(tmp_path):
+    corpus = synthetic_corpus(tmp_path / "c.npy", 500, 16, clusters=8, block=64)
+    queries = make_queries(corpus, 12)
+
+    found = exact_top_k(corpus, queries, k=5, block=37)
+
+    unit = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+    expected = np.argsort(-(queries @ unit.T), axis=1)[:, :5]
+    assert np.array_equal(found, expected)
+    assert recall_at_k(found, expected) == 1.0
+    assert recall_at_k(np.where(np.arange(5) < 2, found, -1), expected) == pytest.approx(0.4)
+
+
+def test_hash_embedder_is_deterministic():
+    known = np.ones(4, dtype=np.float32)
+    embedder = HashEmbedder(4, {"q": known})
+    assert np.array_equal(embedder(["q"])[0], known)
+    assert np.array_equal(embedder(["other"]), HashEmbedder(4)(["other"]))
+    assert not np.array_equal(embedder(["other"]), embedder(["another"]))
+
+
+def test_small_sweep_reports_every_configuration(tmp_path):
+    report = run_latency_benchmark(
+        sizes=(400,), dim=16, n_queries=20, top_k=5, index_types=("flat", "ivf"), nlists=(8,),
+        nprobes=(1, 64), workdir=tmp_path, warmup=2, progress=False,
+    )
+
+    flat, ivf = report["runs"]
+    assert (flat["index_type"], ivf["index_type"], ivf["nlist"]) == ("IndexFlatIP", "IndexIVFFlat", 8)
+    assert [s["nprobe"] for s in flat["sweeps"]] == [None]
+    assert [s["nprobe"] for s in ivf["sweeps"]] == [1, 8]  # clamped to nlist
+    assert flat["sweeps"][0]["recall_at_k"] == 1.0 and ivf["sweeps"][-1]["recall_at_k"] == 1.0
+    for sweep in flat["sweeps"] + ivf["sweeps"]:
+        assert set(sweep["latency_ms"]) == {"end_to_end", "embed", "search"}
+        lat = sweep["latency_ms"]["search"]
+        assert 0 <= lat["p50"] <= lat["p95"] <= lat["p99"] <= lat["max"]
+        assert sweep["qps_batch"] > 0
+    assert report["config"]["sizes"] == [400]
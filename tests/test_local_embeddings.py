@@ -0,0 +1,63 @@
+"""Local LSA embedder, companion index and API failover (rag.local_embeddings)."""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from rag import config
+from rag.index import build_faiss_index_bulk
+from rag.local_embeddings import FailoverRetriever, LSAEmbedder, build_local_index, load_local_retriever
+from rag.snapshots import SnapshotRetriever, publish_snapshot
+
+
+@pytest.fixture(autouse=True)
+def fast_batches(monkeypatch):
+    monkeypatch.setitem(vars(config), "EMBED_BATCH_SIZE", 4)
+    monkeypatch.setitem(vars(config), "EMBED_DELAY_SECONDS", 0.0)
+
+
+def _publish(root, embedder, texts, metadata):
+    emb = embedder(texts)
+    return publish_snapshot(build_faiss_index_bulk(emb), emb, metadata, texts=texts, model=embedder.model_name, root=root)
+
+
+def test_model_name_identifies_the_fitted_arrays(corpus):
+    texts, _ = corpus
+    a = LSAEmbedder.fit(texts, dim=4)
+    same = LSAEmbedder(a.terms, a.idf, a.components)
+    other = LSAEmbedder.fit(texts[:-1], dim=4)
+    assert a.model_name == same.model_name != other.model_name
+    assert a.model_name.startswith("lsa-4d-")
+    assert "__qualname__" not in vars(a)
+
+
+def test_failover_answers_locally_while_primary_fails(tmp_path, fake_embedder, corpus):
+    texts, metadata = corpus
+    _publish(tmp_path / "snap", fake_embedder, texts, metadata)
+    primary = SnapshotRetriever(embed_fn=fake_embedder, poll_interval=0, root=tmp_path / "snap")
+    build_local_index(texts, metadata, dim=4, directory=tmp_path / "local")
+    local = load_local_retriever(tmp_path / "local")
+    assert local.texts_sha256 == primary.texts_sha256
+
+    retriever = FailoverRetriever(primary, local, cooldown=60)
+    fake_embedder.fail = {"colonoscopy"}
+    (hits,) = retriever.search_batch(["colonoscopy"], top_k=2)
+    assert hits and all(h["retrieval_mode"] == "local" for h in hits)
+    assert retriever.stats["fallback"] == 1
+
+
+def test_failover_is_disabled_after_swapping_to_other_texts(tmp_path, fake_embedder, corpus):
+    texts, metadata = corpus
+    _publish(tmp_path / "snap", fake_embedder, texts, metadata)
+    primary = SnapshotRetriever(embed_fn=fake_embedder, poll_interval=0, root=tmp_path / "snap")
+    retriever = FailoverRetriever(primary, build_local_index(texts, metadata, dim=4, directory=tmp_path / "local"), cooldown=60)
+    assert retriever.fallback_current
+
+    _publish(tmp_path / "snap", fake_embedder, texts[::-1], metadata[::-1])  # same rows, other order
+    assert primary.check_for_update()
+    assert not retriever.fallback_current
+
+    fake_embedder.fail = {"colonoscopy"}
+    (hits,) = retriever.search_batch(["colonoscopy"], top_k=2)
+    assert all("retrieval_mode" not in h for h in hits)
+    assert retriever.stats["fallback"] == 0
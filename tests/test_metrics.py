@@ -0,0 +1,82 @@
+"""Term relevance, rank metrics and pooled arm comparison (rag.eval.metrics, rag.eval.benchmark)."""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from rag.eval.benchmark import compare_retrievers
+from rag.eval.metrics import TermMatcher, ndcg_at_k, reciprocal_ranks, term_match_relevance
+
+
+def _substring_relevance(text, terms):
+    """The original definition: share of expected terms that are substrings of the text."""
+    return sum(t.lower() in text.lower() for t in terms) / len(terms)
+
+
+@pytest.mark.parametrize("text, terms", [
+    ("Statins lower LDL cholesterol", ["statin", "statin", "LDL"]),  # duplicates count twice
+    ("statins only", ["statin", "statin", "LDL"]),
+    ("Colonoscopy every 10 years", ["colonoscopy", "", "mammography"]),  # "" is in every text
+    ("mammography", ["MAMMO", "graph", "x"]),
+])
+def test_term_relevance_keeps_substring_semantics(text, terms):
+    assert term_match_relevance(text, terms) == pytest.approx(_substring_relevance(text, terms))
+
+
+def test_found_many_scores_each_text_separately():
+    matcher = TermMatcher(["statin", "ldl", "statin"])
+    texts = ["take a sta", "tin daily", "LDL and statins", "", "statin"]
+
+    found = matcher.found_many(texts)
+
+    assert found == [set(), set(), {"statin", "ldl"}, set(), {"statin"}]  # no match across the boundary
+    scores, coverage = matcher.score_and_coverage(texts)
+    assert scores.tolist() == [_substring_relevance(t, matcher.terms) for t in texts]
+    assert coverage == 1.0
+    assert term_match_relevance("anything", []) == 0.0
+
+
+def test_reciprocal_ranks():
+    relevant = np.array([[False, True, False], [False, False, False], [True, True, False]])
+    assert reciprocal_ranks(relevant).tolist() == [0.5, 0.0, 1.0]
+    assert reciprocal_ranks(np.zeros((2, 0), dtype=bool)).tolist() == [0.0, 0.0]
+
+
+def test_ndcg_at_k():
+    gains = np.array([[1.0, 0.5, 0.0], [0.0, 0.5, 1.0], [0.0, 0.0, 0.0]])
+    scores = ndcg_at_k(gains)
+    discounts = 1 / np.log2([2, 3, 4])
+    assert scores[0] == 1.0 and scores[2] == 0.0
+    assert scores[1] == pytest.approx((0.5 * discounts[1] + discounts[2]) / (discounts[0] + 0.5 * discounts[1]))
+    # a pooled ideal with a better unseen result lowers the score of a locally perfect ranking
+    pooled = ndcg_at_k(gains[:1], np.array([[1.0, 1.0, 0.5, 0.0]]))
+    assert pooled[0] == pytest.approx((discounts[0] + 0.5 * discounts[1]) / (discounts[0] + discounts[1] + 0.5 * discounts[2]))
+
+
+class FixedRetriever:
+    def __init__(self, results):
+        self.results = results
+
+    def search(self, query, top_k=5):
+        return [dict(r, rank=i + 1) for i, r in enumerate(self.results[:top_k])]
+
+
+def _hit(doc, text, header=""):
+    return {"doc_id": doc, "chunk_id": f"{doc}-{text[:4]}", "raw_chunk": text, "ctx_header": header, "similarity_score": 0.5}
+
+
+def test_pooled_ndcg_never_exceeds_one():
+    queries = [{"query": "statin therapy", "expected_terms": ["statin", "ldl", "cardiovascular"]}]
+    plain = FixedRetriever([_hit("a", "statin dosing"), _hit("b", "unrelated text")])
+    # same chunks, but headers raise their term relevance; one result is returned twice
+    headers = FixedRetriever([
+        _hit("a", "statin dosing", "LDL cardiovascular prevention"),
+        _hit("a", "statin dosing", "LDL cardiovascular prevention"),
+        _hit("b", "unrelated text"),
+    ])
+
+    report = compare_retrievers(queries, {"plain": plain, "headers": headers}, top_k=3)
+
+    scores = {name: arm["individual_evaluations"][0]["ndcg_at_k"] for name, arm in report["arms"].items()}
+    assert scores["headers"] == pytest.approx(1.0) and 0 < scores["plain"] < 1
+    assert report["deltas"]["headers_vs_plain"]["win_rate_pct"] == 100.0
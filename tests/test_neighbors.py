@@ -0,0 +1,48 @@
+"""Neighbour-window expansion (rag.neighbors)."""
+from __future__ import annotations
+
+import numpy as np
+
+from rag.models import Chunk
+from rag.neighbors import NeighborIndex
+
+
+def _metadata():
+    # rows interleave two documents and arrive out of reading order
+    rows = [("a", 2), ("b", 0), ("a", 0), ("a", 1), ("b", 1), ("a", 3)]
+    return [{"chunk_id": f"{d}_chunk_{i}", "doc_id": d, "chunk_index": i, "ctx_header": f"{d.upper()} {i}"} for d, i in rows]
+
+
+def test_windows_stay_in_their_document_and_merge():
+    meta = _metadata()
+    neighbors = NeighborIndex.build(meta)
+    hits = [{"row": 3, "rank": 1}, {"row": 0, "rank": 2}, {"row": 1, "rank": 3}]
+
+    passages = neighbors.expand(hits, meta, k=1)
+
+    assert [[m["chunk_id"] for m in p["window"]] for p in passages] == [
+        ["a_chunk_0", "a_chunk_1", "a_chunk_2", "a_chunk_3"],
+        ["b_chunk_0", "b_chunk_1"],
+    ]
+    assert passages[0]["hit_rows"] == [3, 0] and passages[0]["hit_ranks"] == [1, 2]
+
+
+def test_window_text_comes_from_the_chunk_lookup():
+    meta = _metadata()
+    lookup = {"a_chunk_1": Chunk(chunk_id="a_chunk_1", doc_id="a", doc_title="A", raw_chunk="body one", ctx_header="A 1")}
+
+    (passage,) = NeighborIndex.build(meta).expand([{"row": 3}], meta, k=1, chunk_lookup=lookup)
+
+    assert [m["text"] for m in passage["window"]] == ["A 0", "A 1\n\nbody one", "A 2"]
+    assert "text" not in meta[3]
+
+
+def test_arrays_with_legacy_section_rows_still_load(tmp_path):
+    neighbors = NeighborIndex.build(_metadata())
+    legacy = np.vstack([neighbors.arrays, neighbors.arrays[2:4]])
+    np.save(tmp_path / "neighbors.npy", legacy)
+
+    loaded = NeighborIndex.load(tmp_path / "neighbors.npy", mmap=True)
+
+    assert loaded.arrays.shape == (4, 6)
+    assert loaded.window(0, k=1).tolist() == neighbors.window(0, k=1).tolist()
@@ -0,0 +1,85 @@
+"""Quarantine and repair of failed embedding rows (rag.repair)."""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from rag import config
+from rag.index import build_faiss_index_bulk
+from rag.repair import failed_rows, repair_snapshot
+from rag.snapshots import SnapshotConflict, current_version, load_snapshot, publish_snapshot, read_manifest
+
+
+@pytest.fixture(autouse=True)
+def fast_batches(monkeypatch):
+    monkeypatch.setitem(vars(config), "EMBED_BATCH_SIZE", 4)
+    monkeypatch.setitem(vars(config), "EMBED_DELAY_SECONDS", 0.0)
+
+
+def _publish_with_failures(root, embedder, texts, metadata, failed):
+    embedder.fail = {texts[i] for i in failed}
+    emb = embedder(texts)
+    pending = failed_rows(emb)
+    healthy = np.setdiff1d(np.arange(len(texts)), pending)
+    index = build_faiss_index_bulk(emb, rows=healthy)
+    embedder.fail = set()
+    return publish_snapshot(index, emb, metadata, texts=texts, model=embedder.model_name, root=root, extra={"pending": pending.tolist()})
+
+
+def test_failed_rows():
+    emb = np.ones((5, 3), np.float32)
+    emb[1] = 0
+    emb[3, 2] = np.nan
+    assert failed_rows(emb, batch=2).tolist() == [1, 3]
+
+
+def test_repair_publishes_recovered_rows(tmp_path, fake_embedder, corpus):
+    texts, metadata = corpus
+    base = _publish_with_failures(tmp_path, fake_embedder, texts, metadata, failed=[2, 5])
+    assert load_snapshot(root=tmp_path).index.ntotal == 7
+
+    manifest = repair_snapshot(texts, fake_embedder, root=tmp_path)
+    assert manifest["repaired_from"] == base["version"] and manifest["pending"] == []
+    snap = load_snapshot(root=tmp_path)
+    assert snap.index.ntotal == 9
+    query = fake_embedder.vector(texts[5])[None]
+    _, ids = snap.index.search(query / np.linalg.norm(query), 1)
+    assert ids[0, 0] == 5  # recovered rows keep their row position as label
+    assert repair_snapshot(texts, fake_embedder, root=tmp_path) is None  # nothing pending
+
+
+def test_repair_skips_changed_texts_or_model(tmp_path, fake_embedder, corpus):
+    texts, metadata = corpus
+    _publish_with_failures(tmp_path, fake_embedder, texts, metadata, failed=[0])
+    assert repair_snapshot(texts[::-1], fake_embedder, root=tmp_path) is None
+    assert repair_snapshot(texts, fake_embedder, root=tmp_path, model="another-model") is None
+    assert read_manifest(root=tmp_path)["pending"] == [0]
+
+
+def test_repair_never_replaces_a_newer_snapshot(tmp_path, fake_embedder, corpus):
+    texts, metadata = corpus
+    _publish_with_failures(tmp_path, fake_embedder, texts, metadata, failed=[1])
+    fresh = {}
+
+    def embed_while_a_build_publishes(batch):
+        if not fresh:  # a full rebuild lands while the repair is re-embedding
+            emb = fake_embedder(texts)
+            fresh.update(publish_snapshot(build_faiss_index_bulk(emb), emb, metadata, texts=texts, model=fake_embedder.model_name, root=tmp_path))
+        return fake_embedder(batch)
+
+    embed_while_a_build_publishes.model_name = fake_embedder.model_name
+    assert repair_snapshot(texts, embed_while_a_build_publishes, root=tmp_path) is None
+    assert current_version(tmp_path) == fresh["version"]
+    assert load_snapshot(root=tmp_path).index.ntotal == 9
+
+
+def test_publish_compare_and_swap(tmp_path, fake_embedder, corpus):
+    texts, metadata = corpus
+    emb = fake_embedder(texts)
+    index = build_faiss_index_bulk(emb)
+    first = publish_snapshot(index, emb, metadata, root=tmp_path)
+    second = publish_snapshot(index, emb, metadata, root=tmp_path, expected=first["version"])
+    with pytest.raises(SnapshotConflict):
+        publish_snapshot(index, emb, metadata, root=tmp_path, expected=first["version"])
+    assert current_version(tmp_path) == second["version"]
+    assert len([p for p in tmp_path.iterdir() if p.is_dir()]) == 2  # the refused snapshot was removed
@@ -0,0 +1,81 @@
+"""Second-stage reranking with a latency budget and concurrency cap (rag.rerank)."""
+from __future__ import annotations
+
+import threading
+
+from rag.rerank import LexicalScorer, Reranker
+
+
+def _reverse(query, candidates):
+    return [float(i) for i in range(len(candidates))]  # last candidate first
+
+
+def test_rerank_reorders_and_caches(retriever):
+    calls = []
+
+    def scorer(query, candidates):
+        calls.append(query)
+        return _reverse(query, candidates)
+
+    reranker = Reranker(retriever, scorer=scorer, candidates=5, timeout=5, max_concurrent=2, cache_size=8)
+    first_stage = retriever.search("colonoscopy every ten years", top_k=5)
+    hits = reranker.search("colonoscopy every ten years", top_k=3)
+
+    assert [h["chunk_id"] for h in hits] == [h["chunk_id"] for h in first_stage[::-1][:3]]
+    assert [h["rank"] for h in hits] == [1, 2, 3]
+    reranker.search("colonoscopy every ten years", top_k=3)
+    assert len(calls) == 1 and reranker.stats["cache_hits"] == 1
+    reranker.close()
+
+
+def test_lexical_scorer_prefers_term_coverage():
+    candidates = [
+        {"chunk_id": "a", "raw_chunk": "stool based tests annually", "similarity_score": 0.5},
+        {"chunk_id": "b", "raw_chunk": "colonoscopy every ten years", "ctx_header": "Colon cancer screening", "similarity_score": 0.5},
+    ]
+    scores = LexicalScorer()("colonoscopy screening interval", candidates)
+    assert scores[1] > scores[0]
+
+
+def test_timeout_and_overload_fall_back_to_first_stage_order(retriever):
+    release = threading.Event()
+
+    def slow(query, candidates):
+        release.wait(5)
+        return _reverse(query, candidates)
+
+    reranker = Reranker(retriever, scorer=slow, candidates=5, timeout=0.05, max_concurrent=1, cache_size=0)
+    first_stage = [h["chunk_id"] for h in retriever.search("statin therapy", top_k=3)]
+
+    assert [h["chunk_id"] for h in reranker.search("statin therapy", top_k=3)] == first_stage
+    assert reranker.stats["timeouts"] == 1
+    # the abandoned call still holds the only slot: the next query is shed at once
+    assert [h["chunk_id"] for h in reranker.search("statin therapy", top_k=3)] == first_stage
+    assert reranker.stats["shed"] == 1
+    release.set()
+    reranker.close()
+
+
+def test_scorer_errors_fall_back(retriever):
+    def broken(query, candidates):
+        raise RuntimeError("model unavailable")
+
+    reranker = Reranker(retriever, scorer=broken, candidates=4, timeout=5, max_concurrent=1)
+    hits = reranker.search("mammography screening", top_k=2)
+    assert hits == retriever.search("mammography screening", top_k=4)[:2]
+    assert reranker.stats["errors"] == 1
+    reranker.close()
+
+
+def test_stats_are_exact_under_concurrent_callers(retriever):
+    from concurrent.futures import ThreadPoolExecutor
+
+    def broken(query, candidates):
+        raise RuntimeError("model unavailable")
+
+    reranker = Reranker(retriever, scorer=broken, candidates=3, timeout=5, max_concurrent=64, cache_size=0)
+    candidates = retriever.search("statin therapy", top_k=3)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: reranker.rerank("statin therapy", candidates, 2), range(400)))
+    assert reranker.stats["errors"] == 400 and reranker.stats["shed"] == 0
+    reranker.close()
@@ -0,0 +1,55 @@
+"""Semantic result cache for near-duplicate queries (rag.semantic_cache)."""
+from __future__ import annotations
+
+from rag.semantic_cache import SemanticCache, normalize_query
+
+
+def test_normalize_query_ignores_order_case_and_stopwords():
+    assert normalize_query("Breast cancer screening recs?") == normalize_query("screening recs for BREAST cancer")
+    assert normalize_query("the of") == "of the"  # only stopwords: keep them rather than an empty key
+
+
+def test_lexical_repeat_skips_the_embedding_call(retriever, fake_embedder):
+    cache = SemanticCache(retriever, threshold=0.99, max_entries=8)
+    first = cache.search("Colonoscopy screening interval", top_k=3)
+    calls = len(fake_embedder.calls)
+
+    again = cache.search("screening interval, colonoscopy?", top_k=2)
+
+    assert len(fake_embedder.calls) == calls
+    assert again == first[:2] and cache.stats["lexical_hits"] == 1
+    again[0]["rank"] = 99  # callers get copies
+    assert cache.search("colonoscopy screening interval", top_k=3) == first
+
+
+def test_near_duplicate_is_served_from_the_semantic_index(retriever, fake_embedder):
+    cache = SemanticCache(retriever, threshold=0.8, max_entries=8)
+    first = cache.search("colonoscopy screening ten years", top_k=3)
+
+    near = cache.search("colonoscopy screening ten years adults", top_k=3)
+
+    assert near == first
+    assert cache.stats["semantic_hits"] == 1 and cache.stats["misses"] == 1
+    # the new wording is now a lexical alias of the same entry
+    cache.search("adults colonoscopy screening ten years", top_k=3)
+    assert cache.stats["lexical_hits"] == 1
+
+
+def test_smaller_entries_do_not_serve_larger_top_k(retriever):
+    cache = SemanticCache(retriever, threshold=0.8, max_entries=8)
+    cache.search("statin therapy", top_k=2)
+    assert len(cache.search("statin therapy", top_k=4)) == 4
+    assert cache.stats["misses"] == 2
+
+
+def test_lru_eviction_and_version_invalidation(retriever):
+    cache = SemanticCache(retriever, threshold=0.99, max_entries=2)
+    for q in ("mammography", "colonoscopy", "mammography", "statin"):
+        cache.search(q, top_k=2)
+    assert len(cache) == 2 and cache.stats["evictions"] == 1
+    cache.search("mammography", top_k=2)  # recently used: kept
+    assert cache.stats["lexical_hits"] == 2
+
+    retriever._version = "fake-v2"  # index rebuilt
+    cache.search("mammography", top_k=2)
+    assert cache.stats["invalidations"] == 1 and cache.stats["misses"] == 4
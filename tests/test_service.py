@@ -0,0 +1,121 @@
+"""Request coalescing and the HTTP layer (rag.service)."""
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+
+from rag import config
+from rag.service import SearchCoalescer, create_app
+
+
+class CountingRetriever:
+    """Wraps a retriever and records every ``search_batch`` call."""
+
+    def __init__(self, inner, fail: bool = False):
+        self.inner = inner
+        self.fail = fail
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    @property
+    def index(self):
+        return self.inner.index
+
+    @property
+    def version(self):
+        return self.inner.version
+
+    def search_batch(self, queries, top_k):
+        self.batches.append((list(queries), top_k))
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("embedding API down")
+        return self.inner.search_batch(queries, top_k)
+
+
+def test_concurrent_queries_share_one_batch(retriever):
+    counting = CountingRetriever(retriever)
+
+    async def run():
+        coalescer = SearchCoalescer(counting, window_ms=20, max_batch=16)
+        return coalescer, await asyncio.gather(
+            coalescer.search("statin therapy", 2),
+            coalescer.search("colonoscopy", 3),
+            coalescer.search("statin therapy", 2),  # identical: shares the in-flight future
+        )
+
+    coalescer, (a, b, c) = asyncio.run(run())
+
+    assert counting.batches == [(["statin therapy", "colonoscopy"], 3)]
+    assert a == c == retriever.search("statin therapy", 2)
+    assert b == retriever.search("colonoscopy", 3)
+    assert coalescer.stats == {"requests": 3, "deduped": 1, "batches": 1, "batched_queries": 2}
+
+
+def test_full_batch_flushes_without_waiting_for_the_window(retriever):
+    counting = CountingRetriever(retriever)
+
+    async def run():
+        coalescer = SearchCoalescer(counting, window_ms=10_000, max_batch=2)
+        return await asyncio.wait_for(asyncio.gather(coalescer.search("a", 1), coalescer.search("b", 1)), timeout=2)
+
+    assert len(asyncio.run(run())) == 2
+    assert len(counting.batches) == 1
+
+
+def test_batch_errors_reach_every_waiter(retriever):
+    counting = CountingRetriever(retriever, fail=True)
+
+    async def run():
+        coalescer = SearchCoalescer(counting, window_ms=5)
+        return await asyncio.gather(coalescer.search("a"), coalescer.search("b"), return_exceptions=True)
+
+    assert [type(r) for r in asyncio.run(run())] == [RuntimeError, RuntimeError]
+
+
+def test_cancelled_client_does_not_cancel_shared_result(retriever):
+    counting = CountingRetriever(retriever)
+    counting.release.clear()
+
+    async def run():
+        coalescer = SearchCoalescer(counting, window_ms=1)
+        first = asyncio.ensure_future(coalescer.search("statin", 2))
+        second = asyncio.ensure_future(coalescer.search("statin", 2))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        counting.release.set()
+        return await second, first.cancelled()
+
+    results, cancelled = asyncio.run(run())
+    assert cancelled and results == retriever.search("statin", 2)
+
+
+def test_http_validates_and_answers(retriever, monkeypatch):
+    test_utils = pytest.importorskip("aiohttp.test_utils")  # optional dependency of the HTTP layer
+    TestClient, TestServer = test_utils.TestClient, test_utils.TestServer
+
+    monkeypatch.setitem(vars(config), "SERVICE_MAX_TOP_K", 5)
+
+    async def run():
+        client = TestClient(TestServer(create_app(retriever, SearchCoalescer(retriever, window_ms=1))))
+        await client.start_server()
+        try:
+            ok = await (await client.get("/search", params={"q": "statin", "top_k": "2"})).json()
+            post = await (await client.post("/search", json={"query": "statin", "top_k": 2})).json()
+            statuses = [
+                (await client.get("/search", params=params)).status
+                for params in ({"q": ""}, {"q": "x", "top_k": "many"}, {"q": "x", "top_k": "6"})
+            ]
+            health = await (await client.get("/health")).json()
+        finally:
+            await client.close()
+        return ok, post, statuses, health
+
+    ok, post, statuses, health = asyncio.run(run())
+    assert [r["chunk_id"] for r in ok["results"]] == [r["chunk_id"] for r in retriever.search("statin", 2)]
+    assert post["results"] == ok["results"]
+    assert statuses == [400, 400, 400]
+    assert health == {"status": "ok", "ntotal": 9, "version": "fake-v1"}
@@ -0,0 +1,66 @@
+"""Per-collection shards with fan-out search (rag.shards)."""
+from __future__ import annotations
+
+import pytest
+
+from rag import config
+from rag.shards import ShardedRetriever, build_shards, list_shards, load_shard, partition_by_key, partition_by_size
+
+
+@pytest.fixture(autouse=True)
+def fast_batches(monkeypatch):
+    monkeypatch.setitem(vars(config), "EMBED_BATCH_SIZE", 4)
+    monkeypatch.setitem(vars(config), "EMBED_DELAY_SECONDS", 0.0)
+
+
+def test_partitions():
+    meta = [{"source_org": "NCI PDQ"}, {"source_org": "USPSTF"}, {}, {"source_org": "nci-pdq"}]
+    assert partition_by_key(meta) == {"nci-pdq": [0, 3], "uspstf": [1], "unassigned": [2]}
+    assert partition_by_size(5, 2) == {"part-0000": [0, 1], "part-0001": [2, 3], "part-0002": [4]}
+
+
+def test_fan_out_matches_a_single_index(tmp_path, fake_embedder, corpus, retriever):
+    texts, metadata = corpus
+    build_shards(texts, metadata, by="doc_id", embed_fn=fake_embedder, root=tmp_path)
+    assert list_shards(tmp_path) == ["breast", "colon", "statin"]
+
+    sharded = ShardedRetriever.load(root=tmp_path, embed_fn=fake_embedder)
+    for query in ("statin therapy adults", "screening every two years"):
+        merged = sharded.search(query, top_k=4)
+        single = retriever.search(query, top_k=4)
+        assert [h["chunk_id"] for h in merged] == [h["chunk_id"] for h in single]
+        assert [h["rank"] for h in merged] == [1, 2, 3, 4]
+        assert all(h["shard"] == h["doc_id"] for h in merged)
+
+
+def test_rebuilding_one_shard_leaves_the_others(tmp_path, fake_embedder, corpus):
+    texts, metadata = corpus
+    build_shards(texts, metadata, by="doc_id", embed_fn=fake_embedder, root=tmp_path)
+    before = (tmp_path / "breast" / "faiss.index").stat().st_mtime_ns
+    fake_embedder.calls.clear()
+
+    build_shards(texts, metadata, by="doc_id", only=["colon"], embed_fn=fake_embedder, root=tmp_path)
+
+    assert fake_embedder.embedded == 3
+    assert (tmp_path / "breast" / "faiss.index").stat().st_mtime_ns == before
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["breast", "colon", "statin"]  # no staging/old copies
+
+
+def test_failed_rows_stay_out_of_the_shard_index(tmp_path, fake_embedder, corpus):
+    texts, metadata = corpus
+    fake_embedder.fail = {texts[1]}
+    built = build_shards(texts, metadata, by="doc_id", embed_fn=fake_embedder, root=tmp_path)
+
+    assert built["breast"].index.ntotal == 2 and built["colon"].index.ntotal == 3
+    sharded = ShardedRetriever.load(root=tmp_path, embed_fn=fake_embedder)
+    hits = sharded.search("women aged 40 to 74", top_k=9)
+    assert "breast_chunk_1" not in [h["chunk_id"] for h in hits]
+
+
+def test_interrupted_swap_restores_the_previous_shard(tmp_path, fake_embedder, corpus):
+    texts, metadata = corpus
+    build_shards(texts, metadata, by="doc_id", embed_fn=fake_embedder, root=tmp_path)
+    (tmp_path / "colon").replace(tmp_path / ".colon.old")  # crash after moving the old copy aside
+
+    assert list_shards(tmp_path) == ["breast", "colon", "statin"]
+    assert load_shard("colon", root=tmp_path).index.ntotal == 3
@@ -0,0 +1,121 @@
+"""Snapshot publishing, hot reload and embedding-model identity (rag.snapshots, rag.embeddings)."""
+from __future__ import annotations
+
+import numpy as np
+
+from rag.embeddings import embedding_model_name, get_embeddings_batch
+from rag.index import build_faiss_index
+from rag.snapshots import (
+    SnapshotRetriever,
+    current_version,
+    list_snapshots,
+    load_snapshot,
+    publish_snapshot,
+    read_manifest,
+    texts_digest,
+    verify_snapshot,
+)
+
+
+def _publish(root, embedder, texts, metadata, **kw):
+    emb = embedder(texts)
+    return publish_snapshot(build_faiss_index(emb), emb, metadata, texts=texts, model=embedder.model_name, root=root, **kw)
+
+
+def test_publish_and_load(tmp_path, fake_embedder, corpus):
+    texts, metadata = corpus
+    manifest = _publish(tmp_path, fake_embedder, texts, metadata)
+    assert current_version(tmp_path) == manifest["version"]
+    assert manifest["counts"] == {"vectors": 9, "embeddings": 9, "metadata": 9}
+    assert manifest["texts_sha256"] == texts_digest(texts)
+    snap = load_snapshot(root=tmp_path, verify=True)
+    assert snap.version == manifest["version"]
+    assert list(snap.metadata) == metadata
+    assert verify_snapshot(root=tmp_path)
+
+
+def test_tampered_snapshot_is_refused(tmp_path, fake_embedder, corpus):
+    texts, metadata = corpus
+    manifest = _publish(tmp_path, fake_embedder, texts, metadata)
+    (tmp_path / manifest["version"] / "embeddings.npy").write_bytes(b"garbage")
+    assert not verify_snapshot(root=tmp_path)
+    assert load_snapshot(root=tmp_path, verify=True) is None
+
+
+def test_prune_keeps_current(tmp_path, fake_embedder, corpus):
+    texts, metadata = corpus
+    versions = [_publish(tmp_path, fake_embedder, texts, metadata, keep=2)["version"] for _ in range(4)]
+    assert list_snapshots(tmp_path) == versions[-2:]
+    assert read_manifest(root=tmp_path)["version"] == versions[-1]
+
+
+def test_digest_is_order_sensitive():
+    assert texts_digest(["a", "b"]) != texts_digest(["b", "a"])
+    assert texts_digest(["ab"]) != texts_digest(["a", "b"])
+
+
+def test_retriever_hot_swaps(tmp_path, fake_embedder, corpus):
+    texts, metadata = corpus
+    _publish(tmp_path, fake_embedder, texts, metadata)
+    retriever = SnapshotRetriever(embed_fn=fake_embedder, poll_interval=0, root=tmp_path)
+    old = retriever.retriever
+    assert retriever.search("colonoscopy every ten years", top_k=1)[0]["chunk_id"] == "colon_chunk_0"
+    assert not retriever.check_for_update()
+
+    manifest = _publish(tmp_path, fake_embedder, texts[:3], metadata[:3])
+    assert retriever.check_for_update()
+    assert retriever.version == manifest["version"]
+    assert retriever.index.ntotal == 3
+    assert old.index.ntotal == 9  # in-flight users of the old snapshot are unaffected
+
+
+def test_model_identity():
+    class Named:
+        model_name = "local-lsa-abc"
+
+        def __call__(self, texts):
+            return np.zeros((len(texts), 2))
+
+    assert embedding_model_name(model="my-model") == "my-model"
+    assert embedding_model_name(Named()) == "local-lsa-abc"
+    assert embedding_model_name(lambda t: t, model="x") == "x"
+
+
+def unnamed_embedder(texts):
+    return np.ones((len(texts), 4), dtype=np.float32)
+
+
+def test_unnamed_embedder_builds_with_a_fallback_identity(tmp_path, monkeypatch, corpus, capsys):
+    from rag import cache, config
+
+    monkeypatch.setitem(vars(config), "CACHE_DIR", tmp_path)
+    texts, metadata = corpus
+    cache.build_or_load_index(texts, metadata, embed_fn=unnamed_embedder, repair=False)
+
+    name = f"custom:{__name__}.unnamed_embedder"
+    assert read_manifest()["model"] == name == embedding_model_name(unnamed_embedder)
+    assert "no model_name" in capsys.readouterr().out
+    assert verify_snapshot()  # digests computed while writing match the files
+
+
+def test_flat_files_share_the_snapshot_data(tmp_path, monkeypatch, fake_embedder, corpus):
+    from rag import cache, config
+
+    monkeypatch.setitem(vars(config), "CACHE_DIR", tmp_path)
+    texts, metadata = corpus
+    cache.build_or_load_index(texts, metadata, embed_fn=fake_embedder, repair=False)
+    snapshot = tmp_path / "snapshots" / current_version()
+
+    for name in ("embeddings.npy", "faiss.index", "metadata.json", "metadata_cols/columns.json"):
+        assert (tmp_path / name).samefile(snapshot / name)  # linked, not written twice
+    assert cache.load_faiss_index().ntotal == 9 and cache.load_metadata() == metadata
+
+
+def test_api_path_uses_configured_deployment(monkeypatch):
+    from rag import config
+
+    monkeypatch.setitem(vars(config), "AOAI_EMBED_MODEL", "deployment-a")  # bypasses the lazy env lookup
+    assert embedding_model_name() == "deployment-a"
+    assert embedding_model_name(get_embeddings_batch) == "deployment-a"
+    monkeypatch.setitem(vars(config), "AOAI_EMBED_MODEL", "deployment-b")
+    assert embedding_model_name(get_embeddings_batch) == "deployment-b"
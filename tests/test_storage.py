@@ -0,0 +1,156 @@
+"""Storage backends (rag.storage): SQLite on disk and Cosmos against an in-memory container."""
+from __future__ import annotations
+
+import json
+import re
+import sqlite3
+from dataclasses import asdict
+
+import pytest
+
+from rag.models import Chunk, Document
+from rag.storage import CosmosStorage, SQLiteStorage
+
+
+class _NotFound(Exception):
+    status_code = 404
+
+
+class FakeContainer:
+    """The ContainerProxy calls CosmosStorage makes, over a dict keyed by (partition, id).
+
+    `query_items` understands the query shapes rag.storage issues: ``kind``
+    and ``key`` equality, ``ARRAY_CONTAINS(@ids, c.chunk_id)``, ``ORDER BY``,
+    field projections and ``SELECT VALUE MAX(...)``.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.point_reads = 0
+        self.queries = []
+
+    def upsert_item(self, item):
+        self.items[(item["doc_id"], item["id"])] = dict(item)
+
+    def execute_item_batch(self, batch_operations, partition_key):
+        for op, (item,) in batch_operations:
+            assert op == "upsert" and item["doc_id"] == partition_key
+            self.upsert_item(item)
+
+    def read_item(self, item, partition_key):
+        self.point_reads += 1
+        try:
+            return dict(self.items[(partition_key, item)])
+        except KeyError:
+            raise _NotFound(item) from None
+
+    def delete_item(self, item, partition_key):
+        try:
+            del self.items[(partition_key, item)]
+        except KeyError:
+            raise _NotFound(item) from None
+
+    def query_items(self, query, parameters, partition_key=None, enable_cross_partition_query=False):
+        self.queries.append(query)
+        assert partition_key is not None or enable_cross_partition_query
+        params = {p["name"]: p["value"] for p in parameters}
+        head, _, where = query.partition(" FROM c")
+        rows = [dict(v) for (pk, _), v in self.items.items() if partition_key in (None, pk)]
+        where, _, order = where.partition(" ORDER BY c.")
+        for cond in re.findall(r"c\.\w+ = (?:'[^']*'|@\w+)|ARRAY_CONTAINS\(@\w+, c\.\w+\)", where):
+            if cond.startswith("ARRAY_CONTAINS"):
+                name, field = re.match(r"ARRAY_CONTAINS\((@\w+), c\.(\w+)\)", cond).groups()
+                rows = [r for r in rows if r.get(field) in params[name]]
+            else:
+                field, value = re.match(r"c\.(\w+) = (.+)", cond).groups()
+                value = value.strip("'") if value.startswith("'") else params[value]
+                rows = [r for r in rows if r.get(field) == value]
+        if order:
+            rows.sort(key=lambda r: r[order])
+        if head.startswith("SELECT VALUE MAX"):
+            field = re.search(r"c\.(\w+)", head).group(1)
+            values = [r[field] for r in rows if field in r]
+            return [max(values)] if values else []
+        if head != "SELECT *":
+            fields = re.findall(r"c\.(\w+)", head)
+            rows = [{f: r[f] for f in fields} for r in rows]
+        return rows
+
+
+def _chunk(doc_id, i, text=None):
+    return Chunk(chunk_id=f"{doc_id}_chunk_{i}", doc_id=doc_id, doc_title=doc_id.upper(), chunk_index=i, raw_chunk=text or f"{doc_id} text {i}")
+
+
+@pytest.fixture(params=["sqlite", "cosmos"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        backend = SQLiteStorage(tmp_path / "rag.sqlite")
+    else:
+        backend = CosmosStorage(FakeContainer(), concurrency=2)
+    yield backend
+    backend.close()
+
+
+def test_round_trip(store):
+    doc = Document(doc_id="b", title="B", content="body", source_url="https://e.org/b")
+    store.upsert_documents([doc])
+    chunks = [_chunk("b", 1), _chunk("a", 0), _chunk("b", 0)]
+    assert store.replace_chunks(chunks) == 3
+
+    assert store.get_document("b") == doc
+    assert list(store.iter_chunks()) == chunks
+    assert list(store.iter_doc_chunks("b")) == [chunks[2], chunks[0]]
+    assert store.get_chunks(["a_chunk_0", "nope", "b_chunk_1"]) == [chunks[1], None, chunks[0]]
+    assert store.get_chunk("b_chunk_0", "b") == chunks[2]
+    store.put_metadata("index", {"version": 3})
+    assert store.get_metadata("index") == {"version": 3}
+    assert store.get_metadata("missing", "x") == "x"
+
+
+def test_replace_drops_stale_ids_and_keeps_the_new_order(store):
+    store.replace_chunks([_chunk("a", 0), _chunk("a", 1), _chunk("b", 0)])
+    new = [_chunk("b", 0, "rewritten"), _chunk("c", 0), _chunk("a", 0)]
+    store.replace_chunks(new)
+
+    assert list(store.iter_chunks()) == new
+    assert store.get_chunk("a_chunk_1") is None
+    assert list(store.iter_doc_chunks("a")) == [new[2]]
+
+
+def test_upsert_keeps_positions_and_appends_new_ids(store):
+    store.replace_chunks([_chunk("a", 0), _chunk("b", 0)])
+    store.upsert_chunks([_chunk("c", 0), _chunk("a", 0, "updated")])
+
+    assert [(c.chunk_id, c.raw_chunk) for c in store.iter_chunks()] == [
+        ("a_chunk_0", "updated"), ("b_chunk_0", "b text 0"), ("c_chunk_0", "c text 0"),
+    ]
+
+
+def test_cosmos_reads_known_partitions_with_point_reads():
+    container = FakeContainer()
+    store = CosmosStorage(container, concurrency=2)
+    chunks = [_chunk("a", 0), _chunk("b", 0)]
+    store.replace_chunks(chunks)
+    container.queries.clear()
+
+    assert store.get_chunks(["b_chunk_0", "a_chunk_0", "a_chunk_9"], ["b", "a", "a"]) == [chunks[1], chunks[0], None]
+    assert store.get_chunk("a_chunk_0", "a") == chunks[0]
+    assert container.point_reads == 4 and container.queries == []
+    # without a doc_id it falls back to one cross-partition query
+    assert store.get_chunk("b_chunk_0") == chunks[1]
+    assert len(container.queries) == 1
+    store.close()
+
+
+def test_sqlite_adds_ordinal_to_existing_databases(tmp_path):
+    path = tmp_path / "old.sqlite"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE chunks (chunk_id TEXT PRIMARY KEY, doc_id TEXT NOT NULL, chunk_index INTEGER NOT NULL, body TEXT NOT NULL)")
+    old = _chunk("z", 0)
+    conn.execute("INSERT INTO chunks VALUES (?, ?, ?, ?)", (old.chunk_id, old.doc_id, old.chunk_index, json.dumps(asdict(old))))
+    conn.commit()
+    conn.close()
+    store = SQLiteStorage(path)
+    store.upsert_chunks([_chunk("b", 0), _chunk("a", 0)])
+    assert [c.chunk_id for c in store.iter_chunks()] == ["z_chunk_0", "b_chunk_0", "a_chunk_0"]
+    store.close()
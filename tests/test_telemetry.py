@@ -0,0 +1,108 @@
+"""Opt-in spans, counters and the Prometheus exposition (rag.telemetry)."""
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+
+from rag import config, telemetry
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    """Start each test unconfigured with an empty registry; restore the global state after."""
+    monkeypatch.setattr(telemetry._State, "enabled", None)
+    monkeypatch.setattr(telemetry._State, "exporters", [])
+    monkeypatch.setattr(telemetry.atexit, "register", lambda fn: fn)
+    monkeypatch.setitem(vars(config), "TELEMETRY_ENABLED", False)
+    telemetry.registry().reset()
+    yield
+    telemetry.disable(reset=True)
+
+
+def test_disabled_calls_record_nothing():
+    assert telemetry.span("x") is telemetry._NOOP
+    telemetry.count("requests")
+    telemetry.observe("latency", 0.5)
+    assert not telemetry.enabled()
+    assert telemetry.prometheus_text() == "\n"
+
+
+def test_spans_nest_across_await_and_record_errors():
+    mem = telemetry.enable(telemetry.InMemoryExporter())
+
+    async def child():
+        await asyncio.sleep(0)
+        with telemetry.span("child", rows=2) as s:
+            s.set(dim=4)
+
+    async def run():
+        with telemetry.span("parent"):
+            await asyncio.gather(child(), child())
+
+    asyncio.run(run())
+    with pytest.raises(RuntimeError):
+        with telemetry.span("broken"):
+            raise RuntimeError("boom")
+
+    parent = next(s for s in mem.spans if s.name == "parent")
+    children = [s for s in mem.spans if s.name == "child"]
+    assert len(children) == 2 and all(c.parent_id == parent.span_id == c.trace_id for c in children)
+    assert children[0].attrs == {"rows": 2, "dim": 4}
+    assert next(s for s in mem.spans if s.name == "broken").error == "RuntimeError: boom"
+    assert mem.summary()["child"]["count"] == 2
+    assert telemetry.registry().counters[("stage_errors", (("stage", "broken"),))] == 1
+
+
+def test_counters_and_histograms_in_prometheus_format():
+    telemetry.enable()
+    telemetry.count("headers.llm_errors", error="Timeout")
+    telemetry.count("headers.llm_errors", 2, error="Timeout")
+    telemetry.count("cache.hits", tier='say "hi"')
+    for value in (0.003, 0.2, 100.0):
+        telemetry.observe("queue_wait", value, queue="rate_limiter")
+
+    lines = telemetry.prometheus_text().splitlines()
+
+    assert "# TYPE rag_headers_llm_errors_total counter" in lines
+    assert 'rag_headers_llm_errors_total{error="Timeout"} 3' in lines
+    assert 'rag_cache_hits_total{tier="say \\"hi\\""} 1' in lines
+    assert "# TYPE rag_queue_wait histogram" in lines
+    assert 'rag_queue_wait_bucket{queue="rate_limiter",le="0.001"} 0' in lines
+    assert 'rag_queue_wait_bucket{queue="rate_limiter",le="0.005"} 1' in lines
+    assert 'rag_queue_wait_bucket{queue="rate_limiter",le="60"} 2' in lines
+    assert 'rag_queue_wait_bucket{queue="rate_limiter",le="+Inf"} 3' in lines
+    assert 'rag_queue_wait_count{queue="rate_limiter"} 3' in lines
+
+
+def test_environment_configures_exporters_on_first_use(tmp_path, monkeypatch):
+    monkeypatch.setitem(vars(config), "TELEMETRY_ENABLED", True)
+    monkeypatch.setitem(vars(config), "TELEMETRY_JSONL", str(tmp_path / "spans.jsonl"))
+    monkeypatch.setitem(vars(config), "TELEMETRY_PROMETHEUS", str(tmp_path / "metrics.prom"))
+
+    with telemetry.span("index.build"):
+        telemetry.count("embeddings.rows", 9)
+    telemetry.flush()
+
+    assert telemetry._State.enabled is True
+    records = [json.loads(line) for line in (tmp_path / "spans.jsonl").read_text().splitlines()]
+    assert [r["type"] for r in records] == ["span", "metrics"] and records[0]["name"] == "index.build"
+    prom = (tmp_path / "metrics.prom").read_text()
+    assert "rag_embeddings_rows_total 9" in prom
+    assert 'rag_stage_duration_seconds_count{stage="index.build"} 1' in prom
+
+
+def test_failing_exporter_never_breaks_the_caller(capsys):
+    class Broken(telemetry.Exporter):
+        def export(self, record):
+            raise OSError("disk full")
+
+    telemetry.enable(Broken())
+
+    @telemetry.traced()
+    def work():
+        return 42
+
+    assert work() == 42
+    assert "Exporter Broken failed" in capsys.readouterr().out
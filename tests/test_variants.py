@@ -0,0 +1,60 @@
+"""A/B index variants built with shared embedding work (rag.variants)."""
+from __future__ import annotations
+
+import json
+
+import numpy as np
+import pytest
+
+from rag import config, journal
+from rag.journal import EmbeddingJournal
+from rag.variants import VARIANT_MANIFEST, build_variant_indexes
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setitem(vars(config), "EMBED_BATCH_SIZE", 4)
+    monkeypatch.setitem(vars(config), "EMBED_DELAY_SECONDS", 0.0)
+    monkeypatch.setitem(vars(journal), "JOURNAL_DIR", tmp_path / "journals")
+
+
+def _variants(corpus):
+    texts, metadata = corpus
+    return {"baseline": (texts, metadata), "enhanced": ([f"Header. {t}" for t in texts], metadata)}
+
+
+def test_shared_texts_are_embedded_once_and_reruns_load(tmp_path, fake_embedder, corpus):
+    variants = _variants(corpus)
+    variants["enhanced"][0][0] = variants["baseline"][0][0]  # one text in both arms
+    built = build_variant_indexes(variants, embed_fn=fake_embedder, root=tmp_path / "v")
+    assert fake_embedder.embedded == built.stats["unique"] == 2 * len(corpus[0]) - 1
+
+    fake_embedder.calls.clear()
+    again = build_variant_indexes(variants, embed_fn=fake_embedder, root=tmp_path / "v")
+    assert fake_embedder.calls == [] and again.stats["loaded"] == 2
+
+
+def test_bundle_with_failed_rows_is_rebuilt_embedding_only_those(tmp_path, fake_embedder, corpus):
+    variants = _variants(corpus)
+    failing = variants["baseline"][0][3]
+    fake_embedder.fail = {failing}
+    first = build_variant_indexes(variants, embed_fn=fake_embedder, root=tmp_path / "v")
+    assert first["baseline"].failed == 1 and first["baseline"].index.ntotal == len(corpus[0]) - 1
+    assert json.loads((tmp_path / "v" / "baseline" / VARIANT_MANIFEST).read_text("utf-8"))["failed"] == 1
+
+    fake_embedder.fail = set()
+    fake_embedder.calls.clear()
+    second = build_variant_indexes(variants, embed_fn=fake_embedder, root=tmp_path / "v")
+    assert fake_embedder.calls == [[failing]]
+    assert second["baseline"].failed == 0 and second["baseline"].index.ntotal == len(corpus[0])
+    assert second.stats["loaded"] == 1  # the healthy arm was not touched
+
+
+def test_build_keeps_other_journal_rows(tmp_path, fake_embedder, corpus):
+    shared = EmbeddingJournal.for_model(fake_embedder.model_name)
+    shared.append(["main_chunk_0"], ["k"], np.ones((1, fake_embedder.dim), np.float32))
+
+    build_variant_indexes(_variants(corpus), embed_fn=fake_embedder, root=tmp_path / "v")
+
+    reopened = EmbeddingJournal.for_model(fake_embedder.model_name)
+    assert len(reopened) == 1 and reopened.lookup(["main_chunk_0"], ["k"]).tolist() == [True]